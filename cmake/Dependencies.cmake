@@ -19,6 +19,17 @@ if(NOT HAVE_CUDA)
   list(APPEND DAUConvNet_DEFINITIONS PUBLIC -DCPU_ONLY)
 endif()
 
+# ---[ OpenMP
+if(USE_OPENMP)
+  find_package(OpenMP)
+  if(OPENMP_FOUND)
+    list(APPEND DAUConvNet_COMPILE_OPTIONS PUBLIC ${OpenMP_CXX_FLAGS})
+    list(APPEND DAUConvNet_LINKER_LIBS PUBLIC ${OpenMP_CXX_FLAGS})
+  else()
+    message(STATUS "-- OpenMP not found. CPU implementation will use a single thread...")
+  endif()
+endif()
+
 # ---[ BLAS
 if(NOT APPLE)
   set(BLAS "Atlas" CACHE STRING "Selected BLAS library")
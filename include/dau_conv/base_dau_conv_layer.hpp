@@ -15,6 +15,7 @@
 
 #include "dau_conv/util/math_functions.hpp"
 #include "dau_conv/util/common.hpp"
+#include "dau_conv/util/profiler.hpp"
 
 namespace DAUConvNet {
 ////////////////////////////////////////////////////////////////////////////////
@@ -77,6 +78,7 @@ public:
     }
 
     virtual void get_kernels(BaseDAUKernelParams<Dtype> &input, BaseDAUKernelOutput<Dtype> &output, cublasHandle_t cublas_handle);
+    virtual void get_kernels_cpu(BaseDAUKernelParams<Dtype> &input, BaseDAUKernelOutput<Dtype> &output);
 
     virtual void reshape(int num_in_channels, int num_out_channels, int num_gauss,
                          int kernel_h, int kernel_w) = 0;
@@ -112,10 +114,10 @@ struct DAUConvSettings {
 
     float component_border_bound, sigma_lower_bound;
 
-    int merge_iteration_step;
-    float merge_threshold;
-
     bool offsets_already_centered;
+
+    // input/output data is in NHWC instead of NCHW format (supported only by Forward_cpu/Backward_cpu)
+    bool channels_last;
 };
 
 template <typename Dtype>
@@ -147,8 +149,7 @@ public:
  *
  *
  * TODO:
- *  - add sharing of GPU memory accross layers that are computed in sequence
- *  - add stride>1 (currently allows only stride=1)
+ *  - add stride>1 to CUDA version (currently only Forward_cpu/Backward_cpu allow stride>1)
  *  - improve cudaStream for forward and backward pass
  *  - combine convolve and input preparation forward and backward pass (might shave 5-10% off the whole computation time)
  *
@@ -163,6 +164,23 @@ public:
 
     static const int ALLOWED_UNITS_GROUP = 2;
 
+    // largest kernel (i.e. offsets up to 8 pixels) supported by CUDA kernels, while CPU version handles any offsets
+    static const int MAX_GPU_KERNEL_SIZE = 17;
+
+    // size of blurred band held by each thread of fused Forward_cpu (should fit into L2 cache together with output rows)
+    static const long FUSED_BAND_BUFFER_BYTES = 512 * 1024;
+
+    // CPU pre-filtering (blur) switches from direct convolution to FFT for kernels of at least this size; direct
+    // separable blur costs (kernel_h + kernel_w) per pixel but direct blur with non-separable kernels (e.g. derivative
+    // w.r.t. sigma) costs (kernel_h * kernel_w) per pixel, while the cost of FFT does not depend on the kernel size
+    // (measured on 32x32 to 128x128 images, see dau_conv.benchmark --blur-crossover)
+    static const int FFT_BLUR_MIN_KERNEL_SIZE = 81;
+    static const int FFT_BLUR_MIN_KERNEL_SIZE_NONSEPARABLE = 11;
+
+    enum BlurMethod { BLUR_AUTO = 0, BLUR_DIRECT = 1, BLUR_FFT = 2 };
+
+    enum Activation { ACTIVATION_NONE = 0, ACTIVATION_RELU = 1, ACTIVATION_LEAKY_RELU = 2 };
+
     explicit BaseDAUConvLayer(cublasHandle_t cublas_handle, bool ignore_edge_gradients = false, bool offsets_already_centered = true)
             : cublas_handle(cublas_handle), handles_setup_(false),
               ignore_edge_gradients_(ignore_edge_gradients), offsets_already_centered_(offsets_already_centered),
@@ -196,6 +214,58 @@ public:
     void enable_forward(bool enable) { this->enabled_fwd_op = enable; }
     void enable_backward(bool enable) { this->enabled_bwd_op = enable; }
     void enable_memalloc_info(bool enable) {this->enabled_memalloc_info = enable; }
+
+    // number of threads used by Forward_cpu and Backward_cpu (0 == use OpenMP default i.e. all available cores)
+    void set_num_cpu_threads(int num_threads) { this->num_cpu_threads_ = num_threads; }
+    int get_num_cpu_threads() const;
+
+    // upper bound (in bytes) for blurred input held by Forward_cpu at once (0 == no limit); when full blurred input
+    // would not fit, forward pass is computed in tiles of images and strips of output rows (see Forward_cpu)
+    void set_tile_memory_limit(long bytes) { this->tile_memory_limit_ = bytes; }
+    long get_tile_memory_limit() const { return this->tile_memory_limit_; }
+
+    // true if Forward_cpu uses its own tile buffer instead of temp_interm_buffer() (fused == fused blur and
+    // offset-and-sum is used for the current pre-filtering kernel)
+    bool is_forward_tiled(bool fused);
+
+    // fused Forward_cpu blurs input rows into a small per-thread ring buffer and immediately sums their shifted
+    // contributions into output rows, so that the whole blurred input is never written to memory (enabled by default;
+    // tile_memory_limit_ applies when kernel cannot be fused, i.e. is not separable or is blurred with FFT)
+    void set_fused_forward(bool enable) { this->fused_forward_ = enable; }
+    bool get_fused_forward() const { return this->fused_forward_; }
+
+    // true if Forward_cpu uses fused blur and offset-and-sum for separable kernels that are not blurred with FFT (it
+    // does not need temp_interm_buffer() for other kernels either)
+    bool is_forward_fused();
+
+    // buffer of [N x S x H x W] values (always in NCHW format) where Forward_cpu writes the whole blurred input and
+    // from where Backward_cpu reads it instead of blurring the input with derivative kernel of w again (both kernels are
+    // the same normalized gaussian); forward pass is then neither fused nor tiled (NULL == not used)
+    void set_saved_blurred_input(Dtype* data) { this->saved_blurred_input_ = data; }
+    Dtype* get_saved_blurred_input() const { return this->saved_blurred_input_; }
+
+    // method of pre-filtering (blur) in Forward_cpu and Backward_cpu (BLUR_AUTO selects FFT based on kernel size)
+    void set_blur_method(BlurMethod method) { this->blur_method_ = method; }
+    BlurMethod get_blur_method() const { return this->blur_method_; }
+
+    // true if CPU blur with current pre-filtering kernel size uses FFT
+    bool use_fft_blur(bool is_separable) const;
+
+    // activation that Forward_cpu applies to the output in the same pass as bias (negative_slope is used only by
+    // ACTIVATION_LEAKY_RELU and must be >= 0); Backward_cpu then requires the activated output as top_data since
+    // the derivative is computed from its sign
+    void set_activation(Activation activation, Dtype negative_slope = 0) {
+        this->activation_ = activation;
+        this->activation_negative_slope_ = negative_slope;
+    }
+    Activation get_activation() const { return this->activation_; }
+
+    // name under which phase timings are collected by DAUConvProfiler (when profiling is enabled)
+    void set_profile_name(const std::string& name) { this->profile_name_ = name; }
+    const std::string& get_profile_name() const { return this->profile_name_; }
+
+    // size of pre-filtering (aggregation) kernel for specific sigma (kernel size is fixed at LayerSetUp)
+    static int get_prefiltering_kernel_size(Dtype sigma) { return 2 * (int)ceil(5 * sigma) + 1; }
 protected:
     virtual void compute_output_shape();
 
@@ -228,6 +298,7 @@ protected:
     virtual Dtype* temp_param_buffer() = 0;
 
     // requrested size = [aggregation.kernel_h_, aggregation.kernel_w_, height_, width_]
+    // (used by CPU version only when prefiltering kernels are not separable, so can be allocated on first use)
     virtual Dtype* temp_col_buffer() = 0;
 
     // requrested size = [1, height_out_ * width_out_]
@@ -236,6 +307,9 @@ protected:
     virtual void* allocate_workspace_mem(size_t bytes) = 0;
     virtual void deallocate_workspace_mem() = 0;
 
+    // sets buffer_fwd_ and buffer_bwd_ to workspace memory of size workspaceSizeInBytes
+    void set_workspace_mem(void* workspaceData);
+
     Dtype get_sigma_val() {
         Dtype sigma;
         // if sigma ptr is on GPU we need to copy it
@@ -261,11 +335,30 @@ protected:
     Dtype* get_deriv_kernel_error(cudaStream_t stream = 0);
 
     void set_last_n_gauss_to_zero(Dtype* array, int num_gauss_zero);
+    void set_last_n_gauss_to_zero_cpu(Dtype* array, int num_gauss_zero);
 
     bool enabled_fwd_op;
     bool enabled_bwd_op;
     bool enabled_memalloc_info;
 
+    int num_cpu_threads_ = 0;
+
+    long tile_memory_limit_ = 0;
+
+    // blurred input of one tile (used by Forward_cpu with tile_memory_limit_ or as a fallback of fused version only)
+    vector<Dtype> tile_buffer_;
+
+    bool fused_forward_ = true;
+
+    BlurMethod blur_method_ = BLUR_AUTO;
+
+    Dtype* saved_blurred_input_ = NULL;
+
+    Activation activation_ = ACTIVATION_NONE;
+    Dtype activation_negative_slope_ = 0;
+
+    std::string profile_name_ = "DAUConv";
+
     // TODO: add support for K=4 as well (K== number of parameter types i.e., K=4 for [w,mu1,mu2,sigma])
     // NOTE: allthough we set NUM_K=4 we also set last_k_optional=true which allows underlaying system to
     //       ignore last K (i.e. sigma) since at the moment we are not training them
@@ -274,6 +367,7 @@ protected:
     bool bias_term_;
 
     int num_spatial_axes_, channel_axis_;
+    bool channels_last_;
     int bottom_dim_, top_dim_, out_spatial_dim_;
 
     int batch_num_;
@@ -286,6 +380,8 @@ protected:
     int pad_h_, pad_w_;
     int height_, width_;
     int height_out_, width_out_;
+    // output size at stride=1 (strided output is sub-sampled from it without computing the skipped pixels)
+    int height_out_full_, width_out_full_;
 
     int units_per_channel;
     int num_units_ignore;
@@ -298,8 +394,6 @@ protected:
 
     int mean_iteration_step;
     int sigma_iteration_step;
-    int unit_merge_iteration_step;
-    float unit_merge_threshold;
 
     int current_iteration_index;
 
@@ -0,0 +1,56 @@
+#ifndef DAU_CONV_UTIL_FFT_CONV_HPP
+#define DAU_CONV_UTIL_FFT_CONV_HPP
+
+#include <vector>
+
+namespace DAUConvNet {
+
+// Spectra of kernels and sizes of transforms for correlation of images of the
+// same size with fft_conv2d_cpu() (prepared once by fft_conv2d_plan_cpu() and
+// shared by all threads). Complex values are stored as interleaved
+// [real, imag] pairs.
+template <typename Dtype>
+struct FFTConv2dPlan {
+  int num_kernels;
+  int height, width;
+  int height_out, width_out;
+  // size of transforms (powers of two) and number of stored columns of
+  // half-spectrum of real data (fft_w / 2 + 1)
+  int fft_h, fft_w, spectrum_w;
+  // input rows/columns [row_start, row_start + rows) x [col_start,
+  // col_start + cols) contribute to the output
+  int row_start, rows, col_start, cols;
+  // output pixel (y,x) is at (y - shift_h, x - shift_w) of cyclic correlation
+  int shift_h, shift_w;
+  // conjugated spectra [num_kernels x fft_h x spectrum_w] of kernels
+  std::vector<Dtype> kernel_spectra;
+  std::vector<Dtype> twiddles_h, twiddles_w;
+
+  // number of Dtype values of workspace needed by fft_conv2d_cpu()
+  int workspace_size() const;
+};
+
+// Prepares correlation of [height x width] images with num_kernels kernels of
+// [kernel_h x kernel_w] (stored one after another) using zero padding, i.e.,
+// with the same arguments as separable_conv2d_cpu().
+template <typename Dtype>
+void fft_conv2d_plan_cpu(const Dtype* kernels, const int num_kernels,
+    const int kernel_h, const int kernel_w, const int height, const int width,
+    const int pad_h, const int pad_w, const int height_out,
+    const int width_out, FFTConv2dPlan<Dtype>* plan);
+
+// Correlates single image with all kernels of the plan in the frequency
+// domain. Produces the same [height_out x width_out] outputs as
+// separable_conv2d_cpu() or im2col_cpu + gemm (up to rounding) with the cost
+// that does not depend on the kernel size. Output of k-th kernel is written
+// to data_out + k * data_out_step. Requires workspace of
+// plan.workspace_size() values. data_im_step and data_im_upsample are the
+// same as in separable_conv2d_cpu().
+template <typename Dtype>
+void fft_conv2d_cpu(const FFTConv2dPlan<Dtype>& plan, const Dtype* data_im,
+    Dtype* data_out, const long data_out_step, Dtype* workspace,
+    const int data_im_step = 1, const int data_im_upsample = 1);
+
+}  // namespace DAUConvNet
+
+#endif  // DAU_CONV_UTIL_FFT_CONV_HPP
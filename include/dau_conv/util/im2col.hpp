@@ -9,12 +9,14 @@ void im2col_nd_cpu(const Dtype* data_im, const int num_spatial_axes,
     const int* kernel_shape, const int* pad, const int* stride,
     const int* dilation, Dtype* data_col);
 
+// data_im_step is the distance between neighbouring pixels of the same channel
+// i.e. 1 for CHW data and channels for HWC data
 template <typename Dtype>
 void im2col_cpu(const Dtype* data_im, const int channels,
     const int height, const int width, const int kernel_h, const int kernel_w,
     const int pad_h, const int pad_w, const int stride_h,
     const int stride_w, const int dilation_h, const int dilation_w,
-    Dtype* data_col);
+    Dtype* data_col, const int data_im_step = 1);
 
 template <typename Dtype>
 void col2im_nd_cpu(const Dtype* data_col, const int num_spatial_axes,
@@ -0,0 +1,72 @@
+#ifndef DAU_CONV_UTIL_KERNEL_CACHE_HPP
+#define DAU_CONV_UTIL_KERNEL_CACHE_HPP
+
+#include <list>
+#include <map>
+#include <mutex>
+#include <vector>
+
+namespace DAUConvNet {
+
+// All settings that influence pre-filtering (aggregation) kernels produced by
+// get_kernels() for a single unit with w=1 and mu=0.
+struct DAUKernelCacheKey {
+  float sigma;
+  int kernel_h, kernel_w;
+  bool unit_normalization;
+  bool square_unit_normalization;
+  float sigma_lower_bound;
+  bool offsets_already_centered;
+
+  bool operator<(const DAUKernelCacheKey& other) const;
+};
+
+// Process-wide LRU cache of pre-filtering kernels (blur kernel, error kernel
+// and derivative kernels of [w,mu1,mu2,sigma]) shared by all layers with the
+// same settings. Cached values are stored on host and are copied to host or
+// GPU buffers of the layer.
+template <typename Dtype>
+class DAUKernelCache {
+ public:
+  explicit DAUKernelCache(int capacity = 32)
+      : capacity_(capacity), num_hits_(0), num_misses_(0) {}
+
+  static DAUKernelCache<Dtype>& get_instance();
+
+  // Copies cached kernels to weight [K], d_error [K] and d_params [4 x K]
+  // buffers (K = kernel_h * kernel_w). Returns false if key is not cached.
+  bool get(const DAUKernelCacheKey& key, Dtype* weight, Dtype* d_error,
+      Dtype* d_params, bool is_gpu_ptr);
+
+  // Stores copy of kernels in cache and evicts least recently used entries.
+  void put(const DAUKernelCacheKey& key, const Dtype* weight,
+      const Dtype* d_error, const Dtype* d_params, bool is_gpu_ptr);
+
+  void clear();
+  void set_capacity(int capacity);
+
+  int size();
+  long num_hits() const { return num_hits_; }
+  long num_misses() const { return num_misses_; }
+
+ private:
+  struct Entry {
+    DAUKernelCacheKey key;
+    std::vector<Dtype> weight, d_error, d_params;
+  };
+
+  void evict();
+
+  int capacity_;
+  long num_hits_, num_misses_;
+
+  // most recently used entries are at the front
+  std::list<Entry> entries_;
+  std::map<DAUKernelCacheKey, typename std::list<Entry>::iterator> index_;
+
+  std::mutex mutex_;
+};
+
+}  // namespace DAUConvNet
+
+#endif  // DAU_CONV_UTIL_KERNEL_CACHE_HPP
@@ -0,0 +1,97 @@
+#ifndef DAU_CONV_UTIL_PROFILER_HPP
+#define DAU_CONV_UTIL_PROFILER_HPP
+
+#include <atomic>
+#include <chrono>
+#include <map>
+#include <mutex>
+#include <string>
+#include <vector>
+
+namespace DAUConvNet {
+
+// Phases of DAU convolution that are measured separately by DAUConvProfiler.
+enum DAUConvPhase {
+  DAU_PHASE_WORKSPACE_SETUP = 0,
+  DAU_PHASE_KERNEL_PREP,
+  DAU_PHASE_FWD_BLUR,
+  DAU_PHASE_FWD_OFFSET_SUM,
+  DAU_PHASE_FWD_BLUR_OFFSET_SUM,
+  DAU_PHASE_FWD_BIAS,
+  DAU_PHASE_BWD_BLUR_ERROR,
+  DAU_PHASE_BWD_BACKPROP_ERROR,
+  DAU_PHASE_BWD_BLUR_INPUT,
+  DAU_PHASE_BWD_OFFSET_DOT,
+  DAU_PHASE_BWD_BIAS,
+  DAU_NUM_PHASES
+};
+
+const char* get_dau_conv_phase_name(int phase);
+
+// Accumulated wall-time (in ms), number of bytes read/written (or allocated
+// for workspace) and number of calls for each phase of a single layer.
+struct DAUConvProfile {
+  double time_ms[DAU_NUM_PHASES];
+  long bytes[DAU_NUM_PHASES];
+  long calls[DAU_NUM_PHASES];
+
+  DAUConvProfile() { reset(); }
+  void reset();
+};
+
+// Process-wide collection of per-layer profiles. Profiling is disabled by
+// default (or enabled with DAU_CONV_PROFILE=1 environment variable) and can be
+// switched on/off at runtime; when disabled, phases are not timed at all.
+// Only CPU processing is profiled: GPU work is launched asynchronously, so
+// host wall-time of its phases would measure only the launches.
+class DAUConvProfiler {
+ public:
+  DAUConvProfiler();
+
+  static DAUConvProfiler& get_instance();
+
+  bool is_enabled() const { return enabled_.load(std::memory_order_relaxed); }
+  void set_enabled(bool enabled) { enabled_.store(enabled); }
+
+  void add(const std::string& layer_name, int phase, double time_ms,
+      long bytes);
+
+  // Copies names and profiles of all layers measured so far.
+  void get_profiles(std::vector<std::string>* layer_names,
+      std::vector<DAUConvProfile>* profiles);
+
+  void reset();
+
+ private:
+  std::atomic<bool> enabled_;
+
+  std::map<std::string, DAUConvProfile> profiles_;
+
+  std::mutex mutex_;
+};
+
+// Measures consecutive phases of a layer: start() begins timing of a phase and
+// stop() adds its time to DAUConvProfiler (nothing is done when disabled or
+// when timer is not enabled, e.g. for layers processing on GPU).
+class DAUConvPhaseTimer {
+ public:
+  explicit DAUConvPhaseTimer(const std::string& layer_name,
+      bool enabled = true)
+      : layer_name_(layer_name), enabled_(enabled), phase_(-1) {}
+
+  ~DAUConvPhaseTimer() { stop(); }
+
+  void start(int phase, long bytes = 0);
+  void stop();
+
+ private:
+  const std::string& layer_name_;
+  bool enabled_;
+  int phase_;
+  long bytes_;
+  std::chrono::steady_clock::time_point start_time_;
+};
+
+}  // namespace DAUConvNet
+
+#endif  // DAU_CONV_UTIL_PROFILER_HPP
@@ -0,0 +1,34 @@
+#ifndef DAU_CONV_UTIL_SEPARABLE_CONV_HPP
+#define DAU_CONV_UTIL_SEPARABLE_CONV_HPP
+
+namespace DAUConvNet {
+
+// Factorizes [kernel_h x kernel_w] kernel into kernel_col [kernel_h] and
+// kernel_row [kernel_w] such that kernel[i][j] = kernel_col[i] * kernel_row[j].
+// Returns false if kernel is not separable within tolerance (relative to the
+// largest absolute kernel value).
+template <typename Dtype>
+bool separable_kernel_factors_cpu(const Dtype* kernel, const int kernel_h,
+    const int kernel_w, Dtype* kernel_col, Dtype* kernel_row,
+    const Dtype tolerance = 1e-5);
+
+// Correlates single [height x width] image with separable kernel using zero
+// padding i.e., produces the same [height_out x width_out] output as
+// im2col_cpu + gemm with kernel_col * kernel_row^T kernel (stride=1,
+// dilation=1). Requires buffer of size [width] for intermediate row results.
+// Input pixels are data_im_step values apart (use number of channels to read
+// a single channel of HWC data), while output is always contiguous.
+// With data_im_upsample > 1 the input is treated as [height x width] image with
+// zeros inserted between stored pixels, i.e. only every data_im_upsample-th
+// row and column is stored (as produced by strided convolution).
+template <typename Dtype>
+void separable_conv2d_cpu(const Dtype* data_im, const int height,
+    const int width, const Dtype* kernel_col, const int kernel_h,
+    const Dtype* kernel_row, const int kernel_w, const int pad_h,
+    const int pad_w, const int height_out, const int width_out,
+    Dtype* row_buffer, Dtype* data_out, const int data_im_step = 1,
+    const int data_im_upsample = 1);
+
+}  // namespace DAUConvNet
+
+#endif  // DAU_CONV_UTIL_SEPARABLE_CONV_HPP
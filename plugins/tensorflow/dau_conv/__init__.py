@@ -1 +1,9 @@
-from .dau_conv import *
+# numpy_engine (and benchmark/autotune of its engine) do not need Tensorflow, so the package stays importable on
+# hosts without it; layers and ops are exported only when Tensorflow is available
+try:
+    import tensorflow as _tensorflow
+except ImportError:
+    _tensorflow = None
+
+if _tensorflow is not None:
+    from .dau_conv import *
@@ -2,12 +2,24 @@
 
 import tensorflow as tf
 from tensorflow.python.framework import ops
+from tensorflow.python.ops import array_ops
+from tensorflow.python.util import compat
 
 dau_conv_grad_module = tf.load_op_library('libdau_conv_grad_op.so')
 
 
 @ops.RegisterGradient("DAUConv")
-def _dau_conv_op_grad_cc(op, grad):
+def _dau_conv_op_grad_cc(op, grad, _):
+    # blurred input (second output) is only passed to DAUConvGrad, so its gradient is ignored
+    # layers with offsets larger than supported by CUDA kernels are placed on CPU (see DAUConv2d.MAX_GPU_KERNEL_SIZE)
+    # and their gradients must be computed on the same device (imported here since dau_conv imports this module)
+    from .dau_conv import DAUConv2d
+    if op.get_attr("kernel_size") > DAUConv2d.MAX_GPU_KERNEL_SIZE:
+        with ops.device(op.device):
+            return _dau_conv_grad(op, grad)
+    return _dau_conv_grad(op, grad)
+
+def _dau_conv_grad(op, grad):
     # Op is the Op object - get all the inputs
     # Grad is the gradient with respect to the first input
     number_units_x = op.get_attr("number_units_x")
@@ -23,13 +35,33 @@ def _dau_conv_op_grad_cc(op, grad):
     sigma_iteration_step = op.get_attr("sigma_iteration_step")
     component_border_bound = op.get_attr("component_border_bound")
     sigma_lower_bound = op.get_attr("sigma_lower_bound")
-    merge_iteration_step = op.get_attr("merge_iteration_step")
-    merge_threshold = op.get_attr("merge_threshold")
     unit_testing = op.get_attr("unit_testing")
     mu_learning_rate_factor = op.get_attr("mu_learning_rate_factor")
+    num_cpu_threads = op.get_attr("num_cpu_threads")
+    data_format = op.get_attr("data_format")
+    # collect timings of backward pass under the same name as forward pass
+    profile_name = op.get_attr("profile_name") or op.name
+    blur_method = op.get_attr("blur_method")
+    bias_term = op.get_attr("bias_term")
+    activation = op.get_attr("activation")
+    leaky_relu_alpha = op.get_attr("leaky_relu_alpha")
+    # skipped gradients are returned as None (gradient of sigma is never computed and gradient of bias only when bias
+    # is fused into the op)
+    compute_grads = [op.get_attr("compute_grad_input"), op.get_attr("compute_grad_weights"),
+                     op.get_attr("compute_grad_mu1"), op.get_attr("compute_grad_mu2"), False,
+                     bias_term and op.get_attr("compute_grad_bias")]
+
+    if not any(compute_grads):
+        return [None] * len(compute_grads)
 
+    # input blurred by forward pass replaces one blur of the input and activated output is needed for derivative of
+    # activation; outputs of forward pass are passed only when used, so that the gradient op does not depend on the
+    # forward op otherwise
+    blurred_input = op.outputs[1] if op.get_attr("save_blurred_input") else array_ops.zeros([0])
+    output = op.outputs[0] if compat.as_str(activation) != 'none' else array_ops.zeros([0])
 
-    return dau_conv_grad_module.dau_conv_grad(grad, op.inputs[0], op.inputs[1], op.inputs[2], op.inputs[3], op.inputs[4],
+    grads = dau_conv_grad_module.dau_conv_grad(grad, op.inputs[0], op.inputs[1], op.inputs[2], op.inputs[3], op.inputs[4],
+                                            op.inputs[5], blurred_input, output,
                                             number_units_x=number_units_x,
                                             number_units_y=number_units_y,
                                             number_units_ignore=number_units_ignore,
@@ -43,7 +75,19 @@ def _dau_conv_op_grad_cc(op, grad):
                                             sigma_iteration_step=sigma_iteration_step,
                                             component_border_bound=component_border_bound,
                                             sigma_lower_bound=sigma_lower_bound,
-                                            merge_iteration_step=merge_iteration_step,
-                                            merge_threshold=merge_threshold,
                                             mu_learning_rate_factor=mu_learning_rate_factor,
+                                            num_cpu_threads=num_cpu_threads,
+                                            data_format=data_format,
+                                            profile_name=profile_name,
+                                            blur_method=blur_method,
+                                            bias_term=bias_term,
+                                            activation=activation,
+                                            leaky_relu_alpha=leaky_relu_alpha,
+                                            compute_grad_input=compute_grads[0],
+                                            compute_grad_weights=compute_grads[1],
+                                            compute_grad_mu1=compute_grads[2],
+                                            compute_grad_mu2=compute_grads[3],
+                                            compute_grad_bias=compute_grads[5],
                                             unit_testing=unit_testing)
+
+    return [g if compute else None for g, compute in zip(grads, compute_grads)]
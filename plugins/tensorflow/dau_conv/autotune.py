@@ -0,0 +1,199 @@
+"""Selection of the execution engine of DAUConv2d layers.
+
+Two engines compute the same DAU convolution:
+  - 'dau': DAUConv/DAUConvGrad ops, i.e. blur of the input followed by the sparse offset-and-sum of units
+  - 'dense': dense kernel is built from DAU parameters in the graph and computed with tf.nn.conv2d (cost depends on
+             max_kernel_size but uses highly optimized convolution libraries)
+
+Which one is faster depends on the number of units, max_kernel_size, number of channels, image size and the device. With
+engine='auto' both engines are timed the first time a layer shape is seen and the faster one is used. Results are kept
+in memory and in an on-disk cache (JSON) keyed by host and layer shape so that later runs skip the timing:
+
+  DAU_CONV_AUTOTUNE_CACHE - path of the on-disk cache (default ~/.cache/dau_conv/autotune.json, empty to disable)
+  DAU_CONV_ENGINE         - overrides the engine of all layers that use engine='auto' or the default engine
+                            (same as set_engine_override())
+"""
+
+import json
+import os
+import platform
+import sys
+import tempfile
+
+from . import benchmark
+
+ENGINES = ['dau', 'dense']
+
+DEFAULT_ENGINE = 'dau'
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'dau_conv', 'autotune.json')
+
+_engine_override = None
+
+# on-disk cache loaded on first use as {cache_path: {host_key: {shape_key: entry}}}
+_caches = dict()
+
+def set_engine_override(engine):
+    """Forces engine ('dau' or 'dense') of all layers created with engine='auto' or with the default engine. Use None to
+    remove the override (DAU_CONV_ENGINE environment variable is then used if set)."""
+    global _engine_override
+    if engine is not None and engine not in ENGINES:
+        raise ValueError('Unknown DAUConv engine "%s" (available: %s)' % (engine, ', '.join(ENGINES)))
+    _engine_override = engine
+
+def get_engine_override():
+    """Returns engine set by set_engine_override() or DAU_CONV_ENGINE environment variable, or None if not set."""
+    if _engine_override is not None:
+        return _engine_override
+
+    engine = os.environ.get('DAU_CONV_ENGINE', '')
+    if engine == '' or engine == 'auto':
+        return None
+    if engine not in ENGINES:
+        raise ValueError('Unknown DAUConv engine "%s" in DAU_CONV_ENGINE (available: %s)' % (engine, ', '.join(ENGINES)))
+    return engine
+
+def get_cache_path():
+    return os.environ.get('DAU_CONV_AUTOTUNE_CACHE', DEFAULT_CACHE_PATH)
+
+def get_host_key():
+    return '%s/%s/%s' % (platform.node(), platform.machine(), platform.processor())
+
+def get_shape_key(config):
+    return 'N=%d,S=%d,F=%d,H=%d,W=%d,units=%s,kernel=%d,stride=%d,format=%s,device=%s,mode=%s' % \
+           (config['N'], config['S'], config['F'], config['H'], config['W'], 'x'.join(map(str, config['dau_units'])),
+            config['max_kernel_size'], config['stride'], config['data_format'], config['device'], config['mode'])
+
+def load_cache(path):
+    """Returns on-disk cache as {host_key: {shape_key: entry}} (empty if the file does not exist or is invalid)."""
+    if path not in _caches:
+        cache = dict()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    cache = json.load(f)
+            except (IOError, ValueError) as e:
+                print('WARNING: ignoring invalid DAUConv autotune cache %s (%s)' % (path, e), file=sys.stderr)
+        _caches[path] = cache
+    return _caches[path]
+
+def save_cache(path):
+    """Writes cache of path back to the disk (atomically, so that concurrent processes never see a partial file)."""
+    if not path:
+        return
+    try:
+        cache_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # merge with entries written by other processes since the cache was loaded
+        cache = dict()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    cache = json.load(f)
+            except (IOError, ValueError):
+                pass
+        for host_key, entries in _caches.get(path, dict()).items():
+            cache.setdefault(host_key, dict()).update(entries)
+
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except (IOError, OSError) as e:
+        print('WARNING: unable to save DAUConv autotune cache %s (%s)' % (path, e), file=sys.stderr)
+
+def clear_cache(path=None):
+    """Drops in-memory cache of path (or of all paths) so that it is re-loaded from the disk on next use."""
+    if path is None:
+        _caches.clear()
+    else:
+        _caches.pop(path, None)
+
+def time_engines(config, engines=ENGINES, num_warmup=2, num_repeat=5):
+    """Times forward pass (and backward pass if config['mode'] is 'train') of DAUConv2d with each engine on random
+    inputs in a separate graph. Returns {engine: mean time in seconds}."""
+    import numpy as np
+    import tensorflow as tf
+    from .dau_conv import DAUConv2d
+
+    N, S, H, W = config['N'], config['S'], config['H'], config['W']
+
+    channels_first = config['data_format'] == 'NCHW'
+    input_shape = (N, S, H, W) if channels_first else (N, H, W, S)
+
+    timings = dict()
+    for engine in engines:
+        graph = tf.Graph()
+        with graph.as_default(), tf.device(config.get('device_name') or None):
+            # input is kept in variable to avoid measuring copies of feed_dict
+            x = tf.Variable(np.float32(np.random.rand(*input_shape)), trainable=False)
+
+            op = DAUConv2d(filters=config['F'],
+                           dau_units=tuple(config['dau_units']),
+                           max_kernel_size=config['max_kernel_size'],
+                           strides=config['stride'],
+                           data_format='channels_first' if channels_first else 'channels_last',
+                           use_bias=False,
+                           engine=engine)
+            result = op(x)
+
+            fetches = [result]
+            if config['mode'] == 'train':
+                fetches += tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2])
+
+            init = tf.global_variables_initializer()
+
+        with tf.Session(graph=graph, config=tf.ConfigProto(allow_soft_placement=True)) as s:
+            s.run(init)
+
+            # fetch only operations (not tensors) so that copying of outputs back to NumPy is not measured
+            fetch_ops = [f.op for f in fetches]
+            timings[engine] = benchmark.time_function(lambda: s.run(fetch_ops), num_warmup, num_repeat)['mean']
+
+    return timings
+
+def select_engine(config, cache_path=None, time_fn=time_engines, verbose=True):
+    """Returns the faster engine for layer config (dict as returned by DAUConv2d.get_autotune_config()). Engines are
+    timed with time_fn(config) only if the shape was not seen before on this host, and the result is stored in the
+    cache of cache_path (default get_cache_path())."""
+    if cache_path is None:
+        cache_path = get_cache_path()
+
+    host_cache = load_cache(cache_path).setdefault(get_host_key(), dict())
+
+    shape_key = get_shape_key(config)
+
+    entry = host_cache.get(shape_key)
+    if entry is None or entry.get('engine') not in ENGINES:
+        timings = time_fn(config)
+
+        entry = dict(engine=min(timings, key=timings.get), timings=timings)
+        host_cache[shape_key] = entry
+
+        save_cache(cache_path)
+
+        if verbose:
+            print('DAUConv autotune %s: %s (%s)' % (shape_key, entry['engine'],
+                                                     ', '.join('%s %.2f ms' % (e, 1000 * t)
+                                                               for e, t in sorted(timings.items()))))
+    return entry['engine']
+
+def resolve_engine(engine, config=None, **kwargs):
+    """Returns the engine used by a layer created with engine argument:
+      - None: engine override if set, otherwise DEFAULT_ENGINE
+      - 'auto': engine override if set, otherwise select_engine(config) (or DEFAULT_ENGINE if config is None, e.g.
+                when shape of the layer is not fully known)
+      - 'dau' or 'dense': the same engine"""
+    if engine is None or engine == 'auto':
+        override = get_engine_override()
+        if override is not None:
+            return override
+        if engine is None or config is None:
+            return DEFAULT_ENGINE
+        return select_engine(config, **kwargs)
+
+    if engine not in ENGINES:
+        raise ValueError('Unknown DAUConv engine "%s" (available: auto, %s)' % (engine, ', '.join(ENGINES)))
+    return engine
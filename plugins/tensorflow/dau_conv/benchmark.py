@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""Benchmark of DAU convolution engines over a matrix of layer shapes.
+
+For each combination of batch size (N), input channels (S), output channels (F), image size (H,W), number of DAU
+units and max kernel size, the forward and the backward pass of each selected engine are timed after warm-up over
+repeated runs:
+  - 'cpu': DAUConv2d with CPU kernels of the DAUConv/DAUConvGrad ops (Tensorflow session, pre-initialized variables),
+           including timings of individual phases as reported by the built-in profiler of the ops
+  - 'numpy': vectorized NumPy engine (numpy_engine.py), including timings of individual phases
+  - 'dense': inference with DAU parameters frozen into a dense kernel (numpy_engine.get_dense_kernel) and computed
+             with tf.nn.conv2d on CPU, including time to compile the kernel and its error against the NumPy engine
+             (forward pass only)
+
+Each shape is also timed with tf.nn.conv2d on CPU using a dense kernel of max_kernel_size (i.e. the same receptive
+field) as the baseline. Results are written as JSON so that timings of different commits can be compared:
+
+  python -m dau_conv.benchmark --output results.json
+  python -m dau_conv.benchmark --output results_new.json --compare results.json
+
+With --blur-crossover, pre-filtering (blur) with direct convolution is compared to FFT over a range of sigmas
+(i.e. kernel sizes of 2*ceil(5*sigma)+1), for the separable gaussian and for the non-separable derivative w.r.t. sigma
+in the 'numpy' engine, and for the forward and backward pass of DAUConv2d with blur_method='direct'/'fft' in the 'cpu'
+engine. The smallest kernel size from which FFT is faster is reported as the crossover, which is where blur_method='auto'
+should switch to FFT (FFT_BLUR_MIN_KERNEL_SIZE* in numpy_engine.py and in base_dau_conv_layer.hpp):
+
+  python -m dau_conv.benchmark --blur-crossover --engines numpy,cpu --output crossover.json
+
+With --pruning, the forward pass is timed after magnitude pruning of units to a range of sparsities, in the 'numpy'
+engine with the sparse list of surviving units (numpy_engine.forward_sparse) and in the 'cpu' engine with pruned
+weights of DAUConv2d (DAUConv2d.prune_units), and reported as speedup over the same engine without pruning:
+
+  python -m dau_conv.benchmark --pruning --engines numpy,cpu --output pruning.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from . import numpy_engine
+
+ENGINES = ['cpu', 'numpy', 'dense']
+
+DEFAULT_SHAPE_MATRIX = dict(N=[16],
+                            S=[32, 64],
+                            F=[32, 64],
+                            HW=[(32, 32), (64, 64)],
+                            dau_units=[(2, 2), (3, 3)],
+                            max_kernel_size=[9, 17])
+
+QUICK_SHAPE_MATRIX = dict(N=[4],
+                          S=[16],
+                          F=[16],
+                          HW=[(32, 32)],
+                          dau_units=[(2, 2)],
+                          max_kernel_size=[9])
+
+def get_shape_matrix(N, S, F, HW, dau_units, max_kernel_size):
+    """Returns list of benchmark configurations (dicts) for all combinations of the given values."""
+    configs = []
+    for n, s, f, (h, w), units, kernel_size in itertools.product(N, S, F, HW, dau_units, max_kernel_size):
+        configs.append(dict(N=n, S=s, F=f, H=h, W=w, dau_units=list(units), max_kernel_size=kernel_size))
+    return configs
+
+def time_function(fn, num_warmup=2, num_repeat=10):
+    """Calls fn() num_warmup times without measuring and then num_repeat times measuring wall-time of each call.
+    Returns dict with statistics in seconds."""
+    for _ in range(num_warmup):
+        fn()
+
+    times = []
+    for _ in range(num_repeat):
+        t_start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t_start)
+
+    times = np.array(times)
+
+    return dict(mean=float(np.mean(times)),
+                std=float(np.std(times)),
+                min=float(np.min(times)),
+                median=float(np.median(times)),
+                num_repeat=num_repeat)
+
+def _get_random_inputs(config, seed=0):
+    rng = np.random.RandomState(seed)
+
+    N, S, F, H, W = config['N'], config['S'], config['F'], config['H'], config['W']
+    G = int(np.prod(config['dau_units']))
+
+    max_offset = config['max_kernel_size'] // 2 - 1
+
+    x = np.float32(rng.rand(N, S, H, W))
+    error = np.float32(rng.normal(0, 1, (N, F, H, W)))
+    w = np.float32(rng.normal(0, 0.1, (1, S, G, F)))
+    mu1 = np.float32(rng.uniform(-max_offset, max_offset, (1, S, G, F)))
+    mu2 = np.float32(rng.uniform(-max_offset, max_offset, (1, S, G, F)))
+
+    return x, error, w, mu1, mu2
+
+def benchmark_numpy_engine(config, sigma=0.5, num_warmup=2, num_repeat=10):
+    """Times forward/backward pass of the NumPy engine together with its individual phases."""
+    x, error, w, mu1, mu2 = _get_random_inputs(config)
+
+    kernel_size = 2 * int(np.ceil(5 * sigma)) + 1
+
+    filter, deriv_w, deriv_mu1, deriv_mu2, _ = numpy_engine.get_filters(sigma, kernel_size)
+
+    shifts, tap_index, tap_weight = numpy_engine.get_unit_taps(mu1, mu2)
+    coeffs = numpy_engine.get_shift_coefficients(w, tap_index, tap_weight, len(shifts))
+
+    x_blur = numpy_engine.blur(x, filter, 'auto')
+    error_blur = numpy_engine.blur(error, filter, 'auto')
+    x_deriv_blur = np.stack([numpy_engine.blur(x, k, 'auto') for k in [deriv_w, deriv_mu1, deriv_mu2]])
+
+    def unit_setup():
+        shifts, tap_index, tap_weight = numpy_engine.get_unit_taps(mu1, mu2)
+        numpy_engine.get_shift_coefficients(w, tap_index, tap_weight, len(shifts))
+
+    phases = dict(
+        # forward pass
+        unit_setup=unit_setup,
+        blur=lambda: numpy_engine.blur(x, filter, 'auto'),
+        offset_and_sum=lambda: numpy_engine.shift_and_sum(x_blur, shifts, coeffs),
+        # backward pass
+        blur_error=lambda: numpy_engine.blur(error, filter, 'auto'),
+        backprop_error=lambda: numpy_engine.shift_and_sum(error_blur, -1 * shifts, np.swapaxes(coeffs, 1, 2)),
+        blur_derivatives=lambda: [numpy_engine.blur(x, k, 'auto') for k in [deriv_w, deriv_mu1, deriv_mu2]],
+        offset_and_dot=lambda: numpy_engine.shift_and_dot(x_deriv_blur, error, shifts),
+    )
+
+    forward = lambda: numpy_engine.forward(x, w, mu1, mu2, sigma, kernel_size=kernel_size)
+    backward = lambda: numpy_engine.backward(x, error, w, mu1, mu2, sigma, ignore_edge_gradients=False,
+                                             kernel_size=kernel_size)
+
+    return dict(forward=time_function(forward, num_warmup, num_repeat),
+                backward=time_function(backward, num_warmup, num_repeat),
+                phases={name: time_function(fn, num_warmup, num_repeat) for name, fn in phases.items()})
+
+def benchmark_numpy_blur(config, sigma, num_warmup=2, num_repeat=10):
+    """Times numpy_engine.blur() of input with gaussian kernel (separable) and with its derivative w.r.t. sigma
+    (non-separable) using each blur method."""
+    x, _, _, _, _ = _get_random_inputs(config)
+
+    filter, _, _, _, deriv_sigma = numpy_engine.get_filters(sigma)
+
+    kernels = dict(separable=filter, nonseparable=deriv_sigma)
+
+    return {name: {method: time_function(lambda: numpy_engine.blur(x, kernel, method), num_warmup, num_repeat)
+                   for method in ['direct', 'fft']}
+            for name, kernel in kernels.items()}
+
+def benchmark_cpu_blur(config, sigma, num_warmup=2, num_repeat=10):
+    """Times DAUConv2d forward pass (blurs with separable gaussian) and backward pass (blurs also with non-separable
+    derivative w.r.t. sigma) with CPU kernels of the ops using each blur method. Whole passes are compared since the
+    direct blur of forward pass is fused with offset-and-sum."""
+    timings = dict(separable=dict(), nonseparable=dict())
+
+    for method in ['direct', 'fft']:
+        result = benchmark_cpu_engine(config, sigma, num_warmup, num_repeat, blur_method=method)
+
+        timings['separable'][method] = result['forward']
+        timings['nonseparable'][method] = result['backward']
+    return timings
+
+BLUR_BENCHMARK_FUNCTIONS = dict(cpu=benchmark_cpu_blur,
+                                numpy=benchmark_numpy_blur)
+
+DEFAULT_BLUR_SIGMAS = [0.5, 1, 1.5, 2, 3, 4, 6, 8, 10]
+
+def run_blur_crossover(config, engines, sigmas=DEFAULT_BLUR_SIGMAS, num_warmup=2, num_repeat=10, verbose=True):
+    """Times direct and FFT blur of each engine for all sigmas. Returns list of results, one for each (engine, sigma)
+    pair, with 'fft_speedup' of each kernel type."""
+    results = []
+    for engine in engines:
+        for sigma in sigmas:
+            timings = BLUR_BENCHMARK_FUNCTIONS[engine](config, sigma, num_warmup=num_warmup, num_repeat=num_repeat)
+
+            result = dict(config=config, engine=engine, sigma=sigma, kernel_size=2 * int(np.ceil(5 * sigma)) + 1)
+            result.update(timings)
+            result['fft_speedup'] = {name: t['direct']['mean'] / t['fft']['mean'] for name, t in timings.items()
+                                     if t.get('direct') and t.get('fft')}
+            results.append(result)
+
+            if verbose:
+                print('%-6s sigma=%g kernel=%d: %s' % (engine, sigma, result['kernel_size'],
+                                                       ', '.join('%s fft %.2fx' % (name, speedup) for name, speedup
+                                                                 in sorted(result['fft_speedup'].items()))))
+                sys.stdout.flush()
+    return results
+
+def get_blur_crossover(results, engine, kernel_type):
+    """Returns the smallest kernel size from which FFT blur of kernel_type ('separable' or 'nonseparable') is faster
+    than the direct one for all larger measured kernels of engine, or None if FFT is slower for the largest one."""
+    speedups = sorted((r['kernel_size'], r['fft_speedup'][kernel_type]) for r in results
+                      if r['engine'] == engine and kernel_type in r['fft_speedup'])
+    crossover = None
+    for kernel_size, speedup in reversed(speedups):
+        if speedup <= 1:
+            break
+        crossover = kernel_size
+    return crossover
+
+def _time_session_run(session, fetches, num_warmup, num_repeat):
+    # fetch only operations (not tensors) so that copying of outputs back to NumPy is not measured
+    ops = [f.op if hasattr(f, 'op') else f for f in fetches]
+    return time_function(lambda: session.run(ops), num_warmup, num_repeat)
+
+def benchmark_cpu_engine(config, sigma=0.5, num_warmup=2, num_repeat=10, blur_method='auto'):
+    """Times forward/backward pass of DAUConv2d with the CPU kernels of DAUConv/DAUConvGrad ops. Phases are timed in
+    separate runs with profiling enabled so that profiling does not affect forward/backward timings."""
+    import tensorflow as tf
+    from .dau_conv import DAUConv2d, dau_conv_set_profiling, dau_conv_profile, parse_dau_conv_profile
+
+    x_val, error_val, _, _, _ = _get_random_inputs(config)
+
+    graph = tf.Graph()
+    with graph.as_default(), tf.device('/cpu:0'):
+        # inputs are kept in variables to avoid measuring copies of feed_dict
+        x = tf.Variable(x_val, trainable=False)
+        error = tf.Variable(error_val, trainable=False)
+
+        op = DAUConv2d(filters=config['F'],
+                       dau_units=tuple(config['dau_units']),
+                       max_kernel_size=config['max_kernel_size'],
+                       use_bias=False,
+                       sigma_initializer=tf.constant_initializer(sigma),
+                       engine='dau',
+                       blur_method=blur_method)
+
+        result = op(x)
+
+        # gradient op depends only on error and inputs (outputs of forward pass are used only with activation or
+        # save_blurred_input) so forward pass is not re-computed
+        grads = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2], grad_ys=error)
+
+        init = tf.global_variables_initializer()
+
+        enable_profiling = dau_conv_set_profiling(True)
+        disable_profiling = dau_conv_set_profiling(False)
+        profile = dau_conv_profile(reset=True)
+
+    with tf.Session(graph=graph) as s:
+        s.run(init)
+
+        timings = dict(forward=_time_session_run(s, [result], num_warmup, num_repeat),
+                       backward=_time_session_run(s, grads, num_warmup, num_repeat))
+
+        s.run([enable_profiling, profile])
+        for _ in range(num_repeat):
+            s.run([result.op] + [g.op for g in grads])
+        s.run(disable_profiling)
+
+        layer_profile = op.get_profile(parse_dau_conv_profile(s.run(profile))) or dict()
+
+    timings['phases'] = {phase: dict(mean=p['time_ms'] / p['calls'] / 1000.0,
+                                     bytes=p['bytes'] // p['calls'],
+                                     num_repeat=p['calls'])
+                         for phase, p in layer_profile.items()}
+    return timings
+
+def benchmark_conv2d(config, num_warmup=2, num_repeat=10):
+    """Times tf.nn.conv2d (and its gradients) on CPU with a dense [max_kernel_size x max_kernel_size] kernel."""
+    import tensorflow as tf
+
+    x_val, error_val, _, _, _ = _get_random_inputs(config)
+
+    # CPU version of tf.nn.conv2d supports only NHWC
+    x_val = np.transpose(x_val, (0, 2, 3, 1))
+    error_val = np.transpose(error_val, (0, 2, 3, 1))
+
+    k = config['max_kernel_size']
+
+    graph = tf.Graph()
+    with graph.as_default(), tf.device('/cpu:0'):
+        x = tf.Variable(x_val, trainable=False)
+        error = tf.Variable(error_val, trainable=False)
+        kernel = tf.Variable(tf.random_normal([k, k, config['S'], config['F']], stddev=0.1))
+
+        result = tf.nn.conv2d(x, kernel, strides=[1, 1, 1, 1], padding='SAME', data_format='NHWC')
+
+        grads = tf.gradients(result, [x, kernel], grad_ys=error)
+
+        init = tf.global_variables_initializer()
+
+    with tf.Session(graph=graph) as s:
+        s.run(init)
+
+        return dict(forward=_time_session_run(s, [result], num_warmup, num_repeat),
+                    backward=_time_session_run(s, grads, num_warmup, num_repeat))
+
+def benchmark_dense_engine(config, sigma=0.5, num_warmup=2, num_repeat=10):
+    """Times inference of DAU convolution frozen into a dense [F, S, K, K] kernel and computed with tf.nn.conv2d on CPU.
+    Compiling of the dense kernel is timed as 'freeze' phase, and the largest absolute difference to the forward pass of
+    the NumPy engine (excluding border where the dense kernel blurs zero padding into the input) as max_error."""
+    import tensorflow as tf
+
+    x_val, _, w, mu1, mu2 = _get_random_inputs(config)
+
+    dense_kernel = numpy_engine.get_dense_kernel(w, mu1, mu2, sigma)
+
+    fwd_vals = numpy_engine.forward(x_val, w, mu1, mu2, sigma)
+
+    graph = tf.Graph()
+    with graph.as_default(), tf.device('/cpu:0'):
+        # CPU version of tf.nn.conv2d supports only NHWC
+        x = tf.Variable(np.transpose(x_val, (0, 2, 3, 1)), trainable=False)
+        kernel = tf.constant(np.transpose(dense_kernel, (2, 3, 1, 0)))
+
+        result = tf.nn.conv2d(x, kernel, strides=[1, 1, 1, 1], padding='SAME', data_format='NHWC')
+
+        init = tf.global_variables_initializer()
+
+    with tf.Session(graph=graph) as s:
+        s.run(init)
+
+        timings = dict(forward=_time_session_run(s, [result], num_warmup, num_repeat))
+
+        dense_vals = np.transpose(s.run(result), (0, 3, 1, 2))
+
+    border = dense_kernel.shape[-1] // 2
+
+    timings['phases'] = dict(freeze=time_function(lambda: numpy_engine.get_dense_kernel(w, mu1, mu2, sigma),
+                                                  num_warmup, num_repeat))
+    timings['dense_kernel_size'] = int(dense_kernel.shape[-1])
+    timings['max_error'] = float(np.max(np.abs(dense_vals - fwd_vals)[:, :, border:-border, border:-border]))
+
+    return timings
+
+def benchmark_numpy_pruning(config, sparsities, sigma=0.5, num_warmup=2, num_repeat=10):
+    """Times forward pass of the NumPy engine with all units in the dense [1, S, G, F] layout and with units pruned to
+    each sparsity and stored as a sparse list (numpy_engine.forward_sparse()). Returns (unpruned timing, list of
+    (sparsity, number of units, timing))."""
+    x, _, w, mu1, mu2 = _get_random_inputs(config)
+
+    unpruned = time_function(lambda: numpy_engine.forward(x, w, mu1, mu2, sigma), num_warmup, num_repeat)
+
+    pruned = []
+    for sparsity in sparsities:
+        units = numpy_engine.prune_units(w, mu1, mu2, sparsity=sparsity)
+        timing = time_function(lambda: numpy_engine.forward_sparse(x, units, config['F'], sigma), num_warmup, num_repeat)
+        pruned.append((sparsity, len(units[0]), timing))
+
+    return unpruned, pruned
+
+def benchmark_cpu_pruning(config, sparsities, sigma=0.5, num_warmup=2, num_repeat=10):
+    """Times forward pass of DAUConv2d with the CPU kernel of the DAUConv op before and after pruning the layer to each
+    sparsity with DAUConv2d.prune_units(). Returns the same as benchmark_numpy_pruning()."""
+    import tensorflow as tf
+    from .dau_conv import DAUConv2d
+
+    x_val, _, w, mu1, mu2 = _get_random_inputs(config)
+
+    graph = tf.Graph()
+    with graph.as_default(), tf.device('/cpu:0'):
+        x = tf.Variable(x_val, trainable=False)
+
+        op = DAUConv2d(filters=config['F'],
+                       dau_units=tuple(config['dau_units']),
+                       max_kernel_size=config['max_kernel_size'],
+                       use_bias=False,
+                       weight_initializer=tf.constant_initializer(w),
+                       mu1_initializer=tf.constant_initializer(mu1),
+                       mu2_initializer=tf.constant_initializer(mu2),
+                       sigma_initializer=tf.constant_initializer(sigma),
+                       engine='dau')
+
+        result = op(x)
+
+        init = tf.global_variables_initializer()
+
+    with tf.Session(graph=graph) as s:
+        s.run(init)
+
+        unpruned = _time_session_run(s, [result], num_warmup, num_repeat)
+
+        pruned = []
+        for sparsity in sparsities:
+            # every sparsity is pruned from the original weights
+            s.run(init)
+            units = op.prune_units(s, sparsity=sparsity)
+            pruned.append((sparsity, len(units[0]), _time_session_run(s, [result], num_warmup, num_repeat)))
+
+    return unpruned, pruned
+
+PRUNING_BENCHMARK_FUNCTIONS = dict(cpu=benchmark_cpu_pruning,
+                                   numpy=benchmark_numpy_pruning)
+
+DEFAULT_PRUNING_SPARSITIES = [0, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+def run_pruning_benchmark(config, engines, sparsities=DEFAULT_PRUNING_SPARSITIES, num_warmup=2, num_repeat=10,
+                          verbose=True):
+    """Times forward pass of each engine with units pruned to each sparsity. Returns list of results, one for each
+    (engine, sparsity) pair, with 'speedup' relative to the forward pass of the same engine without pruning."""
+    results = []
+    for engine in engines:
+        unpruned, pruned = PRUNING_BENCHMARK_FUNCTIONS[engine](config, sparsities, num_warmup=num_warmup,
+                                                               num_repeat=num_repeat)
+        for sparsity, num_units, timing in pruned:
+            result = dict(config=config, engine=engine, sparsity=sparsity, num_units=num_units, forward=timing,
+                          unpruned_forward=unpruned, speedup=unpruned['mean'] / timing['mean'])
+            results.append(result)
+
+            if verbose:
+                print('%-6s sparsity=%.2f units=%d: fwd %.2f ms (%.2fx)' % (engine, sparsity, num_units,
+                                                                           1000 * timing['mean'], result['speedup']))
+                sys.stdout.flush()
+    return results
+
+BENCHMARK_FUNCTIONS = dict(cpu=benchmark_cpu_engine,
+                           numpy=benchmark_numpy_engine,
+                           dense=benchmark_dense_engine)
+
+PASSES = ['forward', 'backward']
+
+PASS_LABELS = dict(forward='fwd', backward='bwd')
+
+def run_benchmarks(configs, engines=ENGINES, num_warmup=2, num_repeat=10, baseline=True, verbose=True):
+    """Runs selected engines (and tf.nn.conv2d baseline) for all configurations.
+    Returns list of results, one for each (config, engine) pair."""
+    results = []
+    for config in configs:
+        conv2d_timings = benchmark_conv2d(config, num_warmup, num_repeat) if baseline else None
+
+        for engine in engines:
+            timings = BENCHMARK_FUNCTIONS[engine](config, num_warmup=num_warmup, num_repeat=num_repeat)
+
+            result = dict(config=config, engine=engine)
+            result.update(timings)
+
+            if conv2d_timings is not None:
+                result['conv2d'] = conv2d_timings
+                result['speedup'] = {p: conv2d_timings[p]['mean'] / timings[p]['mean'] for p in PASSES if p in timings}
+
+            results.append(result)
+
+            if verbose:
+                print(format_result(result))
+                sys.stdout.flush()
+
+    return results
+
+def format_result(result):
+    c = result['config']
+    line = '%-6s N=%d S=%d F=%d H=%d W=%d units=%s kernel=%d: ' % \
+           (result['engine'], c['N'], c['S'], c['F'], c['H'], c['W'], 'x'.join(map(str, c['dau_units'])),
+            c['max_kernel_size'])
+    line += ', '.join('%s %.2f ms' % (PASS_LABELS[p], 1000 * result[p]['mean']) for p in PASSES if p in result)
+    if 'speedup' in result:
+        line += ' (vs. conv2d: %s)' % ', '.join('%s %.2fx' % (PASS_LABELS[p], result['speedup'][p])
+                                                 for p in PASSES if p in result['speedup'])
+    if 'max_error' in result:
+        line += ' (max error: %g)' % result['max_error']
+    return line
+
+def _get_result_key(result):
+    c = result['config']
+    return (result['engine'], c['N'], c['S'], c['F'], c['H'], c['W'], tuple(c['dau_units']), c['max_kernel_size'])
+
+def compare_results(old_results, new_results, threshold=0.1):
+    """Compares mean forward/backward timings of matching results (same engine and config).
+    Returns list of (result_key, pass_name, old_mean, new_mean) for all slowdowns larger than threshold (relative)."""
+    old_timings = {_get_result_key(r): r for r in old_results}
+
+    slowdowns = []
+    for r in new_results:
+        key = _get_result_key(r)
+        if key not in old_timings:
+            continue
+        for p in PASSES:
+            if p not in r or p not in old_timings[key]:
+                continue
+            old_mean, new_mean = old_timings[key][p]['mean'], r[p]['mean']
+            if new_mean > old_mean * (1 + threshold):
+                slowdowns.append((key, p, old_mean, new_mean))
+    return slowdowns
+
+def get_metadata():
+    metadata = dict(timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    python=platform.python_version(),
+                    numpy=np.__version__,
+                    machine=platform.machine(),
+                    processor=platform.processor())
+    try:
+        import tensorflow as tf
+        metadata['tensorflow'] = tf.__version__
+    except ImportError:
+        pass
+    return metadata
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of DAU convolution engines')
+    parser.add_argument('--output', default='dau_conv_benchmark.json', help='output JSON file')
+    parser.add_argument('--engines', default=','.join(ENGINES), help='comma separated list of engines')
+    parser.add_argument('--warmup', type=int, default=2, help='number of warm-up runs')
+    parser.add_argument('--repeat', type=int, default=10, help='number of measured runs')
+    parser.add_argument('--quick', action='store_true', help='use a single small shape')
+    parser.add_argument('--no-baseline', action='store_true', help='do not time tf.nn.conv2d')
+    parser.add_argument('--compare', default=None, help='JSON file of previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported by --compare')
+    parser.add_argument('--blur-crossover', action='store_true',
+                        help='time direct vs. FFT blur over a range of sigmas (cpu and numpy engines only)')
+    parser.add_argument('--pruning', action='store_true',
+                        help='time forward pass of pruned layers over a range of sparsities (cpu and numpy engines only)')
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(',')
+    for engine in engines:
+        if engine not in BENCHMARK_FUNCTIONS:
+            parser.error('unknown engine "%s" (available: %s)' % (engine, ', '.join(ENGINES)))
+
+    if args.blur_crossover:
+        engines = [engine for engine in engines if engine in BLUR_BENCHMARK_FUNCTIONS]
+
+        config = get_shape_matrix(**QUICK_SHAPE_MATRIX)[0]
+
+        results = run_blur_crossover(config, engines, num_warmup=args.warmup, num_repeat=args.repeat)
+
+        for engine in engines:
+            for kernel_type in ['separable', 'nonseparable']:
+                print('%-6s %s crossover: %s' % (engine, kernel_type, get_blur_crossover(results, engine, kernel_type)))
+
+        with open(args.output, 'w') as f:
+            json.dump(dict(metadata=get_metadata(), results=results), f, indent=2)
+        return 0
+
+    if args.pruning:
+        engines = [engine for engine in engines if engine in PRUNING_BENCHMARK_FUNCTIONS]
+
+        config = get_shape_matrix(**(QUICK_SHAPE_MATRIX if args.quick else DEFAULT_SHAPE_MATRIX))[0]
+
+        results = run_pruning_benchmark(config, engines, num_warmup=args.warmup, num_repeat=args.repeat)
+
+        with open(args.output, 'w') as f:
+            json.dump(dict(metadata=get_metadata(), results=results), f, indent=2)
+        return 0
+
+    configs = get_shape_matrix(**(QUICK_SHAPE_MATRIX if args.quick else DEFAULT_SHAPE_MATRIX))
+
+    results = run_benchmarks(configs, engines, num_warmup=args.warmup, num_repeat=args.repeat,
+                             baseline=not args.no_baseline)
+
+    with open(args.output, 'w') as f:
+        json.dump(dict(metadata=get_metadata(), results=results), f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old_results = json.load(f)['results']
+
+        slowdowns = compare_results(old_results, results, args.threshold)
+        for key, p, old_mean, new_mean in slowdowns:
+            print('SLOWDOWN %s %s: %.2f ms -> %.2f ms' % (key, p, 1000 * old_mean, 1000 * new_mean))
+
+        return 1 if len(slowdowns) > 0 else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
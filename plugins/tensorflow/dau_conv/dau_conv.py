@@ -11,8 +11,15 @@ from tensorflow.python.ops import nn_ops
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import nn
 from tensorflow.python.ops import init_ops
+from tensorflow.python.ops import math_ops
+from tensorflow.python.ops import variables
+from tensorflow.python.ops import state_ops
+from tensorflow.python.ops import script_ops
+from tensorflow.python.ops import control_flow_ops
 
 from ._dau_conv_grad_op import *
+from . import numpy_engine
+from . import autotune
 
 dau_conv_op_module = tf.load_op_library('libdau_conv_op.so')
 
@@ -105,6 +112,99 @@ class ZeroNLast(init_ops.Initializer):
         }
 
 
+def _scale_gradient(x, factor):
+    # identity in forward pass, but with gradient multiplied by factor
+    if factor == 1:
+        return x
+    return x + (x - array_ops.stop_gradient(x)) * (factor - 1)
+
+def _masked_constraint(constraint, mask):
+    # applies constraint and then zeroes units disabled in mask (optimizers apply constraints after each update)
+    def apply(x):
+        if constraint is not None:
+            x = constraint(x)
+        return x * mask
+    return apply
+
+# activations that the DAUConv op can apply to its output (on CPU) together with bias (see fused_bias_activation)
+_FUSED_ACTIVATIONS = {None: 'none', nn.relu: 'relu', nn.leaky_relu: 'leaky_relu'}
+
+def _is_gradient_needed(x):
+    # only variables that are not trainable (e.g. of frozen layers) are known not to need gradients, any other tensor
+    # may depend on trainable variables
+    if isinstance(x, variables.Variable):
+        return any(x is v for v in ops.get_collection(ops.GraphKeys.TRAINABLE_VARIABLES))
+    return True
+
+def _dense_kernel_from_dau_params(w, mu1, mu2, sigma, max_kernel_size, component_border_bound=1,
+                                  mu_learning_rate_factor=1, num_dau_units_ignore=0):
+    """Builds dense [K, K, S, F] kernel (as used by tf.nn.conv2d) from DAU parameters in [1, S, G, F] format with
+    differentiable ops, where K = 4*(max_kernel_size//2)+1 covers the blur kernel (truncated to max_kernel_size) placed
+    at any offset within the max_kernel_size bounds (offsets are clipped to those bounds as in the DAUConv op).
+
+    Gaussian blur as well as bilinear interpolation are separable, so the kernel of each unit is an outer product of
+    two 1D profiles (one for each axis) and all units are summed with a single batched matrix product."""
+    radius = max_kernel_size // 2
+    mu_bound = radius - component_border_bound
+
+    G = w.shape[2].value - num_dau_units_ignore
+
+    sigma = array_ops.reshape(sigma, [-1])[0]
+
+    # blur kernel support is 2*ceil(5*sigma)+1 as in C++ implementation (but at most max_kernel_size)
+    support = math_ops.minimum(math_ops.ceil(5 * sigma), radius)
+
+    def gauss(d):
+        return math_ops.exp(-1 * d**2 / (2 * sigma**2)) * math_ops.cast(math_ops.abs(d) <= support, d.dtype)
+
+    # normalization of 2D kernel is product of normalizations of 1D kernels
+    norm = math_ops.reduce_sum(gauss(math_ops.range(-radius, radius + 1, dtype=w.dtype)))
+
+    positions = math_ops.range(-2 * radius, 2 * radius + 1, dtype=w.dtype)
+
+    def unit_profiles(mu):
+        mu = _scale_gradient(math_ops.minimum(math_ops.maximum(mu[0, :, :G, :], -mu_bound), mu_bound),
+                             mu_learning_rate_factor)
+        mu_int = array_ops.stop_gradient(math_ops.floor(mu))
+        interpol_off = array_ops.expand_dims(mu - mu_int, -1)
+
+        d = positions - array_ops.expand_dims(mu_int, -1)
+
+        # [S, G, F, K] profile of gaussian at integer offset mu_int and mu_int+1 interpolated bilinearly
+        return ((1 - interpol_off) * gauss(d) + interpol_off * gauss(d - 1)) / norm
+
+    profile_x = unit_profiles(mu1)
+    profile_y = unit_profiles(mu2)
+
+    # kernel[s,f,y,x] = sum_g w[s,g,f] * profile_y[s,g,f,y] * profile_x[s,g,f,x]
+    weighted_y = array_ops.transpose(array_ops.expand_dims(w[0, :, :G, :], -1) * profile_y, [0, 2, 3, 1])
+    kernel = math_ops.matmul(weighted_y, array_ops.transpose(profile_x, [0, 2, 1, 3]))
+
+    return array_ops.transpose(kernel, [2, 3, 0, 1])
+
+def _dense_conv2d(inputs, kernel, strides, channels_first):
+    """Convolution of inputs with dense [K, K, S, F] kernel and zero padding of K//2, where output pixels are at the
+    same positions as in DAUConv op (i.e. sub-sampled output of stride=1, which 'SAME' padding does not guarantee
+    for stride > 1)."""
+    # CPU version of tf.nn.conv2d supports only NHWC
+    if channels_first:
+        inputs = array_ops.transpose(inputs, [0, 2, 3, 1])
+
+    if tuple(strides) == (1, 1):
+        padding = 'SAME'
+    else:
+        pad = kernel.shape[0].value // 2
+        inputs = array_ops.pad(inputs, [[0, 0], [pad, pad], [pad, pad], [0, 0]])
+        padding = 'VALID'
+
+    outputs = nn_ops.conv2d(inputs, kernel, strides=[1, strides[0], strides[1], 1], padding=padding,
+                            data_format='NHWC')
+
+    if channels_first:
+        outputs = array_ops.transpose(outputs, [0, 3, 1, 2])
+
+    return outputs
+
 class _DAUConvolution2d(object):
     """Helper class for _dau_convolution.
     Note that this class assumes that shapes of input and filter passed to
@@ -116,6 +216,25 @@ class _DAUConvolution2d(object):
       data_format: see _non_atrous_convolution.
       strides: see _non_atrous_convolution.
       name: see _non_atrous_convolution.
+      profile_name: name under which timings of this layer are collected when profiling is enabled (default is
+                    the name of the DAUConv op)
+      engine: 'dau' to compute with DAUConv op or 'dense' to compute with tf.nn.conv2d using dense kernel built from
+              DAU parameters (see autotune.py)
+      tile_memory_limit: bytes of blurred input that CPU forward pass of DAUConv op holds at once (0 for no limit);
+                         larger inputs are computed in tiles of images or strips of rows with identical output
+                         (used when fused_forward is False or the pre-filtering kernel cannot be fused, i.e. it is
+                         not separable or it is blurred with FFT)
+      fused_forward: CPU forward pass of DAUConv op blurs and sums bands of rows in a single pass without writing
+                     the whole blurred input to memory (identical output to the unfused version)
+      blur_method: pre-filtering of CPU forward and backward pass with 'direct' convolution or with 'fft' (cost
+                   independent of kernel size); 'auto' selects FFT only for kernels larger than the measured crossover
+      compute_input_gradient: DAUConvGrad op back-propagates error to the input (not needed e.g. for the first layer);
+                              gradients of w, mu1 and mu2 are computed only if they are not non-trainable variables
+                              (gradients that are not computed are None)
+      save_blurred_input: CPU forward pass of DAUConv op returns the whole blurred input as a hidden second output
+                          that DAUConvGrad op uses instead of blurring the input for the gradient of w again; the
+                          blurred input has the same size as the input (4 bytes per input value) and is held from the
+                          forward until the backward pass, and the forward pass is then neither fused nor tiled
     """
     def __init__(
             self,
@@ -129,10 +248,28 @@ class _DAUConvolution2d(object):
             num_dau_units_ignore=0,
             mu_learning_rate_factor=500,
             unit_testing=False,
-            name=None):
+            name=None,
+            profile_name=None,
+            engine='dau',
+            tile_memory_limit=0,
+            fused_forward=True,
+            blur_method='auto',
+            compute_input_gradient=True,
+            save_blurred_input=False):
+        if engine not in autotune.ENGINES:
+            raise ValueError('Unknown DAUConv engine "%s" (available: %s)' % (engine, ', '.join(autotune.ENGINES)))
+        self.engine = engine
         self.num_output = num_output
         self.padding = padding
         self.name = name
+        self.profile_name = profile_name
+        self.tile_memory_limit = tile_memory_limit
+        self.fused_forward = fused_forward
+        if blur_method not in numpy_engine.BLUR_METHODS:
+            raise ValueError('Unknown blur_method "%s" (available: %s)' % (blur_method, ', '.join(numpy_engine.BLUR_METHODS)))
+        self.blur_method = blur_method
+        self.compute_input_gradient = compute_input_gradient
+        self.save_blurred_input = save_blurred_input
         self.dau_units = dau_units
         self.num_dau_units_ignore = num_dau_units_ignore
         self.max_kernel_size = max_kernel_size
@@ -154,8 +291,10 @@ class _DAUConvolution2d(object):
             # not supported
             raise ValueError("One dimensional DAUConv not supported - only two dimensions supported.")
         elif conv_dims == 2:
+            # NHWC is handled natively by the op (CPU only), so no transposes are needed
             if data_format is None or data_format == "NHWC":
-                raise ValueError("data_format \"NHWC\" not supported - TODO: manually convert to NHWC.")
+                data_format = "NHWC"
+                strides = [1] + list(strides) + [1]
             elif data_format == "NCHW":
                 strides = [1, 1] + list(strides)
             else:
@@ -167,13 +306,24 @@ class _DAUConvolution2d(object):
             # not supported
             raise ValueError("Three dimensional DAUConv not supported - only two dimensions supported.")
 
-        # currently supporting only strides=1
-        if strides is not None and any(map(lambda x: x != 1, strides)):
-            raise ValueError("Only strides=1 supported.")
+        # op uses the same stride for both spatial dimensions
+        self.spatial_strides = strides[1:3] if data_format == "NHWC" else strides[2:4]
+        if self.spatial_strides[0] != self.spatial_strides[1]:
+            raise ValueError("Only equal strides in both spatial dimensions supported.")
 
     # pylint: enable=redefined-builtin
 
-    def __call__(self, inp, w, mu1, mu2, sigma):  # pylint: disable=redefined-builtin
+    def __call__(self, inp, w, mu1, mu2, sigma, bias=None, activation=None):  # pylint: disable=redefined-builtin
+        """Bias and activation (one of the keys of _FUSED_ACTIVATIONS) are applied by the DAUConv op (CPU only) in
+        the same pass as the output is written, and by the gradient of the op to the back-propagated error."""
+
+        if self.engine == 'dense':
+            with ops.name_scope(self.name, 'DAUConvDense', [inp, w, mu1, mu2, sigma]):
+                kernel = _dense_kernel_from_dau_params(w, mu1, mu2, sigma, self.max_kernel_size[0],
+                                                       component_border_bound=1,
+                                                       mu_learning_rate_factor=self.mu_learning_rate_factor,
+                                                       num_dau_units_ignore=self.num_dau_units_ignore)
+                return _dense_conv2d(inp, kernel, self.spatial_strides, channels_first=self.data_format == "NCHW")
 
         # TODO: number_units should be infereed from W, but we need to fix to have size of W,mu1,mu2,sigma in [S, Gy, Gx, F] format
         settings = dict(num_output=self.num_output,
@@ -182,23 +332,74 @@ class _DAUConvolution2d(object):
                         number_units_ignore=self.num_dau_units_ignore,
                         kernel_size=self.max_kernel_size[0],
                         pad=self.padding[0],
+                        stride=self.spatial_strides[0],
                         component_border_bound=1,
                         sigma_lower_bound=0.01,
                         mu_learning_rate_factor=self.mu_learning_rate_factor,
+                        data_format=self.data_format,
+                        profile_name=self.profile_name or '',
+                        tile_memory_limit=self.tile_memory_limit,
+                        fused_forward=self.fused_forward,
+                        blur_method=self.blur_method,
+                        compute_grad_input=self.compute_input_gradient,
+                        compute_grad_weights=_is_gradient_needed(w),
+                        compute_grad_mu1=_is_gradient_needed(mu1),
+                        compute_grad_mu2=_is_gradient_needed(mu2),
+                        save_blurred_input=self.save_blurred_input,
+                        bias_term=bias is not None,
+                        activation=_FUSED_ACTIVATIONS[activation],
+                        compute_grad_bias=bias is not None and _is_gradient_needed(bias),
                         unit_testing=self.unit_testing)
-        return self.dau_conv_op(
+        # second output (blurred input) is consumed only by the gradient of the op
+        output, _ = self.dau_conv_op(
             input=inp,
             weights=w,
             mu1=mu1,
             mu2=mu2,
             sigma=sigma,
+            bias=bias if bias is not None else array_ops.zeros([0], dtype=inp.dtype),
             name=self.name,
             **settings)
+        return output
+
+def dau_conv_set_profiling(enabled):
+    """Returns op that enables or disables collection of per-phase timings and byte counters in all DAUConv and
+    DAUConvGrad ops of the process (disabled by default or enabled with DAU_CONV_PROFILE=1 environment variable).
+    Only CPU kernels are profiled, since GPU kernels run asynchronously to the host (GPU layers are not reported)."""
+    return dau_conv_op_module.dau_conv_set_profiling(enabled)
+
+def dau_conv_profile(reset=False):
+    """Returns op that outputs counters collected since the last reset as
+    (layer_names [L], phase_names [P], time_ms [L,P], bytes [L,P], calls [L,P], kernel_cache_stats [hits,misses,size]).
+    Use parse_dau_conv_profile() on the evaluated outputs to get a dictionary."""
+    return dau_conv_op_module.dau_conv_profile(reset=reset)
+
+def parse_dau_conv_profile(profile_values):
+    """Converts evaluated outputs of dau_conv_profile() into a dictionary:
+      {'layers': {layer_name: {phase_name: {'time_ms': .., 'bytes': .., 'calls': ..}}},
+       'kernel_cache': {'hits': .., 'misses': .., 'size': ..}}
+    Only phases that were called at least once are included."""
+    layer_names, phase_names, time_ms, num_bytes, calls, kernel_cache_stats = profile_values
+
+    as_str = lambda x: x.decode() if isinstance(x, bytes) else str(x)
+
+    layers = dict()
+    for l, layer_name in enumerate(layer_names):
+        layers[as_str(layer_name)] = {as_str(phase_name): dict(time_ms=float(time_ms[l, p]),
+                                                               bytes=int(num_bytes[l, p]),
+                                                               calls=int(calls[l, p]))
+                                      for p, phase_name in enumerate(phase_names) if calls[l, p] > 0}
+
+    return dict(layers=layers,
+                kernel_cache=dict(hits=int(kernel_cache_stats[0]),
+                                  misses=int(kernel_cache_stats[1]),
+                                  size=int(kernel_cache_stats[2])))
 
 class DAUConv2d(base.Layer):
 
-    # C++/CUDA implementation will compute N units at the same time - enforce this constraint !!
-    DAU_UNITS_GROUP = 2
+    # CUDA implementation supports offsets only up to 8 pixels, so layers with larger max_kernel_size are always placed
+    # on CPU where the cost does not depend on the size of the kernel (see BaseDAUConvLayer::MAX_GPU_KERNEL_SIZE)
+    MAX_GPU_KERNEL_SIZE = 17
 
     def __init__(self, filters,
                  dau_units,
@@ -226,6 +427,15 @@ class DAUConv2d(base.Layer):
                  trainable=True,
                  mu_learning_rate_factor=500,
                  unit_testing=False, # for competability between CPU and GPU version (where gradients of last edge need to be ignored) during unit testing
+                 engine=None, # 'dau', 'dense' or 'auto' (timed on first call, see autotune.py); None for default engine
+                 tile_memory_limit=0, # max bytes of blurred input in CPU forward pass without fusing (0 for no limit)
+                 fused_forward=True, # single-pass blur and offset-and-sum in CPU forward pass
+                 blur_method='auto', # 'direct', 'fft' or 'auto' (FFT for large kernels) pre-filtering on CPU
+                 compute_input_gradient=True, # set to False if input does not need gradient (e.g. for the first layer)
+                 save_blurred_input=False, # keep blurred input (same size as input) from CPU forward pass for backward pass
+                 fused_bias_activation=False, # add bias and apply activation (None, nn.relu or nn.leaky_relu) inside CPU op
+                 merge_iteration_step=0, # merge close units of the same (s,f) every N-th run of update ops (0 to disable)
+                 merge_threshold=1.0, # max distance between offsets of merged units
                  name=None,
                  **kwargs):
         super(DAUConv2d, self).__init__(trainable=trainable, name=name,
@@ -272,35 +482,44 @@ class DAUConv2d(base.Layer):
 
         self.unit_testing = unit_testing
 
+        self.engine = engine
+
+        if tile_memory_limit < 0:
+            raise ValueError('tile_memory_limit must be >= 0')
+        self.tile_memory_limit = tile_memory_limit
+        self.fused_forward = fused_forward
+        if blur_method not in numpy_engine.BLUR_METHODS:
+            raise ValueError('Unknown blur_method "%s" (available: %s)' % (blur_method, ', '.join(numpy_engine.BLUR_METHODS)))
+        self.blur_method = blur_method
+        self.compute_input_gradient = compute_input_gradient
+        self.save_blurred_input = save_blurred_input
+        if fused_bias_activation and activation not in _FUSED_ACTIVATIONS:
+            raise ValueError('fused_bias_activation supports only activations: None, nn.relu and nn.leaky_relu')
+        self.fused_bias_activation = fused_bias_activation
+        if merge_iteration_step < 0:
+            raise ValueError('merge_iteration_step must be >= 0')
+        self.merge_iteration_step = merge_iteration_step
+        self.merge_threshold = merge_threshold
+
         self.input_spec = base.InputSpec(ndim=self.rank + 2)
 
         self.num_dau_units_all = np.int32(np.prod(self.dau_units))
-        self.num_dau_units_ignore = 0
-
-        # if we have less then 2 units per channel then or have odd number of them then add one more dummy unit
-        # since computation is always done with 2 units at the same time (effectively set weight=0 for those dummy units)
-
-        # make sure we have at least ALLOWED_UNITS_GROUP (this is requested so for fast version that can handle only factor of 2)
-        if  self.num_dau_units_all % self.DAU_UNITS_GROUP != 0:
-            new_num_units = np.int32(np.ceil(self.num_dau_units_all / float(self.DAU_UNITS_GROUP)) * self.DAU_UNITS_GROUP)
-
-            self.num_dau_units_ignore = new_num_units - self.num_dau_units_all
-
-            if self.dau_units[0] < self.dau_units[1]:
-                self.dau_units = (self.dau_units[0] + self.num_dau_units_ignore, self.dau_units[1])
-            else:
-                self.dau_units = (self.dau_units[0], self.dau_units[1] + self.num_dau_units_ignore)
-
-            self.num_dau_units_all = new_num_units
-
-            self.weight_initializer = ZeroNLast(self.weight_initializer, last_num_to_zero=self.num_dau_units_ignore, axis=2)
 
+        # any number of units is supported by the ops (GPU kernels pad odd number of units with zero-weight units
+        # internally) so variables hold only the requested units and there are no dummy units to ignore
+        self.num_dau_units_ignore = 0
 
         self.dau_weights = None
         self.dau_mu1 = None
         self.dau_mu2 = None
         self.dau_sigma = None
 
+        # non-trainable mask of units that were not merged away (created in build() only for merge_iteration_step > 0)
+        self.unit_mask = None
+
+        # dense [F, S, K, K] kernel compiled from DAU parameters by freeze_to_dense() (used for inference only)
+        self.dense_kernel = None
+
     def set_dau_variables_manually(self, w = None, mu1 = None, mu2 = None, sigma = None):
         """ Manually set w,mu1,mu2 and/or sigma variables with custom tensor. Call before build() or __call__().
         The shape must match the expecated shape as returned by the get_dau_variable_shape(input_shape)
@@ -322,7 +541,7 @@ class DAUConv2d(base.Layer):
         if self.data_format == 'channels_first':
             channel_axis = 1
         else:
-            raise ValueError('Only `channels_first` supported, i.e., NCHW format.')
+            channel_axis = -1
 
         return channel_axis
 
@@ -348,12 +567,20 @@ class DAUConv2d(base.Layer):
         input_shape = tensor_shape.TensorShape(input_shape)
 
         dau_params_shape = self.get_dau_variable_shape(input_shape)
+        weight_constraint = self.weight_constraint
+        if self.merge_iteration_step > 0:
+            self.unit_mask = self.add_variable(name='unit_mask',
+                                               shape=dau_params_shape,
+                                               initializer=init_ops.ones_initializer(),
+                                               trainable=False,
+                                               dtype=self.dtype)
+            weight_constraint = _masked_constraint(weight_constraint, self.unit_mask)
         if self.dau_weights is None:
             self.dau_weights = self.add_variable(name='weights',
                                                  shape=dau_params_shape,
                                                  initializer=self.weight_initializer,
                                                  regularizer=self.weight_regularizer,
-                                                 constraint=self.weight_constraint,
+                                                 constraint=weight_constraint,
                                                  trainable=True,
                                                  dtype=self.dtype)
         elif np.any(self.dau_weights != dau_params_shape):
@@ -401,6 +628,13 @@ class DAUConv2d(base.Layer):
         else:
             self.bias = None
 
+        if self.merge_iteration_step > 0:
+            self.merge_step = self.add_variable(name='merge_step',
+                                                shape=(),
+                                                initializer=init_ops.zeros_initializer(),
+                                                trainable=False,
+                                                dtype=tf.int64)
+
         input_channel_axis = self._get_input_channel_axis()
         num_input_channels = self._get_input_channels(input_shape)
 
@@ -418,11 +652,128 @@ class DAUConv2d(base.Layer):
             mu_learning_rate_factor=self.mu_learning_rate_factor,
             unit_testing=self.unit_testing,
             data_format=utils.convert_data_format(self.data_format,
-                                                  self.rank + 2))
+                                                  self.rank + 2),
+            profile_name=self.name,
+            engine=autotune.DEFAULT_ENGINE,
+            tile_memory_limit=self.tile_memory_limit,
+            fused_forward=self.fused_forward,
+            blur_method=self.blur_method,
+            compute_input_gradient=self.compute_input_gradient,
+            save_blurred_input=self.save_blurred_input)
         self.built = True
 
+    def freeze_to_dense(self, session):
+        """ Compiles current values of DAU variables (read with session) into an equivalent dense [F, S, K, K] kernel
+        (see numpy_engine.get_dense_kernel()) and caches it on the layer. Any subsequent call of the layer builds
+        tf.nn.conv2d with the cached kernel instead of the DAUConv op, which is intended for inference only since no
+        gradients are propagated to DAU variables. Output matches the DAUConv op except for pixels closer than
+        max offset to the image border. Returns the dense kernel."""
+        w, mu1, mu2, sigma = session.run([self.dau_weights, self.dau_mu1, self.dau_mu2, self.dau_sigma])
+
+        self.dense_kernel = numpy_engine.get_dense_kernel(w, mu1, mu2, sigma,
+                                                          num_dau_units_ignore=self.num_dau_units_ignore)
+        return self.dense_kernel
+
+    def unfreeze(self):
+        """ Drops dense kernel cached by freeze_to_dense() so that subsequent calls use the DAUConv op again."""
+        self.dense_kernel = None
+
+    def prune_units(self, session, threshold=None, sparsity=None):
+        """ Prunes units with small |w| (see numpy_engine.get_pruning_mask()) by setting their weights to zero with
+        session. CPU kernels of the ops iterate only over units with non-zero weight, so the cost of offset-and-sum
+        drops with the number of pruned units. Pruned weights stay zero only until they are updated by training again.
+        Returns surviving units as a sparse list (s, f, mu1, mu2, w) for numpy_engine.forward_sparse()."""
+        w, mu1, mu2 = session.run([self.dau_weights, self.dau_mu1, self.dau_mu2])
+
+        mask = numpy_engine.get_pruning_mask(w, threshold, sparsity)
+
+        self.dau_weights.load(np.where(mask, w, 0).astype(w.dtype), session)
+
+        return numpy_engine.prune_units(w, mu1, mu2, threshold, sparsity)
+
+    def _merge_units_update(self):
+        # merges units in place (see numpy_engine.merge_units() with compact=False) on every merge_iteration_step-th
+        # run; weights of units merged away are zeroed so that variable shapes do not change during training, and
+        # units are disabled in unit_mask so that the weight constraint keeps them at zero after further updates
+        step = state_ops.assign_add(self.merge_step, 1)
+
+        def merge():
+            dau_variables = [self.dau_weights, self.dau_mu1, self.dau_mu2]
+            merged = script_ops.py_func(
+                lambda w, mu1, mu2: numpy_engine.merge_units(w, mu1, mu2, self.merge_threshold, compact=False),
+                dau_variables, [self.dtype] * 3, stateful=False)
+
+            # units merged away had non-zero weight before merging (weights are read before they are assigned)
+            merged_away = math_ops.logical_and(math_ops.not_equal(self.dau_weights, 0), math_ops.equal(merged[0], 0))
+            unit_mask = self.unit_mask * math_ops.cast(math_ops.logical_not(merged_away), self.dtype)
+
+            with ops.control_dependencies([unit_mask]):
+                assign_ops = [state_ops.assign(self.unit_mask, unit_mask)]
+                for var, value in zip(dau_variables, merged):
+                    value.set_shape(var.shape)
+                    assign_ops.append(state_ops.assign(var, value))
+
+            with ops.control_dependencies(assign_ops):
+                return array_ops.identity(True)
+
+        return control_flow_ops.cond(math_ops.equal(step % self.merge_iteration_step, 0), merge,
+                                     lambda: array_ops.identity(False))
+
+    def _dense_convolution(self, inputs):
+        # tf.nn.conv2d expects [K, K, S, F] kernel
+        kernel = ops.convert_to_tensor(np.transpose(self.dense_kernel, (2, 3, 1, 0)), dtype=inputs.dtype)
+
+        return _dense_conv2d(inputs, kernel, self.strides, channels_first=self.data_format == 'channels_first')
+
+    def get_autotune_config(self, input_shape, device=''):
+        """Returns layer config used by autotune.select_engine() or None if input shape is not fully defined
+        (unknown batch size is timed as 1)."""
+        input_shape = tensor_shape.TensorShape(input_shape).as_list()
+
+        space = input_shape[2:] if self.data_format == 'channels_first' else input_shape[1:-1]
+        if None in space:
+            return None
+
+        device_type = 'gpu' if 'GPU' in device.upper() else ('cpu' if 'CPU' in device.upper() else 'default')
+
+        return dict(N=input_shape[0] or 1,
+                    S=self._get_input_channels(tensor_shape.TensorShape(input_shape)),
+                    F=self.filters,
+                    H=space[0],
+                    W=space[1],
+                    dau_units=list(self.dau_units),
+                    max_kernel_size=self.max_kernel_size[0],
+                    stride=self.strides[0],
+                    data_format=utils.convert_data_format(self.data_format, self.rank + 2),
+                    device=device_type,
+                    device_name=device,
+                    mode='train' if self.trainable else 'inference')
+
     def call(self, inputs):
-        outputs = self._dau_convolution_op(inputs, self.dau_weights, self.dau_mu1, self.dau_mu2, self.dau_sigma)
+        # engine is selected on the first call when the device and the full shape of the input are known
+        if self.engine not in autotune.ENGINES:
+            self.engine = autotune.resolve_engine(self.engine, self.get_autotune_config(inputs.shape, inputs.device))
+        self._dau_convolution_op.engine = self.engine
+
+        if self.merge_iteration_step > 0:
+            self.add_update(self._merge_units_update(), inputs=inputs)
+
+        # bias and activation are fused only into the DAUConv op (not into dense convolution)
+        fused = self.fused_bias_activation and self.dense_kernel is None and self.engine == 'dau'
+        fused_args = dict(bias=self.bias, activation=self.activation) if fused else dict()
+
+        if self.dense_kernel is not None:
+            outputs = self._dense_convolution(inputs)
+        elif self.engine == 'dau' and max(self.max_kernel_size) > self.MAX_GPU_KERNEL_SIZE:
+            with ops.device('/cpu:0'):
+                outputs = self._dau_convolution_op(inputs, self.dau_weights, self.dau_mu1, self.dau_mu2, self.dau_sigma,
+                                                   **fused_args)
+        else:
+            outputs = self._dau_convolution_op(inputs, self.dau_weights, self.dau_mu1, self.dau_mu2, self.dau_sigma,
+                                               **fused_args)
+
+        if fused:
+            return outputs
 
         if self.use_bias:
             if self.data_format == 'channels_first':
@@ -452,32 +803,27 @@ class DAUConv2d(base.Layer):
             return self.activation(outputs)
         return outputs
 
+    def get_profile(self, profile):
+        """Returns per-phase counters of this layer (forward and backward pass) from dictionary returned by
+        parse_dau_conv_profile() or None if layer was not profiled."""
+        return profile['layers'].get(self.name)
+
+    def _get_output_length(self, input_length, i):
+        if input_length is None:
+            return None
+        # same as BaseDAUConvLayer::compute_output_shape() in C++
+        return int(input_length + 2 * self.padding[i] - self.max_kernel_size[i]) // self.strides[i] + 1
+
     def compute_output_shape(self, input_shape):
         input_shape = tensor_shape.TensorShape(input_shape).as_list()
         if self.data_format == 'channels_last':
             space = input_shape[1:-1]
-            new_space = []
-            for i in range(len(space)):
-                new_dim = utils.conv_output_length(
-                    space[i],
-                    self.max_kernel_size[i],
-                    padding=self.padding,
-                    stride=self.strides[i],
-                    dilation=self.dilation_rate[i])
-                new_space.append(new_dim)
+            new_space = [self._get_output_length(space[i], i) for i in range(len(space))]
             return tensor_shape.TensorShape([input_shape[0]] + new_space +
                                             [self.filters])
         else:
             space = input_shape[2:]
-            new_space = []
-            for i in range(len(space)):
-                new_dim = utils.conv_output_length(
-                    space[i],
-                    self.kernel_size[i],
-                    padding=self.padding,
-                    stride=self.strides[i],
-                    dilation=self.dilation_rate[i])
-                new_space.append(new_dim)
+            new_space = [self._get_output_length(space[i], i) for i in range(len(space))]
             return tensor_shape.TensorShape([input_shape[0], self.filters] +
                                             new_space)
 
@@ -511,9 +857,18 @@ def dau_conv2d(inputs,
              variables_collections=None,
              outputs_collections=None,
              trainable=True,
+             engine=None,
+             tile_memory_limit=0,
+             fused_forward=True,
+             blur_method='auto',
+             compute_input_gradient=True,
+             save_blurred_input=False,
+             fused_bias_activation=False,
+             merge_iteration_step=0,
+             merge_threshold=1.0,
              scope=None):
 
-    if data_format not in [None, 'NCHW']:
+    if data_format not in [None, 'NCHW', 'NHWC']:
         raise ValueError('Invalid data_format: %r' % (data_format,))
 
     layer_variable_getter = layers_contrib._build_variable_getter({
@@ -537,12 +892,15 @@ def dau_conv2d(inputs,
         df = ('channels_first'
               if data_format and data_format.startswith('NC') else 'channels_last')
 
+        # activation is fused into the layer only if it directly follows the convolution
+        fuse_activation = fused_bias_activation and normalizer_fn is None and activation_fn in _FUSED_ACTIVATIONS
+
         layer = DAUConv2d(filters,
                           dau_units,
                           max_kernel_size,
                           strides=stride,
                           data_format=df,
-                          activation=None,
+                          activation=activation_fn if fuse_activation else None,
                           use_bias=not normalizer_fn and biases_initializer,
                           mu_learning_rate_factor=mu_learning_rate_factor,
                           weight_initializer=weights_initializer,
@@ -558,6 +916,15 @@ def dau_conv2d(inputs,
                           activity_regularizer=None,
                           trainable=trainable,
                           unit_testing=False,
+                          engine=engine,
+                          tile_memory_limit=tile_memory_limit,
+                          fused_forward=fused_forward,
+                          blur_method=blur_method,
+                          compute_input_gradient=compute_input_gradient,
+                          save_blurred_input=save_blurred_input,
+                          fused_bias_activation=fused_bias_activation,
+                          merge_iteration_step=merge_iteration_step,
+                          merge_threshold=merge_threshold,
                           name=sc.name,
                           _scope=sc,
                           _reuse=reuse)
@@ -577,6 +944,109 @@ def dau_conv2d(inputs,
             normalizer_params = normalizer_params or {}
             outputs = normalizer_fn(outputs, **normalizer_params)
 
-        if activation_fn is not None:
+        if activation_fn is not None and not fuse_activation:
             outputs = activation_fn(outputs)
         return utils_contrib.collect_named_outputs(outputs_collections, sc.name, outputs)
+
+from tensorflow.python.framework import dtypes
+from tensorflow.python.framework import graph_util
+from tensorflow.python.framework import tensor_util
+
+_FOLDABLE_BATCH_NORM_OPS = ('FusedBatchNorm', 'FusedBatchNormV2', 'FusedBatchNormV3')
+
+def _get_tensor_name(input_name):
+    return input_name if ':' in input_name else input_name + ':0'
+
+def _get_const_value(nodes, input_name):
+    # follows Identity nodes (e.g. 'weights/read' of frozen variables) to a Const node; returns None for anything else
+    node = nodes.get(input_name.split(':')[0])
+    while node is not None and node.op == 'Identity':
+        node = nodes.get(node.input[0].split(':')[0])
+    if node is None or node.op != 'Const':
+        return None
+    return tensor_util.MakeNdarray(node.attr['value'].tensor)
+
+def _add_const_node(graph_def, name, value, dtype, device):
+    node = graph_def.node.add()
+    node.name = name
+    node.op = 'Const'
+    node.device = device
+    node.attr['dtype'].type = dtype.as_datatype_enum
+    node.attr['value'].tensor.CopyFrom(tensor_util.make_tensor_proto(value, dtype=dtype))
+    return node
+
+def _is_cpu_device(device):
+    return (tf.DeviceSpec.from_string(device).device_type or '').upper() == 'CPU'
+
+def fold_batch_norm(session, output_node_names, fuse_bias=False):
+    """Returns inference GraphDef of session.graph, with variables converted to constants, where batch normalization
+    that directly follows a DAUConv op is folded into it. This is the case for dau_conv2d with
+    normalizer_fn=layers.batch_norm and is_training=False, which adds FusedBatchNorm in inference mode.
+
+    Weights of each output filter are scaled by the normalization factor (see numpy_engine.fold_batch_norm()) and the
+    remaining shift becomes a bias, which is added by a BiasAdd op. With fuse_bias the bias is instead added by the
+    DAUConv op itself, but only for DAUConv ops placed on CPU (the op supports bias only on CPU, as for
+    fused_bias_activation of DAUConv2d). Batch normalization node is replaced by Identity (or BiasAdd) with the same
+    name, so that its consumers and output_node_names remain valid. Folded constants keep the dtype of DAUConv weights.
+
+    Batch normalization is kept when it cannot be folded: after a DAUConv op with fused activation, when DAUConv output
+    has other consumers or when DAUConv weights or normalization parameters are not constant."""
+    graph_def = graph_util.convert_variables_to_constants(session, session.graph.as_graph_def(), output_node_names)
+
+    nodes = {node.name: node for node in graph_def.node}
+    consumers = {}
+    for node in graph_def.node:
+        for i, input_name in enumerate(node.input):
+            if not input_name.startswith('^'):
+                consumers.setdefault(_get_tensor_name(input_name), []).append((node, i))
+
+    for node in list(graph_def.node):
+        if node.op != 'DAUConv' or node.attr['activation'].s.decode() != 'none':
+            continue
+
+        output_consumers = consumers.get(node.name + ':0', [])
+        if len(output_consumers) != 1:
+            continue
+
+        bn, bn_input_index = output_consumers[0]
+        if bn.op not in _FOLDABLE_BATCH_NORM_OPS or bn.attr['is_training'].b or bn_input_index != 0:
+            continue
+
+        # batch statistics and other auxiliary outputs must not be used
+        if any(name.startswith(bn.name + ':') and name != bn.name + ':0' for name in consumers):
+            continue
+
+        bias_term = node.attr['bias_term'].b
+
+        w = _get_const_value(nodes, node.input[1])
+        scale, offset, mean, variance = [_get_const_value(nodes, name) for name in bn.input[1:5]]
+        bias = _get_const_value(nodes, node.input[5]) if bias_term else None
+
+        if any(v is None for v in [w, scale, offset, mean, variance]) or (bias_term and bias is None):
+            continue
+
+        dtype = dtypes.as_dtype(w.dtype)
+
+        w, bias = numpy_engine.fold_batch_norm(w, bias, mean, variance, scale, offset, bn.attr['epsilon'].f)
+
+        node.input[1] = _add_const_node(graph_def, node.name + '/folded_weights', w, dtype, node.device).name
+        bias_name = _add_const_node(graph_def, node.name + '/folded_bias', bias, dtype, node.device).name
+
+        bn_name, bn_device, bn_dtype, data_format = bn.name, bn.device, bn.attr['T'].type, bn.attr['data_format'].s
+        bn.Clear()
+        bn.name = bn_name
+        bn.device = bn_device
+        bn.attr['T'].type = bn_dtype
+
+        if bias_term or (fuse_bias and _is_cpu_device(node.device)):
+            node.input[5] = bias_name
+            node.attr['bias_term'].b = True
+            bn.op = 'Identity'
+            bn.input.extend([node.name])
+        else:
+            bn.op = 'BiasAdd'
+            bn.input.extend([node.name, bias_name])
+            bn.attr['data_format'].s = data_format
+
+    # drops constants of folded normalization and original weights
+    return graph_util.extract_sub_graph(graph_def, output_node_names)
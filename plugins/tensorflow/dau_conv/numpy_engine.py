@@ -0,0 +1,674 @@
+"""Vectorized NumPy implementation of the DAU convolution.
+
+This is a CPU-only engine that does not depend on Tensorflow or on the compiled C++/CUDA ops and follows the same
+computation as the C++ implementation:
+  - pre-blur the input with a single gaussian kernel shared by the whole layer
+  - offset (with bilinear interpolation of sub-pixel offsets) and sum blurred input channels into output channels
+
+Instead of looping over every (f,s,g) unit, units are grouped by integer shifts of their bilinear interpolation taps,
+i.e. (floor(mu1)+dx, floor(mu2)+dy) for dx,dy in {0,1}. All taps with the same shift are combined into a single
+[S x F] coefficient matrix and each distinct shift is computed with one matrix product over all images and pixels.
+The backward pass reuses the same shifts for error back-propagation and for w/mu1/mu2 gradients, where dot-products of
+all three derivative-blurred inputs are collected from the same shifted views with one matrix product per shift.
+
+All parameters are expected in [1, S, G, F] format as used by DAUConv2d, and input/output in NCHW format.
+
+Strides larger than one are computed natively: only every stride-th output pixel is read from the shifted views, and
+in the backward pass the strided error is up-sampled with zeros before the error back-propagation.
+
+For inference, the same shift coefficients can be compiled into a dense [F, S, K, K] kernel (get_dense_kernel) that is
+used with any standard convolution implementation.
+
+Layers pruned by magnitude of w keep only the surviving units in a sparse list (prune_units), which forward_sparse
+computes without ever expanding it back to the [1, S, G, F] layout.
+"""
+
+import numpy as np
+
+BLUR_METHODS = ('auto', 'direct', 'fft')
+
+# smallest kernels that blur() computes with FFT when method='auto' (the cost of the direct version grows with kernel
+# size, linearly for separable kernels and quadratically for non-separable ones, while FFT does not depend on it; see
+# benchmark.py --blur-crossover)
+FFT_BLUR_MIN_KERNEL_SIZE = 21
+FFT_BLUR_MIN_KERNEL_SIZE_NONSEPARABLE = 9
+
+def get_filters(sigma, kernel_size=None):
+    """Returns gaussian blur kernel and its derivatives (deriv_w, deriv_mu1, deriv_mu2, deriv_sigma) for sigma.
+    Args:
+      sigma: float. Sigma of the aggregation (gaussian) kernel shared by the whole layer
+      kernel_size: Integer. Size of kernel; if None then 2*ceil(5*sigma)+1 is used (as in C++ implementation)
+    """
+    if kernel_size is None:
+        kernel_size = 2 * int(np.ceil(5 * sigma)) + 1
+
+    x = np.tile(np.arange(kernel_size), (kernel_size, 1)) - kernel_size // 2
+    y = x.T
+
+    filter = np.exp(-1 * (x**2 + y**2) / (2 * sigma**2))
+    deriv_w = filter
+    deriv_mu1 = x / (sigma**2) * filter
+    deriv_mu2 = y / (sigma**2) * filter
+    deriv_sigma = (x**2 + y**2) / (sigma**3) * filter
+
+    sum_filter = np.sum(filter)
+    sum_mu1 = np.sum(deriv_mu1) / sum_filter
+    sum_mu2 = np.sum(deriv_mu2) / sum_filter
+    sum_sigma = np.sum(deriv_sigma) / sum_filter
+
+    filter = filter / sum_filter
+    deriv_w = deriv_w / sum_filter
+
+    deriv_mu1 = deriv_mu1 / sum_filter - deriv_w * sum_mu1
+    deriv_mu2 = deriv_mu2 / sum_filter - deriv_w * sum_mu2
+    deriv_sigma = deriv_sigma / sum_filter - deriv_w * sum_sigma
+
+    return (filter, deriv_w, deriv_mu1, deriv_mu2, deriv_sigma)
+
+def _get_sigma_value(sigma):
+    # sigma is shared by the whole layer so accept scalar, list or [1,S,G,F] tensor and use the first value
+    return float(np.ravel(sigma)[0])
+
+def _get_compute_dtype(x):
+    return np.result_type(x.dtype, np.float32)
+
+def get_separable_factors(kernel, tolerance=1e-5):
+    """Factorizes 2D kernel into column and row vectors such that kernel = np.outer(kernel_col, kernel_row).
+    Returns (kernel_col, kernel_row) or None if kernel is not separable within tolerance (relative to the largest
+    absolute kernel value)."""
+    pivot_i, pivot_j = np.unravel_index(np.argmax(np.abs(kernel)), kernel.shape)
+    pivot_val = kernel[pivot_i, pivot_j]
+
+    if pivot_val == 0:
+        return np.zeros(kernel.shape[0]), np.zeros(kernel.shape[1])
+
+    kernel_col = kernel[:, pivot_j] / pivot_val
+    kernel_row = kernel[pivot_i, :]
+
+    if np.max(np.abs(kernel - np.outer(kernel_col, kernel_row))) > tolerance * np.abs(pivot_val):
+        return None
+
+    return kernel_col, kernel_row
+
+def use_fft_blur(kernel, method='auto'):
+    """Returns True if blur() with method computes kernel with FFT."""
+    if method not in BLUR_METHODS:
+        raise ValueError('Unknown blur method "%s" (available: %s)' % (method, ', '.join(BLUR_METHODS)))
+    if method != 'auto':
+        return method == 'fft'
+
+    min_kernel_size = FFT_BLUR_MIN_KERNEL_SIZE if get_separable_factors(kernel) is not None \
+        else FFT_BLUR_MIN_KERNEL_SIZE_NONSEPARABLE
+
+    return max(kernel.shape) >= min_kernel_size
+
+def blur_fft(x, kernel):
+    """Same as blur() but computed as a product of spectra of zero-padded input and kernel (equal up to rounding)."""
+    k_h, k_w = kernel.shape
+
+    height, width = x.shape[-2:]
+
+    # linear (not cyclic) convolution with flipped kernel needs transforms of at least the size of the full output
+    fft_size = (height + k_h - 1, width + k_w - 1)
+
+    x_fft = np.fft.rfft2(x, s=fft_size)
+    kernel_fft = np.fft.rfft2(kernel[::-1, ::-1], s=fft_size)
+
+    y = np.fft.irfft2(x_fft * kernel_fft, s=fft_size)
+
+    return y[..., k_h // 2:k_h // 2 + height, k_w // 2:k_w // 2 + width].astype(_get_compute_dtype(x))
+
+def blur(x, kernel, method='direct'):
+    """Correlates each [H,W] image in NCHW input with 2D kernel using zero padding (same as
+    scipy.ndimage.correlate(mode='constant')), but for all images at once. Separable kernels (e.g. gaussian) are
+    applied as a column and a row pass. With method='fft' (or 'auto' for large kernels) see blur_fft()."""
+    if use_fft_blur(kernel, method):
+        return blur_fft(x, kernel)
+
+    k_h, k_w = kernel.shape
+    pad_h, pad_w = k_h // 2, k_w // 2
+
+    height, width = x.shape[-2:]
+
+    dtype = _get_compute_dtype(x)
+
+    factors = get_separable_factors(kernel)
+
+    if factors is not None:
+        kernel_col, kernel_row = factors
+
+        x_pad = np.pad(x, pad_width=[(0, 0)] * (x.ndim - 2) + [(pad_h, pad_h), (0, 0)], mode='constant')
+
+        y_col = np.zeros(x.shape, dtype=dtype)
+        for i in range(k_h):
+            if kernel_col[i] != 0:
+                y_col += kernel_col[i] * x_pad[..., i:i + height, :]
+
+        y_col = np.pad(y_col, pad_width=[(0, 0)] * (x.ndim - 2) + [(0, 0), (pad_w, pad_w)], mode='constant')
+
+        y = np.zeros(x.shape, dtype=dtype)
+        for j in range(k_w):
+            if kernel_row[j] != 0:
+                y += kernel_row[j] * y_col[..., j:j + width]
+        return y
+
+    x_pad = np.pad(x, pad_width=[(0, 0)] * (x.ndim - 2) + [(pad_h, pad_h), (pad_w, pad_w)], mode='constant')
+
+    y = np.zeros(x.shape, dtype=dtype)
+
+    for i in range(k_h):
+        for j in range(k_w):
+            if kernel[i, j] != 0:
+                y += kernel[i, j] * x_pad[..., i:i + height, j:j + width]
+    return y
+
+def get_unit_taps(mu1, mu2, num_dau_units_ignore=0):
+    """Groups bilinear interpolation taps of all units by their integer shifts.
+    Returns:
+      shifts: int array [K, 2] of distinct (shift_y, shift_x) values
+      tap_index: int array [4, S, G', F] with index into shifts for each tap of each unit
+      tap_weight: array [4, S, G', F] with interpolation weight (without w) for each tap of each unit
+    where G' = G - num_dau_units_ignore.
+    """
+    G = mu1.shape[2]
+
+    mu1 = mu1[0, :, :G - num_dau_units_ignore, :]
+    mu2 = mu2[0, :, :G - num_dau_units_ignore, :]
+
+    offset_x_int = np.floor(mu1)
+    offset_y_int = np.floor(mu2)
+
+    interpol_off_x = mu1 - offset_x_int
+    interpol_off_y = mu2 - offset_y_int
+
+    shift_y, shift_x, tap_weight = [], [], []
+    for dy in [0, 1]:
+        for dx in [0, 1]:
+            shift_y.append(offset_y_int + dy)
+            shift_x.append(offset_x_int + dx)
+            tap_weight.append(((1 - interpol_off_x) if dx == 0 else interpol_off_x) *
+                              ((1 - interpol_off_y) if dy == 0 else interpol_off_y))
+
+    shift_y = np.int64(np.stack(shift_y))
+    shift_x = np.int64(np.stack(shift_x))
+    tap_weight = np.stack(tap_weight)
+
+    # encode (shift_y, shift_x) pairs into a single integer key since np.unique over rows is slow
+    min_shift = min(np.min(shift_y), np.min(shift_x)) if shift_y.size > 0 else 0
+    key_base = max(np.max(shift_y), np.max(shift_x)) - min_shift + 1 if shift_y.size > 0 else 1
+
+    keys, tap_index = np.unique((shift_y - min_shift) * key_base + (shift_x - min_shift), return_inverse=True)
+
+    shifts = np.stack([keys // key_base + min_shift, keys % key_base + min_shift], axis=1)
+
+    return shifts, tap_index.reshape(tap_weight.shape), tap_weight
+
+def get_shift_coefficients(w, tap_index, tap_weight, num_shifts, num_dau_units_ignore=0):
+    """Accumulates w * tap_weight of all units into [K, S, F] coefficient matrices (one for each distinct shift)."""
+    S, G, F = w.shape[1:]
+
+    w = w[0, :, :G - num_dau_units_ignore, :]
+
+    # flat index into [K, S, F] for each tap
+    coeff_index = (tap_index * S + np.arange(S).reshape(1, S, 1, 1)) * F + np.arange(F).reshape(1, 1, 1, F)
+
+    coeffs = np.bincount(coeff_index.ravel(), weights=(tap_weight * w[np.newaxis]).ravel(), minlength=num_shifts * S * F)
+
+    return coeffs.reshape(num_shifts, S, F).astype(np.result_type(w.dtype, tap_weight.dtype), copy=False)
+
+def _get_padding(shifts):
+    return int(np.max(np.abs(shifts))) if len(shifts) > 0 else 0
+
+def _get_strided_size(size, stride):
+    return (size - 1) // stride + 1
+
+def shift_and_sum(x, shifts, coeffs, stride=1, rows=None, in_row_start=0):
+    """Computes y[n,f,h,w] = sum_k sum_s coeffs[k,s,f] * x[n,s,h*stride+shifts[k,0],w*stride+shifts[k,1]] with zero
+    padding.
+    With rows=(row_start, row_end) only output rows [row_start, row_end) are computed from x that holds only rows
+    [in_row_start, in_row_start + x.shape[2]) of the image; all rows of the image that are read must be present."""
+    N, S, H, W = x.shape
+    F = coeffs.shape[2]
+
+    H_out, W_out = _get_strided_size(H, stride), _get_strided_size(W, stride)
+
+    row_start, row_end = rows if rows is not None else (0, H_out)
+    H_out = row_end - row_start
+
+    dtype = _get_compute_dtype(x)
+
+    padding = _get_padding(shifts)
+
+    # use [S, N, H, W] layout so that each shift is a single [F x S] * [S x N*H*W] matrix product
+    x_pad = np.pad(np.transpose(x, (1, 0, 2, 3)).astype(dtype, copy=False),
+                   pad_width=[(0, 0), (0, 0), (padding, padding), (padding, padding)], mode='constant')
+
+    y = np.zeros((F, N * H_out * W_out), dtype=dtype)
+
+    for k, (shift_y, shift_x) in enumerate(shifts):
+        coeff_k = coeffs[k]
+        if not np.any(coeff_k):
+            continue
+
+        y_start = padding + shift_y + row_start * stride - in_row_start
+
+        x_s = x_pad[:, :, y_start:y_start + (H_out - 1) * stride + 1:stride,
+                          padding + shift_x:padding + shift_x + W:stride]
+
+        y += np.dot(coeff_k.T.astype(dtype, copy=False), x_s.reshape(S, N * H_out * W_out))
+
+    return np.transpose(y.reshape(F, N, H_out, W_out), (1, 0, 2, 3))
+
+def offset_and_sum(x, w, mu1, mu2, num_dau_units_ignore=0, stride=1):
+    """Offsets (with bilinear interpolation) and sums input channels of x according to DAU parameters.
+    Equivalent to DAUConvPython._offset_and_sum from unit-tests (sub-sampled by stride)."""
+    shifts, tap_index, tap_weight = get_unit_taps(mu1, mu2, num_dau_units_ignore)
+
+    coeffs = get_shift_coefficients(w, tap_index, tap_weight, len(shifts), num_dau_units_ignore)
+
+    return shift_and_sum(x, shifts, coeffs, stride)
+
+def forward(x, w, mu1, mu2, sigma, num_dau_units_ignore=0, kernel_size=None, stride=1, tile_memory_limit=0,
+            blur_method='auto', return_blurred_input=False):
+    """Forward pass of DAU convolution for NCHW input x and [1,S,G,F] parameters w, mu1, mu2 (and shared sigma).
+    Returns output of size [N,F,H_out,W_out] with H_out = (H-1)/stride+1 and W_out = (W-1)/stride+1.
+    If blurred input would take more than tile_memory_limit bytes (0 for no limit) the output is computed in tiles
+    (see forward_tiled). Input is blurred with blur_method (see blur()). With return_blurred_input the whole blurred
+    input is kept (no tiling) and returned as (output, blurred_input) to be passed to backward()."""
+    filter, _, _, _, _ = get_filters(_get_sigma_value(sigma), kernel_size)
+
+    if 0 < tile_memory_limit < x.size * np.dtype(_get_compute_dtype(x)).itemsize and not return_blurred_input:
+        return forward_tiled(x, w, mu1, mu2, filter, tile_memory_limit, num_dau_units_ignore, stride, blur_method)
+
+    # pre-blur the X
+    x_blur = blur(x, filter, blur_method)
+
+    # then offset and sum element-wise
+    output = offset_and_sum(x_blur, w, mu1, mu2, num_dau_units_ignore=num_dau_units_ignore, stride=stride)
+
+    return (output, x_blur) if return_blurred_input else output
+
+def forward_tiled(x, w, mu1, mu2, filter, tile_memory_limit, num_dau_units_ignore=0, stride=1, blur_method='auto'):
+    """Forward pass that holds at most tile_memory_limit bytes of blurred input at once (same as Forward_cpu of C++
+    implementation with tile_memory_limit). Batch is split into groups of whole images, or if a single image does not
+    fit, each image into strips of output rows. A strip needs blurred rows at y shifts of all taps around its rows
+    (the halo of max |mu2|+1 rows), and those are blurred from input rows within the radius of the gaussian filter. The
+    limit is exceeded only if a single output row with its halo does not fit into it.
+    Output is identical to the untiled forward pass since each tile computes the same sums as the whole image (with
+    FFT blur only up to rounding, since transforms of tiles have different sizes)."""
+    N, S, H, W = x.shape
+
+    shifts, tap_index, tap_weight = get_unit_taps(mu1, mu2, num_dau_units_ignore)
+    coeffs = get_shift_coefficients(w, tap_index, tap_weight, len(shifts), num_dau_units_ignore)
+
+    F = coeffs.shape[2]
+    H_out, W_out = _get_strided_size(H, stride), _get_strided_size(W, stride)
+
+    filter_radius = filter.shape[0] // 2
+
+    min_shift_y = min(0, int(np.min(shifts[:, 0]))) if len(shifts) > 0 else 0
+    max_shift_y = max(0, int(np.max(shifts[:, 0]))) if len(shifts) > 0 else 0
+
+    dtype = _get_compute_dtype(x)
+
+    max_rows = max(1, tile_memory_limit // (S * W * np.dtype(dtype).itemsize))
+
+    if max_rows >= H:
+        tile_images, tile_rows = min(N, max_rows // H), H_out
+    else:
+        tile_images = 1
+        tile_rows = min(H_out, max(1, (max_rows - (max_shift_y - min_shift_y + 1)) // stride + 1))
+
+    y = np.zeros((N, F, H_out, W_out), dtype=dtype)
+
+    for n_start in range(0, N, tile_images):
+        images = slice(n_start, n_start + tile_images)
+
+        for row_start in range(0, H_out, tile_rows):
+            row_end = min(row_start + tile_rows, H_out)
+
+            in_row_start = max(0, row_start * stride + min_shift_y)
+            in_row_end = min(H, (row_end - 1) * stride + max_shift_y + 1)
+
+            # rows outside of the image are zero-padded by blur() in the same way as for the whole image
+            x_start = max(0, in_row_start - filter_radius)
+
+            x_blur = blur(x[images, :, x_start:in_row_end + filter_radius], filter, blur_method)
+            x_blur = x_blur[:, :, in_row_start - x_start:in_row_end - x_start]
+
+            y[images, :, row_start:row_end] = shift_and_sum(x_blur, shifts, coeffs, stride,
+                                                            rows=(row_start, row_end), in_row_start=in_row_start)
+    return y
+
+def get_dense_kernel(w, mu1, mu2, sigma, num_dau_units_ignore=0, kernel_size=None):
+    """Compiles DAU parameters into an equivalent dense kernel of size [F, S, K, K] for a standard convolution
+    (correlation with zero padding of K//2), where K = 2*(kernel_size//2 + max shift)+1 covers the blur kernel placed at
+    every integer shift of bilinear interpolation taps.
+
+    Output of dense convolution is the same as of forward() except for pixels closer than max shift to the image border:
+    forward() uses zero for blurred input outside of the image, while dense kernel blurs zero padding into it."""
+    filter, _, _, _, _ = get_filters(_get_sigma_value(sigma), kernel_size)
+
+    shifts, tap_index, tap_weight = get_unit_taps(mu1, mu2, num_dau_units_ignore)
+
+    coeffs = get_shift_coefficients(w, tap_index, tap_weight, len(shifts), num_dau_units_ignore)
+
+    k_h, k_w = filter.shape
+    padding = _get_padding(shifts)
+
+    K = 2 * (max(k_h, k_w) // 2 + padding) + 1
+
+    # place blur kernel at each distinct shift (relative to the center of dense kernel) so that dense kernel is
+    # a single [K, S, F] x [K, K*K] matrix product of shift coefficients and blur kernels at those shifts
+    offset_y = shifts[:, 0] + K // 2 - k_h // 2
+    offset_x = shifts[:, 1] + K // 2 - k_w // 2
+
+    i, j = np.meshgrid(np.arange(k_h), np.arange(k_w), indexing='ij')
+
+    shifted_filters = np.zeros((len(shifts), K, K), dtype=coeffs.dtype)
+    shifted_filters[np.arange(len(shifts)).reshape(-1, 1, 1),
+                    offset_y.reshape(-1, 1, 1) + i,
+                    offset_x.reshape(-1, 1, 1) + j] = filter
+
+    dense_kernel = np.tensordot(coeffs, shifted_filters, axes=([0], [0]))
+
+    return np.ascontiguousarray(np.transpose(dense_kernel, (1, 0, 2, 3)))
+
+def fold_batch_norm(w, bias, mean, variance, scale, offset, epsilon):
+    """Folds inference-mode batch normalization of output channels, i.e. scale * (y - mean) / sqrt(variance + epsilon)
+    + offset, into [1, S, G, F] weights and bias of size [F] (None when there is no bias).
+
+    Output is linear in weights, so the per-filter factor is applied directly to w of each output filter f. Returns
+    (w, bias) of the equivalent DAU convolution."""
+    factor = np.asarray(scale) / np.sqrt(np.asarray(variance) + epsilon)
+
+    if bias is None:
+        bias = np.zeros_like(factor)
+
+    folded_w = w * factor.reshape(1, 1, 1, -1)
+    folded_bias = (bias - mean) * factor + offset
+
+    return folded_w.astype(w.dtype), folded_bias.astype(w.dtype)
+
+def merge_units(w, mu1, mu2, threshold, compact=True):
+    """Merges units of the same input channel s and output filter f whose offsets (mu1, mu2) are closer than threshold.
+
+    Units of each (s, f) are visited in the order of decreasing |w| and each one either joins the nearest merged unit
+    of the same sign of w within threshold of its center or starts a new one. Merged unit has the sum of weights at
+    |w|-weighted mean of offsets, which is the position where the first-order error of replacing units with a single
+    one vanishes (units of opposite signs, e.g. pairs of edge detectors, are never merged since no such position
+    exists for them). Zero-weight units are dropped.
+
+    With compact, G is reduced to the largest number of merged units of any (s, f) (at least one) and the remaining
+    units are filled with zero weights at zero offset. Otherwise the [1, S, G, F] shape is kept: every merged unit
+    stays at the index of its largest unit and the units merged into it get zero weights (with unchanged offsets), so
+    that parameters can be assigned back to layer variables during training. Returns (w, mu1, mu2)."""
+    _, S, G, F = w.shape
+
+    order = np.argsort(-np.abs(w[0]), axis=1, kind='stable')
+    w_sorted = np.take_along_axis(w[0], order, axis=1).astype(np.float64)
+    mu1_sorted = np.take_along_axis(mu1[0], order, axis=1).astype(np.float64)
+    mu2_sorted = np.take_along_axis(mu2[0], order, axis=1).astype(np.float64)
+
+    # sums of weights, of |w| and of |w|-weighted offsets of merged units, and index of their largest unit
+    merged_w = np.zeros((S, G, F))
+    merged_abs_w = np.zeros((S, G, F))
+    merged_mu1 = np.zeros((S, G, F))
+    merged_mu2 = np.zeros((S, G, F))
+    merged_index = np.zeros((S, G, F), dtype=np.int64)
+
+    num_merged = np.zeros((S, F), dtype=np.int64)
+
+    s_idx, f_idx = np.meshgrid(np.arange(S), np.arange(F), indexing='ij')
+    unit_idx = np.arange(G).reshape(1, G, 1)
+
+    for g in range(G):
+        w_g, mu1_g, mu2_g = w_sorted[:, g, :], mu1_sorted[:, g, :], mu2_sorted[:, g, :]
+
+        abs_w = np.maximum(merged_abs_w, np.finfo(np.float64).tiny)
+        dist2 = (merged_mu1 / abs_w - mu1_g[:, None, :]) ** 2 + (merged_mu2 / abs_w - mu2_g[:, None, :]) ** 2
+        dist2[unit_idx >= num_merged[:, None, :]] = np.inf
+        dist2[np.sign(merged_w) != np.sign(w_g)[:, None, :]] = np.inf
+
+        nearest = np.argmin(dist2, axis=1)
+        is_merged = dist2[s_idx, nearest, f_idx] < threshold ** 2
+        is_new = np.logical_and(w_g != 0, np.logical_not(is_merged))
+
+        # zero-weight units are added to the next free unit without starting it (num_merged <= g < G)
+        target = np.where(is_merged, nearest, num_merged)
+
+        merged_w[s_idx, target, f_idx] += w_g
+        merged_abs_w[s_idx, target, f_idx] += np.abs(w_g)
+        merged_mu1[s_idx, target, f_idx] += np.abs(w_g) * mu1_g
+        merged_mu2[s_idx, target, f_idx] += np.abs(w_g) * mu2_g
+        merged_index[s_idx, target, f_idx] = np.where(is_new, order[:, g, :], merged_index[s_idx, target, f_idx])
+
+        num_merged += is_new
+
+    is_used = unit_idx < num_merged[:, None, :]
+    abs_w = np.maximum(merged_abs_w, np.finfo(np.float64).tiny)
+
+    merged_w = np.where(is_used, merged_w, 0)
+    merged_mu1 = np.where(is_used, merged_mu1 / abs_w, 0)
+    merged_mu2 = np.where(is_used, merged_mu2 / abs_w, 0)
+
+    if compact:
+        G_merged = max(1, int(np.max(num_merged)))
+        return tuple(x[None, :, :G_merged, :].astype(w.dtype) for x in [merged_w, merged_mu1, merged_mu2])
+
+    out_w = np.zeros_like(w)
+    out_mu1 = mu1.copy()
+    out_mu2 = mu2.copy()
+
+    s_used, g_used, f_used = np.nonzero(is_used)
+    index = merged_index[s_used, g_used, f_used]
+
+    out_w[0, s_used, index, f_used] = merged_w[s_used, g_used, f_used]
+    out_mu1[0, s_used, index, f_used] = merged_mu1[s_used, g_used, f_used]
+    out_mu2[0, s_used, index, f_used] = merged_mu2[s_used, g_used, f_used]
+
+    return out_w, out_mu1, out_mu2
+
+def get_pruning_mask(w, threshold=None, sparsity=None):
+    """Returns bool mask of [1, S, G, F] units that survive magnitude pruning: units with |w| > threshold or, with
+    sparsity, all but the given fraction of units with the smallest |w|. Zero-weight units never survive. Exactly one
+    of threshold and sparsity must be given."""
+    if (threshold is None) == (sparsity is None):
+        raise ValueError('Exactly one of threshold and sparsity must be given')
+
+    abs_w = np.abs(w)
+
+    if threshold is not None:
+        return abs_w > threshold
+
+    if not 0 <= sparsity <= 1:
+        raise ValueError('sparsity must be within [0, 1]')
+
+    num_pruned = int(round(sparsity * abs_w.size))
+
+    mask = np.zeros(abs_w.size, dtype=bool)
+    mask[np.argsort(abs_w, axis=None, kind='stable')[num_pruned:]] = True
+
+    return np.logical_and(mask.reshape(abs_w.shape), abs_w > 0)
+
+def prune_units(w, mu1, mu2, threshold=None, sparsity=None):
+    """Drops units with small |w| (see get_pruning_mask()) and returns survivors as a compact sparse list
+    (s, f, mu1, mu2, w) of 1D arrays, ordered by input channel s and then by output channel f."""
+    s, g, f = np.nonzero(get_pruning_mask(w, threshold, sparsity)[0])
+
+    order = np.lexsort((g, f, s))
+    s, g, f = s[order], g[order], f[order]
+
+    return s, f, mu1[0, s, g, f], mu2[0, s, g, f], w[0, s, g, f]
+
+def sparse_offset_and_sum(x, units, num_output, stride=1):
+    """Same as offset_and_sum() for units given as a sparse list (s, f, mu1, mu2, w) with s indexing channels of x.
+
+    Interpolation taps of all units are grouped by their integer shifts as in offset_and_sum(), but each shift is a
+    matrix product only over input and output channels that have at least one surviving tap at that shift, so the cost
+    drops with the number of surviving units instead of always being the dense [F x S] product of every shift."""
+    s, f, mu1, mu2, w = units
+
+    N, S, H, W = x.shape
+    H_out, W_out = _get_strided_size(H, stride), _get_strided_size(W, stride)
+
+    dtype = _get_compute_dtype(x)
+
+    shifts, tap_index, tap_weight = get_unit_taps(np.reshape(mu1, (1, 1, -1, 1)), np.reshape(mu2, (1, 1, -1, 1)))
+
+    tap_index = tap_index.ravel()
+    tap_coeff = (tap_weight.reshape(4, -1) * w).ravel()
+    tap_s = np.tile(s, 4)
+    tap_f = np.tile(f, 4)
+
+    order = np.argsort(tap_index, kind='stable')
+    tap_index, tap_coeff, tap_s, tap_f = tap_index[order], tap_coeff[order], tap_s[order], tap_f[order]
+
+    shift_start = np.searchsorted(tap_index, np.arange(len(shifts) + 1))
+
+    padding = _get_padding(shifts)
+
+    x_pad = np.pad(np.transpose(x, (1, 0, 2, 3)).astype(dtype, copy=False),
+                   pad_width=[(0, 0), (0, 0), (padding, padding), (padding, padding)], mode='constant')
+
+    y = np.zeros((num_output, N * H_out * W_out), dtype=dtype)
+
+    for k, (shift_y, shift_x) in enumerate(shifts):
+        taps = slice(shift_start[k], shift_start[k + 1])
+
+        used_s, s_index = np.unique(tap_s[taps], return_inverse=True)
+        used_f, f_index = np.unique(tap_f[taps], return_inverse=True)
+
+        coeff_k = np.bincount(f_index * len(used_s) + s_index, weights=tap_coeff[taps],
+                              minlength=len(used_f) * len(used_s)).reshape(len(used_f), len(used_s))
+
+        y_start = padding + shift_y
+        x_start = padding + shift_x
+
+        x_s = x_pad[used_s, :, y_start:y_start + (H_out - 1) * stride + 1:stride, x_start:x_start + W:stride]
+
+        y[used_f] += np.dot(coeff_k.astype(dtype, copy=False), x_s.reshape(len(used_s), N * H_out * W_out))
+
+    return np.transpose(y.reshape(num_output, N, H_out, W_out), (1, 0, 2, 3))
+
+def forward_sparse(x, units, num_output, sigma, kernel_size=None, stride=1, blur_method='auto'):
+    """Forward pass of DAU convolution (same as forward()) with units given as a sparse list from prune_units(). Only
+    input channels used by at least one unit are blurred and offset-and-sum iterates over the surviving units only
+    (see sparse_offset_and_sum())."""
+    s, f, mu1, mu2, w = units
+
+    filter, _, _, _, _ = get_filters(_get_sigma_value(sigma), kernel_size)
+
+    used_s, s_index = np.unique(s, return_inverse=True)
+
+    x_blur = blur(x[:, used_s], filter, blur_method)
+
+    return sparse_offset_and_sum(x_blur, (s_index, f, mu1, mu2, w), num_output, stride)
+
+def _is_last_edge_ignored(size):
+    # GPU version does not accurately compute gradients of the last row/column when image size is a factor
+    # of 8, 16, 32 or 64 so we may need to ignore them for compatibility
+    for block_size in [64, 32, 16, 8]:
+        if size >= block_size:
+            return size % block_size == 0
+    return False
+
+def shift_and_dot(x, error, shifts, used_shifts=None, stride=1):
+    """Computes D[k,...,s,f] = sum_{n,h,w} x[...,n,s,h*stride+shifts[k,0],w*stride+shifts[k,1]] * error[n,f,h,w] with
+    zero padding for all distinct shifts at once; x can have additional leading axes (e.g. [K,N,S,H,W] for multiple
+    blurred inputs) that share the same shifted views.
+    Returns array of size [K] + x.shape[:-4] + [S, F]."""
+    lead_shape = x.shape[:-4]
+    N, S, H, W = x.shape[-4:]
+    F = error.shape[1]
+
+    H_out, W_out = error.shape[-2:]
+
+    dtype = np.result_type(_get_compute_dtype(x), error.dtype)
+
+    padding = _get_padding(shifts)
+
+    num_lead = int(np.prod(lead_shape))
+
+    # use [..., S, N, H, W] layout so that each shift is a single [...*S x N*H*W] * [N*H*W x F] matrix product
+    x_pad = np.pad(np.swapaxes(x.reshape((num_lead, N, S, H, W)), 1, 2).astype(dtype, copy=False),
+                   pad_width=[(0, 0), (0, 0), (0, 0), (padding, padding), (padding, padding)], mode='constant')
+
+    error_t = np.transpose(error, (0, 2, 3, 1)).reshape(N * H_out * W_out, F).astype(dtype, copy=False)
+
+    output = np.zeros((len(shifts), num_lead * S, F), dtype=dtype)
+
+    for k, (shift_y, shift_x) in enumerate(shifts):
+        if used_shifts is not None and not used_shifts[k]:
+            continue
+
+        x_s = x_pad[:, :, :, padding + shift_y:padding + shift_y + H:stride,
+                             padding + shift_x:padding + shift_x + W:stride]
+
+        output[k] = np.dot(x_s.reshape(num_lead * S, N * H_out * W_out), error_t)
+
+    return output.reshape((len(shifts),) + lead_shape + (S, F))
+
+def backward(x, error, w, mu1, mu2, sigma, num_dau_units_ignore=0, ignore_edge_gradients=True, kernel_size=None,
+             stride=1, blur_method='auto', blurred_input=None):
+    """Backward pass of DAU convolution for NCHW input x, back-propagated error of size [N,F,H_out,W_out] and
+    [1,S,G,F] parameters w, mu1, mu2 (and shared sigma). Error and input are blurred with blur_method (see blur()).
+    Input blurred by forward pass (see forward() with return_blurred_input) can be passed as blurred_input, which
+    saves blurring of the input for the gradient of w (derivative kernel of w is the forward gaussian filter).
+    Returns (backprop_error, w_grad, mu1_grad, mu2_grad), same as DAUConvPython.backward_cpu from unit-tests."""
+    S, G, F = w.shape[1:]
+    H, W = error.shape[-2:]
+
+    filter, deriv_w, deriv_mu1, deriv_mu2, _ = get_filters(_get_sigma_value(sigma), kernel_size)
+
+    # distinct shifts of all units are shared by all three gradients and by the error back-propagation
+    shifts, tap_index, tap_weight = get_unit_taps(mu1, mu2, num_dau_units_ignore)
+
+    coeffs = get_shift_coefficients(w, tap_index, tap_weight, len(shifts), num_dau_units_ignore)
+
+    # we get back-propagated error by rotating offsets i.e. we use negatives of shifts and swap S and F
+    if stride > 1:
+        # strided error is zero at skipped pixels of the full resolution output
+        error_full = np.zeros(error.shape[:2] + x.shape[-2:], dtype=error.dtype)
+        error_full[:, :, ::stride, ::stride] = error
+    else:
+        error_full = error
+
+    backprop_error = shift_and_sum(blur(error_full, filter, blur_method), -1 * shifts, np.swapaxes(coeffs, 1, 2))
+
+    # set right/bottom edges to zero if we should ignore them (for GPU compatibility)
+    if ignore_edge_gradients:
+        error = np.array(error, copy=True)
+
+        if _is_last_edge_ignored(W):
+            error[:, :, :, W - 1] = 0.0
+        if _is_last_edge_ignored(H):
+            error[:, :, H - 1, :] = 0.0
+
+    # pre-blur the X with all three derivative kernels
+    x_blur = np.stack([blur(x, deriv_w, blur_method) if blurred_input is None else blurred_input,
+                       blur(x, deriv_mu1, blur_method),
+                       blur(x, deriv_mu2, blur_method)])
+
+    # skip shifts that have zero interpolation weight in all units
+    used_shifts = np.bincount(tap_index.ravel(), weights=(tap_weight != 0).ravel(), minlength=len(shifts)) > 0
+
+    # [K, 3, S, F] dot-products for all shifts collected in a single pass over shifted views
+    shift_grads = shift_and_dot(x_blur, error, shifts, used_shifts, stride)
+
+    # then gather dot-products of individual units based on their taps
+    s_idx = np.arange(S).reshape(1, S, 1, 1)
+    f_idx = np.arange(F).reshape(1, 1, 1, F)
+
+    unit_grads = np.sum(tap_weight[..., np.newaxis] * np.moveaxis(shift_grads, 1, -1)[tap_index, s_idx, f_idx], axis=0)
+
+    grads = np.zeros((3, 1, S, G, F), dtype=np.float32)
+    grads[:, 0, :, :G - num_dau_units_ignore, :] = np.moveaxis(unit_grads, -1, 0)
+
+    w_grad, mu1_grad, mu2_grad = grads
+
+    # add multiplication with weight for mean gradients
+    mu1_grad = np.multiply(mu1_grad, w)
+    mu2_grad = np.multiply(mu2_grad, w)
+
+    return (backprop_error, w_grad, mu1_grad, mu2_grad)
@@ -17,11 +17,15 @@ REGISTER_OP("DAUConvGrad")
         .Input("mu1: float32") // 4 inputi, w,mu12,sigma
         .Input("mu2: float32") // 4 inputi, w,mu12,sigma
         .Input("sigma: float32") // 4 inputi, w,mu12,sigma
+        .Input("bias: float32") // bias of size [num_output] (used only for its shape with bias_term)
+        .Input("blurred_input: float32") // second output of DAUConv (empty if input needs to be blurred again)
+        .Input("output: float32") // activated output of DAUConv (used only with activation)
         .Output("grad_input: float32") //error naprej
         .Output("grad_weights: float32") //
         .Output("grad_mu1: float32") //
         .Output("grad_mu2: float32") //
         .Output("grad_sigma: float32")
+        .Output("grad_bias: float32")
         .Attr("number_units_x : int  = 2")
         .Attr("number_units_y : int = 2")
         .Attr("number_units_ignore : int = 0")
@@ -35,10 +39,22 @@ REGISTER_OP("DAUConvGrad")
         .Attr("sigma_iteration_step: int = 1")
         .Attr("component_border_bound: int = 4")
         .Attr("sigma_lower_bound: float = 0.3")
-        .Attr("merge_iteration_step: int = 0")
-        .Attr("merge_threshold: int = 1")
         .Attr("unit_testing: bool = false")
-        .Attr("mu_learning_rate_factor: float = 1.0");
+        .Attr("mu_learning_rate_factor: float = 1.0")
+        .Attr("num_cpu_threads: int = 0")
+        .Attr("data_format: {'NCHW', 'NHWC'} = 'NCHW'")
+        .Attr("profile_name: string = ''")
+        .Attr("blur_method: {'auto', 'direct', 'fft'} = 'auto'")
+        // bias and activation fused into the output by DAUConv (CPU only)
+        .Attr("bias_term: bool = false")
+        .Attr("activation: {'none', 'relu', 'leaky_relu'} = 'none'")
+        .Attr("leaky_relu_alpha: float = 0.2")
+        // outputs that are not computed are returned as empty tensors
+        .Attr("compute_grad_input: bool = true")
+        .Attr("compute_grad_weights: bool = true")
+        .Attr("compute_grad_mu1: bool = true")
+        .Attr("compute_grad_mu2: bool = true")
+        .Attr("compute_grad_bias: bool = true");
 //TODO ADD SETTING INITIALIZATION FROM ATTRIBUTES
 template<typename Device, typename Dtype>
 class DAUConvGradOp : public OpKernel {
@@ -57,8 +73,6 @@ public:
         int sigma_iteration_step;
         int component_border_bound;
         float sigma_lower_bound;
-        int merge_iteration_step;
-        int merge_threshold;
         OP_REQUIRES_OK(context, context->GetAttr("number_units_x", &number_units_x));
         OP_REQUIRES_OK(context, context->GetAttr("number_units_y", &number_units_y));
         OP_REQUIRES_OK(context, context->GetAttr("number_units_ignore", &this->number_units_ignore));
@@ -72,16 +86,42 @@ public:
         OP_REQUIRES_OK(context, context->GetAttr("sigma_iteration_step", &sigma_iteration_step));
         OP_REQUIRES_OK(context, context->GetAttr("component_border_bound", &component_border_bound));
         OP_REQUIRES_OK(context, context->GetAttr("sigma_lower_bound", &sigma_lower_bound));
-        OP_REQUIRES_OK(context, context->GetAttr("merge_iteration_step", &merge_iteration_step));
-        OP_REQUIRES_OK(context, context->GetAttr("merge_threshold", &merge_threshold));
         OP_REQUIRES_OK(context, context->GetAttr("unit_testing", &this->unit_testing));
         OP_REQUIRES_OK(context, context->GetAttr("mu_learning_rate_factor", &this->mu_learning_rate_factor));
+        OP_REQUIRES_OK(context, context->GetAttr("num_cpu_threads", &this->num_cpu_threads));
+        OP_REQUIRES_OK(context, context->GetAttr("profile_name", &this->profile_name));
+        OP_REQUIRES_OK(context, context->GetAttr("blur_method", &this->blur_method));
+        OP_REQUIRES_OK(context, context->GetAttr("bias_term", &this->bias_term));
+        OP_REQUIRES_OK(context, context->GetAttr("activation", &this->activation));
+        OP_REQUIRES_OK(context, context->GetAttr("leaky_relu_alpha", &this->leaky_relu_alpha));
+        OP_REQUIRES(context, this->leaky_relu_alpha >= 0, errors::InvalidArgument("DAUConvGrad requires leaky_relu_alpha >= 0"));
+        OP_REQUIRES_OK(context, context->GetAttr("compute_grad_input", &this->compute_grad_input));
+        OP_REQUIRES_OK(context, context->GetAttr("compute_grad_weights", &this->compute_grad_weights));
+        OP_REQUIRES_OK(context, context->GetAttr("compute_grad_mu1", &this->compute_grad_mu1));
+        OP_REQUIRES_OK(context, context->GetAttr("compute_grad_mu2", &this->compute_grad_mu2));
+        OP_REQUIRES_OK(context, context->GetAttr("compute_grad_bias", &this->compute_grad_bias));
+        // gradient of bias exists only when bias is fused into the op
+        this->compute_grad_bias = this->compute_grad_bias && this->bias_term;
+        // timings of forward and backward ops of the same layer are collected under the same name
+        if (this->profile_name.empty())
+            this->profile_name = this->name();
+        string data_format;
+        OP_REQUIRES_OK(context, context->GetAttr("data_format", &data_format));
+        OP_REQUIRES(context, data_format == "NCHW" || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConvGrad supports NHWC data format only on CPU"));
+        OP_REQUIRES(context, stride > 0, errors::InvalidArgument("DAUConvGrad requires stride > 0"));
+        OP_REQUIRES(context, stride == 1 || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConvGrad supports stride > 1 only on CPU"));
+        OP_REQUIRES(context, kernel_size <= BaseDAUConvLayer<Dtype>::MAX_GPU_KERNEL_SIZE || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConvGrad supports kernel_size > 17 (offsets larger than 8) only on CPU"));
+        OP_REQUIRES(context, (this->bias_term == false && this->activation == "none") || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConvGrad supports bias_term and activation only on CPU"));
         dau_conv_settings.offsets_already_centered = true;
         dau_conv_settings.num_output = num_output;
         //num units per X and per Y
         dau_conv_settings.number_units.push_back(number_units_x);
         dau_conv_settings.number_units.push_back(number_units_y);
-        dau_conv_settings.bias_term = false;
+        dau_conv_settings.bias_term = this->bias_term;
         dau_conv_settings.kernel_size = kernel_size;
         dau_conv_settings.pad = pad;
         dau_conv_settings.stride = stride;
@@ -91,8 +131,7 @@ public:
         dau_conv_settings.sigma_iteration_step = sigma_iteration_step;
         dau_conv_settings.component_border_bound = component_border_bound;
         dau_conv_settings.sigma_lower_bound = sigma_lower_bound;
-        dau_conv_settings.merge_iteration_step = merge_iteration_step;
-        dau_conv_settings.merge_threshold = merge_threshold;
+        dau_conv_settings.channels_last = data_format == "NHWC";
 
 
     }
@@ -100,10 +139,7 @@ public:
     void Compute(OpKernelContext *context) override {
 
 
-        DCHECK_EQ(6, context->num_inputs());
-
-        // in_train is used only for merge_iteration_step, which is not setup.
-        bool in_train = false;
+        DCHECK_EQ(9, context->num_inputs());
 
         const Tensor *grad;
         context->input("grad", &grad);
@@ -117,6 +153,12 @@ public:
         context->input("mu2", &mu2);
         const Tensor *sigma;
         context->input("sigma", &sigma);
+        const Tensor *bias;
+        context->input("bias", &bias);
+        const Tensor *blurred_input;
+        context->input("blurred_input", &blurred_input);
+        const Tensor *output;
+        context->input("output", &output);
 
         TensorShape input_shape = input->shape();
         TensorShape weights_shape = weights->shape();
@@ -141,15 +183,72 @@ public:
         Tensor *grad_mu1 = NULL;
         Tensor *grad_mu2 = NULL;
         Tensor *grad_sigma = NULL;
-        OP_REQUIRES_OK(context, context->allocate_output(1, weights_shape, &grad_weights));
-        OP_REQUIRES_OK(context, context->allocate_output(2, mu1_shape, &grad_mu1));
-        OP_REQUIRES_OK(context, context->allocate_output(3, mu2_shape, &grad_mu2));
-        OP_REQUIRES_OK(context, context->allocate_output(4, sigma_shape, &grad_sigma));
-
+        // gradients that are not requested are not computed and their outputs are empty (sigma gradient is never
+        // computed since sigma is not learned)
+        const TensorShape empty_shape({0});
+        OP_REQUIRES_OK(context, context->allocate_output(1, this->compute_grad_weights ? weights_shape : empty_shape, &grad_weights));
+        OP_REQUIRES_OK(context, context->allocate_output(2, this->compute_grad_mu1 ? mu1_shape : empty_shape, &grad_mu1));
+        OP_REQUIRES_OK(context, context->allocate_output(3, this->compute_grad_mu2 ? mu2_shape : empty_shape, &grad_mu2));
+        OP_REQUIRES_OK(context, context->allocate_output(4, empty_shape, &grad_sigma));
+
+        OP_REQUIRES(context, this->bias_term == false || bias->shape() == TensorShape({dau_conv_settings.num_output}),
+                    errors::InvalidArgument("DAUConvGrad with bias_term requires bias of size [num_output]"));
+
+        // bias gradient is accumulated by Backward_cpu
+        Tensor *grad_bias = NULL;
+        OP_REQUIRES_OK(context, context->allocate_output(5, this->compute_grad_bias ? bias->shape() : empty_shape, &grad_bias));
+        if (this->compute_grad_bias)
+            memset(TENSOR_DATA_PTR(grad_bias, Dtype), 0, grad_bias->NumElements() * sizeof(Dtype));
+
+
+        const bool on_gpu = DAUConvDeviceTF<Device, Dtype>::on_gpu;
+
+        // GPU version computes units in groups of ALLOWED_UNITS_GROUP so odd number of units are padded with
+        // zero-weight units for computation and gradients of padded units are dropped at the end
+        Tensor weights_padded, mu1_padded, mu2_padded, sigma_padded;
+        Tensor grad_weights_padded, grad_mu1_padded, grad_mu2_padded, grad_sigma_padded;
+
+        Tensor* grad_weights_out = grad_weights;
+        Tensor* grad_mu1_out = grad_mu1;
+        Tensor* grad_mu2_out = grad_mu2;
+
+        const int num_units = weights_shape.dim_size(2);
+        const int num_units_padded = get_num_units_padded_tf(num_units, on_gpu);
+
+        if (num_units_padded != num_units) {
+            TensorShape padded_shape = weights_shape;
+            padded_shape.set_dim(2, num_units_padded);
+
+            Tensor* padded_tensors[] = {&weights_padded, &mu1_padded, &mu2_padded, &sigma_padded,
+                                        &grad_weights_padded, &grad_mu1_padded, &grad_mu2_padded, &grad_sigma_padded};
+            for (Tensor* t : padded_tensors)
+                OP_REQUIRES_OK(context, context->allocate_temp(DataTypeToEnum<Dtype>::v(), padded_shape, t));
+
+            copy_dau_units_gpu<Dtype>(*weights, &weights_padded);
+            copy_dau_units_gpu<Dtype>(*mu1, &mu1_padded);
+            copy_dau_units_gpu<Dtype>(*mu2, &mu2_padded);
+            copy_dau_units_gpu<Dtype>(*sigma, &sigma_padded, true);
+
+            weights = &weights_padded;
+            mu1 = &mu1_padded;
+            mu2 = &mu2_padded;
+            sigma = &sigma_padded;
+
+            grad_weights = &grad_weights_padded;
+            grad_mu1 = &grad_mu1_padded;
+            grad_mu2 = &grad_mu2_padded;
+            grad_sigma = &grad_sigma_padded;
+        }
 
-        CUDA_CHECK(cudaMemset(TENSOR_DATA_PTR(grad_weights,Dtype),0, grad_weights->NumElements() * sizeof(Dtype)));
-        CUDA_CHECK(cudaMemset(TENSOR_DATA_PTR(grad_mu1, Dtype),0, grad_mu1->NumElements() * sizeof(Dtype)));
-        CUDA_CHECK(cudaMemset(TENSOR_DATA_PTR(grad_mu2, Dtype),0, grad_mu2->NumElements() * sizeof(Dtype)));
+        if (on_gpu) {
+            CUDA_CHECK(cudaMemset(TENSOR_DATA_PTR(grad_weights,Dtype),0, grad_weights->NumElements() * sizeof(Dtype)));
+            CUDA_CHECK(cudaMemset(TENSOR_DATA_PTR(grad_mu1, Dtype),0, grad_mu1->NumElements() * sizeof(Dtype)));
+            CUDA_CHECK(cudaMemset(TENSOR_DATA_PTR(grad_mu2, Dtype),0, grad_mu2->NumElements() * sizeof(Dtype)));
+        } else {
+            memset(TENSOR_DATA_PTR(grad_weights,Dtype),0, grad_weights->NumElements() * sizeof(Dtype));
+            memset(TENSOR_DATA_PTR(grad_mu1, Dtype),0, grad_mu1->NumElements() * sizeof(Dtype));
+            memset(TENSOR_DATA_PTR(grad_mu2, Dtype),0, grad_mu2->NumElements() * sizeof(Dtype));
+        }
         //CUDA_CHECK(cudaMemset(reinterpret_cast<Dtype*>(grad_sigma->flat<Dtype>().data()),0, grad_sigma->NumElements() * sizeof(Dtype)));
 
 
@@ -157,87 +256,178 @@ public:
         //Initializer does nothing, Tensorflow variables are initialized in python.
         NullDAUComponentInitializerTensorflow<Dtype> param_initializer;
 
-        DAUKernelComputeTFGPU<Dtype> dau_kernel_compute(context);
-        DAUKernelParamsTFGPU<Dtype> dau_kernel_params(context);
-        DAUKernelOutputTFGPU<Dtype> dau_kernel_output(context);
+        //TODO Get stream from context and add it to cublas handle..
 
+        // reuse layer from previous call unless input shape or pre-filtering kernel size changed (concurrent calls
+        // check out their own layer states, so they do not wait for each other)
+        const std::vector<int> state_key = DAUConvLayerStateTF<Device, Dtype>::get_key(input, sigma);
+        typename DAUConvLayerStatePoolTF<Device, Dtype>::ScopedState layer_state(layer_states, state_key);
 
+        const bool rebuild_layer = layer_state->is_valid(state_key) == false;
 
+        DAUConvLayerTensorflowGPU<Dtype>* tf_layer = rebuild_layer ? layer_state->rebuild(context, this->unit_testing)
+                                                                   : layer_state->reuse(context);
 
+        tf_layer->set_num_cpu_threads(get_num_cpu_threads_tf(context, this->num_cpu_threads));
+        tf_layer->set_profile_name(this->profile_name);
+        tf_layer->set_blur_method(get_blur_method_tf(this->blur_method));
+        tf_layer->set_activation(get_activation_tf(this->activation), this->leaky_relu_alpha);
 
-        cublasHandle_t handle;
-        cublasCreate(&handle);
-        //const cudaStream_t* stream = CHECK_NOTNULL(reinterpret_cast<const cudaStream_t*>(context->op_device_context()
-        //                                                                                -> stream()->implementation()
-        //                                                                                ->CudaStreamMemberHack()) );
-        //cublasSetStream(handle, stream);
-        //TODO Get stream from context and add it to handle..
+        // input blurred by forward pass (saved only by CPU version of DAUConv)
+        const bool use_blurred_input = blurred_input->NumElements() > 0;
 
+        OP_REQUIRES(context, use_blurred_input == false || blurred_input->NumElements() == input->NumElements(),
+                    errors::InvalidArgument("DAUConvGrad requires blurred_input of the same size as input or empty"));
+        OP_REQUIRES(context, use_blurred_input == false || on_gpu == false,
+                    errors::InvalidArgument("DAUConvGrad supports blurred_input only on CPU"));
 
-        // Tensorflow layer initialization
-        DAUConvLayerTensorflowGPU<Dtype> tf_layer(handle, context, this->unit_testing);
+        tf_layer->set_saved_blurred_input(use_blurred_input ? (Dtype*)TENSOR_DATA_PTR_CONST(blurred_input, Dtype) : NULL);
 
         //set parameters from input tensors
+        tf_layer->InitializeFromInput(dau_conv_settings, (Tensor *) weights, (Tensor *) mu1, (Tensor *) mu2,
+                                      (Tensor *) sigma, (Tensor *) bias);
+
+        tf_layer->InitializeGrad(dau_conv_settings, grad_weights, grad_mu1, grad_mu2, grad_sigma, grad_bias);
 
-        tf_layer.enable_forward(false);
-        tf_layer.enable_backward(true);
+        const int height_axis = dau_conv_settings.channels_last ? 1 : 2;
+        const int height_out = get_output_size_tf(input_shape.dim_size(height_axis), dau_conv_settings.kernel_size,
+                                                  dau_conv_settings.pad, dau_conv_settings.stride);
+        const int width_out = get_output_size_tf(input_shape.dim_size(height_axis + 1), dau_conv_settings.kernel_size,
+                                                 dau_conv_settings.pad, dau_conv_settings.stride);
 
-        // prevent display of allocation size on each call (except when doing unit testing)
-        tf_layer.enable_memalloc_info(this->unit_testing == true ? true : false);
+        std::vector<int> top_shape;
+        if (dau_conv_settings.channels_last) {
+            top_shape.push_back(input_shape.dim_size(0));
+            top_shape.push_back(height_out);
+            top_shape.push_back(width_out);
+            top_shape.push_back(dau_conv_settings.num_output);
+        } else {
+            top_shape.push_back(input_shape.dim_size(0));
+            top_shape.push_back(dau_conv_settings.num_output);
+            top_shape.push_back(height_out);
+            top_shape.push_back(width_out);
+        }
 
-        tf_layer.InitializeFromInput(dau_conv_settings, (Tensor *) weights, (Tensor *) mu1, (Tensor *) mu2,
-                                     (Tensor *) sigma);
+        if (rebuild_layer) {
+            tf_layer->enable_forward(false);
+            tf_layer->enable_backward(true);
 
-        tf_layer.InitializeGrad(dau_conv_settings, grad_weights, grad_mu1, grad_mu2, grad_sigma);
+            // prevent display of allocation size on each call (except when doing unit testing)
+            tf_layer->enable_memalloc_info(this->unit_testing == true ? true : false);
 
-        tf_layer.LayerSetUp(dau_conv_settings, param_initializer, &dau_kernel_compute, &dau_kernel_params,
-                            &dau_kernel_output, bottom_shape, number_units_ignore, in_train);
+            tf_layer->LayerSetUp(dau_conv_settings, param_initializer, layer_state->kernel_compute(), layer_state->kernel_params(),
+                                 layer_state->kernel_output(), bottom_shape, number_units_ignore);
 
+            tf_layer->Reshape(bottom_shape, top_shape);
 
+            if (!context->status().ok()) {
+                layer_state->reset();
+                return;
+            }
 
+            // only fully initialized layer can be reused by later calls
+            layer_state->commit(state_key);
 
-        std::vector<int> top_shape;
-        top_shape.push_back(input_shape.dim_size(0));
-        top_shape.push_back(weights->dim_size(1));
-        top_shape.push_back(input_shape.dim_size(2));
-        top_shape.push_back(input_shape.dim_size(3));
+            if (this->unit_testing) {
+                DAUWorkspacePoolTF* pool = layer_state->workspace_pool();
+                std::cout << "DAUConvGrad layer state rebuilt (hits: " << layer_states.num_hits() << ", rebuilds: " << layer_states.num_rebuilds() << ")";
+                if (pool != NULL)
+                    std::cout << " workspace (steady-state: " << pool->steady_state_bytes() << " B, peak: " << pool->peak_bytes() << " B, allocations: " << pool->num_allocations() << ", arenas: " << pool->num_arenas() << ")";
+                std::cout << std::endl;
+            }
+        }
 
-        tf_layer.Reshape(bottom_shape, top_shape);
 
         TensorShape output_shape;
         for (int i = 0; i < top_shape.size(); i++) output_shape.AddDim(top_shape[i]);
 
+        OP_REQUIRES(context, grad->shape() == output_shape,
+                    errors::InvalidArgument("DAUConvGrad requires grad of the same shape as output of DAUConv"));
+
         // grad is top error since it is the error of the output of the layer
         const Dtype *top_error = TENSOR_DATA_PTR_CONST(grad, Dtype);
 
         const Dtype *bottom_data = TENSOR_DATA_PTR_CONST(input, Dtype);
 
-        OP_REQUIRES_OK(context, context->allocate_output(0, input_shape, &grad_input));
-        Dtype *bottom_error = TENSOR_DATA_PTR(grad_input,Dtype);
+        // derivative of activation is computed from the activated output
+        OP_REQUIRES(context, this->activation == "none" || output->shape() == output_shape,
+                    errors::InvalidArgument("DAUConvGrad with activation requires output of DAUConv"));
 
+        const Dtype *top_data = this->activation != "none" ? TENSOR_DATA_PTR_CONST(output, Dtype) : NULL;
 
-        tf_layer.Backward_gpu(NULL, top_error, top_shape, true, bottom_data, bottom_error, bottom_shape,
-                              {true, true, true, false, false});
+        OP_REQUIRES_OK(context, context->allocate_output(0, this->compute_grad_input ? input_shape : empty_shape, &grad_input));
+        Dtype *bottom_error = this->compute_grad_input ? TENSOR_DATA_PTR(grad_input,Dtype) : NULL;
+
+        const std::vector<bool> params_propagate_down = {this->compute_grad_weights, this->compute_grad_mu1,
+                                                         this->compute_grad_mu2, false, this->compute_grad_bias};
+
+        if (on_gpu) {
+            // workspace is shared with other DAUConv layers on the same device, but it is checked out only while
+            // this call enqueues its work (CPU version does not use workspace)
+            OP_REQUIRES(context, tf_layer->update_workspace_mem(),
+                        errors::ResourceExhausted("Unable to allocate workspace memory for DAUConvGrad"));
+
+            tf_layer->Backward_gpu(NULL, top_error, top_shape, this->compute_grad_input, bottom_data, bottom_error, bottom_shape,
+                                   params_propagate_down);
+            tf_layer->release_workspace_mem();
+        } else {
+            tf_layer->Backward_cpu(top_data, top_error, top_shape, this->compute_grad_input, bottom_data, bottom_error, bottom_shape,
+                                   params_propagate_down);
+        }
+
+        // drop gradients of padded units
+        if (grad_weights != grad_weights_out) {
+            if (this->compute_grad_weights) copy_dau_units_gpu<Dtype>(*grad_weights, grad_weights_out);
+            if (this->compute_grad_mu1) copy_dau_units_gpu<Dtype>(*grad_mu1, grad_mu1_out);
+            if (this->compute_grad_mu2) copy_dau_units_gpu<Dtype>(*grad_mu2, grad_mu2_out);
+
+            grad_weights = grad_weights_out;
+            grad_mu1 = grad_mu1_out;
+            grad_mu2 = grad_mu2_out;
+        }
 
         // multiply mu with learning rate if needed
         if (mu_learning_rate_factor != 1.0) {
             Dtype* mu1_data = TENSOR_DATA_PTR(grad_mu1, Dtype);
             Dtype* mu2_data = TENSOR_DATA_PTR(grad_mu2, Dtype);
 
-            DAUConvNet::caffe_gpu_scal<Dtype>(grad_mu1->NumElements(), mu_learning_rate_factor, mu1_data, handle);
-            DAUConvNet::caffe_gpu_scal<Dtype>(grad_mu2->NumElements(), mu_learning_rate_factor, mu2_data, handle);
+            if (on_gpu) {
+                DAUConvNet::caffe_gpu_scal<Dtype>(grad_mu1->NumElements(), mu_learning_rate_factor, mu1_data, layer_state->cublas_handle());
+                DAUConvNet::caffe_gpu_scal<Dtype>(grad_mu2->NumElements(), mu_learning_rate_factor, mu2_data, layer_state->cublas_handle());
+            } else {
+                DAUConvNet::caffe_scal<Dtype>(grad_mu1->NumElements(), mu_learning_rate_factor, mu1_data);
+                DAUConvNet::caffe_scal<Dtype>(grad_mu2->NumElements(), mu_learning_rate_factor, mu2_data);
+            }
         }
 
-
-        //destroy cublas handle after end of op
-        cublasDestroy(handle);
-
     }
 private:
     DAUConvNet::DAUConvSettings dau_conv_settings;
     bool unit_testing;
     float mu_learning_rate_factor;
     int number_units_ignore;
+    int num_cpu_threads;
+    std::string profile_name;
+    // direct or FFT pre-filtering on CPU ('auto' selects FFT for large kernels)
+    string blur_method;
+    // which gradients are computed (e.g. input gradient is not needed for the first layer and parameter gradients
+    // are not needed for frozen layers)
+    bool compute_grad_input;
+    bool compute_grad_weights;
+    bool compute_grad_mu1;
+    bool compute_grad_mu2;
+    bool compute_grad_bias;
+    // bias and activation fused into the output by DAUConv (CPU only)
+    bool bias_term;
+    string activation;
+    float leaky_relu_alpha;
+
+    // layers with buffers that are reused between calls
+    DAUConvLayerStatePoolTF<Device, Dtype> layer_states;
 };
 
-REGISTER_KERNEL_BUILDER(Name("DAUConvGrad").Device(DEVICE_GPU), DAUConvGradOp<GPUDevice, float>);
\ No newline at end of file
+REGISTER_KERNEL_BUILDER(Name("DAUConvGrad").Device(DEVICE_CPU), DAUConvGradOp<CPUDevice, float>);
+
+#ifdef GOOGLE_CUDA
+REGISTER_KERNEL_BUILDER(Name("DAUConvGrad").Device(DEVICE_GPU), DAUConvGradOp<GPUDevice, float>);
+#endif //google_cuda
\ No newline at end of file
@@ -1,4 +1,5 @@
 #include <algorithm>
+#include <map>
 
 #include "tensorflow/core/framework/op_kernel.h"
 
@@ -11,26 +12,22 @@ using namespace std;
 using namespace tensorflow;
 
 template <typename Dtype>
-void DAUConvLayerTensorflowGPU<Dtype>::InitializeGrad(DAUConvSettings& settings, Tensor* w_grad, Tensor* mu1_grad, Tensor* mu2_grad, Tensor* sigma_grad){
+void DAUConvLayerTensorflowGPU<Dtype>::InitializeGrad(DAUConvSettings& settings, Tensor* w_grad, Tensor* mu1_grad, Tensor* mu2_grad, Tensor* sigma_grad,
+                                                     Tensor* bias_grad){
 
     this->param_buffer_w_grad = w_grad;
     this->param_buffer_mu1_grad = mu1_grad;
     this->param_buffer_mu2_grad = mu2_grad;
     this->param_buffer_sigma_grad = sigma_grad;
 
-    if(settings.bias_term){
-
-        this->param_buffer_bias_grad = new Tensor();
-        OP_REQUIRES_OK(this->context_, this->context_->allocate_temp(DT_FLOAT, w_grad->shape(), this->param_buffer_bias_grad));
-
-    }
-
-
+    // bias gradient of size [num_output] is accumulated directly into output of the op
+    this->param_buffer_bias_grad = settings.bias_term ? bias_grad : NULL;
 }
 
 
 template <typename Dtype>
-void DAUConvLayerTensorflowGPU<Dtype>::InitializeFromInput(DAUConvSettings& settings, Tensor* w, Tensor* mu1, Tensor* mu2, Tensor* sigma){
+void DAUConvLayerTensorflowGPU<Dtype>::InitializeFromInput(DAUConvSettings& settings, Tensor* w, Tensor* mu1, Tensor* mu2, Tensor* sigma,
+                                                          Tensor* bias){
     //Set the layer parameters from input tensors
 
     this->param_buffer_w_ = w;
@@ -38,18 +35,18 @@ void DAUConvLayerTensorflowGPU<Dtype>::InitializeFromInput(DAUConvSettings& sett
     this->param_buffer_mu2_ = mu2;
     this->param_buffer_sigma_ = sigma;
 
-    if(settings.bias_term){
+    // when layer is reused for another call of the op we need to re-connect aggregation sigma (see LayerSetUp)
+    if (this->aggregation.param != NULL)
+        reinterpret_cast<DAUKernelParamsTF<Dtype>* >(this->aggregation.param)->sigma_ = sigma;
 
-        if(this->param_buffer_bias_ != NULL) delete this->param_buffer_bias_;
-        this->param_buffer_bias_ = new Tensor();
-        OP_REQUIRES_OK(this->context_, this->context_->allocate_temp(DT_FLOAT, w->shape(), (Tensor*) this->param_buffer_bias_));
+    // bias of size [num_output] is used only by CPU version (see BaseDAUConvLayer::Forward_cpu)
+    this->param_buffer_bias_ = settings.bias_term ? bias : NULL;
 
-    }
-    
 }
 
 template <typename Dtype>
 DAUConvLayerTensorflowGPU<Dtype>::~DAUConvLayerTensorflowGPU(){
+    this->release_workspace_mem();
     this->deallocate_workspace_mem();
     if(this->bwd_gradients_ != NULL) delete this->bwd_gradients_;
     if(this->interm_buffer_ != NULL) delete this->interm_buffer_;
@@ -59,9 +56,157 @@ DAUConvLayerTensorflowGPU<Dtype>::~DAUConvLayerTensorflowGPU(){
 
 }
 
+std::shared_ptr<DAUWorkspacePoolTF> DAUWorkspacePoolTF::get_pool(const string& device_name) {
+
+    static mutex pools_mu;
+    static std::map<string, std::weak_ptr<DAUWorkspacePoolTF> > pools;
+
+    mutex_lock lock(pools_mu);
+
+    std::shared_ptr<DAUWorkspacePoolTF> pool = pools[device_name].lock();
+
+    if (!pool) {
+        pool.reset(new DAUWorkspacePoolTF());
+        pools[device_name] = pool;
+    }
+    return pool;
+}
+
+DAUWorkspacePoolTF::Arena* DAUWorkspacePoolTF::acquire(OpKernelContext* context, size_t bytes) {
+
+    Arena* arena = NULL;
+    {
+        mutex_lock lock(this->mu_);
+
+        this->requested_bytes_ = bytes;
+        this->peak_bytes_ = std::max(this->peak_bytes_, bytes);
+
+        // prefer the most recently returned arena that is big enough, then any free arena (that will grow)
+        for (std::list<Arena*>::iterator it = this->free_arenas_.begin(); it != this->free_arenas_.end(); ++it) {
+            if ((*it)->allocated_bytes >= bytes) {
+                arena = *it;
+                this->free_arenas_.erase(it);
+                break;
+            }
+        }
+        if (arena == NULL && this->free_arenas_.empty() == false) {
+            arena = this->free_arenas_.front();
+            this->free_arenas_.pop_front();
+        }
+        if (arena == NULL) {
+            arena = new Arena();
+            this->arenas_.push_back(std::unique_ptr<Arena>(arena));
+        }
+    }
+
+    // reuse existing memory if it is big enough
+    if (arena->tensor != NULL && bytes <= arena->allocated_bytes)
+        return arena;
+
+    // release existing memory first to allow allocator to reuse it (but only once its last user is done with it)
+    const size_t released_bytes = arena->allocated_bytes;
+
+    if (arena->tensor != NULL) {
+        if (arena->released_event != NULL)
+            CUDA_CHECK(cudaEventSynchronize(arena->released_event));
+
+        delete arena->tensor;
+        arena->tensor = NULL;
+        arena->allocated_bytes = 0;
+    }
+
+    Tensor* tmp_ten = new Tensor();
+    Status can_allocate = context->allocate_temp(DT_INT8, TensorShape({(int64)bytes}), tmp_ten);
+
+    mutex_lock lock(this->mu_);
+
+    this->allocated_bytes_ -= released_bytes;
+
+    if(!TF_PREDICT_TRUE(can_allocate.ok())){
+        delete tmp_ten;
+        this->free_arenas_.push_back(arena);
+        return NULL;
+    }
+
+    arena->tensor = tmp_ten;
+    arena->allocated_bytes = bytes;
+
+    this->allocated_bytes_ += bytes;
+    this->num_allocations_++;
+
+    return arena;
+}
+
+void DAUWorkspacePoolTF::release(Arena* arena, cudaStream_t stream) {
+
+    // arena is not shared until it is returned so event can be (re)recorded without lock
+    if (arena->released_event == NULL)
+        CUDA_CHECK(cudaEventCreateWithFlags(&arena->released_event, cudaEventDisableTiming));
+
+    CUDA_CHECK(cudaEventRecord(arena->released_event, stream));
+
+    mutex_lock lock(this->mu_);
+    this->free_arenas_.push_front(arena);
+}
+
+template <typename Dtype>
+bool DAUConvLayerTensorflowGPU<Dtype>::update_workspace_mem() {
+
+    if (!this->workspace_pool_ || this->workspaceSizeInBytes == 0)
+        return true;
+
+    // held arena could be too small only if layer was reshaped since it was checked out
+    if (this->workspace_arena_ != NULL && this->workspace_arena_->allocated_bytes < this->workspaceSizeInBytes)
+        this->release_workspace_mem();
+
+    if (this->workspace_arena_ == NULL) {
+        this->workspace_arena_ = this->workspace_pool_->acquire(this->context_, this->workspaceSizeInBytes);
+
+        if (this->workspace_arena_ == NULL)
+            return false;
+
+        // previous user of arena may still be using it on its own streams, so all our streams wait for it
+        // (work on the main stream and on parallel streams both uses workspace)
+        cudaEvent_t released_event = this->workspace_arena_->released_event;
+        if (released_event != NULL) {
+            CUDA_CHECK(cudaStreamWaitEvent(this->stream_[0], released_event, 0));
+            for (int g = 0; g < 4; ++g)
+                CUDA_CHECK(cudaStreamWaitEvent(this->paralel_streams[g], released_event, 0));
+        }
+    }
+
+    void* workspace_data = TENSOR_DATA_PTR(this->workspace_arena_->tensor, int8);
+
+    // buffers need to be updated only if memory was moved (by this or any other layer)
+    if (workspace_data != this->pool_workspace_data) {
+        this->set_workspace_mem(workspace_data);
+        this->pool_workspace_data = workspace_data;
+    }
+    return true;
+}
+
+template <typename Dtype>
+void DAUConvLayerTensorflowGPU<Dtype>::release_workspace_mem() {
+
+    if (this->workspace_arena_ == NULL)
+        return;
+
+    // Forward_gpu() and Backward_gpu() join work of parallel streams into the main stream, so event on the main
+    // stream marks the point when workspace is no longer used
+    this->workspace_pool_->release(this->workspace_arena_, this->stream_[0]);
+    this->workspace_arena_ = NULL;
+}
+
 template <typename Dtype>
 void* DAUConvLayerTensorflowGPU<Dtype>::allocate_workspace_mem(size_t bytes) {
 
+    // when using shared pool then memory is owned by pool (and it is held until release_workspace_mem())
+    if (this->workspace_pool_) {
+        if (this->update_workspace_mem() == false)
+            return NULL;
+        return this->pool_workspace_data;
+    }
+
     DataType tensorflow_dtype = DataTypeToEnum<Dtype>::v();
 
     //delete previously allocated memory
@@ -152,10 +297,10 @@ void DAUConvLayerTensorflowGPU<Dtype>::reshape_params(const vector<int>& shape)
     }
 
 
-    if (this->bias_term_ != NULL) {
+    if (this->bias_term_) {
 
         Tensor* orig_ten_bias = (Tensor*) this->param_buffer_bias_;
-        CHECK(orig_ten_bias->shape().IsSameSize(tmp_shape));
+        CHECK(orig_ten_bias->shape().IsSameSize(TensorShape({tmp_shape.dim_size(3)})));
 
     }
 }
@@ -168,27 +313,20 @@ void DAUConvLayerTensorflowGPU<Dtype>::LayerSetUp(const DAUConvSettings& setting
                                              BaseDAUKernelOutput<Dtype>* kernel_output,
                                              const vector<int>& bottom_shape, int num_dau_units_ignore, bool in_train) {
 
-    // ensure prod(settings.number_units) must be dividable by ALLOWED_UNITS_GROUP
-    int num_units_all = 1;
-    for (int i = 0; i < settings.number_units.size(); i++)
-        num_units_all *= settings.number_units[i];
-
-    DCHECK_EQ(num_units_all % this->ALLOWED_UNITS_GROUP, 0);
-
     // call parent to compute all the shape variables and call initialize of parameter shape
     BaseDAUConvLayer<Dtype>::LayerSetUp(settings, param_initializer,
                                         kernel_compute, kernel_param, kernel_output,
                                         bottom_shape, in_train);
 
-    // for tensorflow we expect to get memory for all units (i.e. prod(settings.number_units) must be dividable by ALLOWED_UNITS_GROUP)
-    // but if we need only some then we need to setup this here
-    // NOTE: this must be done after call to parent LayerSetUp where 'this->num_units_ignore = 0' is called
-    this->num_units_ignore = num_dau_units_ignore;
+    // for tensorflow we expect to get memory for all units (on GPU ops provide params padded to ALLOWED_UNITS_GROUP
+    // that parent LayerSetUp has already set to be ignored) but if we need only some then we need to setup this here
+    // NOTE: this must be done after call to parent LayerSetUp where 'this->num_units_ignore' is initialized
+    this->num_units_ignore += num_dau_units_ignore;
 
     // we use actual (learnable) sigma parameter when computing kernels so connect that param with the sigma for aggregation
-    DAUKernelParamsTFGPU<Dtype>* kernel_param_tf_gpu = reinterpret_cast<DAUKernelParamsTFGPU<Dtype>* >(kernel_param);
-    if(kernel_param_tf_gpu->sigma_) delete kernel_param_tf_gpu->sigma_;
-    kernel_param_tf_gpu->sigma_ = (Tensor*) this->param_buffer_sigma_;
+    DAUKernelParamsTF<Dtype>* kernel_param_tf = reinterpret_cast<DAUKernelParamsTF<Dtype>* >(kernel_param);
+    if(kernel_param_tf->sigma_) delete kernel_param_tf->sigma_;
+    kernel_param_tf->sigma_ = (Tensor*) this->param_buffer_sigma_;
     
 }
 
@@ -220,31 +358,24 @@ vector<int> DAUConvLayerTensorflowGPU<Dtype>::Reshape(const vector<int>& bottom_
     }
 
     if (this->enabled_fwd_op || this->enabled_bwd_op) {
-        // make sure col_buffer is big enough
-        if(this->col_buffer_ == NULL){
-
-            this->col_buffer_ = new Tensor();
-            TensorShape col_shape = TensorShape({this->aggregation.kernel_h_, this->aggregation.kernel_w_, this->height_, this->width_});
-            OP_REQUIRES_OK_BREAK(this->context_, this->context_->allocate_temp(tensorflow_dtype, col_shape, this->col_buffer_));
-
-        }else{
-
-            CHECK(this->col_buffer_->shape().IsSameSize(TensorShape({this->aggregation.kernel_h_, this->aggregation.kernel_w_, this->height_, this->width_})));
-
-        }
+        // NOTE: col_buffer is allocated on first use in temp_col_buffer() since CPU version needs it only when
+        //       prefiltering kernels are not separable
 
+        // (fused and tiled CPU forward passes use their own buffers of limited size, see set_fused_forward() and
+        //  set_tile_memory_limit(), and forward pass with saved blurred input writes it directly to that buffer)
         int interm_buf_size = 0;
-        if (this->enabled_fwd_op) interm_buf_size = std::max(interm_buf_size, this->conv_in_channels_);
+        if (this->enabled_fwd_op && this->is_forward_tiled(false) == false && this->is_forward_fused() == false &&
+            this->saved_blurred_input_ == NULL) interm_buf_size = std::max(interm_buf_size, this->conv_in_channels_);
         if (this->enabled_bwd_op) interm_buf_size = std::max(interm_buf_size, this->conv_out_channels_ * this->NUM_K);
 
         // use inter buffer for both fwd and bwd passes so allocate buffer with suitable size for both
-        if(this->interm_buffer_ == NULL){
+        if (interm_buf_size > 0 && this->interm_buffer_ == NULL){
 
             this->interm_buffer_ = new Tensor();
             TensorShape interm_shape = TensorShape({this->batch_num_, interm_buf_size, max_height, max_width});
             OP_REQUIRES_OK_BREAK(this->context_, this->context_->allocate_temp(tensorflow_dtype, interm_shape, this->interm_buffer_));
 
-        }else{
+        }else if (interm_buf_size > 0){
 
             CHECK(this->interm_buffer_->shape().IsSameSize(TensorShape({this->batch_num_, interm_buf_size, max_height, max_width})));
 
@@ -284,6 +415,35 @@ vector<int> DAUConvLayerTensorflowGPU<Dtype>::Reshape(const vector<int>& bottom_
 
 }
 
+template <typename Dtype>
+Dtype* DAUConvLayerTensorflowGPU<Dtype>::temp_col_buffer() {
+
+    // make sure col_buffer is big enough
+    if(this->col_buffer_ == NULL){
+
+        DataType tensorflow_dtype = DataTypeToEnum<Dtype>::v();
+
+        Tensor* col_buffer = new Tensor();
+        TensorShape col_shape = TensorShape({this->aggregation.kernel_h_, this->aggregation.kernel_w_, this->height_, this->width_});
+
+        Status can_allocate = this->context_->allocate_temp(tensorflow_dtype, col_shape, col_buffer);
+
+        if(!TF_PREDICT_TRUE(can_allocate.ok())){
+            this->context_->CtxFailureWithWarning(__FILE__, __LINE__, can_allocate);
+            delete col_buffer;
+            return NULL;
+        }
+
+        this->col_buffer_ = col_buffer;
+
+    }else{
+
+        CHECK(this->col_buffer_->shape().IsSameSize(TensorShape({this->aggregation.kernel_h_, this->aggregation.kernel_w_, this->height_, this->width_})));
+
+    }
+    return TENSOR_DATA_PTR(col_buffer_, Dtype);
+}
+
 template <typename Dtype>
 bool DAUConvLayerTensorflowGPU<Dtype>::update_prefiltering_kernels(cudaStream_t stream) {
     return BaseDAUConvLayer<Dtype>::update_prefiltering_kernels(stream);
@@ -300,9 +460,18 @@ template void* DAUConvLayerTensorflowGPU<float>::allocate_workspace_mem(size_t b
 template void DAUConvLayerTensorflowGPU<double>::deallocate_workspace_mem();
 template void DAUConvLayerTensorflowGPU<float>::deallocate_workspace_mem();
 
+template bool DAUConvLayerTensorflowGPU<double>::update_workspace_mem();
+template bool DAUConvLayerTensorflowGPU<float>::update_workspace_mem();
+
+template void DAUConvLayerTensorflowGPU<double>::release_workspace_mem();
+template void DAUConvLayerTensorflowGPU<float>::release_workspace_mem();
+
 template vector<int> DAUConvLayerTensorflowGPU<double>::Reshape(const vector<int>& bottom_shape, const vector<int>& top);
 template vector<int> DAUConvLayerTensorflowGPU<float>::Reshape(const vector<int>& bottom_shape, const vector<int>& top);
 
+template double* DAUConvLayerTensorflowGPU<double>::temp_col_buffer();
+template float* DAUConvLayerTensorflowGPU<float>::temp_col_buffer();
+
 template void DAUConvLayerTensorflowGPU<float>::LayerSetUp(const DAUConvSettings& settings, const BaseDAUComponentInitializer<float>& param_initializer,
                                                       BaseDAUKernelCompute<float>* kernel_compute, BaseDAUKernelParams<float>* kernel_param, BaseDAUKernelOutput<float>* kernel_output,
                                                       const vector<int>& bottom_shape, int num_dau_units_ignore, bool in_train);
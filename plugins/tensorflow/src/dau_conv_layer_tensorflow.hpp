@@ -3,12 +3,16 @@
 
 #include <string>
 #include <utility>
+#include <list>
 #include <vector>
+#include <memory>
+#include <algorithm>
 
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/tensor_shape.h"
 #include "tensorflow/core/platform/default/logging.h"
 #include "tensorflow/core/framework/shape_inference.h"
+#include "tensorflow/core/platform/mutex.h"
 
 #include "dau_conv/base_dau_conv_layer.hpp"
 
@@ -40,6 +44,9 @@ public:
 
     virtual ~DAUKernelParamsTF();
 
+    // buffers can be reused in subsequent calls of the op so update context before each use
+    void set_context(OpKernelContext* context) { context_ = context; }
+
     void reshape(int num_in_channels, int num_out_channels, int num_gauss);
 
 	void initialize_params(Tensor w, Tensor mu1, Tensor mu2, Tensor sigma);
@@ -63,6 +70,8 @@ public:
 
     virtual ~DAUKernelOutputTF();
 
+    void set_context(OpKernelContext* context) { context_ = context; }
+
 	virtual void reshape(int num_in_channels, int num_out_channels, int num_gauss, int kernel_h, int kernel_w);
 
 	// main filter weights
@@ -85,6 +94,8 @@ public:
 
 	virtual ~DAUKernelComputeTF();
 
+	void set_context(OpKernelContext* context) { context_ = context; }
+
 	virtual void reshape(int num_in_channels, int num_out_channels, int num_gauss,
 						 int kernel_h, int kernel_w);
 
@@ -157,10 +168,14 @@ private:
 
 };
 
-//
+////////////////////////////////////////////////////////////////////////////////
+// CPU version of Tensorflow buffers used in DAUKernel*
+
 template <typename Dtype>
 class DAUKernelParamsTFCPU : public DAUKernelParamsTF<Dtype> {
 public:
+    explicit DAUKernelParamsTFCPU(OpKernelContext* context)
+    : DAUKernelParamsTF<Dtype>(context) {}
 
 	virtual Dtype* weight() { return TENSOR_DATA_PTR(this->weight_, Dtype); }
 	virtual Dtype* mu1() { return TENSOR_DATA_PTR(this->mu1_, Dtype); }
@@ -171,6 +186,9 @@ public:
 template <typename Dtype>
 class DAUKernelOutputTFCPU : public DAUKernelOutputTF<Dtype> {
 public:
+    explicit DAUKernelOutputTFCPU(OpKernelContext* context)
+    : DAUKernelOutputTF<Dtype>(context) {}
+
 	virtual Dtype* weight() {return TENSOR_DATA_PTR(this->weight_, Dtype); }
 	virtual Dtype* d_error() {return TENSOR_DATA_PTR(this->d_error_, Dtype); }
 	virtual Dtype* d_params() {return TENSOR_DATA_PTR(this->d_params_, Dtype); }
@@ -179,10 +197,22 @@ public:
 template <typename Dtype>
 class DAUKernelComputeTFCPU : public DAUKernelComputeTF<Dtype> {
 public:
+	explicit DAUKernelComputeTFCPU(OpKernelContext* context)
+		: DAUKernelComputeTF<Dtype>(context) {}
 
-	virtual Dtype* param_temp(typename BaseDAUKernelCompute<Dtype>::Param_IDX index) { return TENSOR_DATA_PTR(this->param_buffers_[index], Dtype); }
-	virtual Dtype* kernels_temp(typename BaseDAUKernelCompute<Dtype>::Kernel_IDX index) { return TENSOR_DATA_PTR(this->param_buffers_[index], Dtype); }
-	virtual int* precomp_index() { return TENSOR_DATA_PTR(this->tmp_precomp_index_, Dtype); }
+	// get_kernels_cpu() does not use any temporary buffers so only store sizes
+	virtual void reshape(int num_in_channels, int num_out_channels, int num_gauss,
+						 int kernel_h, int kernel_w) {
+		this->num_in_channels = num_in_channels;
+		this->num_out_channels = num_out_channels;
+		this->num_gauss = num_gauss;
+		this->kernel_h = kernel_h;
+		this->kernel_w = kernel_w;
+	}
+
+	virtual Dtype* param_temp(typename BaseDAUKernelCompute<Dtype>::Param_IDX index) { return NULL; }
+	virtual Dtype* kernels_temp(typename BaseDAUKernelCompute<Dtype>::Kernel_IDX index) { return NULL; }
+	virtual int* precomp_index() { return NULL; }
 
 };
 
@@ -204,7 +234,64 @@ public:
 };
 
 ////////////////////////////////////////////////////////////////////////////////
-// Tensorflow GPU version of DAUConvolution layer (BaseDAUConvLayer)
+// Workspace memory shared by DAUConv layers (forward and backward ops) on the same GPU (CPU layers do not need it):
+//  - memory is kept in arenas at their high-water mark (i.e. they only grow) so that steady-state training steps do not allocate
+//  - layer checks out an arena only for one call and returns it with an event recorded on the stream that used it, so
+//    the next user waits for that event on its own streams instead of holding a lock while the layer computes
+//  - layers running one after another reuse the same arena, while concurrent layers get separate arenas
+//  - when arena grows existing pointers become invalid, so layers must check memory pointer after each acquire()
+
+class DAUWorkspacePoolTF {
+public:
+	struct Arena {
+		Arena() : tensor(NULL), allocated_bytes(0), released_event(NULL) {}
+		~Arena() {
+			if (tensor != NULL) delete tensor;
+			if (released_event != NULL) cudaEventDestroy(released_event);
+		}
+
+		Tensor* tensor;
+		size_t allocated_bytes;
+		// recorded on the stream of the last user when arena was returned (NULL before first release)
+		cudaEvent_t released_event;
+	};
+
+	DAUWorkspacePoolTF() : allocated_bytes_(0), requested_bytes_(0), peak_bytes_(0), num_allocations_(0) {}
+
+	// returns pool for specific device (the same pool is returned as long as someone is holding it)
+	static std::shared_ptr<DAUWorkspacePoolTF> get_pool(const string& device_name);
+
+	// checks out arena with at least bytes of memory (or NULL if allocation failed) - user must wait for
+	// released_event on all its streams before using the memory
+	Arena* acquire(OpKernelContext* context, size_t bytes);
+
+	// returns arena once all work that uses it has been enqueued on stream
+	void release(Arena* arena, cudaStream_t stream);
+
+	// currently allocated memory of all arenas i.e. the steady-state size after the first few steps
+	size_t steady_state_bytes() const { mutex_lock lock(mu_); return allocated_bytes_; }
+	// largest requested memory (the latest request may be smaller than allocated)
+	size_t peak_bytes() const { mutex_lock lock(mu_); return peak_bytes_; }
+	size_t requested_bytes() const { mutex_lock lock(mu_); return requested_bytes_; }
+	int64 num_allocations() const { mutex_lock lock(mu_); return num_allocations_; }
+	int num_arenas() const { mutex_lock lock(mu_); return arenas_.size(); }
+
+private:
+	mutable mutex mu_;
+
+	vector<std::unique_ptr<Arena> > arenas_;
+	// most recently returned arenas are at the front
+	std::list<Arena*> free_arenas_;
+
+	size_t allocated_bytes_;
+	size_t requested_bytes_;
+	size_t peak_bytes_;
+	int64 num_allocations_;
+};
+
+////////////////////////////////////////////////////////////////////////////////
+// Tensorflow version of DAUConvolution layer (BaseDAUConvLayer) - processing is done on GPU by default and
+// on CPU when set_processing_on_gpu(false) is called before LayerSetUp()
 
 template <typename Dtype>
 class DAUConvLayerTensorflowGPU : public  BaseDAUConvLayer<Dtype> {
@@ -227,8 +314,8 @@ public:
 	//Dtype* w, Dtype* mu1, Dtype* mu2, Dtype* sigma, bool is_gpu_ptr,
     //                                                           int num_units_per_x, int num_units_per_y, int num_units_ignore,
     //                                                           int conv_in_channels, int conv_out_channels, int kernel_h, int kernel_w
-	virtual void InitializeFromInput(DAUConvSettings& settings, Tensor* w, Tensor* mu1, Tensor* mu2, Tensor* sigma);
-	virtual void InitializeGrad(DAUConvSettings& settings, Tensor* w_grad, Tensor* mu1_grad, Tensor* mu2_grad, Tensor* sigma_grad);
+	virtual void InitializeFromInput(DAUConvSettings& settings, Tensor* w, Tensor* mu1, Tensor* mu2, Tensor* sigma, Tensor* bias = NULL);
+	virtual void InitializeGrad(DAUConvSettings& settings, Tensor* w_grad, Tensor* mu1_grad, Tensor* mu2_grad, Tensor* sigma_grad, Tensor* bias_grad = NULL);
 	virtual vector<int> Reshape(const vector<int>& bottom_shape, const vector<int>& top);
 
 	// make compute_output_shape() public
@@ -236,6 +323,16 @@ public:
 
 	void set_processing_on_gpu(bool do_on_gpu) { do_on_gpu_ = do_on_gpu; }
 
+	// use shared workspace pool instead of allocating own workspace memory (must be set before Reshape())
+	void set_workspace_pool(const std::shared_ptr<DAUWorkspacePoolTF>& pool) { workspace_pool_ = pool; }
+
+	// checks out workspace from pool (when not already held) and updates buffers if memory was moved - must be called
+	// before each use on GPU
+	bool update_workspace_mem();
+
+	// returns workspace to pool once Forward_gpu()/Backward_gpu() enqueued all work that uses it
+	void release_workspace_mem();
+
 	// parameters to learn
 	const Tensor* param_buffer_w_ = NULL;
 	const Tensor* param_buffer_mu1_ = NULL;
@@ -275,7 +372,7 @@ protected:
     virtual Dtype* temp_bwd_gradients() { return TENSOR_DATA_PTR(bwd_gradients_, Dtype); }
     virtual Dtype* temp_interm_buffer() { return TENSOR_DATA_PTR(interm_buffer_, Dtype); }
     virtual Dtype* temp_param_buffer() { return TENSOR_DATA_PTR(tmp_param_buffer_, Dtype); }
-    virtual Dtype* temp_col_buffer() { return TENSOR_DATA_PTR(col_buffer_, Dtype); }
+    virtual Dtype* temp_col_buffer();
     virtual Dtype* temp_bias_multiplier() { return TENSOR_DATA_PTR(bias_multiplier_, Dtype); }
 
 	virtual void* allocate_workspace_mem(size_t bytes);
@@ -295,9 +392,287 @@ protected:
     //tensor that holds the workspace memory
     Tensor* own_workspace_tensor = NULL;
 
+	// shared workspace memory (when used then own_workspace_* are not used)
+	std::shared_ptr<DAUWorkspacePoolTF> workspace_pool_;
+	DAUWorkspacePoolTF::Arena* workspace_arena_ = NULL;
+	void* pool_workspace_data = NULL;
+
 	bool do_on_gpu_;
 };
 
+////////////////////////////////////////////////////////////////////////////////
+// Device specific types used by DAUConv ops (Eigen::ThreadPoolDevice for CPU and Eigen::GpuDevice for GPU)
+
+template <typename Device, typename Dtype>
+struct DAUConvDeviceTF;
+
+template <typename Dtype>
+struct DAUConvDeviceTF<Eigen::ThreadPoolDevice, Dtype> {
+	typedef DAUKernelComputeTFCPU<Dtype> KernelCompute;
+	typedef DAUKernelParamsTFCPU<Dtype> KernelParams;
+	typedef DAUKernelOutputTFCPU<Dtype> KernelOutput;
+
+	static const bool on_gpu = false;
+};
+
+template <typename Dtype>
+struct DAUConvDeviceTF<Eigen::GpuDevice, Dtype> {
+	typedef DAUKernelComputeTFGPU<Dtype> KernelCompute;
+	typedef DAUKernelParamsTFGPU<Dtype> KernelParams;
+	typedef DAUKernelOutputTFGPU<Dtype> KernelOutput;
+
+	static const bool on_gpu = true;
+};
+
+// number of threads for CPU processing: when not specified (num_threads == 0) use the same number of threads as
+// Tensorflow uses for intra-op parallelism on its Eigen::ThreadPoolDevice
+inline int get_num_cpu_threads_tf(OpKernelContext* context, int num_threads) {
+	if (num_threads > 0)
+		return num_threads;
+	return context->device()->tensorflow_cpu_worker_threads()->num_threads;
+}
+
+// method of CPU pre-filtering from value of blur_method attribute (one of 'auto', 'direct' or 'fft')
+inline BaseDAUConvLayer<float>::BlurMethod get_blur_method_tf(const string& blur_method) {
+	if (blur_method == "direct")
+		return BaseDAUConvLayer<float>::BLUR_DIRECT;
+	if (blur_method == "fft")
+		return BaseDAUConvLayer<float>::BLUR_FFT;
+	return BaseDAUConvLayer<float>::BLUR_AUTO;
+}
+
+// activation fused into CPU output from value of activation attribute (one of 'none', 'relu' or 'leaky_relu')
+inline BaseDAUConvLayer<float>::Activation get_activation_tf(const string& activation) {
+	if (activation == "relu")
+		return BaseDAUConvLayer<float>::ACTIVATION_RELU;
+	if (activation == "leaky_relu")
+		return BaseDAUConvLayer<float>::ACTIVATION_LEAKY_RELU;
+	return BaseDAUConvLayer<float>::ACTIVATION_NONE;
+}
+
+// spatial size of output (same as in BaseDAUConvLayer::compute_output_shape())
+inline int get_output_size_tf(int input_size, int kernel_size, int pad, int stride) {
+	return (input_size + 2 * pad - kernel_size) / stride + 1;
+}
+
+// number of units per channel the layer computes on GPU, where CUDA kernels process ALLOWED_UNITS_GROUP units at the
+// same time (CPU implementation handles any number of units)
+inline int get_num_units_padded_tf(int num_units, bool on_gpu) {
+	const int group = BaseDAUConvLayer<float>::ALLOWED_UNITS_GROUP;
+	return on_gpu ? ((num_units + group - 1) / group) * group : num_units;
+}
+
+// copies GPU params of shape [1, S, src_units, F] into [1, S, dst_units, F] with units beyond src_units (if any) set
+// to zero or to the last unit of src when replicate_last_unit is used (e.g. for sigma that must remain valid)
+template <typename Dtype>
+void copy_dau_units_gpu(const Tensor& src, Tensor* dst, bool replicate_last_unit = false) {
+	const int S = src.dim_size(1);
+	const int F = src.dim_size(3);
+	const int src_units = src.dim_size(2);
+	const int dst_units = dst->dim_size(2);
+	const int copy_units = std::min(src_units, dst_units);
+
+	const Dtype* src_data = reinterpret_cast<const Dtype*>(src.template flat<Dtype>().data());
+	Dtype* dst_data = reinterpret_cast<Dtype*>(dst->template flat<Dtype>().data());
+
+	if (dst_units > src_units && replicate_last_unit == false)
+		CUDA_CHECK(cudaMemset(dst_data, 0, dst->NumElements() * sizeof(Dtype)));
+
+	CUDA_CHECK(cudaMemcpy2D(dst_data, dst_units * F * sizeof(Dtype), src_data, src_units * F * sizeof(Dtype),
+							copy_units * F * sizeof(Dtype), S, cudaMemcpyDeviceToDevice));
+
+	if (replicate_last_unit) {
+		for (int g = src_units; g < dst_units; ++g)
+			CUDA_CHECK(cudaMemcpy2D(dst_data + g * F, dst_units * F * sizeof(Dtype),
+									src_data + (src_units - 1) * F, src_units * F * sizeof(Dtype),
+									F * sizeof(Dtype), S, cudaMemcpyDeviceToDevice));
+	}
+}
+
+////////////////////////////////////////////////////////////////////////////////
+// Persistent state of DAUConv ops: layer and its buffers are kept between calls of OpKernel::Compute() and are
+// rebuilt only when input shape or size of pre-filtering kernel changes
+
+template <typename Device, typename Dtype>
+class DAUConvLayerStateTF {
+public:
+	typedef DAUConvDeviceTF<Device, Dtype> DeviceTF;
+
+	DAUConvLayerStateTF() : cublas_handle_(NULL) {}
+
+	~DAUConvLayerStateTF() {
+		reset();
+		if (cublas_handle_ != NULL)
+			cublasDestroy(cublas_handle_);
+	}
+
+	// key under which layer was build (input shape and size of pre-filtering kernel)
+	static vector<int> get_key(const Tensor* input, const Tensor* sigma) {
+		vector<int> key;
+		for (int i = 0; i < input->dims(); i++)
+			key.push_back(input->dim_size(i));
+
+		Dtype sigma_val;
+		if (DeviceTF::on_gpu) {
+			CUDA_CHECK(cudaMemcpy(&sigma_val, TENSOR_DATA_PTR_CONST(sigma, Dtype), sizeof(Dtype), cudaMemcpyDefault));
+		} else {
+			sigma_val = TENSOR_DATA_PTR_CONST(sigma, Dtype)[0];
+		}
+		key.push_back(BaseDAUConvLayer<Dtype>::get_prefiltering_kernel_size(sigma_val));
+
+		return key;
+	}
+
+	bool is_valid(const vector<int>& key) const { return is_built() && key_ == key; }
+
+	// layer was rebuilt and successfully initialized (see commit())
+	bool is_built() const { return layer_ && key_.empty() == false; }
+
+	const vector<int>& key() const { return key_; }
+
+	// creates new layer (and its buffers) that still needs to be initialized with LayerSetUp() and Reshape(), and
+	// then committed under its key (state is not valid for reuse until then)
+	DAUConvLayerTensorflowGPU<Dtype>* rebuild(OpKernelContext* context, bool ignore_edge_gradients) {
+		reset();
+
+		// cublas is needed only for GPU processing
+		if (DeviceTF::on_gpu && cublas_handle_ == NULL)
+			cublasCreate(&cublas_handle_);
+
+		kernel_compute_.reset(new typename DeviceTF::KernelCompute(context));
+		kernel_params_.reset(new typename DeviceTF::KernelParams(context));
+		kernel_output_.reset(new typename DeviceTF::KernelOutput(context));
+
+		// workspace is needed only for GPU processing
+		if (DeviceTF::on_gpu && !workspace_pool_)
+			workspace_pool_ = DAUWorkspacePoolTF::get_pool(context->device()->name());
+
+		layer_.reset(new DAUConvLayerTensorflowGPU<Dtype>(cublas_handle_, context, ignore_edge_gradients));
+		layer_->set_processing_on_gpu(DeviceTF::on_gpu);
+		if (workspace_pool_)
+			layer_->set_workspace_pool(workspace_pool_);
+
+		return layer_.get();
+	}
+
+	// marks rebuilt layer as initialized, so that it can be reused by calls with the same key
+	void commit(const vector<int>& key) {
+		key_ = key;
+	}
+
+	// returns existing layer for use in new call of the op
+	DAUConvLayerTensorflowGPU<Dtype>* reuse(OpKernelContext* context) {
+		layer_->context_ = context;
+		kernel_compute_->set_context(context);
+		kernel_params_->set_context(context);
+		kernel_output_->set_context(context);
+
+		return layer_.get();
+	}
+
+	void reset() {
+		// layer references kernel buffers so release it first
+		layer_.reset();
+		kernel_compute_.reset();
+		kernel_params_.reset();
+		kernel_output_.reset();
+		key_.clear();
+	}
+
+	typename DeviceTF::KernelCompute* kernel_compute() { return kernel_compute_.get(); }
+	typename DeviceTF::KernelParams* kernel_params() { return kernel_params_.get(); }
+	typename DeviceTF::KernelOutput* kernel_output() { return kernel_output_.get(); }
+	cublasHandle_t cublas_handle() { return cublas_handle_; }
+	// NULL on CPU
+	DAUWorkspacePoolTF* workspace_pool() { return workspace_pool_.get(); }
+
+private:
+	std::unique_ptr<DAUConvLayerTensorflowGPU<Dtype> > layer_;
+	std::unique_ptr<typename DeviceTF::KernelCompute> kernel_compute_;
+	std::unique_ptr<typename DeviceTF::KernelParams> kernel_params_;
+	std::unique_ptr<typename DeviceTF::KernelOutput> kernel_output_;
+
+	cublasHandle_t cublas_handle_;
+
+	std::shared_ptr<DAUWorkspacePoolTF> workspace_pool_;
+
+	vector<int> key_;
+};
+
+// Layer states of one DAUConv op: OpKernel::Compute() can be called concurrently so each call checks out its own
+// state (lock is held only during checkout and checkin, not while the layer is used) and returns it when done, where
+// a few free states are kept so that concurrent calls and alternating input shapes do not rebuild the layer
+
+template <typename Device, typename Dtype>
+class DAUConvLayerStatePoolTF {
+public:
+	typedef DAUConvLayerStateTF<Device, Dtype> LayerState;
+
+	// number of free states kept between calls (least recently used are released first)
+	static const int MAX_FREE_STATES = 4;
+
+	DAUConvLayerStatePoolTF() : num_hits_(0), num_rebuilds_(0) {}
+
+	// returns free state built for key or new empty state that must be rebuilt (i.e. is_valid(key) == false)
+	std::unique_ptr<LayerState> checkout(const vector<int>& key) {
+		mutex_lock lock(mu_);
+
+		for (auto it = free_states_.begin(); it != free_states_.end(); ++it) {
+			if ((*it)->is_valid(key)) {
+				std::unique_ptr<LayerState> state = std::move(*it);
+				free_states_.erase(it);
+				num_hits_++;
+				return state;
+			}
+		}
+		num_rebuilds_++;
+		return std::unique_ptr<LayerState>(new LayerState());
+	}
+
+	// returns state for use in later calls (states that were not committed or were reset are released)
+	void checkin(std::unique_ptr<LayerState> state) {
+		// released states are destroyed after the lock is released
+		std::unique_ptr<LayerState> released;
+		mutex_lock lock(mu_);
+
+		if (state->is_built() == false) {
+			released = std::move(state);
+			return;
+		}
+
+		free_states_.push_front(std::move(state));
+
+		if (free_states_.size() > MAX_FREE_STATES) {
+			released = std::move(free_states_.back());
+			free_states_.pop_back();
+		}
+	}
+
+	int64 num_hits() const { mutex_lock lock(mu_); return num_hits_; }
+	int64 num_rebuilds() const { mutex_lock lock(mu_); return num_rebuilds_; }
+
+	// state checked out for the duration of one call (it is returned on any exit from Compute(), including errors)
+	class ScopedState {
+	public:
+		ScopedState(DAUConvLayerStatePoolTF& pool, const vector<int>& key) : pool_(pool), state_(pool.checkout(key)) {}
+		~ScopedState() { pool_.checkin(std::move(state_)); }
+
+		LayerState* operator->() { return state_.get(); }
+
+	private:
+		DAUConvLayerStatePoolTF& pool_;
+		std::unique_ptr<LayerState> state_;
+	};
+
+private:
+	mutable mutex mu_;
+
+	std::list<std::unique_ptr<LayerState> > free_states_;
+
+	int64 num_hits_;
+	int64 num_rebuilds_;
+};
+
 //OP_REQUIRES_OK uses return, problematic for compilation in non void functions
 #define OP_REQUIRES_OK_BREAK(CTX, ...)                      \
   do {                                                      \
@@ -5,6 +5,8 @@
 //#include "tensorflow/core/util/cuda_launch_config.h"
 #include "dau_conv/base_dau_conv_layer.hpp"
 #include "dau_conv_layer_tensorflow.hpp"
+#include "dau_conv/util/kernel_cache.hpp"
+#include "dau_conv/util/profiler.hpp"
 //using DAUConvNet::DAUConvSettings;
 using namespace tensorflow;
 
@@ -18,7 +20,11 @@ REGISTER_OP("DAUConv")
         .Input("mu1: float")
         .Input("mu2: float")
         .Input("sigma: float")
+        // bias of size [num_output] added by the op with bias_term (otherwise it is ignored and can be empty)
+        .Input("bias: float")
         .Output("output: float")
+        // whole blurred input in NCHW format re-used by DAUConvGrad (empty unless save_blurred_input is set)
+        .Output("blurred_input: float")
         .Attr("number_units_x : int  = 2")
         .Attr("number_units_y : int = 2")
         .Attr("number_units_ignore : int = 0")
@@ -32,10 +38,25 @@ REGISTER_OP("DAUConv")
         .Attr("sigma_iteration_step: int = 1")
         .Attr("component_border_bound: int = 4")
         .Attr("sigma_lower_bound: float = 0.3")
-        .Attr("merge_iteration_step: int = 0")
-        .Attr("merge_threshold: int = 1")
         .Attr("unit_testing: bool = false")
         .Attr("mu_learning_rate_factor: float = 1.0")
+        .Attr("num_cpu_threads: int = 0")
+        .Attr("data_format: {'NCHW', 'NHWC'} = 'NCHW'")
+        .Attr("profile_name: string = ''")
+        .Attr("tile_memory_limit: int = 0")
+        .Attr("fused_forward: bool = true")
+        .Attr("blur_method: {'auto', 'direct', 'fft'} = 'auto'")
+        .Attr("save_blurred_input: bool = false")
+        // bias and activation fused into the output of CPU version
+        .Attr("bias_term: bool = false")
+        .Attr("activation: {'none', 'relu', 'leaky_relu'} = 'none'")
+        .Attr("leaky_relu_alpha: float = 0.2")
+        // gradients computed by DAUConvGrad (used only by the gradient function of this op)
+        .Attr("compute_grad_input: bool = true")
+        .Attr("compute_grad_weights: bool = true")
+        .Attr("compute_grad_mu1: bool = true")
+        .Attr("compute_grad_mu2: bool = true")
+        .Attr("compute_grad_bias: bool = true")
 .SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
   shape_inference::ShapeHandle input_shape;
   TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 4, &input_shape));
@@ -65,11 +86,41 @@ REGISTER_OP("DAUConv")
     TF_RETURN_IF_ERROR(c->WithValue(mu2_out, num_out, &out_dim));
     TF_RETURN_IF_ERROR(c->WithValue(sigma_out, num_out, &out_dim));
 
+    string data_format;
+    TF_RETURN_IF_ERROR(c->GetAttr("data_format", &data_format));
+    const int channel_axis = data_format == "NHWC" ? 3 : 1;
+    const int height_axis = data_format == "NHWC" ? 1 : 2;
+
+    int kernel_size, pad, stride;
+    TF_RETURN_IF_ERROR(c->GetAttr("kernel_size", &kernel_size));
+    TF_RETURN_IF_ERROR(c->GetAttr("pad", &pad));
+    TF_RETURN_IF_ERROR(c->GetAttr("stride", &stride));
+
 shape_inference::ShapeHandle output_shape;
 
-  TF_RETURN_IF_ERROR(c->ReplaceDim(input_shape, 1, output_rows, &output_shape));
+  TF_RETURN_IF_ERROR(c->ReplaceDim(input_shape, channel_axis, output_rows, &output_shape));
+
+    // spatial output size depends on kernel_size, pad and stride
+    for (int axis = height_axis; axis <= height_axis + 1; ++axis) {
+        shape_inference::DimensionHandle input_dim = c->Dim(input_shape, axis);
+        shape_inference::DimensionHandle output_dim = c->UnknownDim();
+        if (c->ValueKnown(input_dim))
+            output_dim = c->MakeDim(get_output_size_tf(c->Value(input_dim), kernel_size, pad, stride));
+        TF_RETURN_IF_ERROR(c->ReplaceDim(output_shape, axis, output_dim, &output_shape));
+    }
 
   c->set_output(0, output_shape);
+
+    bool save_blurred_input;
+    TF_RETURN_IF_ERROR(c->GetAttr("save_blurred_input", &save_blurred_input));
+
+    if (save_blurred_input) {
+        // blurred input has the same size as input but it is always in NCHW format
+        c->set_output(1, c->MakeShape({c->Dim(input_shape, 0), c->Dim(input_shape, channel_axis),
+                                       c->Dim(input_shape, height_axis), c->Dim(input_shape, height_axis + 1)}));
+    } else {
+        c->set_output(1, c->MakeShape({0}));
+    }
   return Status::OK();
 });
 
@@ -89,8 +140,6 @@ public:
         int sigma_iteration_step;
         int component_border_bound;
         float sigma_lower_bound;
-        int merge_iteration_step;
-        int merge_threshold;
         OP_REQUIRES_OK(context, context->GetAttr("number_units_x", &number_units_x));
         OP_REQUIRES_OK(context, context->GetAttr("number_units_y", &number_units_y));
         OP_REQUIRES_OK(context, context->GetAttr("number_units_ignore", &this->number_units_ignore));
@@ -104,16 +153,41 @@ public:
         OP_REQUIRES_OK(context, context->GetAttr("sigma_iteration_step", &sigma_iteration_step));
         OP_REQUIRES_OK(context, context->GetAttr("component_border_bound", &component_border_bound));
         OP_REQUIRES_OK(context, context->GetAttr("sigma_lower_bound", &sigma_lower_bound));
-        OP_REQUIRES_OK(context, context->GetAttr("merge_iteration_step", &merge_iteration_step));
-        OP_REQUIRES_OK(context, context->GetAttr("merge_threshold", &merge_threshold));
         OP_REQUIRES_OK(context, context->GetAttr("unit_testing", &this->unit_testing));
+        OP_REQUIRES_OK(context, context->GetAttr("num_cpu_threads", &this->num_cpu_threads));
+        OP_REQUIRES_OK(context, context->GetAttr("profile_name", &this->profile_name));
+        OP_REQUIRES_OK(context, context->GetAttr("tile_memory_limit", &this->tile_memory_limit));
+        OP_REQUIRES(context, this->tile_memory_limit >= 0, errors::InvalidArgument("DAUConv requires tile_memory_limit >= 0"));
+        OP_REQUIRES_OK(context, context->GetAttr("fused_forward", &this->fused_forward));
+        OP_REQUIRES_OK(context, context->GetAttr("blur_method", &this->blur_method));
+        OP_REQUIRES_OK(context, context->GetAttr("save_blurred_input", &this->save_blurred_input));
+        OP_REQUIRES_OK(context, context->GetAttr("bias_term", &this->bias_term));
+        OP_REQUIRES_OK(context, context->GetAttr("activation", &this->activation));
+        OP_REQUIRES_OK(context, context->GetAttr("leaky_relu_alpha", &this->leaky_relu_alpha));
+        OP_REQUIRES(context, this->leaky_relu_alpha >= 0, errors::InvalidArgument("DAUConv requires leaky_relu_alpha >= 0"));
+        // timings of forward and backward ops of the same layer are collected under the same name
+        if (this->profile_name.empty())
+            this->profile_name = this->name();
+        string data_format;
+        OP_REQUIRES_OK(context, context->GetAttr("data_format", &data_format));
+        OP_REQUIRES(context, data_format == "NCHW" || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConv supports NHWC data format only on CPU"));
+        OP_REQUIRES(context, stride > 0, errors::InvalidArgument("DAUConv requires stride > 0"));
+        OP_REQUIRES(context, stride == 1 || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConv supports stride > 1 only on CPU"));
+        OP_REQUIRES(context, kernel_size <= BaseDAUConvLayer<Dtype>::MAX_GPU_KERNEL_SIZE || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConv supports kernel_size > 17 (offsets larger than 8) only on CPU"));
+        OP_REQUIRES(context, this->save_blurred_input == false || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConv supports save_blurred_input only on CPU"));
+        OP_REQUIRES(context, (this->bias_term == false && this->activation == "none") || DAUConvDeviceTF<Device, Dtype>::on_gpu == false,
+                    errors::InvalidArgument("DAUConv supports bias_term and activation only on CPU"));
         dau_conv_settings.offsets_already_centered = true;
         dau_conv_settings.num_output = num_output;
         //num units per X and per Y
         dau_conv_settings.number_units.push_back(number_units_x);
         dau_conv_settings.number_units.push_back(number_units_y);
-        //bias handled by Tensorflow
-        dau_conv_settings.bias_term = false;
+        //bias handled by Tensorflow unless it is fused into the output
+        dau_conv_settings.bias_term = this->bias_term;
         dau_conv_settings.kernel_size = kernel_size;
         dau_conv_settings.pad = pad;
         dau_conv_settings.stride = stride;
@@ -123,16 +197,14 @@ public:
         dau_conv_settings.sigma_iteration_step = sigma_iteration_step;
         dau_conv_settings.component_border_bound = component_border_bound;
         dau_conv_settings.sigma_lower_bound = sigma_lower_bound;
-        dau_conv_settings.merge_iteration_step = merge_iteration_step;
-        dau_conv_settings.merge_threshold = merge_threshold;
+        dau_conv_settings.channels_last = data_format == "NHWC";
 
     }
 
     void Compute(OpKernelContext* context) override {
 
-        DCHECK_EQ(5, context->num_inputs());
+        DCHECK_EQ(6, context->num_inputs());
 
-        // in_train is used only for merge_iteration_step, which is not setup.
         /*
         AllocatorAttributes alloc_attrs;
         tensorflow::DeviceBase* device = context->device();
@@ -142,19 +214,22 @@ public:
         printf("Bytes in use %d\n",stats.bytes_in_use);
         */
 
-        bool in_train = false;
-
         const Tensor* input;
         const Tensor* weights;
         const Tensor* mu1;
         const Tensor* mu2;
         const Tensor* sigma;
+        const Tensor* bias;
 
         context->input("input", &input);
         context->input("weights",&weights);
         context->input("mu1",&mu1);
         context->input("mu2",&mu2);
         context->input("sigma",&sigma);
+        context->input("bias",&bias);
+
+        OP_REQUIRES(context, this->bias_term == false || bias->shape() == TensorShape({dau_conv_settings.num_output}),
+                    errors::InvalidArgument("DAUConv with bias_term requires bias of size [num_output]"));
 
 
         const TensorShape input_shape = input->shape();
@@ -178,44 +253,121 @@ public:
         //Initializer does nothing tensorflow variables are initialized in python.
 
         NullDAUComponentInitializerTensorflow<Dtype> param_initializer;
-        DAUKernelComputeTFGPU<Dtype> dau_kernel_compute(context);
-        DAUKernelParamsTFGPU<Dtype> dau_kernel_params(context);
-        DAUKernelOutputTFGPU<Dtype> dau_kernel_output(context);
 
+        const bool on_gpu = DAUConvDeviceTF<Device, Dtype>::on_gpu;
 
-        cublasHandle_t handle;
-        cublasCreate(&handle);
-        /*
-        const cudaStream_t* stream = CHECK_NOTNULL(reinterpret_cast<const cudaStream_t*>(context->op_device_context()
-                                                                                        -> stream()->implementation()
-                                                                                        ->CudaStreamMemberHack()) );
-        cublasSetStream(handle, (cudaStream_t) *stream);
-         */
-        //TODO Get stream from context and add it to handle..
+        // GPU version computes units in groups of ALLOWED_UNITS_GROUP so odd number of units are padded with
+        // zero-weight units (layer ignores them on its own)
+        Tensor weights_padded, mu1_padded, mu2_padded, sigma_padded;
+
+        const int num_units = weights_shape.dim_size(2);
+        const int num_units_padded = get_num_units_padded_tf(num_units, on_gpu);
+
+        if (num_units_padded != num_units) {
+            TensorShape padded_shape = weights_shape;
+            padded_shape.set_dim(2, num_units_padded);
 
+            OP_REQUIRES_OK(context, context->allocate_temp(DataTypeToEnum<Dtype>::v(), padded_shape, &weights_padded));
+            OP_REQUIRES_OK(context, context->allocate_temp(DataTypeToEnum<Dtype>::v(), padded_shape, &mu1_padded));
+            OP_REQUIRES_OK(context, context->allocate_temp(DataTypeToEnum<Dtype>::v(), padded_shape, &mu2_padded));
+            OP_REQUIRES_OK(context, context->allocate_temp(DataTypeToEnum<Dtype>::v(), padded_shape, &sigma_padded));
 
-        DAUConvLayerTensorflowGPU<Dtype> tf_layer(handle,context);
+            copy_dau_units_gpu<Dtype>(*weights, &weights_padded);
+            copy_dau_units_gpu<Dtype>(*mu1, &mu1_padded);
+            copy_dau_units_gpu<Dtype>(*mu2, &mu2_padded);
+            copy_dau_units_gpu<Dtype>(*sigma, &sigma_padded, true);
 
-        tf_layer.enable_forward(true);
-        tf_layer.enable_backward(false);
+            weights = &weights_padded;
+            mu1 = &mu1_padded;
+            mu2 = &mu2_padded;
+            sigma = &sigma_padded;
+        }
 
-        // prevent display of allocation size on each call (except when doing unit testing)
-        tf_layer.enable_memalloc_info(this->unit_testing == true ? true : false);
+        //TODO Get stream from context and add it to cublas handle..
 
-        tf_layer.InitializeFromInput(dau_conv_settings, (Tensor*) weights,(Tensor*) mu1,(Tensor*) mu2,(Tensor*) sigma);
+        // reuse layer from previous call unless input shape or pre-filtering kernel size changed (concurrent calls
+        // check out their own layer states, so they do not wait for each other)
+        const std::vector<int> state_key = DAUConvLayerStateTF<Device, Dtype>::get_key(input, sigma);
+        typename DAUConvLayerStatePoolTF<Device, Dtype>::ScopedState layer_state(layer_states, state_key);
 
+        const bool rebuild_layer = layer_state->is_valid(state_key) == false;
 
-        tf_layer.LayerSetUp(dau_conv_settings, param_initializer, &dau_kernel_compute, &dau_kernel_params, &dau_kernel_output, bottom_shape, number_units_ignore, in_train);
+        DAUConvLayerTensorflowGPU<Dtype>* tf_layer = rebuild_layer ? layer_state->rebuild(context, false)
+                                                                   : layer_state->reuse(context);
+
+        tf_layer->set_num_cpu_threads(get_num_cpu_threads_tf(context, this->num_cpu_threads));
+        tf_layer->set_profile_name(this->profile_name);
+        tf_layer->set_tile_memory_limit(this->tile_memory_limit);
+        tf_layer->set_fused_forward(this->fused_forward);
+        tf_layer->set_blur_method(get_blur_method_tf(this->blur_method));
+        tf_layer->set_activation(get_activation_tf(this->activation), this->leaky_relu_alpha);
+
+        // blurred input is written directly to the second output (it must be set before Reshape() since forward pass
+        // does not need temp_interm_buffer() then)
+        Tensor* blurred_input;
+        TensorShape blurred_input_shape({0});
+        if (this->save_blurred_input) {
+            const int channel_axis = dau_conv_settings.channels_last ? 3 : 1;
+            const int height_axis = dau_conv_settings.channels_last ? 1 : 2;
+            blurred_input_shape = TensorShape({input_shape.dim_size(0), input_shape.dim_size(channel_axis),
+                                               input_shape.dim_size(height_axis), input_shape.dim_size(height_axis + 1)});
+        }
+        OP_REQUIRES_OK(context, context->allocate_output(1, blurred_input_shape, &blurred_input));
+
+        tf_layer->set_saved_blurred_input(this->save_blurred_input ? TENSOR_DATA_PTR(blurred_input, Dtype) : NULL);
+
+        tf_layer->InitializeFromInput(dau_conv_settings, (Tensor*) weights,(Tensor*) mu1,(Tensor*) mu2,(Tensor*) sigma, (Tensor*) bias);
+
+        const int height_axis = dau_conv_settings.channels_last ? 1 : 2;
+        const int height_out = get_output_size_tf(input_shape.dim_size(height_axis), dau_conv_settings.kernel_size,
+                                                  dau_conv_settings.pad, dau_conv_settings.stride);
+        const int width_out = get_output_size_tf(input_shape.dim_size(height_axis + 1), dau_conv_settings.kernel_size,
+                                                 dau_conv_settings.pad, dau_conv_settings.stride);
 
         std::vector<int> top_shape;
 
-        top_shape.push_back(input_shape.dim_size(0));
-        top_shape.push_back(dau_conv_settings.num_output);
-        top_shape.push_back(input_shape.dim_size(2));
-        top_shape.push_back(input_shape.dim_size(3));
+        if (dau_conv_settings.channels_last) {
+            top_shape.push_back(input_shape.dim_size(0));
+            top_shape.push_back(height_out);
+            top_shape.push_back(width_out);
+            top_shape.push_back(dau_conv_settings.num_output);
+        } else {
+            top_shape.push_back(input_shape.dim_size(0));
+            top_shape.push_back(dau_conv_settings.num_output);
+            top_shape.push_back(height_out);
+            top_shape.push_back(width_out);
+        }
+
+
+        if (rebuild_layer) {
+            tf_layer->enable_forward(true);
+            tf_layer->enable_backward(false);
+
+            // prevent display of allocation size on each call (except when doing unit testing)
+            tf_layer->enable_memalloc_info(this->unit_testing == true ? true : false);
+
+            tf_layer->LayerSetUp(dau_conv_settings, param_initializer, layer_state->kernel_compute(), layer_state->kernel_params(),
+                                 layer_state->kernel_output(), bottom_shape, number_units_ignore);
+
+            tf_layer->Reshape(bottom_shape, top_shape);
+
+            if (!context->status().ok()) {
+                layer_state->reset();
+                return;
+            }
 
+            // only fully initialized layer can be reused by later calls
+            layer_state->commit(state_key);
+
+            if (this->unit_testing) {
+                DAUWorkspacePoolTF* pool = layer_state->workspace_pool();
+                std::cout << "DAUConv layer state rebuilt (hits: " << layer_states.num_hits() << ", rebuilds: " << layer_states.num_rebuilds() << ")";
+                if (pool != NULL)
+                    std::cout << " workspace (steady-state: " << pool->steady_state_bytes() << " B, peak: " << pool->peak_bytes() << " B, allocations: " << pool->num_allocations() << ", arenas: " << pool->num_arenas() << ")";
+                std::cout << std::endl;
+            }
+        }
 
-        std::vector<int> new_shape = tf_layer.Reshape(bottom_shape, top_shape);
 
 
         TensorShape output_shape;
@@ -231,21 +383,45 @@ public:
         const Dtype* bottom_data = TENSOR_DATA_PTR_CONST(input, Dtype);
 
 
-        tf_layer.Forward_gpu(bottom_data, bottom_shape, top_data, top_shape);
+        if (on_gpu) {
+            // workspace is shared with other DAUConv layers on the same device, but it is checked out only while
+            // this call enqueues its work (CPU version does not use workspace)
+            OP_REQUIRES(context, tf_layer->update_workspace_mem(),
+                        errors::ResourceExhausted("Unable to allocate workspace memory for DAUConv"));
 
-        //destroy cublas handle after end of op
-        cublasDestroy(handle);
+            tf_layer->Forward_gpu(bottom_data, bottom_shape, top_data, top_shape);
+            tf_layer->release_workspace_mem();
+        } else {
+            tf_layer->Forward_cpu(bottom_data, bottom_shape, top_data, top_shape);
+        }
     }
 private:
     DAUConvNet::DAUConvSettings dau_conv_settings;
     bool unit_testing;
     int number_units_ignore;
+    int num_cpu_threads;
+    std::string profile_name;
+    // bytes of blurred input kept at once by the CPU forward pass (0 == no limit)
+    int64 tile_memory_limit;
+    // CPU forward pass blurs and sums in a single pass without the whole blurred input (otherwise tile_memory_limit applies)
+    bool fused_forward;
+    // direct or FFT pre-filtering on CPU ('auto' selects FFT for large kernels)
+    string blur_method;
+    // forward pass returns the whole blurred input as second output so that DAUConvGrad does not need to blur it again
+    bool save_blurred_input;
+    // bias and activation applied in the same pass as the output is written (CPU only)
+    bool bias_term;
+    string activation;
+    float leaky_relu_alpha;
+
+    // layers with buffers that are reused between calls
+    DAUConvLayerStatePoolTF<Device, Dtype> layer_states;
 };
 
-#define REGISTER_CPU(T) REGISTER_KERNEL_BUILDER(Name("BaseOp").Device(DEVICE_CPU), BaseOpOp<CPUDevice, T>);
+#define REGISTER_CPU(T) \
+REGISTER_KERNEL_BUILDER(Name("DAUConv").Device(DEVICE_CPU), DAUConvOp<CPUDevice, T>);
 
-//REGISTER_CPU(float);
-//REGISTER_CPU(int32);
+REGISTER_CPU(float);
 
 #ifdef GOOGLE_CUDA
 #define REGISTER_GPU(T) \
@@ -257,4 +433,108 @@ REGISTER_KERNEL_BUILDER(Name("DAUConv").Device(DEVICE_GPU), DAUConvOp<GPUDevice,
 
 REGISTER_GPU(float);
 //REGISTER_GPU(int32);
-#endif //google_cuda
\ No newline at end of file
+#endif //google_cuda
+
+////////////////////////////////////////////////////////////////////////////////
+// Access to DAUConvProfiler (per-layer and per-phase timings of DAUConv and DAUConvGrad ops) from Python
+
+REGISTER_OP("DAUConvSetProfiling")
+        .Input("enabled: bool")
+        .SetIsStateful()
+        .SetShapeFn(shape_inference::NoOutputs);
+
+class DAUConvSetProfilingOp : public OpKernel {
+public:
+    explicit DAUConvSetProfilingOp(OpKernelConstruction* context) : OpKernel(context) {}
+
+    void Compute(OpKernelContext* context) override {
+        const Tensor& enabled = context->input(0);
+        OP_REQUIRES(context, TensorShapeUtils::IsScalar(enabled.shape()),
+                    errors::InvalidArgument("DAUConvSetProfiling requires scalar input"));
+
+        DAUConvNet::DAUConvProfiler::get_instance().set_enabled(enabled.scalar<bool>()());
+    }
+};
+
+REGISTER_KERNEL_BUILDER(Name("DAUConvSetProfiling").Device(DEVICE_CPU), DAUConvSetProfilingOp);
+
+REGISTER_OP("DAUConvProfile")
+        .Output("layer_names: string")
+        .Output("phase_names: string")
+        .Output("time_ms: double")
+        .Output("bytes: int64")
+        .Output("calls: int64")
+        .Output("kernel_cache_stats: int64")
+        .Attr("reset: bool = false")
+        .SetIsStateful()
+.SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+    shape_inference::DimensionHandle num_layers = c->UnknownDim();
+    shape_inference::DimensionHandle num_phases = c->MakeDim(DAUConvNet::DAU_NUM_PHASES);
+
+    c->set_output(0, c->Vector(num_layers));
+    c->set_output(1, c->Vector(num_phases));
+    c->set_output(2, c->Matrix(num_layers, num_phases));
+    c->set_output(3, c->Matrix(num_layers, num_phases));
+    c->set_output(4, c->Matrix(num_layers, num_phases));
+    c->set_output(5, c->Vector(3));
+    return Status::OK();
+});
+
+class DAUConvProfileOp : public OpKernel {
+public:
+    explicit DAUConvProfileOp(OpKernelConstruction* context) : OpKernel(context) {
+        OP_REQUIRES_OK(context, context->GetAttr("reset", &this->reset));
+    }
+
+    void Compute(OpKernelContext* context) override {
+        DAUConvNet::DAUConvProfiler& profiler = DAUConvNet::DAUConvProfiler::get_instance();
+
+        std::vector<std::string> layer_names;
+        std::vector<DAUConvNet::DAUConvProfile> profiles;
+
+        profiler.get_profiles(&layer_names, &profiles);
+
+        if (this->reset)
+            profiler.reset();
+
+        const int num_layers = layer_names.size();
+        const int num_phases = DAUConvNet::DAU_NUM_PHASES;
+
+        Tensor* layer_names_out = NULL;
+        Tensor* phase_names_out = NULL;
+        Tensor* time_ms_out = NULL;
+        Tensor* bytes_out = NULL;
+        Tensor* calls_out = NULL;
+        Tensor* kernel_cache_out = NULL;
+
+        OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape({num_layers}), &layer_names_out));
+        OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape({num_phases}), &phase_names_out));
+        OP_REQUIRES_OK(context, context->allocate_output(2, TensorShape({num_layers, num_phases}), &time_ms_out));
+        OP_REQUIRES_OK(context, context->allocate_output(3, TensorShape({num_layers, num_phases}), &bytes_out));
+        OP_REQUIRES_OK(context, context->allocate_output(4, TensorShape({num_layers, num_phases}), &calls_out));
+        OP_REQUIRES_OK(context, context->allocate_output(5, TensorShape({3}), &kernel_cache_out));
+
+        for (int p = 0; p < num_phases; ++p)
+            phase_names_out->vec<string>()(p) = DAUConvNet::get_dau_conv_phase_name(p);
+
+        for (int l = 0; l < num_layers; ++l) {
+            layer_names_out->vec<string>()(l) = layer_names[l];
+            for (int p = 0; p < num_phases; ++p) {
+                time_ms_out->matrix<double>()(l, p) = profiles[l].time_ms[p];
+                bytes_out->matrix<int64>()(l, p) = profiles[l].bytes[p];
+                calls_out->matrix<int64>()(l, p) = profiles[l].calls[p];
+            }
+        }
+
+        // DAUConv ops are registered only for float so report only float kernel cache
+        DAUConvNet::DAUKernelCache<float>& kernel_cache = DAUConvNet::DAUKernelCache<float>::get_instance();
+
+        kernel_cache_out->vec<int64>()(0) = kernel_cache.num_hits();
+        kernel_cache_out->vec<int64>()(1) = kernel_cache.num_misses();
+        kernel_cache_out->vec<int64>()(2) = kernel_cache.size();
+    }
+private:
+    bool reset;
+};
+
+REGISTER_KERNEL_BUILDER(Name("DAUConvProfile").Device(DEVICE_CPU), DAUConvProfileOp);
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+import os
+import tempfile
+
+from dau_conv import autotune
+
+class DAUConvAutotuneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, 'autotune.json')
+
+        autotune.set_engine_override(None)
+        autotune.clear_cache()
+
+    def tearDown(self):
+        autotune.set_engine_override(None)
+        autotune.clear_cache()
+        self.tmp_dir.cleanup()
+
+    def _get_config(self, **kwargs):
+        config = dict(N=4, S=16, F=16, H=32, W=32, dau_units=[2, 2], max_kernel_size=9, stride=1, data_format='NCHW',
+                      device='cpu', mode='train')
+        config.update(kwargs)
+        return config
+
+    def _get_time_fn(self, timings, calls):
+        def time_fn(config):
+            calls.append(config)
+            return dict(timings)
+        return time_fn
+
+    def test_select_engine(self):
+
+        calls = []
+        time_fn = self._get_time_fn(dict(dau=2.0, dense=1.0), calls)
+
+        engine = autotune.select_engine(self._get_config(), cache_path=self.cache_path, time_fn=time_fn, verbose=False)
+        self.assertEqual(engine, 'dense')
+        self.assertEqual(len(calls), 1)
+
+        # the same shape is not timed again
+        engine = autotune.select_engine(self._get_config(), cache_path=self.cache_path, time_fn=time_fn, verbose=False)
+        self.assertEqual(engine, 'dense')
+        self.assertEqual(len(calls), 1)
+
+        # but any other shape is
+        autotune.select_engine(self._get_config(max_kernel_size=17), cache_path=self.cache_path, time_fn=time_fn,
+                               verbose=False)
+        self.assertEqual(len(calls), 2)
+
+    def test_disk_cache(self):
+
+        calls = []
+        time_fn = self._get_time_fn(dict(dau=1.0, dense=2.0), calls)
+
+        autotune.select_engine(self._get_config(), cache_path=self.cache_path, time_fn=time_fn, verbose=False)
+
+        with open(self.cache_path) as f:
+            cache = json.load(f)
+
+        entry = cache[autotune.get_host_key()][autotune.get_shape_key(self._get_config())]
+        self.assertEqual(entry['engine'], 'dau')
+        self.assertEqual(entry['timings'], dict(dau=1.0, dense=2.0))
+
+        # new process (i.e. empty in-memory cache) uses results from the disk
+        autotune.clear_cache()
+
+        engine = autotune.select_engine(self._get_config(), cache_path=self.cache_path, time_fn=time_fn, verbose=False)
+        self.assertEqual(engine, 'dau')
+        self.assertEqual(len(calls), 1)
+
+        # results of other hosts are not used
+        with open(self.cache_path, 'w') as f:
+            json.dump({'other-host': cache[autotune.get_host_key()]}, f)
+        autotune.clear_cache()
+
+        autotune.select_engine(self._get_config(), cache_path=self.cache_path, time_fn=time_fn, verbose=False)
+        self.assertEqual(len(calls), 2)
+
+        with open(self.cache_path) as f:
+            self.assertEqual(set(json.load(f).keys()), {'other-host', autotune.get_host_key()})
+
+    def test_resolve_engine(self):
+
+        calls = []
+        time_fn = self._get_time_fn(dict(dau=2.0, dense=1.0), calls)
+
+        kwargs = dict(cache_path=self.cache_path, time_fn=time_fn, verbose=False)
+
+        self.assertEqual(autotune.resolve_engine(None, self._get_config(), **kwargs), autotune.DEFAULT_ENGINE)
+        self.assertEqual(autotune.resolve_engine('dau', self._get_config(), **kwargs), 'dau')
+        self.assertEqual(autotune.resolve_engine('auto', None, **kwargs), autotune.DEFAULT_ENGINE)
+        self.assertEqual(len(calls), 0)
+
+        self.assertEqual(autotune.resolve_engine('auto', self._get_config(), **kwargs), 'dense')
+        self.assertEqual(len(calls), 1)
+
+        with self.assertRaises(ValueError):
+            autotune.resolve_engine('sparse', self._get_config(), **kwargs)
+
+    def test_engine_override(self):
+
+        calls = []
+        time_fn = self._get_time_fn(dict(dau=2.0, dense=1.0), calls)
+
+        kwargs = dict(cache_path=self.cache_path, time_fn=time_fn, verbose=False)
+
+        autotune.set_engine_override('dau')
+
+        # override is used instead of timing and instead of the default engine, but not instead of explicit engine
+        self.assertEqual(autotune.resolve_engine('auto', self._get_config(), **kwargs), 'dau')
+        self.assertEqual(autotune.resolve_engine(None, self._get_config(), **kwargs), 'dau')
+        self.assertEqual(autotune.resolve_engine('dense', self._get_config(), **kwargs), 'dense')
+        self.assertEqual(len(calls), 0)
+
+        autotune.set_engine_override(None)
+
+        os.environ['DAU_CONV_ENGINE'] = 'dense'
+        try:
+            self.assertEqual(autotune.get_engine_override(), 'dense')
+            self.assertEqual(autotune.resolve_engine(None, self._get_config(), **kwargs), 'dense')
+        finally:
+            del os.environ['DAU_CONV_ENGINE']
+
+        with self.assertRaises(ValueError):
+            autotune.set_engine_override('sparse')
+
+if __name__ == '__main__':
+    unittest.main()
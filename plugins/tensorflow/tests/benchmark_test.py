@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+import os
+import tempfile
+
+from dau_conv import benchmark
+
+class DAUConvBenchmarkTest(unittest.TestCase):
+
+    def _get_small_config(self):
+        return benchmark.get_shape_matrix(N=[2], S=[4], F=[8], HW=[(16, 16)], dau_units=[(2, 2)],
+                                          max_kernel_size=[9])[0]
+
+    def test_shape_matrix(self):
+
+        configs = benchmark.get_shape_matrix(N=[1, 2], S=[4], F=[8, 16], HW=[(16, 16), (32, 24)],
+                                             dau_units=[(2, 2), (3, 3)], max_kernel_size=[9])
+
+        self.assertEqual(len(configs), 2 * 2 * 2 * 2)
+        self.assertIn(dict(N=2, S=4, F=16, H=32, W=24, dau_units=[3, 3], max_kernel_size=9), configs)
+
+    def test_time_function(self):
+
+        calls = []
+        timing = benchmark.time_function(lambda: calls.append(1), num_warmup=3, num_repeat=5)
+
+        self.assertEqual(len(calls), 3 + 5)
+        self.assertEqual(timing['num_repeat'], 5)
+        self.assertLessEqual(timing['min'], timing['median'])
+
+    def test_numpy_engine(self):
+
+        results = benchmark.run_benchmarks([self._get_small_config()], engines=['numpy'], num_warmup=1,
+                                           num_repeat=2, baseline=False, verbose=False)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['engine'], 'numpy')
+
+        for phase in ['blur', 'offset_and_sum', 'blur_error', 'backprop_error', 'blur_derivatives', 'offset_and_dot']:
+            self.assertIn(phase, results[0]['phases'])
+
+        # results must be serializable to JSON
+        json.dumps(results)
+
+    def test_compare_results(self):
+
+        config = self._get_small_config()
+        timing = lambda mean: dict(mean=mean, std=0, min=mean, median=mean, num_repeat=1)
+
+        old_results = [dict(config=config, engine='numpy', forward=timing(1.0), backward=timing(2.0))]
+        new_results = [dict(config=config, engine='numpy', forward=timing(1.05), backward=timing(3.0))]
+
+        slowdowns = benchmark.compare_results(old_results, new_results, threshold=0.1)
+
+        self.assertEqual(len(slowdowns), 1)
+        self.assertEqual(slowdowns[0][1], 'backward')
+
+    def test_forward_only_result(self):
+
+        config = self._get_small_config()
+        timing = lambda mean: dict(mean=mean, std=0, min=mean, median=mean, num_repeat=1)
+
+        # dense engine times only forward pass
+        old_results = [dict(config=config, engine='dense', forward=timing(1.0), max_error=1e-6)]
+        new_results = [dict(config=config, engine='dense', forward=timing(2.0), max_error=1e-6,
+                            speedup=dict(forward=0.5))]
+
+        line = benchmark.format_result(new_results[0])
+        self.assertIn('fwd 2000.00 ms', line)
+        self.assertNotIn('bwd', line)
+
+        slowdowns = benchmark.compare_results(old_results, new_results, threshold=0.1)
+
+        self.assertEqual(len(slowdowns), 1)
+        self.assertEqual(slowdowns[0][1], 'forward')
+
+    def test_blur_crossover(self):
+
+        results = benchmark.run_blur_crossover(self._get_small_config(), engines=['numpy'], sigmas=[0.5, 2],
+                                               num_warmup=0, num_repeat=1, verbose=False)
+
+        self.assertEqual([r['kernel_size'] for r in results], [7, 21])
+
+        for r in results:
+            for kernel_type in ['separable', 'nonseparable']:
+                self.assertIn('fft', r[kernel_type])
+                self.assertIn(kernel_type, r['fft_speedup'])
+
+        json.dumps(results)
+
+        # crossover is the smallest kernel from which FFT stays faster
+        speedups = [(7, 0.5), (11, 1.2), (21, 0.9), (41, 1.5), (81, 3.0)]
+        results = [dict(engine='numpy', kernel_size=k, fft_speedup=dict(separable=speedup)) for k, speedup in speedups]
+
+        self.assertEqual(benchmark.get_blur_crossover(results, 'numpy', 'separable'), 41)
+        self.assertIsNone(benchmark.get_blur_crossover(results[:3], 'numpy', 'separable'))
+
+    def test_pruning(self):
+
+        results = benchmark.run_pruning_benchmark(self._get_small_config(), engines=['numpy'], sparsities=[0, 0.9],
+                                                  num_warmup=0, num_repeat=1, verbose=False)
+
+        self.assertEqual([r['sparsity'] for r in results], [0, 0.9])
+        self.assertEqual([r['num_units'] for r in results], [4 * 4 * 8, 13])
+
+        for r in results:
+            self.assertIn('unpruned_forward', r)
+            self.assertGreater(r['speedup'], 0)
+
+        json.dumps(results)
+
+    def test_main(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'results.json')
+
+            ret = benchmark.main(['--output', output, '--engines', 'numpy', '--quick', '--no-baseline',
+                                  '--warmup', '0', '--repeat', '1'])
+            self.assertEqual(ret, 0)
+
+            with open(output) as f:
+                data = json.load(f)
+
+            self.assertIn('metadata', data)
+            self.assertEqual(len(data['results']), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+"""Reference (loop-based) implementation of DAU convolution used by unit-tests; depends only on NumPy and SciPy."""
+
+import numpy as np
+
+from scipy.ndimage.filters import correlate
+
+class DAUConvPython:
+    def _offset_and_sum(self, x, w, mu1, mu2, num_dau_units_ignore=0):
+        S = w.shape[1]
+        G = w.shape[2]
+        F = w.shape[3]
+
+        out_shape = (x.shape[0], F, x.shape[2], x.shape[3])
+
+        width_out = out_shape[-1]
+        height_out = out_shape[-2]
+
+        y = np.zeros(out_shape, dtype=np.float32)
+
+        # add padding but b
+        max_offset = np.max((np.max(np.abs(mu1)),
+                             np.max(np.abs(mu2))))
+        padding = np.int32(np.ceil(max_offset + 1))
+        x_pad = np.pad(x, pad_width=[(0,),(0,),(padding,),(padding,)], mode='constant')
+
+        for f in range(F):
+            for s in range(S):
+                for g in range(G-num_dau_units_ignore):
+                    w_val = w[0,s,g,f]
+                    offset_x = mu1[0,s,g,f]
+                    offset_y = mu2[0,s,g,f]
+
+                    offset_x_int = np.floor(offset_x)
+                    offset_y_int = np.floor(offset_y)
+
+                    interpol_off_x = offset_x - offset_x_int
+                    interpol_off_y = offset_y - offset_y_int
+
+                    for dy in [0,1]:
+                        for dx in [0,1]:
+                            interpol_w = w_val
+
+                            interpol_w = interpol_w * ((1-interpol_off_x) if dx == 0 else interpol_off_x)
+                            interpol_w = interpol_w * ((1-interpol_off_y) if dy == 0 else interpol_off_y)
+
+                            access_off_x = np.int32(offset_x_int + dx + padding)
+                            access_off_y = np.int32(offset_y_int + dy + padding)
+
+                            x_s = x_pad[:,s,access_off_y:height_out + access_off_y, access_off_x:width_out + access_off_x]
+
+                            y[:,f,:,:] = y[:,f,:,:] + interpol_w *x_s
+        return y
+
+
+    def forward_cpu(self, x, w, mu1, mu2, sigma, num_dau_units_ignore=0):
+        N = x.shape[0]
+        S = x.shape[1]
+
+        sigma_val = sigma[0]
+
+        x_blur = np.zeros(x.shape,dtype=np.float32)
+
+        filter,_,_,_,_ = self._get_filters(sigma_val)
+
+        # pre-blur the X
+        for n in range(N):
+            for s in range(S):
+                x_blur[n,s,:,:] = correlate(x[n,s,:,:],weights=filter,mode='constant')
+
+        # then offset and sum element-wise
+        y = self._offset_and_sum(x_blur,w,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore)
+
+        return y
+
+    def _offset_and_dot(self, x, error_, mu1, mu2, num_dau_units_ignore=0, ignore_edge_gradients=True):
+        S = mu1.shape[1]
+        G = mu1.shape[2]
+        F = mu1.shape[3]
+
+        out_shape = (x.shape[0], F, x.shape[2], x.shape[3])
+
+        width_out = out_shape[-1]
+        height_out = out_shape[-2]
+
+        error = error_
+
+        # set right/bottom edges to zero if we should ignore them (for GPU compatability)
+        # this must be done for competability with GPU version since by one last pixel will not be accounted accurately
+        # in GPU mode
+        if ignore_edge_gradients:
+
+            disable_last_column = False
+            disable_last_row = False
+
+            if width_out >= 64:
+                disable_last_column = width_out % 64 == 0
+            elif width_out >= 32:
+                disable_last_column = width_out % 32 == 0
+            elif width_out >= 16:
+                disable_last_column = width_out % 16 == 0
+            elif width_out >= 8:
+                disable_last_column = width_out % 8 == 0
+
+            if height_out >= 64:
+                disable_last_row = height_out % 64 == 0
+            elif height_out >= 32:
+                disable_last_row = height_out % 32 == 0
+            elif height_out >= 16:
+                disable_last_row = height_out % 16 == 0
+            elif height_out >= 8:
+                disable_last_row = height_out % 8 == 0
+
+            if disable_last_column:
+                error[:,:,:,width_out-1] = 0.0
+            if disable_last_row:
+                error[:,:,height_out-1,:] = 0.0
+
+
+
+        # add padding but b
+        max_offset = np.max((np.max(np.abs(mu1)),
+                             np.max(np.abs(mu2))))
+        padding = np.int32(np.ceil(max_offset + 1))
+        x_pad = np.pad(x, pad_width=[(0,),(0,),(padding,),(padding,)], mode='constant')
+
+        output = np.zeros(mu1.shape,dtype=np.float32)
+
+        for f in range(F):
+            for s in range(S):
+                for g in range(G-num_dau_units_ignore):
+                    offset_x = mu1[0,s,g,f]
+                    offset_y = mu2[0,s,g,f]
+
+                    offset_x_int = np.floor(offset_x)
+                    offset_y_int = np.floor(offset_y)
+
+                    interpol_off_x = offset_x - offset_x_int
+                    interpol_off_y = offset_y - offset_y_int
+
+                    for dy in [0,1]:
+                        for dx in [0,1]:
+                            interpol_w = 1
+
+                            interpol_w = interpol_w * ((1-interpol_off_x) if dx == 0 else interpol_off_x)
+                            interpol_w = interpol_w * ((1-interpol_off_y) if dy == 0 else interpol_off_y)
+
+                            access_off_x = np.int32(offset_x_int + dx + padding)
+                            access_off_y = np.int32(offset_y_int + dy + padding)
+
+                            output[0,s,g,f] += np.sum(np.multiply(x_pad[:,s,access_off_y:height_out + access_off_y, access_off_x:width_out + access_off_x],
+                                                                  error[:,f,:,:])) * interpol_w
+        return output
+
+    def _get_filters(self, sigma):
+        N = 9
+
+        x = np.tile(np.arange(N),(N,1))-4
+        y = x.T
+
+        filter = np.exp(-1 * (x**2 + y**2) /(2*sigma**2))
+        deriv_w = filter
+        deriv_mu1 = x / (sigma**2) * filter
+        deriv_mu2 = y / (sigma**2) * filter
+        deriv_sigma = (x**2 + y**2) / (sigma**3) * filter
+
+        sum_filter = np.sum(filter)
+        sum_mu1 = np.sum(deriv_mu1) / sum_filter
+        sum_mu2 = np.sum(deriv_mu2) / sum_filter
+        sum_sigma = np.sum(deriv_sigma) / sum_filter
+
+        filter = filter / sum_filter
+        deriv_w = deriv_w / sum_filter
+
+        deriv_mu1 = deriv_mu1 / sum_filter - deriv_w *  sum_mu1
+        deriv_mu2 = deriv_mu2 / sum_filter - deriv_w *  sum_mu2
+        deriv_sigma = deriv_sigma / sum_filter - deriv_w * sum_sigma
+
+        return (filter, deriv_w, deriv_mu1, deriv_mu2, deriv_sigma)
+
+    def backward_cpu(self, x, error, w, mu1, mu2, sigma, num_dau_units_ignore=0, unit_testing=True):
+
+        # we get back-propagated error by rotating offsets i.e. we just use negatives of offsets
+        backprop_error = self.forward_cpu(error,
+                                           np.swapaxes(w, 1,3),
+                                           np.swapaxes(-1 * mu1, 1,3),
+                                           np.swapaxes(-1 * mu2, 1,3), sigma)
+        N = x.shape[0]
+        F = x.shape[1]
+
+        sigma_val = sigma[0]
+
+        filter,deriv_w, deriv_mu1,deriv_mu2,_ = self._get_filters(sigma_val)
+
+        # next we need to get gradients wrt w,mu1,mu2
+        if True:
+            x_w_blur = np.zeros(x.shape,dtype=np.float32)
+            # pre-blur the X
+            for n in range(N):
+                for f in range(F):
+                    x_w_blur[n,f,:,:] = correlate(x[n,f,:,:],weights=deriv_w,mode='constant')
+
+            # then offset and sum element-wise
+            w_grad = self._offset_and_dot(x_w_blur,error,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore, ignore_edge_gradients=unit_testing)
+
+        if True:
+            x_mu1_blur = np.zeros(x.shape,dtype=np.float32)
+            # pre-blur the X
+            for n in range(N):
+                for f in range(F):
+                    x_mu1_blur[n,f,:,:] = correlate(x[n,f,:,:],weights=deriv_mu1,mode='constant')
+
+            # then offset and sum element-wise
+            mu1_grad = self._offset_and_dot(x_mu1_blur,error,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore, ignore_edge_gradients=unit_testing)
+
+        if True:
+            x_mu2_blur = np.zeros(x.shape,dtype=np.float32)
+            # pre-blur the X
+            for n in range(N):
+                for f in range(F):
+                    x_mu2_blur[n,f,:,:] = correlate(x[n,f,:,:],weights=deriv_mu2,mode='constant')
+
+            # then offset and sum element-wise
+            mu2_grad = self._offset_and_dot(x_mu2_blur,error,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore, ignore_edge_gradients=unit_testing)
+
+        # add multiplication with weight for mean gradients
+        mu1_grad = np.multiply(mu1_grad, w)
+        mu2_grad = np.multiply(mu2_grad, w)
+
+        return (backprop_error, w_grad, mu1_grad, mu2_grad)
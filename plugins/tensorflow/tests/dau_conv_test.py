@@ -8,6 +8,9 @@ import scipy
 from dau_conv import DAUConv2d
 from dau_conv import ZeroNLast
 from dau_conv import DAUGridMean
+from dau_conv import numpy_engine
+from dau_conv import dau_conv_set_profiling, dau_conv_profile, parse_dau_conv_profile
+from dau_conv import dau_conv2d, fold_batch_norm
 
 from scipy.ndimage.filters import gaussian_filter
 from scipy.ndimage.filters import convolve
@@ -17,229 +20,7 @@ from tensorflow.python.ops import init_ops
 
 import pylab as plt
 
-class DAUConvPython:
-    def _offset_and_sum(self, x, w, mu1, mu2, num_dau_units_ignore=0):
-        S = w.shape[1]
-        G = w.shape[2]
-        F = w.shape[3]
-
-        out_shape = (x.shape[0], F, x.shape[2], x.shape[3])
-
-        width_out = out_shape[-1]
-        height_out = out_shape[-2]
-
-        y = np.zeros(out_shape, dtype=np.float32)
-
-        # add padding but b
-        max_offset = np.max((np.max(np.abs(mu1)),
-                             np.max(np.abs(mu2))))
-        padding = np.int32(np.ceil(max_offset + 1))
-        x_pad = np.pad(x, pad_width=[(0,),(0,),(padding,),(padding,)], mode='constant')
-
-        for f in range(F):
-            for s in range(S):
-                for g in range(G-num_dau_units_ignore):
-                    w_val = w[0,s,g,f]
-                    offset_x = mu1[0,s,g,f]
-                    offset_y = mu2[0,s,g,f]
-
-                    offset_x_int = np.floor(offset_x)
-                    offset_y_int = np.floor(offset_y)
-
-                    interpol_off_x = offset_x - offset_x_int
-                    interpol_off_y = offset_y - offset_y_int
-
-                    for dy in [0,1]:
-                        for dx in [0,1]:
-                            interpol_w = w_val
-
-                            interpol_w = interpol_w * ((1-interpol_off_x) if dx == 0 else interpol_off_x)
-                            interpol_w = interpol_w * ((1-interpol_off_y) if dy == 0 else interpol_off_y)
-
-                            access_off_x = np.int32(offset_x_int + dx + padding)
-                            access_off_y = np.int32(offset_y_int + dy + padding)
-
-                            x_s = x_pad[:,s,access_off_y:height_out + access_off_y, access_off_x:width_out + access_off_x]
-
-                            y[:,f,:,:] = y[:,f,:,:] + interpol_w *x_s
-        return y
-
-
-    def forward_cpu(self, x, w, mu1, mu2, sigma, num_dau_units_ignore=0):
-        N = x.shape[0]
-        S = x.shape[1]
-
-        sigma_val = sigma[0]
-
-        x_blur = np.zeros(x.shape,dtype=np.float32)
-
-        filter,_,_,_,_ = self._get_filters(sigma_val)
-
-        # pre-blur the X
-        for n in range(N):
-            for s in range(S):
-                x_blur[n,s,:,:] = correlate(x[n,s,:,:],weights=filter,mode='constant')
-
-        # then offset and sum element-wise
-        y = self._offset_and_sum(x_blur,w,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore)
-
-        return y
-
-    def _offset_and_dot(self, x, error_, mu1, mu2, num_dau_units_ignore=0, ignore_edge_gradients=True):
-        S = mu1.shape[1]
-        G = mu1.shape[2]
-        F = mu1.shape[3]
-
-        out_shape = (x.shape[0], F, x.shape[2], x.shape[3])
-
-        width_out = out_shape[-1]
-        height_out = out_shape[-2]
-
-        error = error_
-
-        # set right/bottom edges to zero if we should ignore them (for GPU compatability)
-        # this must be done for competability with GPU version since by one last pixel will not be accounted accurately
-        # in GPU mode
-        if ignore_edge_gradients:
-
-            disable_last_column = False
-            disable_last_row = False
-
-            if width_out >= 64:
-                disable_last_column = width_out % 64 == 0
-            elif width_out >= 32:
-                disable_last_column = width_out % 32 == 0
-            elif width_out >= 16:
-                disable_last_column = width_out % 16 == 0
-            elif width_out >= 8:
-                disable_last_column = width_out % 8 == 0
-
-            if height_out >= 64:
-                disable_last_row = height_out % 64 == 0
-            elif height_out >= 32:
-                disable_last_row = height_out % 32 == 0
-            elif height_out >= 16:
-                disable_last_row = height_out % 16 == 0
-            elif height_out >= 8:
-                disable_last_row = height_out % 8 == 0
-
-            if disable_last_column:
-                error[:,:,:,width_out-1] = 0.0
-            if disable_last_row:
-                error[:,:,height_out-1,:] = 0.0
-
-
-
-        # add padding but b
-        max_offset = np.max((np.max(np.abs(mu1)),
-                             np.max(np.abs(mu2))))
-        padding = np.int32(np.ceil(max_offset + 1))
-        x_pad = np.pad(x, pad_width=[(0,),(0,),(padding,),(padding,)], mode='constant')
-
-        output = np.zeros(mu1.shape,dtype=np.float32)
-
-        for f in range(F):
-            for s in range(S):
-                for g in range(G-num_dau_units_ignore):
-                    offset_x = mu1[0,s,g,f]
-                    offset_y = mu2[0,s,g,f]
-
-                    offset_x_int = np.floor(offset_x)
-                    offset_y_int = np.floor(offset_y)
-
-                    interpol_off_x = offset_x - offset_x_int
-                    interpol_off_y = offset_y - offset_y_int
-
-                    for dy in [0,1]:
-                        for dx in [0,1]:
-                            interpol_w = 1
-
-                            interpol_w = interpol_w * ((1-interpol_off_x) if dx == 0 else interpol_off_x)
-                            interpol_w = interpol_w * ((1-interpol_off_y) if dy == 0 else interpol_off_y)
-
-                            access_off_x = np.int32(offset_x_int + dx + padding)
-                            access_off_y = np.int32(offset_y_int + dy + padding)
-
-                            output[0,s,g,f] += np.sum(np.multiply(x_pad[:,s,access_off_y:height_out + access_off_y, access_off_x:width_out + access_off_x],
-                                                                  error[:,f,:,:])) * interpol_w
-        return output
-
-    def _get_filters(self, sigma):
-        N = 9
-
-        x = np.tile(np.arange(N),(N,1))-4
-        y = x.T
-
-        filter = np.exp(-1 * (x**2 + y**2) /(2*sigma**2))
-        deriv_w = filter
-        deriv_mu1 = x / (sigma**2) * filter
-        deriv_mu2 = y / (sigma**2) * filter
-        deriv_sigma = (x**2 + y**2) / (sigma**3) * filter
-
-        sum_filter = np.sum(filter)
-        sum_mu1 = np.sum(deriv_mu1) / sum_filter
-        sum_mu2 = np.sum(deriv_mu2) / sum_filter
-        sum_sigma = np.sum(deriv_sigma) / sum_filter
-
-        filter = filter / sum_filter
-        deriv_w = deriv_w / sum_filter
-
-        deriv_mu1 = deriv_mu1 / sum_filter - deriv_w *  sum_mu1
-        deriv_mu2 = deriv_mu2 / sum_filter - deriv_w *  sum_mu2
-        deriv_sigma = deriv_sigma / sum_filter - deriv_w * sum_sigma
-
-        return (filter, deriv_w, deriv_mu1, deriv_mu2, deriv_sigma)
-
-    def backward_cpu(self, x, error, w, mu1, mu2, sigma, num_dau_units_ignore=0, unit_testing=True):
-
-        # we get back-propagated error by rotating offsets i.e. we just use negatives of offsets
-        backprop_error = self.forward_cpu(error,
-                                           np.swapaxes(w, 1,3),
-                                           np.swapaxes(-1 * mu1, 1,3),
-                                           np.swapaxes(-1 * mu2, 1,3), sigma)
-        N = x.shape[0]
-        F = x.shape[1]
-
-        sigma_val = sigma[0]
-
-        filter,deriv_w, deriv_mu1,deriv_mu2,_ = self._get_filters(sigma_val)
-
-        # next we need to get gradients wrt w,mu1,mu2
-        if True:
-            x_w_blur = np.zeros(x.shape,dtype=np.float32)
-            # pre-blur the X
-            for n in range(N):
-                for f in range(F):
-                    x_w_blur[n,f,:,:] = correlate(x[n,f,:,:],weights=deriv_w,mode='constant')
-
-            # then offset and sum element-wise
-            w_grad = self._offset_and_dot(x_w_blur,error,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore, ignore_edge_gradients=unit_testing)
-
-        if True:
-            x_mu1_blur = np.zeros(x.shape,dtype=np.float32)
-            # pre-blur the X
-            for n in range(N):
-                for f in range(F):
-                    x_mu1_blur[n,f,:,:] = correlate(x[n,f,:,:],weights=deriv_mu1,mode='constant')
-
-            # then offset and sum element-wise
-            mu1_grad = self._offset_and_dot(x_mu1_blur,error,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore, ignore_edge_gradients=unit_testing)
-
-        if True:
-            x_mu2_blur = np.zeros(x.shape,dtype=np.float32)
-            # pre-blur the X
-            for n in range(N):
-                for f in range(F):
-                    x_mu2_blur[n,f,:,:] = correlate(x[n,f,:,:],weights=deriv_mu2,mode='constant')
-
-            # then offset and sum element-wise
-            mu2_grad = self._offset_and_dot(x_mu2_blur,error,mu1,mu2, num_dau_units_ignore=num_dau_units_ignore, ignore_edge_gradients=unit_testing)
-
-        # add multiplication with weight for mean gradients
-        mu1_grad = np.multiply(mu1_grad, w)
-        mu2_grad = np.multiply(mu2_grad, w)
-
-        return (backprop_error, w_grad, mu1_grad, mu2_grad)
+from dau_conv_python import DAUConvPython
 
 class DAUConvTest(unittest.TestCase):
 
@@ -356,6 +137,309 @@ class DAUConvTest(unittest.TestCase):
             self._assertMatrix(r_grad[2], gt_bwd_vals[2], 'bwd_mu1_grad', rel_tolerance=0.01, plot_difference=True)
             self._assertMatrix(r_grad[3], gt_bwd_vals[3], 'bwd_mu2_grad', rel_tolerance=0.01, plot_difference=True)
 
+    def test_DAUConvCPU(self):
+
+        mu_learning_rate_factor = 1000
+        N = 4
+        W = 32
+        H = 32
+        input_channels = 16
+        num_output = 16
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        # force CPU kernels for DAUConv and DAUConvGrad
+        with tf.device('/cpu:0'):
+            x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+            op = DAUConv2d(filters=num_output,
+                           dau_units=(2,2),
+                           max_kernel_size=9,
+                           use_bias=False,
+                           weight_initializer=tf.random_normal_initializer(stddev=0.1, dtype=np.float32),
+                           mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                           mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                           sigma_initializer=tf.constant_initializer(sigma),
+                           mu_learning_rate_factor=mu_learning_rate_factor,
+                           unit_testing=True)
+
+            result = op(x)
+            result_error = tf.random_normal([np.int32(x.shape[0]),num_output,
+                                             np.int32(x.shape[2]),
+                                             np.int32(x.shape[3])],dtype=tf.float32)
+
+            var_grad = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2], grad_ys=result_error)
+
+        init = tf.global_variables_initializer()
+
+        c = tf.ConfigProto(allow_soft_placement=False,
+                           log_device_placement=True)
+
+        with tf.Session(config=c) as s:
+
+            s.run(init)
+            t_start = time.time()
+
+            r, r_error, r_grad, w, mu1, mu2  = s.run([result, result_error, var_grad, op.dau_weights, op.dau_mu1, op.dau_mu2], feed_dict = {x: x_rand})
+
+            t_end = time.time()
+            print(t_end-t_start)
+
+        gt_fwd_vals = DAUConvPython().forward_cpu(x=x_rand, w=w, mu1=mu1, mu2=mu2,
+                                                  sigma=[sigma], num_dau_units_ignore=op.num_dau_units_ignore)
+
+        gt_bwd_vals = DAUConvPython().backward_cpu(x=x_rand, error=r_error, w=w, mu1=mu1,mu2=mu2,
+                                                   sigma=[sigma], num_dau_units_ignore=op.num_dau_units_ignore, unit_testing=True)
+        # interpolation in C++ code at the right edge excludes one pixel so ignore those pixels in check
+        r = r[:,:,:,:-2]
+        r_grad[0] = r_grad[0][:,:,:,:-2]
+        gt_fwd_vals = gt_fwd_vals[:,:,:,:-2]
+        gt_bwd_vals = (gt_bwd_vals[0][:,:,:,:-2],
+                       gt_bwd_vals[1],
+                       gt_bwd_vals[2]* mu_learning_rate_factor,
+                       gt_bwd_vals[3]* mu_learning_rate_factor)
+
+        self._assertMatrix(r, gt_fwd_vals, 'fwd_output', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[0], gt_bwd_vals[0], 'bwd_error', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[1], gt_bwd_vals[1], 'bwd_w_grad', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[2], gt_bwd_vals[2], 'bwd_mu1_grad', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[3], gt_bwd_vals[3], 'bwd_mu2_grad', rel_tolerance=0.01)
+
+    def test_DAUConvCPUChannelsLast(self):
+
+        mu_learning_rate_factor = 1000
+        N = 4
+        W = 32
+        H = 32
+        input_channels = 16
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,H,W,input_channels)
+
+        # NHWC is supported only by CPU kernels
+        with tf.device('/cpu:0'):
+            x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+            op = DAUConv2d(filters=num_output,
+                           dau_units=(2,2),
+                           max_kernel_size=9,
+                           data_format='channels_last',
+                           use_bias=False,
+                           weight_initializer=tf.random_normal_initializer(stddev=0.1, dtype=np.float32),
+                           mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                           mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                           sigma_initializer=tf.constant_initializer(sigma),
+                           mu_learning_rate_factor=mu_learning_rate_factor,
+                           unit_testing=True)
+
+            result = op(x)
+            result_error = tf.random_normal([N, H, W, num_output],dtype=tf.float32)
+
+            var_grad = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2], grad_ys=result_error)
+
+        init = tf.global_variables_initializer()
+
+        c = tf.ConfigProto(allow_soft_placement=False,
+                           log_device_placement=True)
+
+        with tf.Session(config=c) as s:
+
+            s.run(init)
+
+            r, r_error, r_grad, w, mu1, mu2  = s.run([result, result_error, var_grad, op.dau_weights, op.dau_mu1, op.dau_mu2], feed_dict = {x: x_rand})
+
+        self.assertEqual(r.shape, (N, H, W, num_output))
+
+        # reference implementation works on NCHW data
+        to_nchw = lambda a: np.transpose(a, (0,3,1,2))
+        to_nhwc = lambda a: np.transpose(a, (0,2,3,1))
+
+        gt_fwd_vals = to_nhwc(DAUConvPython().forward_cpu(x=to_nchw(x_rand), w=w, mu1=mu1, mu2=mu2,
+                                                          sigma=[sigma], num_dau_units_ignore=op.num_dau_units_ignore))
+
+        gt_bwd_vals = DAUConvPython().backward_cpu(x=to_nchw(x_rand), error=to_nchw(r_error), w=w, mu1=mu1,mu2=mu2,
+                                                   sigma=[sigma], num_dau_units_ignore=op.num_dau_units_ignore, unit_testing=True)
+
+        # interpolation in C++ code at the right edge excludes one pixel so ignore those pixels in check
+        r = r[:,:,:-2,:]
+        r_grad[0] = r_grad[0][:,:,:-2,:]
+        gt_fwd_vals = gt_fwd_vals[:,:,:-2,:]
+        gt_bwd_vals = (to_nhwc(gt_bwd_vals[0])[:,:,:-2,:],
+                       gt_bwd_vals[1],
+                       gt_bwd_vals[2]* mu_learning_rate_factor,
+                       gt_bwd_vals[3]* mu_learning_rate_factor)
+
+        self._assertMatrix(r, gt_fwd_vals, 'fwd_output', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[0], gt_bwd_vals[0], 'bwd_error', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[1], gt_bwd_vals[1], 'bwd_w_grad', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[2], gt_bwd_vals[2], 'bwd_mu1_grad', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[3], gt_bwd_vals[3], 'bwd_mu2_grad', rel_tolerance=0.01)
+
+    def test_DAUConvCPUStrided(self):
+
+        mu_learning_rate_factor = 1000
+        N = 4
+        W = 32
+        H = 32
+        input_channels = 16
+        num_output = 8
+        sigma = 0.5
+        stride = 2
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        # stride > 1 is supported only by CPU kernels
+        with tf.device('/cpu:0'):
+            x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+            op = DAUConv2d(filters=num_output,
+                           dau_units=(2,2),
+                           max_kernel_size=9,
+                           strides=stride,
+                           use_bias=False,
+                           weight_initializer=tf.random_normal_initializer(stddev=0.1, dtype=np.float32),
+                           mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                           mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                           sigma_initializer=tf.constant_initializer(sigma),
+                           mu_learning_rate_factor=mu_learning_rate_factor,
+                           unit_testing=True)
+
+            result = op(x)
+            result_error = tf.random_normal([N, num_output, H // stride, W // stride],dtype=tf.float32)
+
+            var_grad = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2], grad_ys=result_error)
+
+        self.assertEqual(result.shape.as_list(), [N, num_output, H // stride, W // stride])
+        self.assertEqual(op.compute_output_shape(x_rand.shape).as_list(), [N, num_output, H // stride, W // stride])
+
+        init = tf.global_variables_initializer()
+
+        with tf.Session() as s:
+
+            s.run(init)
+
+            r, r_error, r_grad, w, mu1, mu2  = s.run([result, result_error, var_grad, op.dau_weights, op.dau_mu1, op.dau_mu2], feed_dict = {x: x_rand})
+
+        # strided output must be the same as sub-sampled output of stride=1
+        gt_fwd_vals = DAUConvPython().forward_cpu(x=x_rand, w=w, mu1=mu1, mu2=mu2,
+                                                  sigma=[sigma], num_dau_units_ignore=op.num_dau_units_ignore)
+        gt_fwd_vals = gt_fwd_vals[:,:,::stride,::stride]
+
+        gt_bwd_vals = numpy_engine.backward(x_rand, r_error, w, mu1, mu2, [sigma],
+                                            num_dau_units_ignore=op.num_dau_units_ignore, kernel_size=9, stride=stride)
+
+        # interpolation in C++ code at the right edge excludes one pixel so ignore those pixels in check
+        r = r[:,:,:,:-1]
+        r_grad[0] = r_grad[0][:,:,:,:-2]
+        gt_fwd_vals = gt_fwd_vals[:,:,:,:-1]
+        gt_bwd_vals = (gt_bwd_vals[0][:,:,:,:-2],
+                       gt_bwd_vals[1],
+                       gt_bwd_vals[2]* mu_learning_rate_factor,
+                       gt_bwd_vals[3]* mu_learning_rate_factor)
+
+        self._assertMatrix(r, gt_fwd_vals, 'fwd_output', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[0], gt_bwd_vals[0], 'bwd_error', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[1], gt_bwd_vals[1], 'bwd_w_grad', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[2], gt_bwd_vals[2], 'bwd_mu1_grad', rel_tolerance=0.01)
+        self._assertMatrix(r_grad[3], gt_bwd_vals[3], 'bwd_mu2_grad', rel_tolerance=0.01)
+
+    def test_DAUConvLayerStateReuse(self):
+
+        N = 4
+        W = 32
+        H = 32
+        input_channels = 16
+        num_output = 16
+        sigma = 0.5
+
+        # batch size is not fixed so the same op is called with different input shapes (forces rebuild of layer state)
+        x = tf.placeholder(tf.float32, shape = [None, input_channels, H, W])
+
+        op = DAUConv2d(filters=num_output,
+                       dau_units=(2,2),
+                       max_kernel_size=9,
+                       use_bias=False,
+                       weight_initializer=tf.random_normal_initializer(stddev=0.1, dtype=np.float32),
+                       mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                       mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                       sigma_initializer=tf.constant_initializer(sigma),
+                       unit_testing=True)
+
+        result = op(x)
+
+        init = tf.global_variables_initializer()
+
+        c = tf.ConfigProto(allow_soft_placement=True,
+                           log_device_placement=True)
+        c.gpu_options.visible_device_list = '0'
+        c.gpu_options.allow_growth = True
+
+        with tf.Session(config=c) as s:
+
+            s.run(init)
+
+            for n in [N, N, N // 2, N]:
+                x_rand = np.random.rand(n,input_channels,H,W)
+
+                r, w, mu1, mu2 = s.run([result, op.dau_weights, op.dau_mu1, op.dau_mu2], feed_dict = {x: x_rand})
+
+                gt_fwd_vals = DAUConvPython().forward_cpu(x=x_rand, w=w, mu1=mu1, mu2=mu2,
+                                                          sigma=[sigma], num_dau_units_ignore=op.num_dau_units_ignore)
+
+                self._assertMatrix(r[:,:,:,:-2], gt_fwd_vals[:,:,:,:-2], 'fwd_output', rel_tolerance=0.01)
+
+    def test_DAUConvProfiling(self):
+
+        N = 4
+        W = 32
+        H = 32
+        input_channels = 16
+        num_output = 8
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        # only CPU kernels are profiled
+        with tf.device('/cpu:0'):
+            x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+            op = DAUConv2d(filters=num_output,
+                           dau_units=(2,2),
+                           max_kernel_size=9,
+                           use_bias=False)
+
+            result = op(x)
+
+            var_grad = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2])
+
+        init = tf.global_variables_initializer()
+
+        with tf.Session() as s:
+
+            s.run(init)
+
+            # nothing is collected while profiling is disabled
+            s.run([dau_conv_set_profiling(False), dau_conv_profile(reset=True)])
+            s.run(var_grad, feed_dict = {x: x_rand})
+
+            self.assertIsNone(op.get_profile(parse_dau_conv_profile(s.run(dau_conv_profile(reset=True)))))
+
+            s.run(dau_conv_set_profiling(True))
+            for i in range(3):
+                s.run(var_grad, feed_dict = {x: x_rand})
+            s.run(dau_conv_set_profiling(False))
+
+            profile = parse_dau_conv_profile(s.run(dau_conv_profile(reset=True)))
+
+        layer_profile = op.get_profile(profile)
+
+        # forward and backward ops are collected under the name of the layer
+        # (blur and offset-and-sum of the forward pass are fused on CPU)
+        for phase in ['fwd_blur_offset_sum', 'bwd_blur_error', 'bwd_backprop_error', 'bwd_blur_input', 'bwd_offset_dot']:
+            self.assertIn(phase, layer_profile)
+            self.assertEqual(layer_profile[phase]['calls'], 3)
+            self.assertGreater(layer_profile[phase]['time_ms'], 0)
+            self.assertGreater(layer_profile[phase]['bytes'], 0)
+
+        self.assertGreaterEqual(profile['kernel_cache']['size'], 1)
+
     def test_DAUConvSingleUnit(self):
 
         for i in range(3):
@@ -427,6 +511,692 @@ class DAUConvTest(unittest.TestCase):
             self._assertMatrix(r_grad[2], gt_bwd_vals[2], 'bwd_mu1_grad', rel_tolerance=0.01, plot_difference=True)
             self._assertMatrix(r_grad[3], gt_bwd_vals[3], 'bwd_mu2_grad', rel_tolerance=0.01, plot_difference=True)
 
+    def test_DAUConvCPUOddUnits(self):
+
+        mu_learning_rate_factor = 1000
+        N = 4
+        W = 32
+        H = 32
+        input_channels = 16
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        for dau_units in [(1,1), (3,1), (3,3)]:
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+                op = DAUConv2d(filters=num_output,
+                               dau_units=dau_units,
+                               max_kernel_size=9,
+                               use_bias=False,
+                               weight_initializer=tf.random_normal_initializer(stddev=0.1, dtype=np.float32),
+                               mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                               mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                               sigma_initializer=tf.constant_initializer(sigma),
+                               mu_learning_rate_factor=mu_learning_rate_factor,
+                               unit_testing=True)
+
+                result = op(x)
+                result_error = tf.random_normal([N, num_output, H, W],dtype=tf.float32)
+
+                var_grad = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2], grad_ys=result_error)
+
+                # variables must hold only requested units without any padding
+                self.assertEqual(op.num_dau_units_ignore, 0)
+                self.assertEqual(op.dau_weights.shape.as_list(), [1, input_channels, np.prod(dau_units), num_output])
+
+                init = tf.global_variables_initializer()
+
+                with tf.Session() as s:
+
+                    s.run(init)
+
+                    r, r_error, r_grad, w, mu1, mu2  = s.run([result, result_error, var_grad, op.dau_weights, op.dau_mu1, op.dau_mu2], feed_dict = {x: x_rand})
+
+            gt_fwd_vals = DAUConvPython().forward_cpu(x=x_rand, w=w, mu1=mu1, mu2=mu2, sigma=[sigma])
+
+            gt_bwd_vals = DAUConvPython().backward_cpu(x=x_rand, error=r_error, w=w, mu1=mu1,mu2=mu2,
+                                                       sigma=[sigma], unit_testing=True)
+            # interpolation in C++ code at the right edge excludes one pixel so ignore those pixels in check
+            r = r[:,:,:,:-2]
+            r_grad[0] = r_grad[0][:,:,:,:-2]
+            gt_fwd_vals = gt_fwd_vals[:,:,:,:-2]
+            gt_bwd_vals = (gt_bwd_vals[0][:,:,:,:-2],
+                           gt_bwd_vals[1],
+                           gt_bwd_vals[2]* mu_learning_rate_factor,
+                           gt_bwd_vals[3]* mu_learning_rate_factor)
+
+            self._assertMatrix(r, gt_fwd_vals, 'fwd_output', rel_tolerance=0.01)
+            self._assertMatrix(r_grad[0], gt_bwd_vals[0], 'bwd_error', rel_tolerance=0.01)
+            self._assertMatrix(r_grad[1], gt_bwd_vals[1], 'bwd_w_grad', rel_tolerance=0.01)
+            self._assertMatrix(r_grad[2], gt_bwd_vals[2], 'bwd_mu1_grad', rel_tolerance=0.01)
+            self._assertMatrix(r_grad[3], gt_bwd_vals[3], 'bwd_mu2_grad', rel_tolerance=0.01)
+
+    def test_DAUConvFreezeToDense(self):
+
+        N = 16
+        W = 64
+        H = 64
+        input_channels = 32
+        num_output = 32
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        for stride in [1, 2]:
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+                op = DAUConv2d(filters=num_output,
+                               dau_units=(2,2),
+                               max_kernel_size=9,
+                               strides=stride,
+                               use_bias=True,
+                               weight_initializer=tf.random_normal_initializer(stddev=0.1, dtype=np.float32),
+                               mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                               mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                               sigma_initializer=tf.constant_initializer(sigma),
+                               bias_initializer=tf.random_normal_initializer(stddev=0.1, dtype=np.float32),
+                               unit_testing=True)
+
+                result = op(x)
+
+                init = tf.global_variables_initializer()
+
+                with tf.Session() as s:
+                    s.run(init)
+
+                    dense_kernel = op.freeze_to_dense(s)
+                    result_dense = op(x)
+
+                    self.assertEqual(result_dense.shape.as_list(), result.shape.as_list())
+
+                    r, r_dense = s.run([result, result_dense], feed_dict = {x: x_rand})
+
+                    t_start = time.time()
+                    for i in range(10):
+                        s.run(result.op, feed_dict = {x: x_rand})
+                    t_dau = (time.time() - t_start) / 10
+
+                    t_start = time.time()
+                    for i in range(10):
+                        s.run(result_dense.op, feed_dict = {x: x_rand})
+                    t_dense = (time.time() - t_start) / 10
+
+                op.unfreeze()
+                self.assertIsNone(op.dense_kernel)
+
+            print('stride=%d: DAUConv: %f sec, dense %dx%d conv2d: %f sec' % (stride, t_dau, dense_kernel.shape[-2],
+                                                                              dense_kernel.shape[-1], t_dense))
+
+            # outputs are the same except for border where dense kernel blurs zero padding into the input
+            # (and the last pixel that C++ interpolation excludes at the right edge)
+            max_shift = dense_kernel.shape[-1] // 2 - 3 # radius of blur kernel for sigma=0.5 is 3
+            border = max_shift // stride + 1
+
+            self._assertMatrix(r_dense[:,:,border:-border,border:-border], r[:,:,border:-border,border:-border],
+                               'dense_output', rel_tolerance=0.01)
+
+    def test_DAUConvDenseEngine(self):
+
+        N = 4
+        W = 32
+        H = 32
+        input_channels = 16
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        # both engines use the same parameters
+        w_rand = np.random.normal(0, 0.1, (1,input_channels,4,num_output))
+        mu1_rand = np.random.uniform(-3, 3, (1,input_channels,4,num_output))
+        mu2_rand = np.random.uniform(-3, 3, (1,input_channels,4,num_output))
+
+        for stride in [1, 2]:
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+                results = []
+                for engine in ['dau', 'dense']:
+                    op = DAUConv2d(filters=num_output,
+                                   dau_units=(2,2),
+                                   max_kernel_size=9,
+                                   strides=stride,
+                                   use_bias=False,
+                                   weight_initializer=tf.constant_initializer(w_rand),
+                                   mu1_initializer=tf.constant_initializer(mu1_rand),
+                                   mu2_initializer=tf.constant_initializer(mu2_rand),
+                                   sigma_initializer=tf.constant_initializer(sigma),
+                                   unit_testing=True,
+                                   engine=engine)
+                    result = op(x)
+
+                    self.assertEqual(op.engine, engine)
+
+                    results.append(result)
+
+                result_error = tf.random_normal(results[0].shape.as_list(),dtype=tf.float32)
+
+                grads = [tf.gradients(r, x, grad_ys=result_error)[0] for r in results]
+
+                init = tf.global_variables_initializer()
+
+                with tf.Session() as s:
+                    s.run(init)
+
+                    r, r_dense, r_grad, r_dense_grad = s.run(results + grads, feed_dict = {x: x_rand})
+
+            # outputs are the same except for border where dense kernel blurs zero padding into the input
+            # (and the last pixel that C++ interpolation excludes at the right edge)
+            border = 4 // stride + 1
+
+            self._assertMatrix(r_dense[:,:,border:-border,border:-border], r[:,:,border:-border,border:-border],
+                               'dense_output', rel_tolerance=0.01)
+
+            border = 8
+            self._assertMatrix(r_dense_grad[:,:,border:-border,border:-border], r_grad[:,:,border:-border,border:-border],
+                               'dense_bwd_error', rel_tolerance=0.01)
+
+    def test_DAUConvLargeKernel(self):
+
+        N = 2
+        W = 48
+        H = 48
+        input_channels = 8
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        for max_kernel_size in [33, 65]:
+            offset = max_kernel_size // 2 - 1
+
+            w_rand = np.float32(np.random.normal(0, 0.1, (1,input_channels,4,num_output)))
+            mu1_rand = np.float32(np.random.uniform(-offset, offset, (1,input_channels,4,num_output)))
+            mu2_rand = np.float32(np.random.uniform(-offset, offset, (1,input_channels,4,num_output)))
+
+            # layer is placed on CPU even when created under GPU device scope
+            with tf.Graph().as_default() as graph, tf.device('/gpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+                op = DAUConv2d(filters=num_output,
+                               dau_units=(2,2),
+                               max_kernel_size=max_kernel_size,
+                               use_bias=False,
+                               weight_initializer=tf.constant_initializer(w_rand),
+                               mu1_initializer=tf.constant_initializer(mu1_rand),
+                               mu2_initializer=tf.constant_initializer(mu2_rand),
+                               sigma_initializer=tf.constant_initializer(sigma),
+                               unit_testing=True,
+                               engine='dau')
+                result = op(x)
+
+                result_error = tf.random_normal(result.shape.as_list(),dtype=tf.float32)
+
+                grad = tf.gradients(result, x, grad_ys=result_error)[0]
+
+                for dau_op in graph.get_operations():
+                    if dau_op.type in ['DAUConv', 'DAUConvGrad']:
+                        self.assertIn('CPU', dau_op.device.upper())
+
+                init = tf.global_variables_initializer()
+
+                with tf.Session(config=tf.ConfigProto(allow_soft_placement=True)) as s:
+                    s.run(init)
+
+                    r, r_error, r_grad = s.run([result, result_error, grad], feed_dict = {x: x_rand})
+
+            gt_fwd_vals = numpy_engine.forward(x_rand, w_rand, mu1_rand, mu2_rand, sigma)
+
+            gt_bwd_vals = numpy_engine.backward(x_rand, r_error, w_rand, mu1_rand, mu2_rand, sigma,
+                                                ignore_edge_gradients=True)
+
+            self._assertMatrix(r, gt_fwd_vals, 'fwd_output', rel_tolerance=0.01)
+            self._assertMatrix(r_grad, gt_bwd_vals[0], 'bwd_error', rel_tolerance=0.01)
+
+    def test_DAUConvCPUTiled(self):
+
+        N = 2
+        W = 48
+        H = 64
+        input_channels = 8
+        num_output = 16
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        # all layers use the same parameters
+        w_rand = np.random.normal(0, 0.1, (1,input_channels,4,num_output))
+        mu1_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+        mu2_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+
+        blurred_bytes = N * input_channels * H * W * 4
+
+        for data_format in ['channels_first', 'channels_last']:
+            x_in = x_rand if data_format == 'channels_first' else np.transpose(x_rand, (0, 2, 3, 1))
+
+            for stride in [1, 2]:
+                with tf.Graph().as_default(), tf.device('/cpu:0'):
+                    x = tf.placeholder(tf.float32, shape = x_in.shape)
+
+                    # unfused version without tiling, with tiles of single images and with strips of rows of a
+                    # single image, fused version, and fused version with FFT blur (kernel is not fused then, so
+                    # it is tiled with strips of rows)
+                    results = []
+                    for fused_forward, tile_memory_limit, blur_method in [(False, 0, 'direct'),
+                                                                          (False, blurred_bytes // N, 'direct'),
+                                                                          (False, blurred_bytes // (4 * N), 'direct'),
+                                                                          (True, 0, 'direct'),
+                                                                          (True, blurred_bytes // (4 * N), 'fft')]:
+                        op = DAUConv2d(filters=num_output,
+                                       dau_units=(2,2),
+                                       max_kernel_size=9,
+                                       strides=stride,
+                                       data_format=data_format,
+                                       use_bias=False,
+                                       weight_initializer=tf.constant_initializer(w_rand),
+                                       mu1_initializer=tf.constant_initializer(mu1_rand),
+                                       mu2_initializer=tf.constant_initializer(mu2_rand),
+                                       sigma_initializer=tf.constant_initializer(sigma),
+                                       unit_testing=True,
+                                       engine='dau',
+                                       tile_memory_limit=tile_memory_limit,
+                                       fused_forward=fused_forward,
+                                       blur_method=blur_method)
+                        results.append(op(x))
+
+                    init = tf.global_variables_initializer()
+
+                    with tf.Session() as s:
+                        s.run(init)
+
+                        r, r_images, r_rows, r_fused, r_fft_rows = s.run(results, feed_dict = {x: x_in})
+
+                # tiles and bands of fused version are computed exactly as the same part of the whole input
+                np.testing.assert_array_equal(r_images, r)
+                np.testing.assert_array_equal(r_rows, r)
+                np.testing.assert_array_equal(r_fused, r)
+
+                np.testing.assert_allclose(r_fft_rows, r, rtol=1e-4, atol=1e-5)
+
+    def test_DAUConvCPUBlurMethod(self):
+
+        N = 2
+        W = 32
+        H = 40
+        input_channels = 4
+        num_output = 8
+        x_rand = np.random.rand(N,input_channels,H,W)
+        error_rand = np.random.normal(0, 1, (N,num_output,H,W))
+
+        w_rand = np.random.normal(0, 0.1, (1,input_channels,4,num_output))
+        mu1_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+        mu2_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+
+        # small sigma uses direct blur with 'auto', larger one uses FFT for non-separable kernel (derivative w.r.t. sigma)
+        for sigma in [0.5, 2.0]:
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+                results = []
+                for blur_method in ['direct', 'fft', 'auto']:
+                    op = DAUConv2d(filters=num_output,
+                                   dau_units=(2,2),
+                                   max_kernel_size=9,
+                                   data_format='channels_first',
+                                   use_bias=False,
+                                   weight_initializer=tf.constant_initializer(w_rand),
+                                   mu1_initializer=tf.constant_initializer(mu1_rand),
+                                   mu2_initializer=tf.constant_initializer(mu2_rand),
+                                   sigma_initializer=tf.constant_initializer(sigma),
+                                   unit_testing=True,
+                                   engine='dau',
+                                   blur_method=blur_method)
+                    result = op(x)
+
+                    grads = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2],
+                                         grad_ys=error_rand.astype(np.float32))
+                    results.append([result] + grads)
+
+                init = tf.global_variables_initializer()
+
+                with tf.Session() as s:
+                    s.run(init)
+
+                    r_direct, r_fft, r_auto = s.run(results, feed_dict = {x: x_rand})
+
+            for val_direct, val_fft, val_auto in zip(r_direct, r_fft, r_auto):
+                np.testing.assert_allclose(val_fft, val_direct, rtol=1e-3, atol=1e-4)
+                np.testing.assert_allclose(val_auto, val_direct, rtol=1e-3, atol=1e-4)
+
+        with self.assertRaises(ValueError):
+            DAUConv2d(filters=num_output, dau_units=(2,2), max_kernel_size=9, blur_method='iir')
+
+    def test_DAUConvSelectiveGradients(self):
+
+        N = 2
+        W = 32
+        H = 32
+        input_channels = 4
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+        error_rand = np.random.normal(0, 1, (N,num_output,H,W)).astype(np.float32)
+
+        w_rand = np.random.normal(0, 0.1, (1,input_channels,4,num_output))
+        mu1_rand = np.random.uniform(-3, 3, (1,input_channels,4,num_output))
+        mu2_rand = np.random.uniform(-3, 3, (1,input_channels,4,num_output))
+
+        with tf.Graph().as_default(), tf.device('/cpu:0'):
+            x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+            # all gradients, frozen layer (only input gradient) and first layer (only parameter gradients)
+            grads = []
+            for trainable, compute_input_gradient in [(True, True), (False, True), (True, False)]:
+                op = DAUConv2d(filters=num_output,
+                               dau_units=(2,2),
+                               max_kernel_size=9,
+                               data_format='channels_first',
+                               use_bias=False,
+                               weight_initializer=tf.constant_initializer(w_rand),
+                               mu1_initializer=tf.constant_initializer(mu1_rand),
+                               mu2_initializer=tf.constant_initializer(mu2_rand),
+                               sigma_initializer=tf.constant_initializer(sigma),
+                               unit_testing=True,
+                               engine='dau',
+                               trainable=trainable,
+                               compute_input_gradient=compute_input_gradient)
+                result = op(x)
+
+                grads.append(tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2], grad_ys=error_rand))
+
+            full_grads, frozen_grads, first_grads = grads
+
+            # skipped gradients are not computed at all
+            self.assertEqual([g is None for g in frozen_grads], [False, True, True, True])
+            self.assertEqual([g is None for g in first_grads], [True, False, False, False])
+
+            init = tf.global_variables_initializer()
+
+            with tf.Session() as s:
+                s.run(init)
+
+                r_full, r_frozen, r_first = s.run([full_grads, frozen_grads[:1], first_grads[1:]],
+                                                  feed_dict = {x: x_rand})
+
+        np.testing.assert_array_equal(r_frozen[0], r_full[0])
+        for val, gt_val in zip(r_first, r_full[1:]):
+            np.testing.assert_array_equal(val, gt_val)
+
+    def test_DAUConvSaveBlurredInput(self):
+
+        N = 2
+        W = 32
+        H = 40
+        input_channels = 4
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+        error_rand = np.random.normal(0, 1, (N,num_output,H,W))
+
+        w_rand = np.random.normal(0, 0.1, (1,input_channels,4,num_output))
+        mu1_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+        mu2_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+
+        for data_format in ['channels_first', 'channels_last']:
+            x_in = x_rand if data_format == 'channels_first' else np.transpose(x_rand, (0, 2, 3, 1))
+            error_in = error_rand if data_format == 'channels_first' else np.transpose(error_rand, (0, 2, 3, 1))
+
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_in.shape)
+
+                results = []
+                for save_blurred_input in [False, True]:
+                    op = DAUConv2d(filters=num_output,
+                                   dau_units=(2,2),
+                                   max_kernel_size=9,
+                                   data_format=data_format,
+                                   use_bias=False,
+                                   weight_initializer=tf.constant_initializer(w_rand),
+                                   mu1_initializer=tf.constant_initializer(mu1_rand),
+                                   mu2_initializer=tf.constant_initializer(mu2_rand),
+                                   sigma_initializer=tf.constant_initializer(sigma),
+                                   unit_testing=True,
+                                   engine='dau',
+                                   save_blurred_input=save_blurred_input)
+                    result = op(x)
+
+                    grads = tf.gradients(result, [x, op.dau_weights, op.dau_mu1, op.dau_mu2],
+                                         grad_ys=error_in.astype(np.float32))
+                    results.append([result] + grads)
+
+                init = tf.global_variables_initializer()
+
+                with tf.Session() as s:
+                    s.run(init)
+
+                    r_gt, r_saved = s.run(results, feed_dict = {x: x_in})
+
+            for val, gt_val in zip(r_saved, r_gt):
+                np.testing.assert_allclose(val, gt_val, rtol=1e-5, atol=1e-6)
+
+    def test_DAUConvFusedBiasActivation(self):
+
+        N = 2
+        W = 32
+        H = 40
+        input_channels = 4
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+        error_rand = np.random.normal(0, 1, (N,num_output,H,W))
+
+        w_rand = np.random.normal(0, 0.1, (1,input_channels,4,num_output))
+        mu1_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+        mu2_rand = np.random.uniform(-4, 4, (1,input_channels,4,num_output))
+        bias_rand = np.random.normal(0, 0.1, (num_output,))
+
+        for data_format in ['channels_first', 'channels_last']:
+            x_in = x_rand if data_format == 'channels_first' else np.transpose(x_rand, (0, 2, 3, 1))
+            error_in = error_rand if data_format == 'channels_first' else np.transpose(error_rand, (0, 2, 3, 1))
+
+            for activation, use_bias in [(None, True), (tf.nn.relu, True), (tf.nn.leaky_relu, True), (tf.nn.relu, False)]:
+                with tf.Graph().as_default(), tf.device('/cpu:0'):
+                    x = tf.placeholder(tf.float32, shape = x_in.shape)
+
+                    results = []
+                    for fused_bias_activation in [False, True]:
+                        op = DAUConv2d(filters=num_output,
+                                       dau_units=(2,2),
+                                       max_kernel_size=9,
+                                       data_format=data_format,
+                                       activation=activation,
+                                       use_bias=use_bias,
+                                       weight_initializer=tf.constant_initializer(w_rand),
+                                       mu1_initializer=tf.constant_initializer(mu1_rand),
+                                       mu2_initializer=tf.constant_initializer(mu2_rand),
+                                       sigma_initializer=tf.constant_initializer(sigma),
+                                       bias_initializer=tf.constant_initializer(bias_rand),
+                                       unit_testing=True,
+                                       engine='dau',
+                                       fused_bias_activation=fused_bias_activation)
+                        result = op(x)
+
+                        params = [x, op.dau_weights, op.dau_mu1, op.dau_mu2] + ([op.bias] if use_bias else [])
+                        grads = tf.gradients(result, params, grad_ys=error_in.astype(np.float32))
+                        results.append([result] + grads)
+
+                    init = tf.global_variables_initializer()
+
+                    with tf.Session() as s:
+                        s.run(init)
+
+                        r_gt, r_fused = s.run(results, feed_dict = {x: x_in})
+
+                for val, gt_val in zip(r_fused, r_gt):
+                    np.testing.assert_allclose(val, gt_val, rtol=1e-4, atol=1e-5)
+
+        with self.assertRaises(ValueError):
+            DAUConv2d(filters=num_output, dau_units=(2,2), max_kernel_size=9, activation=tf.nn.elu,
+                      fused_bias_activation=True)
+
+    def test_DAUConvFoldBatchNorm(self):
+
+        N = 2
+        W = 32
+        H = 32
+        input_channels = 4
+        num_output = 8
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        bn_initializers = {
+            'beta': tf.random_normal_initializer(stddev=0.1),
+            'gamma': tf.random_normal_initializer(mean=1, stddev=0.5),
+            'moving_mean': tf.random_normal_initializer(stddev=0.1),
+            'moving_variance': tf.random_uniform_initializer(minval=0.5, maxval=2),
+        }
+
+        for fuse_bias in [True, False]:
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_rand.shape, name='input')
+
+                result = dau_conv2d(x, num_output, dau_units=(2,2), max_kernel_size=9, data_format='NCHW',
+                                    activation_fn=tf.nn.relu,
+                                    normalizer_fn=tf.contrib.layers.batch_norm,
+                                    normalizer_params=dict(is_training=False, fused=True, scale=True,
+                                                           data_format='NCHW', param_initializers=bn_initializers),
+                                    mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3),
+                                    mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3),
+                                    sigma_initializer=tf.constant_initializer(sigma),
+                                    engine='dau')
+
+                with tf.Session() as s:
+                    s.run(tf.global_variables_initializer())
+
+                    r_gt = s.run(result, feed_dict = {x: x_rand})
+
+                    graph_def = fold_batch_norm(s, [result.op.name], fuse_bias=fuse_bias)
+
+            self.assertFalse([node.name for node in graph_def.node if node.op.startswith('FusedBatchNorm')])
+
+            # bias is fused only on request (op is placed on CPU)
+            self.assertEqual([node.attr['bias_term'].b for node in graph_def.node if node.op == 'DAUConv'], [fuse_bias])
+
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                folded_result, = tf.import_graph_def(graph_def, return_elements=[result.name], name='')
+
+                with tf.Session() as s:
+                    r_folded = s.run(folded_result, feed_dict = {'input:0': x_rand})
+
+            np.testing.assert_allclose(r_folded, r_gt, rtol=1e-4, atol=1e-5)
+
+    def test_DAUConvMergeUnits(self):
+
+        N = 2
+        W = 16
+        H = 16
+        input_channels = 4
+        num_output = 8
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        w_rand = np.random.normal(0, 0.1, (1,input_channels,4,num_output)).astype(np.float32)
+        mu1_rand = np.random.uniform(-3, 3, (1,input_channels,4,num_output)).astype(np.float32)
+        mu2_rand = np.random.uniform(-3, 3, (1,input_channels,4,num_output)).astype(np.float32)
+
+        # second pair of units nearly duplicates the first one (only units of the same sign are merged)
+        mu1_rand[:,:,2:] = mu1_rand[:,:,:2] + 0.01
+        mu2_rand[:,:,2:] = mu2_rand[:,:,:2] - 0.01
+        w_rand[:,:,2:] = np.abs(w_rand[:,:,2:]) * np.sign(w_rand[:,:,:2])
+
+        merge_iteration_step = 2
+
+        with tf.Graph().as_default(), tf.device('/cpu:0'):
+            x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+            op = DAUConv2d(filters=num_output,
+                           dau_units=(2,2),
+                           max_kernel_size=9,
+                           weight_initializer=tf.constant_initializer(w_rand),
+                           mu1_initializer=tf.constant_initializer(mu1_rand),
+                           mu2_initializer=tf.constant_initializer(mu2_rand),
+                           sigma_initializer=tf.constant_initializer(0.5),
+                           merge_iteration_step=merge_iteration_step,
+                           merge_threshold=0.1)
+            result = op(x)
+
+            update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+            self.assertEqual(len(update_ops), 1)
+
+            train_op = tf.train.GradientDescentOptimizer(0.1).minimize(tf.reduce_sum(result))
+
+            with tf.Session() as s:
+                s.run(tf.global_variables_initializer())
+
+                for i in range(merge_iteration_step):
+                    values = s.run([op.dau_weights, op.dau_mu1, op.dau_mu2])
+                    s.run(update_ops, feed_dict = {x: x_rand})
+
+                # nothing is merged until merge_iteration_step-th run
+                for val, gt_val in zip(values, [w_rand, mu1_rand, mu2_rand]):
+                    np.testing.assert_array_equal(val, gt_val)
+
+                merged = s.run([op.dau_weights, op.dau_mu1, op.dau_mu2])
+                unit_mask = s.run(op.unit_mask)
+
+                # units merged away stay disabled after further training steps
+                for i in range(2):
+                    s.run(train_op, feed_dict = {x: x_rand})
+                trained_w = s.run(op.dau_weights)
+
+        gt_merged = numpy_engine.merge_units(w_rand, mu1_rand, mu2_rand, 0.1, compact=False)
+
+        for val, gt_val in zip(merged, gt_merged):
+            np.testing.assert_allclose(val, gt_val, rtol=1e-6, atol=1e-7)
+
+        self.assertLessEqual(np.max(np.sum(merged[0] != 0, axis=2)), 2)
+
+        np.testing.assert_array_equal(unit_mask, (gt_merged[0] != 0).astype(np.float32))
+        np.testing.assert_array_equal(trained_w[unit_mask == 0], 0)
+        self.assertTrue(np.any(trained_w[unit_mask != 0] != merged[0][unit_mask != 0]))
+
+    def test_DAUConvPruneUnits(self):
+
+        N = 2
+        W = 32
+        H = 32
+        input_channels = 8
+        num_output = 16
+        sigma = 0.5
+        x_rand = np.random.rand(N,input_channels,H,W)
+
+        for sparsity in [0.5, 0.9]:
+            with tf.Graph().as_default(), tf.device('/cpu:0'):
+                x = tf.placeholder(tf.float32, shape = x_rand.shape)
+
+                op = DAUConv2d(filters=num_output,
+                               dau_units=(2,2),
+                               max_kernel_size=9,
+                               use_bias=False,
+                               mu1_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                               mu2_initializer=tf.random_uniform_initializer(minval=-3, maxval=3,dtype=tf.float32),
+                               sigma_initializer=tf.constant_initializer(sigma),
+                               unit_testing=True,
+                               engine='dau')
+                result = op(x)
+
+                with tf.Session() as s:
+                    s.run(tf.global_variables_initializer())
+
+                    units = op.prune_units(s, sparsity=sparsity)
+
+                    w, r = s.run([op.dau_weights, result], feed_dict = {x: x_rand})
+
+            self.assertEqual(np.sum(w != 0), len(units[0]))
+            self.assertEqual(len(units[0]), int(round((1 - sparsity) * w.size)))
+
+            r_sparse = numpy_engine.forward_sparse(x_rand, units, num_output, sigma)
+
+            np.testing.assert_allclose(r, r_sparse, rtol=1e-4, atol=1e-5)
+
     def test_DAUConvMemtest(self):
 
         N = 16
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+
+import unittest
+import time
+import numpy as np
+
+from dau_conv import numpy_engine
+
+from dau_conv_python import DAUConvPython
+
+class DAUConvNumpyEngineTest(unittest.TestCase):
+
+    def _get_random_params(self, S, G, F, max_offset=3):
+        w = np.float32(np.random.normal(0, 0.1, (1, S, G, F)))
+        mu1 = np.float32(np.random.uniform(-max_offset, max_offset, (1, S, G, F)))
+        mu2 = np.float32(np.random.uniform(-max_offset, max_offset, (1, S, G, F)))
+
+        return w, mu1, mu2
+
+    def test_forward(self):
+
+        for num_dau_units_ignore in [0, 1]:
+            N, S, F, H, W, G = 4, 8, 16, 32, 32, 4
+            sigma = 0.5
+
+            x_rand = np.random.rand(N, S, H, W)
+            w, mu1, mu2 = self._get_random_params(S, G, F)
+
+            t_start = time.time()
+            gt_fwd_vals = DAUConvPython().forward_cpu(x=x_rand, w=w, mu1=mu1, mu2=mu2, sigma=[sigma],
+                                                      num_dau_units_ignore=num_dau_units_ignore)
+            t_ref = time.time() - t_start
+
+            t_start = time.time()
+            fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, [sigma], num_dau_units_ignore=num_dau_units_ignore,
+                                            kernel_size=9)
+            t_engine = time.time() - t_start
+
+            print('reference: %f sec, numpy_engine: %f sec' % (t_ref, t_engine))
+
+            np.testing.assert_allclose(fwd_vals, gt_fwd_vals, rtol=1e-4, atol=1e-5)
+
+    def test_forward_integer_offsets(self):
+
+        N, S, F, H, W, G = 2, 4, 4, 16, 16, 2
+        sigma = 0.5
+
+        x_rand = np.random.rand(N, S, H, W)
+        w, mu1, mu2 = self._get_random_params(S, G, F)
+
+        # integer offsets have only one non-zero interpolation tap
+        mu1 = np.round(mu1)
+        mu2 = np.round(mu2)
+
+        gt_fwd_vals = DAUConvPython().forward_cpu(x=x_rand, w=w, mu1=mu1, mu2=mu2, sigma=[sigma])
+        fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9)
+
+        np.testing.assert_allclose(fwd_vals, gt_fwd_vals, rtol=1e-4, atol=1e-5)
+
+    def test_separable_blur(self):
+
+        x_rand = np.random.rand(2, 3, 16, 16)
+
+        filter, deriv_w, deriv_mu1, deriv_mu2, deriv_sigma = numpy_engine.get_filters(1.5)
+
+        for kernel in [filter, deriv_mu1, deriv_mu2]:
+            self.assertIsNotNone(numpy_engine.get_separable_factors(kernel))
+
+        # sigma derivative is not separable and must use the generic 2D path
+        self.assertIsNone(numpy_engine.get_separable_factors(deriv_sigma))
+
+        for kernel in [filter, deriv_mu1, deriv_sigma]:
+            k_h, k_w = kernel.shape
+            x_pad = np.pad(x_rand, [(0, 0), (0, 0), (k_h // 2, k_h // 2), (k_w // 2, k_w // 2)], mode='constant')
+
+            gt_vals = np.zeros(x_rand.shape)
+            for i in range(k_h):
+                for j in range(k_w):
+                    gt_vals += kernel[i, j] * x_pad[:, :, i:i + 16, j:j + 16]
+
+            np.testing.assert_allclose(numpy_engine.blur(x_rand, kernel), gt_vals, rtol=1e-5, atol=1e-8)
+
+    def test_fft_blur(self):
+
+        x_rand = np.random.rand(2, 3, 24, 17)
+
+        # kernels larger than the image are zero-padded as well
+        for sigma in [0.5, 1.5, 4]:
+            filter, _, deriv_mu1, _, deriv_sigma = numpy_engine.get_filters(sigma)
+
+            for kernel in [filter, deriv_mu1, deriv_sigma]:
+                gt_vals = numpy_engine.blur(x_rand, kernel, 'direct')
+
+                np.testing.assert_allclose(numpy_engine.blur(x_rand, kernel, 'fft'), gt_vals, rtol=1e-5, atol=1e-6)
+
+        # auto switches to FFT sooner for non-separable kernels
+        filter, _, _, _, deriv_sigma = numpy_engine.get_filters(1.5)
+
+        self.assertFalse(numpy_engine.use_fft_blur(filter, 'auto'))
+        self.assertTrue(numpy_engine.use_fft_blur(deriv_sigma, 'auto'))
+        self.assertTrue(numpy_engine.use_fft_blur(numpy_engine.get_filters(4)[0], 'auto'))
+
+        with self.assertRaises(ValueError):
+            numpy_engine.blur(x_rand, filter, 'iir')
+
+    def test_fft_blur_forward_backward(self):
+
+        N, S, F, H, W, G = 2, 4, 8, 32, 32, 4
+        sigma = 2.5
+
+        x_rand = np.random.rand(N, S, H, W)
+        error_rand = np.float32(np.random.normal(0, 1, (N, F, H, W)))
+        w, mu1, mu2 = self._get_random_params(S, G, F)
+
+        for stride in [1, 2]:
+            error = error_rand[:, :, ::stride, ::stride]
+
+            gt_fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, stride=stride, blur_method='direct')
+            fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, stride=stride, blur_method='fft')
+
+            np.testing.assert_allclose(fwd_vals, gt_fwd_vals, rtol=1e-4, atol=1e-5)
+
+            gt_bwd_vals = numpy_engine.backward(x_rand, error, w, mu1, mu2, sigma, stride=stride, blur_method='direct')
+            bwd_vals = numpy_engine.backward(x_rand, error, w, mu1, mu2, sigma, stride=stride, blur_method='fft')
+
+            for val, gt_val in zip(bwd_vals, gt_bwd_vals):
+                np.testing.assert_allclose(val, gt_val, rtol=1e-4, atol=1e-4)
+
+    def test_backward_blurred_input(self):
+
+        N, S, F, H, W, G = 2, 4, 8, 32, 32, 4
+        sigma = 0.5
+
+        x_rand = np.random.rand(N, S, H, W)
+        error = np.float32(np.random.normal(0, 1, (N, F, H, W)))
+        w, mu1, mu2 = self._get_random_params(S, G, F)
+
+        gt_fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma)
+        gt_bwd_vals = numpy_engine.backward(x_rand, error, w, mu1, mu2, sigma)
+
+        # tiling is disabled when blurred input is returned
+        fwd_vals, blurred_input = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, tile_memory_limit=1024,
+                                                       return_blurred_input=True)
+        bwd_vals = numpy_engine.backward(x_rand, error, w, mu1, mu2, sigma, blurred_input=blurred_input)
+
+        self.assertEqual(blurred_input.shape, x_rand.shape)
+
+        np.testing.assert_allclose(fwd_vals, gt_fwd_vals, rtol=1e-6, atol=1e-6)
+
+        for val, gt_val in zip(bwd_vals, gt_bwd_vals):
+            np.testing.assert_allclose(val, gt_val, rtol=1e-6, atol=1e-6)
+
+    def test_backward(self):
+
+        for num_dau_units_ignore in [0, 1]:
+            N, S, F, H, W, G = 4, 8, 16, 32, 32, 4
+            sigma = 0.5
+
+            x_rand = np.random.rand(N, S, H, W)
+            error_rand = np.float32(np.random.normal(0, 1, (N, F, H, W)))
+            w, mu1, mu2 = self._get_random_params(S, G, F)
+
+            # ignored units have zero weights (as initialized by ZeroNLast)
+            if num_dau_units_ignore > 0:
+                w[:, :, -num_dau_units_ignore:, :] = 0
+
+            t_start = time.time()
+            gt_bwd_vals = DAUConvPython().backward_cpu(x=x_rand, error=np.copy(error_rand), w=w, mu1=mu1, mu2=mu2,
+                                                       sigma=[sigma], num_dau_units_ignore=num_dau_units_ignore,
+                                                       unit_testing=True)
+            t_ref = time.time() - t_start
+
+            t_start = time.time()
+            bwd_vals = numpy_engine.backward(x_rand, error_rand, w, mu1, mu2, [sigma],
+                                             num_dau_units_ignore=num_dau_units_ignore, ignore_edge_gradients=True,
+                                             kernel_size=9)
+            t_engine = time.time() - t_start
+
+            print('reference: %f sec, numpy_engine: %f sec' % (t_ref, t_engine))
+
+            for val, gt_val in zip(bwd_vals, gt_bwd_vals):
+                self.assertEqual(val.shape, gt_val.shape)
+                np.testing.assert_allclose(val, gt_val, rtol=1e-3, atol=1e-4)
+
+    def test_strided(self):
+
+        N, S, F, H, W, G = 4, 8, 16, 33, 30, 4
+        sigma = 0.5
+
+        x_rand = np.random.rand(N, S, H, W)
+        w, mu1, mu2 = self._get_random_params(S, G, F)
+
+        full_fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9)
+
+        for stride in [2, 3]:
+            # strided output must be equal to sub-sampled output of stride=1
+            t_start = time.time()
+            numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9)[:, :, ::stride, ::stride]
+            t_subsampled = time.time() - t_start
+
+            t_start = time.time()
+            fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9, stride=stride)
+            t_strided = time.time() - t_start
+
+            print('stride=%d: compute-then-subsample: %f sec, strided: %f sec' % (stride, t_subsampled, t_strided))
+
+            np.testing.assert_allclose(fwd_vals, full_fwd_vals[:, :, ::stride, ::stride], rtol=1e-5, atol=1e-6)
+
+            # gradients must be equal to gradients of stride=1 with zeros at skipped output pixels
+            error_rand = np.float32(np.random.normal(0, 1, fwd_vals.shape))
+
+            error_full = np.zeros(full_fwd_vals.shape, dtype=np.float32)
+            error_full[:, :, ::stride, ::stride] = error_rand
+
+            gt_bwd_vals = numpy_engine.backward(x_rand, error_full, w, mu1, mu2, sigma, ignore_edge_gradients=False,
+                                                kernel_size=9)
+            bwd_vals = numpy_engine.backward(x_rand, error_rand, w, mu1, mu2, sigma, ignore_edge_gradients=False,
+                                             kernel_size=9, stride=stride)
+
+            for val, gt_val in zip(bwd_vals, gt_bwd_vals):
+                self.assertEqual(val.shape, gt_val.shape)
+                np.testing.assert_allclose(val, gt_val, rtol=1e-4, atol=1e-5)
+
+    def test_large_offsets(self):
+
+        N, S, F, H, W, G = 2, 4, 4, 40, 40, 4
+        sigma = 0.5
+
+        x_rand = np.random.rand(N, S, H, W)
+
+        # offsets of 33x33 and 65x65 kernels (CUDA kernels support only up to 17x17)
+        for max_kernel_size in [33, 65]:
+            w, mu1, mu2 = self._get_random_params(S, G, F, max_offset=max_kernel_size // 2 - 1)
+            error_rand = np.float32(np.random.normal(0, 1, (N, F, H, W)))
+
+            gt_fwd_vals = DAUConvPython().forward_cpu(x=x_rand, w=w, mu1=mu1, mu2=mu2, sigma=[sigma])
+            fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9)
+
+            np.testing.assert_allclose(fwd_vals, gt_fwd_vals, rtol=1e-4, atol=1e-5)
+
+            gt_bwd_vals = DAUConvPython().backward_cpu(x=x_rand, error=np.copy(error_rand), w=w, mu1=mu1, mu2=mu2,
+                                                       sigma=[sigma], unit_testing=True)
+            bwd_vals = numpy_engine.backward(x_rand, error_rand, w, mu1, mu2, sigma, ignore_edge_gradients=True,
+                                             kernel_size=9)
+
+            for val, gt_val in zip(bwd_vals, gt_bwd_vals):
+                self.assertEqual(val.shape, gt_val.shape)
+                np.testing.assert_allclose(val, gt_val, rtol=1e-3, atol=1e-4)
+
+    def test_forward_tiled(self):
+
+        N, S, F, H, W, G = 3, 4, 8, 45, 23, 4
+        sigma = 0.8
+
+        x_rand = np.random.rand(N, S, H, W)
+        w, mu1, mu2 = self._get_random_params(S, G, F, max_offset=6)
+
+        blurred_bytes = x_rand.size * x_rand.itemsize
+
+        for stride in [1, 2, 3]:
+            gt_fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=17, stride=stride)
+
+            # tiles of several images, of single images and of strips of rows (down to a single row per strip)
+            for tile_memory_limit in [blurred_bytes // 2, blurred_bytes // N, blurred_bytes // (3 * N), 1]:
+                fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=17, stride=stride,
+                                                tile_memory_limit=tile_memory_limit)
+
+                np.testing.assert_array_equal(fwd_vals, gt_fwd_vals)
+
+    def test_dense_kernel(self):
+
+        N, S, F, H, W = 4, 8, 16, 32, 32
+        sigma = 0.5
+
+        x_rand = np.random.rand(N, S, H, W)
+
+        for G in [1, 3, 4]:
+            w, mu1, mu2 = self._get_random_params(S, G, F)
+
+            dense_kernel = numpy_engine.get_dense_kernel(w, mu1, mu2, sigma, kernel_size=9)
+
+            # shifts of both bilinear interpolation taps
+            max_shift = int(max(np.max(np.abs(np.floor([mu1, mu2]))), np.max(np.abs(np.floor([mu1, mu2]) + 1))))
+            K = 2 * (4 + max_shift) + 1
+            self.assertEqual(dense_kernel.shape, (F, S, K, K))
+
+            # dense convolution as sum of [F x S] matrix products over all positions of the kernel
+            y, x = np.meshgrid(np.arange(K) - K // 2, np.arange(K) - K // 2, indexing='ij')
+            dense_shifts = np.stack([y.ravel(), x.ravel()], axis=1)
+            dense_coeffs = np.transpose(dense_kernel.reshape(F, S, K * K), (2, 1, 0))
+
+            dense_vals = numpy_engine.shift_and_sum(x_rand, dense_shifts, dense_coeffs)
+
+            fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9)
+
+            # output is the same except for border where dense kernel blurs zero padding into the input
+            self.assertEqual(dense_vals.shape, fwd_vals.shape)
+            np.testing.assert_allclose(dense_vals[:, :, max_shift:-max_shift, max_shift:-max_shift],
+                                       fwd_vals[:, :, max_shift:-max_shift, max_shift:-max_shift], rtol=1e-4, atol=1e-5)
+
+    def test_fold_batch_norm(self):
+
+        N, S, G, F, H, W = 2, 4, 4, 8, 16, 16
+        sigma = 0.5
+        epsilon = 1e-3
+
+        x_rand = np.random.rand(N, S, H, W)
+        w, mu1, mu2 = self._get_random_params(S, G, F)
+
+        mean = np.random.normal(0, 0.1, F)
+        variance = np.random.uniform(0.5, 2, F)
+        scale = np.random.normal(1, 0.5, F)
+        offset = np.random.normal(0, 0.1, F)
+
+        for bias in [None, np.random.normal(0, 0.1, F)]:
+            y = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9)
+            if bias is not None:
+                y = y + bias.reshape(1, -1, 1, 1)
+            bn_vals = (scale.reshape(1, -1, 1, 1) * (y - mean.reshape(1, -1, 1, 1)) /
+                       np.sqrt(variance.reshape(1, -1, 1, 1) + epsilon) + offset.reshape(1, -1, 1, 1))
+
+            folded_w, folded_bias = numpy_engine.fold_batch_norm(w, bias, mean, variance, scale, offset, epsilon)
+
+            self.assertEqual(folded_w.shape, w.shape)
+            self.assertEqual(folded_bias.shape, (F,))
+
+            folded_vals = numpy_engine.forward(x_rand, folded_w, mu1, mu2, sigma, kernel_size=9) + \
+                          folded_bias.reshape(1, -1, 1, 1)
+
+            np.testing.assert_allclose(folded_vals, bn_vals, rtol=1e-4, atol=1e-5)
+
+    def test_merge_units(self):
+
+        N, S, G, F, H, W = 2, 4, 6, 8, 16, 16
+        sigma = 0.5
+
+        x_rand = np.random.rand(N, S, H, W)
+        w, mu1, mu2 = self._get_random_params(S, G, F)
+
+        # last three units of each (s, f) nearly duplicate the first three
+        mu1[:, :, 3:] = mu1[:, :, :3] + np.random.uniform(-0.02, 0.02, (1, S, 3, F))
+        mu2[:, :, 3:] = mu2[:, :, :3] + np.random.uniform(-0.02, 0.02, (1, S, 3, F))
+        w[:, :, 3:] = np.abs(w[:, :, 3:]) * np.sign(w[:, :, :3])
+
+        fwd_vals = numpy_engine.forward(x_rand, w, mu1, mu2, sigma, kernel_size=9)
+
+        merged = numpy_engine.merge_units(w, mu1, mu2, 0.1)
+        self.assertLessEqual(merged[0].shape[2], 3)
+        np.testing.assert_allclose(numpy_engine.forward(x_rand, *merged, sigma=sigma, kernel_size=9), fwd_vals,
+                                   rtol=1e-3, atol=1e-3)
+
+        # shape is kept and merged units are zeroed in place
+        merged_w, merged_mu1, merged_mu2 = numpy_engine.merge_units(w, mu1, mu2, 0.1, compact=False)
+        self.assertEqual(merged_w.shape, w.shape)
+        self.assertLessEqual(np.max(np.sum(merged_w != 0, axis=2)), 3)
+        np.testing.assert_allclose(numpy_engine.forward(x_rand, merged_w, merged_mu1, merged_mu2, sigma, kernel_size=9),
+                                   fwd_vals, rtol=1e-3, atol=1e-3)
+
+        # nothing is merged with zero threshold
+        for compact in [True, False]:
+            merged = numpy_engine.merge_units(w, mu1, mu2, 0, compact=compact)
+            self.assertEqual(merged[0].shape, w.shape)
+            np.testing.assert_allclose(numpy_engine.forward(x_rand, *merged, sigma=sigma, kernel_size=9), fwd_vals,
+                                       rtol=1e-5, atol=1e-6)
+
+        # nearby units of opposite signs are not merged (first three units are kept apart)
+        mu1[:, :, :3] = np.reshape([-2, 0, 2], (1, 1, 3, 1))
+        mu1[:, :, 3:] = mu1[:, :, :3] + 0.01
+        w[:, :, 3:] = -w[:, :, 3:]
+        merged = numpy_engine.merge_units(w, mu1, mu2, 0.1, compact=False)
+        for val, gt_val in zip(merged, [w, mu1, mu2]):
+            np.testing.assert_allclose(val, gt_val, rtol=1e-6)
+
+    def test_prune_units(self):
+
+        N, S, G, F, H, W = 2, 8, 4, 16, 16, 16
+        sigma = 0.5
+
+        x_rand = np.random.rand(N, S, H, W)
+        w, mu1, mu2 = self._get_random_params(S, G, F)
+
+        mask = numpy_engine.get_pruning_mask(w, threshold=0.1)
+        np.testing.assert_array_equal(mask, np.abs(w) > 0.1)
+
+        for sparsity in [0, 0.5, 0.9, 1]:
+            mask = numpy_engine.get_pruning_mask(w, sparsity=sparsity)
+            self.assertEqual(np.sum(mask), int(round((1 - sparsity) * w.size)))
+            self.assertGreaterEqual(np.min(np.abs(w[mask]), initial=np.inf), np.max(np.abs(w[~mask]), initial=0))
+
+            s, f, unit_mu1, unit_mu2, unit_w = numpy_engine.prune_units(w, mu1, mu2, sparsity=sparsity)
+            self.assertEqual(len(s), np.sum(mask))
+            np.testing.assert_array_equal(np.sort(unit_w), np.sort(w[mask]))
+
+            for stride in [1, 2]:
+                fwd_vals = numpy_engine.forward(x_rand, w * mask, mu1, mu2, sigma, kernel_size=9, stride=stride)
+                sparse_vals = numpy_engine.forward_sparse(x_rand, (s, f, unit_mu1, unit_mu2, unit_w), F, sigma,
+                                                          kernel_size=9, stride=stride)
+
+                self.assertEqual(sparse_vals.shape, fwd_vals.shape)
+                np.testing.assert_allclose(sparse_vals, fwd_vals, rtol=1e-4, atol=1e-5)
+
+        with self.assertRaises(ValueError):
+            numpy_engine.get_pruning_mask(w)
+        with self.assertRaises(ValueError):
+            numpy_engine.get_pruning_mask(w, threshold=0.1, sparsity=0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,15 @@
 #include <vector>
 #include <numeric>
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
 #include "dau_conv/util/math_functions.hpp"
 #include "dau_conv/util/im2col.hpp"
+#include "dau_conv/util/separable_conv.hpp"
+#include "dau_conv/util/fft_conv.hpp"
+#include "dau_conv/util/kernel_cache.hpp"
 
 #include "dau_conv/dau_conv_impl/dau_conv_forward.hpp"
 #include "dau_conv/dau_conv_impl/dau_conv_backward.hpp"
@@ -21,6 +28,9 @@ void BaseDAUConvLayer<Dtype>::compute_output_shape() {
                         / this->stride_h_ + 1;
     this->width_out_ = (this->width_ + 2 * this->pad_w_ - this->kernel_w_)
                        / this->stride_w_ + 1;
+
+    this->height_out_full_ = this->height_ + 2 * this->pad_h_ - this->kernel_h_ + 1;
+    this->width_out_full_ = this->width_ + 2 * this->pad_w_ - this->kernel_w_ + 1;
 }
 
 
@@ -43,7 +53,8 @@ void BaseDAUConvLayer<Dtype>::LayerSetUp(const DAUConvSettings& settings,
     this->num_units_ignore = 0;
 
     // make sure we have at least ALLOWED_UNITS_GROUP (this is requested so for fast version that can handle only factor of 2)
-    if (this->units_per_channel % ALLOWED_UNITS_GROUP != 0) {
+    // (CPU version handles any number of units so units are added only for GPU)
+    if (this->is_data_on_gpu() && this->units_per_channel % ALLOWED_UNITS_GROUP != 0) {
         int new_num_gauss = ceil(this->units_per_channel / (float)ALLOWED_UNITS_GROUP) * ALLOWED_UNITS_GROUP;
         this->num_units_ignore = new_num_gauss - units_per_channel;
 
@@ -65,14 +76,21 @@ void BaseDAUConvLayer<Dtype>::LayerSetUp(const DAUConvSettings& settings,
     M_Assert(this->kernel_h_ > 0, "Filter dimensions cannot be zero.");
     M_Assert(this->kernel_w_ > 0, "Filter dimensions cannot be zero.");
 
-    M_Assert(this->stride_h_ == 1, "BaseDAUConvLayer does not support stride>1 parameter at the moment");
-    M_Assert(this->stride_w_ == 1, "BaseDAUConvLayer does not support stride>1 parameter at the moment");
+    M_Assert(this->stride_h_ > 0 && this->stride_w_ > 0, "Stride dimensions must be positive.");
+    M_Assert((this->stride_h_ == 1 && this->stride_w_ == 1) || this->is_data_on_gpu() == false,
+             "BaseDAUConvLayer supports stride>1 only on CPU");
+
+    M_Assert((this->kernel_h_ <= MAX_GPU_KERNEL_SIZE && this->kernel_w_ <= MAX_GPU_KERNEL_SIZE) || this->is_data_on_gpu() == false,
+             "BaseDAUConvLayer supports kernel size larger than MAX_GPU_KERNEL_SIZE only on CPU");
+
+    // NCHW format has channel axis indexed as 1 and NHWC as 3 (NHWC is supported only on CPU)
+    this->channels_last_ = settings.channels_last;
+    this->channel_axis_ = this->channels_last_ ? 3 : 1;
+
+    M_Assert(this->channels_last_ == false || this->is_data_on_gpu() == false, "BaseDAUConvLayer supports NHWC format only on CPU");
 
-    // curently we support only NCHW format !! so channel axis is indexed as 1
-    this->channel_axis_ = 1;
-    const int first_spatial_axis = this->channel_axis_ + 1;
     const int num_axes = bottom_shape.size();
-    this->num_spatial_axes_ = num_axes - first_spatial_axis;
+    this->num_spatial_axes_ = num_axes - 2;
     M_Assert(this->num_spatial_axes_ >= 0, "Only positive num_spatial_axes allowed");
 
     // Configure output channels and groups.
@@ -102,14 +120,6 @@ void BaseDAUConvLayer<Dtype>::LayerSetUp(const DAUConvSettings& settings,
     this->mean_iteration_step = settings.mean_iteration_step;
     this->sigma_iteration_step = settings.sigma_iteration_step;
 
-    // make sure component merging is done only at training step
-    if (in_train)
-        this->unit_merge_iteration_step = settings.merge_iteration_step;
-    else
-        this->unit_merge_iteration_step = 0;
-
-    this->unit_merge_threshold = settings.merge_threshold;
-
     this->current_iteration_index = 0;
 
     this->kernel_compute = kernel_compute;
@@ -125,8 +135,12 @@ void BaseDAUConvLayer<Dtype>::LayerSetUp(const DAUConvSettings& settings,
     this->top_dim_ = 0;
     this->batch_num_ = 0;
 
-    // Initialize CUDA streams
-    stream_         = new cudaStream_t[1];
+    // Initialize CUDA streams (only when processing on GPU so that CPU version can run on hosts without GPU)
+    stream_ = NULL;
+    paralel_streams = NULL;
+
+    if (this->is_data_on_gpu())
+        stream_ = new cudaStream_t[1];
 
     // workspace data
     workspaceSizeInBytes = 0;
@@ -141,8 +155,8 @@ void BaseDAUConvLayer<Dtype>::LayerSetUp(const DAUConvSettings& settings,
     M_Assert(sigma > 0, "Must use sigma > 0 - initialize it with appropriate value");
 
     // define pre-filtering kernel size based on 5*sigma - NOTE: currently this is fixed and cannot be changed if sigma increases !!
-    aggregation.kernel_h_ = 2 * (int)ceil(5 * sigma) + 1;
-    aggregation.kernel_w_ = 2 * (int)ceil(5 * sigma) + 1;
+    aggregation.kernel_h_ = get_prefiltering_kernel_size(sigma);
+    aggregation.kernel_w_ = get_prefiltering_kernel_size(sigma);
 
     M_Assert(aggregation.kernel_h_ > 1, "Sigma too small; must have gaussian kernel size > 1 - increase sigma value");
     M_Assert(aggregation.kernel_w_ > 1, "Sigma too small; must have gaussian kernel size > 1 - increase sigma value");
@@ -165,19 +179,27 @@ void BaseDAUConvLayer<Dtype>::LayerSetUp(const DAUConvSettings& settings,
 
     // by default we generate kernels with w=1, mu=(0,0) so fill buffers with them
     // NOTE: mu=(0,0) is center of kernel so use that value
-    caffe_gpu_set(1, (Dtype)1.0f, aggregation.param->weight());
-    caffe_gpu_set(1, (Dtype)(this->offsets_already_centered_ == false ? (int)(aggregation.kernel_w_/2) : 0), aggregation.param->mu1());
-    caffe_gpu_set(1, (Dtype)(this->offsets_already_centered_ == false ? (int)(aggregation.kernel_h_/2) : 0), aggregation.param->mu2());
+    if (this->is_data_on_gpu()) {
+        caffe_gpu_set(1, (Dtype)1.0f, aggregation.param->weight());
+        caffe_gpu_set(1, (Dtype)(this->offsets_already_centered_ == false ? (int)(aggregation.kernel_w_/2) : 0), aggregation.param->mu1());
+        caffe_gpu_set(1, (Dtype)(this->offsets_already_centered_ == false ? (int)(aggregation.kernel_h_/2) : 0), aggregation.param->mu2());
+    } else {
+        caffe_set(1, (Dtype)1.0f, aggregation.param->weight());
+        caffe_set(1, (Dtype)(this->offsets_already_centered_ == false ? (int)(aggregation.kernel_w_/2) : 0), aggregation.param->mu1());
+        caffe_set(1, (Dtype)(this->offsets_already_centered_ == false ? (int)(aggregation.kernel_h_/2) : 0), aggregation.param->mu2());
+    }
 
     this->use_interpolation_ = true;
 
-    paralel_streams = new cudaStream_t[4];
-    for (int g = 0; g < 4; ++g) {
-        CUDA_CHECK(cudaStreamCreate(&paralel_streams[g]));
-    }
+    if (this->is_data_on_gpu()) {
+        paralel_streams = new cudaStream_t[4];
+        for (int g = 0; g < 4; ++g) {
+            CUDA_CHECK(cudaStreamCreate(&paralel_streams[g]));
+        }
 
-    for (int g = 0; g < 1 ; g++) {
-        CUDA_CHECK(cudaStreamCreate(&stream_[g]));
+        for (int g = 0; g < 1 ; g++) {
+            CUDA_CHECK(cudaStreamCreate(&stream_[g]));
+        }
     }
 
 
@@ -190,13 +212,13 @@ void BaseDAUConvLayer<Dtype>::LayerSetUp(const DAUConvSettings& settings,
 template <typename Dtype>
 vector<int> BaseDAUConvLayer<Dtype>::Reshape(const vector<int>& bottom_shape, const vector<int>& top_shape) {
 
-    const int batch_axis = this->channel_axis_ - 1;
-    const int height_axis = this->channel_axis_ + 1;
-    const int width_axis = this->channel_axis_ + 2;
+    const int batch_axis = 0;
+    const int height_axis = this->channels_last_ ? 1 : 2;
+    const int width_axis = this->channels_last_ ? 2 : 3;
 
     int top_count = top_shape.empty() == false ? std::accumulate(top_shape.begin(), top_shape.end(), 1, std::multiplies<int>()) : 0;
-    int top_dim = top_shape.empty() == false ? std::accumulate(top_shape.begin() + this->channel_axis_, top_shape.end(), 1, std::multiplies<int>()) : 0;
-    int bottom_dim = bottom_shape.empty() == false ? std::accumulate(bottom_shape.begin() + this->channel_axis_, bottom_shape.end(), 1, std::multiplies<int>()) : 0;
+    int top_dim = top_shape.empty() == false ? std::accumulate(top_shape.begin() + 1, top_shape.end(), 1, std::multiplies<int>()) : 0;
+    int bottom_dim = bottom_shape.empty() == false ? std::accumulate(bottom_shape.begin() + 1, bottom_shape.end(), 1, std::multiplies<int>()) : 0;
 
     if (this->bottom_dim_ == bottom_dim && top_count > 0 && this->top_dim_ == top_dim &&
         this->batch_num_ == bottom_shape[batch_axis] &&
@@ -204,7 +226,6 @@ vector<int> BaseDAUConvLayer<Dtype>::Reshape(const vector<int>& bottom_shape, co
         this->width_ == bottom_shape[width_axis] ) {
         return top_shape;
     }
-    const int first_spatial_axis = this->channel_axis_ + 1;
 
     M_Assert(bottom_shape.size() == 4, "Input must have 4 axes, corresponding to (num, channels, height, width)");
     this->batch_num_ = bottom_shape[batch_axis];
@@ -215,12 +236,14 @@ vector<int> BaseDAUConvLayer<Dtype>::Reshape(const vector<int>& bottom_shape, co
     // Shape the tops.
     this->compute_output_shape();
 
-    vector<int> new_top_shape = {this->batch_num_, this->conv_out_channels_, this->height_out_, this->width_out_ };
+    vector<int> new_top_shape = this->channels_last_ ?
+                                (vector<int>){this->batch_num_, this->height_out_, this->width_out_, this->conv_out_channels_ } :
+                                (vector<int>){this->batch_num_, this->conv_out_channels_, this->height_out_, this->width_out_ };
 
 
-    this->out_spatial_dim_ = std::accumulate(new_top_shape.begin() + first_spatial_axis, new_top_shape.end(), 1, std::multiplies<int>());
-    this->bottom_dim_ = std::accumulate(bottom_shape.begin() + this->channel_axis_, bottom_shape.end(), 1, std::multiplies<int>());
-    this->top_dim_ = std::accumulate(new_top_shape.begin() + this->channel_axis_, new_top_shape.end(), 1, std::multiplies<int>());
+    this->out_spatial_dim_ = this->height_out_ * this->width_out_;
+    this->bottom_dim_ = std::accumulate(bottom_shape.begin() + 1, bottom_shape.end(), 1, std::multiplies<int>());
+    this->top_dim_ = std::accumulate(new_top_shape.begin() + 1, new_top_shape.end(), 1, std::multiplies<int>());
 
 
     M_Assert(this->num_spatial_axes_ == 2, "BaseDAUConvLayer input must have 2 spatial axes (e.g., height and width). ");
@@ -235,7 +258,10 @@ vector<int> BaseDAUConvLayer<Dtype>::Reshape(const vector<int>& bottom_shape, co
     // prepare output buffer used in kernel pre-computing
     this->aggregation.kernels->reshape(1, 1, 1, this->aggregation.kernel_h_, this->aggregation.kernel_w_);
 
-    if (enabled_fwd_op) {
+    // workspace for custom CUDA kernels is not needed when processing on CPU
+    const bool use_gpu_workspace = this->is_data_on_gpu();
+
+    if (enabled_fwd_op && use_gpu_workspace) {
         forward_obj.reset(
                 new DAUConvNet::DAUConvForward<Dtype>(this->width_, this->height_, this->width_out_, this->height_out_,
                                                       this->batch_num_, this->conv_in_channels_,
@@ -251,7 +277,7 @@ vector<int> BaseDAUConvLayer<Dtype>::Reshape(const vector<int>& bottom_shape, co
         buffer_fwd_.filter_offsets_sizes_ = 0;
     }
 
-    if (enabled_bwd_op) {
+    if (enabled_bwd_op && use_gpu_workspace) {
         // check how much memory do we need for our custom kernels
         backward_grad_obj.reset(
                 new DAUConvNet::DAUConvBackward<Dtype>(this->width_, this->height_, this->width_out_, this->height_out_,
@@ -342,6 +368,10 @@ vector<int> BaseDAUConvLayer<Dtype>::Reshape(const vector<int>& bottom_shape, co
         }
         workspaceSizeInBytes = total_max_workspace;
 
+        // only CPU processing is profiled (see DAUConvProfiler)
+        DAUConvPhaseTimer phase_timer(this->profile_name_, this->is_data_on_gpu() == false);
+        phase_timer.start(DAU_PHASE_WORKSPACE_SETUP, workspaceSizeInBytes);
+
         // allocate workspace data but we do not own it so do not store original pointer and do not do any cleanups
         void* workspaceData = this->allocate_workspace_mem(workspaceSizeInBytes);
 
@@ -350,48 +380,209 @@ vector<int> BaseDAUConvLayer<Dtype>::Reshape(const vector<int>& bottom_shape, co
         }
 
         // NOTE: buffer_ is not ready for multiple groups so modify this if you want to have multiple groups
-        // we reuse the buffer allocated for convolution, however that buffer will bi small
-        // TODO:
-        //    - we need to implement a mechanizem to share workspace buffer between layers
-        //    - this would work for layer that are executed in sequence but will fail for parallel layers
-        //    - also make sure to count on multi-GPU implementations so do explicitly use only static buffers !!!
-
-        // We should implement memory as:
-        // - for each GPU-device we use seperate class for handling memory
-        // - we use static array within this class to store memory storage classes and save them with GPU-id
-        // - we can get GPU-id of current active device since that is setup for us by dau_conv_impl
-        // - memory storage class needs to take care of:
-        //   - allocating memory when requested
-        //   - ensuring the same memory is used across all alocations
-        //   - if more memory is requested then currently allocated then we need to allocat new memory
-        //   - in case of allocating additional memory we NEED to ensure that existing instances with pointers to that memory are updated
-        //     (this should be done by wraping allocated pointer around new class, possibly std:shared_ptr and using that one instead of raw pointers)
-        // - we need to ensure to deallocate memory when all not used any more
-        //   - when each BaseDAUConvLayer is destroyed it should indicate to memory manegement class to destroy its memory
-        //   - memory manegment should keep an index if valid pointer that are still using it and it should deallocate CUDA memory when there are no more valid pointers!!
-
-
-
-        // TODO: make all memory align to 4x 32bit values
-        if (enabled_fwd_op || enabled_bwd_op) {
-            // buffer_fwd_ is used for backward pass (for backproped error) so allocate for enabled_bwd_op==True
-            buffer_fwd_.filtered_images = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData));
-            buffer_fwd_.filter_offsets_and_weights = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_fwd_.filtered_images_sizes_);
-            buffer_fwd_.filter_weights = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_fwd_.filtered_images_sizes_);
-            buffer_fwd_.filter_offsets = reinterpret_cast<int*>(reinterpret_cast<char *>(workspaceData) + buffer_fwd_.filtered_images_sizes_ + buffer_fwd_.filter_weights_sizes_);
+        // (sharing of workspace memory between layers is left to the child class that owns the memory, it can
+        //  call set_workspace_mem() when workspace memory is moved)
+        this->set_workspace_mem(workspaceData);
+    }
+
+    return new_top_shape;
+}
+
+template <typename Dtype>
+void BaseDAUConvLayer<Dtype>::set_workspace_mem(void* workspaceData) {
+
+    // TODO: make all memory align to 4x 32bit values
+    if (enabled_fwd_op || enabled_bwd_op) {
+        // buffer_fwd_ is used for backward pass (for backproped error) so allocate for enabled_bwd_op==True
+        buffer_fwd_.filtered_images = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData));
+        buffer_fwd_.filter_offsets_and_weights = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_fwd_.filtered_images_sizes_);
+        buffer_fwd_.filter_weights = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_fwd_.filtered_images_sizes_);
+        buffer_fwd_.filter_offsets = reinterpret_cast<int*>(reinterpret_cast<char *>(workspaceData) + buffer_fwd_.filtered_images_sizes_ + buffer_fwd_.filter_weights_sizes_);
+    }
+    if (enabled_bwd_op) {
+        buffer_bwd_.filtered_images = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData));
+        buffer_bwd_.error_images = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_bwd_.filtered_images_sizes_);
+        buffer_bwd_.filter_weights = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_bwd_.filtered_images_sizes_ + buffer_bwd_.error_image_sizes_);
+        buffer_bwd_.filter_offsets = reinterpret_cast<int*>(reinterpret_cast<char *>(workspaceData) + buffer_bwd_.filtered_images_sizes_ + buffer_bwd_.error_image_sizes_ + buffer_bwd_.filter_weights_sizes_);
+
+        // we can reuse workspace data since it will not be used at the same time
+        buffer_bwd_.resized_top_for_bwd = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData));
+    }
+}
+
+#define OFFSET(l,k,j,i, num_l, num_k, num_j, num_i) ((( (l)*(num_k) + (k)) * (num_j) + (j))*(num_i) + (i) )
+
+template <typename Dtype>
+void BaseDAUKernelCompute<Dtype>::get_kernels_cpu(BaseDAUKernelParams<Dtype>& input, BaseDAUKernelOutput<Dtype>& output) {
+
+    // CPU version of get_kernels() (see base_dau_conv_layer.cu for details) that produces the same kernels, but
+    // does not modify input parameters when clipping them
+
+    Dtype* weight = output.weight();
+
+    const Dtype* gauss_params_w = input.weight();
+    const Dtype* gauss_params_mu1 = input.mu1();
+    const Dtype* gauss_params_mu2 = input.mu2();
+    const Dtype* gauss_params_sigma = input.sigma();
+
+    const int S = this->num_in_channels;
+    const int F = this->num_out_channels;
+    const int G = this->num_gauss;
+
+    const int K_w = this->kernel_w;
+    const int K_h = this->kernel_h;
+
+    const int K = K_w * K_h;
+
+    Dtype mu1_lower_limit = this->offsets_already_centered  == false ? (Dtype)component_border_bound : (-1* (int)(kernel_w/2) + component_border_bound);
+    Dtype mu2_lower_limit = this->offsets_already_centered  == false ? (Dtype)component_border_bound : (-1* (int)(kernel_h/2) + component_border_bound);
+
+    Dtype mu1_upper_limit = this->offsets_already_centered  == false ? kernel_w-1 - (Dtype)component_border_bound : ((int)(kernel_w/2) - component_border_bound);
+    Dtype mu2_upper_limit = this->offsets_already_centered  == false ? kernel_h-1 - (Dtype)component_border_bound : ((int)(kernel_h/2) - component_border_bound);
+
+    size_t d_param_size = S * G* F* K_h * K_w;
+
+    Dtype* deriv_weight = output.d_params() + 0 * d_param_size;
+    Dtype* deriv_mu1 = output.d_params() + 1 * d_param_size;
+    Dtype* deriv_mu2 = output.d_params() + 2 * d_param_size;
+    Dtype* deriv_sigma = output.d_params() + 3 * d_param_size;
+
+    vector<Dtype> gauss_dist(K);
+
+    caffe_set(F * S * K, (Dtype)0, weight);
+
+    for (int s = 0; s < S; ++s) {
+        for (int g = 0; g < G; ++g) {
+            for (int f = 0; f < F; ++f) {
+                const int n = OFFSET(0, s, g, f, 1, S, G, F);
+
+                // 0. clip sigma, mu1 and mu2 to within bounds and precompute sigma^2, sigma^3 and (sigma^2)/2
+                const Dtype sigma = std::max(gauss_params_sigma[n], this->sigma_lower_bound);
+                const Dtype mu1 = std::min(std::max(gauss_params_mu1[n], mu1_lower_limit), mu1_upper_limit) + (this->offsets_already_centered ? (int)(K_w/2) : 0);
+                const Dtype mu2 = std::min(std::max(gauss_params_mu2[n], mu2_lower_limit), mu2_upper_limit) + (this->offsets_already_centered ? (int)(K_h/2) : 0);
+
+                const Dtype sigma_square_inv = 1 / (sigma * sigma);
+                const Dtype sigma_cube_inv = 1 / (sigma * sigma * sigma);
+                const Dtype sigma_square_inv_half = 0.5 * sigma_square_inv;
+
+                Dtype* d_weight = deriv_weight + n * K;
+                Dtype* d_mu1 = deriv_mu1 + n * K;
+                Dtype* d_mu2 = deriv_mu2 + n * K;
+                Dtype* d_sigma = deriv_sigma + n * K;
+
+                // 1. compute G (Gauss distribution), dG/dx, dG/dy, dG/dsigma and 2. sums needed for normalization
+                Dtype gauss_sum = 0, gauss_square_sum = 0;
+                Dtype deriv_mu1_sum = 0, deriv_mu2_sum = 0, deriv_sigma_sum = 0;
+
+                for (int y = 0; y < K_h; ++y) {
+                    for (int x = 0; x < K_w; ++x) {
+                        const Dtype dist_x = x - mu1;
+                        const Dtype dist_y = y - mu2;
+                        const Dtype dist = dist_x * dist_x + dist_y * dist_y;
+                        const Dtype gauss_value = exp(-dist * sigma_square_inv_half);
+
+                        const int i = y * K_w + x;
+
+                        gauss_dist[i] = gauss_value;
+                        d_mu1[i] = (dist_x * sigma_square_inv) * gauss_value;
+                        d_mu2[i] = (dist_y * sigma_square_inv) * gauss_value;
+                        d_sigma[i] = (dist * sigma_cube_inv) * gauss_value;
+
+                        // when using square gauss normalization derivatives need to be multiplied by gauss_dist
+                        const Dtype sum_factor = this->use_square_unit_normalization ? gauss_value : 1;
+
+                        gauss_sum += gauss_value;
+                        gauss_square_sum += gauss_value * gauss_value;
+                        deriv_mu1_sum += d_mu1[i] * sum_factor;
+                        deriv_mu2_sum += d_mu2[i] * sum_factor;
+                        deriv_sigma_sum += d_sigma[i] * sum_factor;
+                    }
+                }
+
+                Dtype guass_norm = 1;
+
+                if (this->use_unit_normalization == false) {
+                    // if there is no normalization then there should be no derivative of normalization
+                    deriv_mu1_sum = deriv_mu2_sum = deriv_sigma_sum = 0;
+                } else if (this->use_square_unit_normalization) {
+                    deriv_mu1_sum *= 2;
+                    deriv_mu2_sum *= 2;
+                    deriv_sigma_sum *= 2;
+                    guass_norm = 1 / gauss_square_sum;
+                } else {
+                    guass_norm = 1 / gauss_sum;
+                }
+
+                deriv_mu1_sum = std::fabs(deriv_mu1_sum) > 1e-10 ? deriv_mu1_sum : 0;
+                deriv_mu2_sum = std::fabs(deriv_mu2_sum) > 1e-10 ? deriv_mu2_sum : 0;
+
+                // 3. apply normalization terms to G and derivative filters dG/dx, dG/dy, dG/dsigma
+                const Dtype guass_norm_w = gauss_params_w[n] * guass_norm;
+
+                deriv_mu1_sum *= guass_norm_w;
+                deriv_mu2_sum *= guass_norm_w;
+                deriv_sigma_sum *= guass_norm_w;
+
+                for (int i = 0; i < K; ++i) {
+                    d_weight[i] = guass_norm * gauss_dist[i];
+
+                    d_mu1[i] = -deriv_mu1_sum * d_weight[i] + guass_norm_w * d_mu1[i];
+                    d_mu2[i] = -deriv_mu2_sum * d_weight[i] + guass_norm_w * d_mu2[i];
+                    d_sigma[i] = -deriv_sigma_sum * d_weight[i] + guass_norm_w * d_sigma[i];
+                }
+
+                // 4. calculate main kernel weights by summing over G into [F x S] kernels
+                Dtype* weight_fs = weight + OFFSET(0, f, s, 0, 1, F, S, K);
+                for (int i = 0; i < K; ++i) {
+                    weight_fs[i] += guass_norm_w * gauss_dist[i];
+                }
+            }
         }
-        if (enabled_bwd_op) {
-            buffer_bwd_.filtered_images = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData));
-            buffer_bwd_.error_images = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_bwd_.filtered_images_sizes_);
-            buffer_bwd_.filter_weights = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData) + buffer_bwd_.filtered_images_sizes_ + buffer_bwd_.error_image_sizes_);
-            buffer_bwd_.filter_offsets = reinterpret_cast<int*>(reinterpret_cast<char *>(workspaceData) + buffer_bwd_.filtered_images_sizes_ + buffer_bwd_.error_image_sizes_ + buffer_bwd_.filter_weights_sizes_);
-
-            // we can reuse workspace data since it will not be used at the same time
-            buffer_bwd_.resized_top_for_bwd = reinterpret_cast<Dtype*>(reinterpret_cast<char *>(workspaceData));
+    }
+
+    // 5. create error kernel for back-propagation by reversing the kernel (and switching S and F)
+    Dtype* deriv_error = output.d_error();
+
+    for (int f = 0; f < F; ++f) {
+        for (int s = 0; s < S; ++s) {
+            for (int i = 0; i < K; ++i) {
+                deriv_error[OFFSET(0, s, f, i, 1, S, F, K)] = weight[OFFSET(0, f, s, K - i - 1, 1, F, S, K)];
+            }
         }
     }
+}
 
-    return new_top_shape;
+template <typename Dtype>
+int BaseDAUConvLayer<Dtype>::get_num_cpu_threads() const {
+#ifdef _OPENMP
+    return this->num_cpu_threads_ > 0 ? this->num_cpu_threads_ : omp_get_max_threads();
+#else
+    return 1;
+#endif
+}
+
+template <typename Dtype>
+bool BaseDAUConvLayer<Dtype>::is_forward_tiled(bool fused) {
+    // tiling is used only when the whole blurred input would exceed the limit
+    const long interm_bytes = (long)this->batch_num_ * this->conv_in_channels_ * this->height_ * this->width_ * sizeof(Dtype);
+
+    return this->is_data_on_gpu() == false && fused == false && this->saved_blurred_input_ == NULL &&
+           this->tile_memory_limit_ > 0 && this->tile_memory_limit_ < interm_bytes;
+}
+
+template <typename Dtype>
+bool BaseDAUConvLayer<Dtype>::is_forward_fused() {
+    return this->is_data_on_gpu() == false && this->fused_forward_ && this->saved_blurred_input_ == NULL;
+}
+
+template <typename Dtype>
+bool BaseDAUConvLayer<Dtype>::use_fft_blur(bool is_separable) const {
+    if (this->blur_method_ != BLUR_AUTO)
+        return this->blur_method_ == BLUR_FFT;
+
+    const int kernel_size = std::max(this->aggregation.kernel_h_, this->aggregation.kernel_w_);
+
+    return kernel_size >= (is_separable ? FFT_BLUR_MIN_KERNEL_SIZE : FFT_BLUR_MIN_KERNEL_SIZE_NONSEPARABLE);
 }
 
 template <typename Dtype>
@@ -399,16 +590,20 @@ BaseDAUConvLayer<Dtype>::~BaseDAUConvLayer() {
     // Check that handles have been setup before destroying.
     if (!handles_setup_) { return; }
 
-    for (int g = 0; g < 1 ; g++) {
-        cudaStreamDestroy(stream_[g]);
+    // streams are created only when processing on GPU
+    if (stream_ != NULL) {
+        for (int g = 0; g < 1 ; g++) {
+            cudaStreamDestroy(stream_[g]);
+        }
+        delete [] stream_;
     }
 
-    for (int g = 0; g < 4; ++g) {
-        cudaStreamDestroy(paralel_streams[g]);
+    if (paralel_streams != NULL) {
+        for (int g = 0; g < 4; ++g) {
+            cudaStreamDestroy(paralel_streams[g]);
+        }
+        delete [] paralel_streams;
     }
-
-    delete [] stream_;
-    delete [] paralel_streams;
 }
 
 __global__ void sync_fast_gauss_conv_groups() { }
@@ -423,10 +618,37 @@ bool BaseDAUConvLayer<Dtype>::update_prefiltering_kernels(cudaStream_t stream) {
 
     if (std::fabs(aggregation.current_sigma - sigma) > 1e-5) {
 
+        // blur kernel, error kernel and four derivative kernels (timed only on CPU since kernels are computed
+        // asynchronously on GPU)
+        DAUConvPhaseTimer phase_timer(this->profile_name_, this->is_data_on_gpu() == false);
+        phase_timer.start(DAU_PHASE_KERNEL_PREP, 6 * this->aggregation.kernel_h_ * this->aggregation.kernel_w_ * sizeof(Dtype));
+
         // we compute kernels for blur using the same code as in std-implementation but we compute only for a single
         // component i.e., num_in_channels = 1, num_out_channels = 1, num_gauss = 1, and we use weight=1, mu = [0,0]
 
-        this->kernel_compute->get_kernels(*this->aggregation.param, *this->aggregation.kernels, cublas_handle);
+        // kernels depend only on sigma and layer settings so they can be shared between all layers in process
+        DAUKernelCacheKey cache_key;
+        cache_key.sigma = sigma;
+        cache_key.kernel_h = this->aggregation.kernel_h_;
+        cache_key.kernel_w = this->aggregation.kernel_w_;
+        cache_key.unit_normalization = this->use_unit_normalization;
+        cache_key.square_unit_normalization = this->use_square_unit_normalization;
+        cache_key.sigma_lower_bound = this->unit_sigma_lower_bound;
+        cache_key.offsets_already_centered = this->offsets_already_centered_;
+
+        DAUKernelCache<Dtype>& kernel_cache = DAUKernelCache<Dtype>::get_instance();
+
+        BaseDAUKernelOutput<Dtype>* kernels = this->aggregation.kernels;
+
+        if (kernel_cache.get(cache_key, kernels->weight(), kernels->d_error(), kernels->d_params(), this->is_data_on_gpu()) == false) {
+
+            if (this->is_data_on_gpu())
+                this->kernel_compute->get_kernels(*this->aggregation.param, *this->aggregation.kernels, cublas_handle);
+            else
+                this->kernel_compute->get_kernels_cpu(*this->aggregation.param, *this->aggregation.kernels);
+
+            kernel_cache.put(cache_key, kernels->weight(), kernels->d_error(), kernels->d_params(), this->is_data_on_gpu());
+        }
 
         this->aggregation.current_sigma = sigma;
 
@@ -459,15 +681,15 @@ Dtype* BaseDAUConvLayer<Dtype>::get_deriv_kernel_error(cudaStream_t stream) {
     return this->aggregation.kernels->d_error();
 }
 
-#define OFFSET(l,k,j,i, num_l, num_k, num_j, num_i) ((( (l)*(num_k) + (k)) * (num_j) + (j))*(num_i) + (i) )
-
+// Y_step is distance between neighbouring pixels in Y (1 for NCHW data or number of channels for NHWC data)
+// and X_stride is sub-sampling of X (each pixel of Y corresponds to every X_stride-th row and column of X)
 template <typename Dtype>
 Dtype cpu_dot_elementwise_skip(const Dtype* X, const int X_width, const int X_height, const int src_offset_x, const int src_offset_y,
                               const Dtype* Y, const int Y_width, const int Y_height, const int dst_offset_x, const int dst_offset_y,
-                              const int copy_width, const int copy_height) {
+                              const int copy_width, const int copy_height, const int Y_step = 1, const int X_stride = 1) {
 
     Dtype const* src_ptr = X + OFFSET(0, 0,src_offset_y,src_offset_x, 1, 1, X_height, X_width);
-    Dtype const* dst_ptr = Y + OFFSET(0, 0,dst_offset_y,dst_offset_x, 1, 1, Y_height, Y_width);
+    Dtype const* dst_ptr = Y + OFFSET(0, 0,dst_offset_y,dst_offset_x, 1, 1, Y_height, Y_width) * Y_step;
 
     Dtype result = 0;
 
@@ -476,12 +698,12 @@ Dtype cpu_dot_elementwise_skip(const Dtype* X, const int X_width, const int X_he
             result += dst_ptr[0] * src_ptr[0];
 
             // move to next element
-            src_ptr++;
-            dst_ptr++;
+            src_ptr += X_stride;
+            dst_ptr += Y_step;
         }
         // if copy_width does not equalt to size of arrays then we need to advance for missing elements
-        src_ptr += Y_width - copy_width;
-        dst_ptr += X_width - copy_width;
+        src_ptr += (X_width * X_stride) - copy_width * X_stride;
+        dst_ptr += (Y_width - copy_width) * Y_step;
     }
 
     return result;
@@ -492,23 +714,113 @@ Dtype cpu_dot_elementwise_skip(const Dtype* X, const int X_width, const int X_he
 template <typename Dtype>
 void cpu_sum_elementwise_skip(const float alpha, const Dtype* X, const int X_width, const int X_height, const int src_offset_x, const int src_offset_y,
                               Dtype* Y, const int Y_width, const int Y_height, const int dst_offset_x, const int dst_offset_y,
-                              const int copy_width, const int copy_height) {
+                              const int copy_width, const int copy_height, const int Y_step = 1, const int X_stride = 1) {
 
     Dtype const* src_ptr = X + OFFSET(0, 0,src_offset_y,src_offset_x, 1, 1, X_height, X_width);
-    Dtype* dst_ptr = Y + OFFSET(0, 0,dst_offset_y,dst_offset_x, 1, 1, Y_height, Y_width);
+    Dtype* dst_ptr = Y + OFFSET(0, 0,dst_offset_y,dst_offset_x, 1, 1, Y_height, Y_width) * Y_step;
 
     for (int j = 0; j < copy_height; ++j) {
         for (int i = 0; i < copy_width; ++i) {
-            dst_ptr[0] = dst_ptr[0] * src_ptr[0] * alpha;
+            dst_ptr[0] += src_ptr[0] * alpha;
 
             // move to next element
-            src_ptr++;
-            dst_ptr++;
+            src_ptr += X_stride;
+            dst_ptr += Y_step;
         }
         // if copy_width does not equalt to size of arrays then we need to advance for missing elements
-        src_ptr += Y_width - copy_width;
-        dst_ptr += X_width - copy_width;
+        src_ptr += (X_width * X_stride) - copy_width * X_stride;
+        dst_ptr += (Y_width - copy_width) * Y_step;
+    }
+}
+
+// ceil(a / b) for b > 0 and possibly negative a
+inline int ceil_div(const int a, const int b) {
+    return a > 0 ? (a + b - 1) / b : -((-a) / b);
+}
+
+// range [*dst_start, *dst_end) of strided output pixels i for which pixel (i * stride + offset) of stride=1 output
+// lies within [0, size_full)
+inline void get_strided_copy_range(const int offset, const int size_full, const int size_out, const int stride,
+                                   int* dst_start, int* dst_end) {
+    *dst_start = std::max(0, ceil_div(-offset, stride));
+    *dst_end = std::min(size_out, ceil_div(size_full - offset, stride));
+}
+
+// offset of the first pixel of plane at index n * channels + c in NCHW or NHWC data with [height x width] planes
+inline int get_plane_offset(const int plane_index, const int channels, const int plane_size, const bool channels_last) {
+    if (channels_last == false)
+        return plane_index * plane_size;
+
+    const int c = plane_index % channels;
+    return (plane_index - c) * plane_size + c;
+}
+
+// Units with non-zero weight (e.g. the ones left after pruning) in a compact list grouped by output channel: units of
+// output channel f are [f_start[f], f_start[f+1]) and are ordered by input channel. Integer offsets and the four
+// bilinear interpolation weights (multiplied by w) are computed once for all images and rows.
+struct DAUSparseUnits {
+    vector<int> f_start;
+    vector<int> s;
+    vector<int> offset_x, offset_y;
+    vector<float> tap_w;
+};
+
+template <typename Dtype>
+void get_sparse_units_cpu(const Dtype* filter_weights, const Dtype* filter_offsets_float_mu1, const Dtype* filter_offsets_float_mu2,
+                          const int conv_in_channels_, const int NUM_GAUSS, const int conv_out_channels_,
+                          const int kernel_width, const int kernel_height, const bool offsets_already_centered,
+                          const DAUConvForward<float>::PARAM_FORMAT INPUT_FORMAT, DAUSparseUnits* units) {
+
+    units->f_start.resize(conv_out_channels_ + 1);
+    units->s.clear();
+    units->offset_x.clear();
+    units->offset_y.clear();
+    units->tap_w.clear();
+
+    for (int f = 0; f < conv_out_channels_; ++f) {
+        units->f_start[f] = units->s.size();
+
+        for (int s = 0; s < conv_in_channels_; ++s) {
+            for (int g = 0; g < NUM_GAUSS; ++g) {
+                int param_offset = -1;
+                if (INPUT_FORMAT == DAUConvForward<float>::SGF)
+                    param_offset = OFFSET(0, s,g,f, 1, conv_in_channels_, NUM_GAUSS, conv_out_channels_);
+                else if (INPUT_FORMAT == DAUConvForward<float>::FGS)
+                    param_offset = OFFSET(0, f,g,s, 1, conv_out_channels_, NUM_GAUSS, conv_in_channels_);
+
+                float w = filter_weights[param_offset];
+
+                if (w == 0)
+                    continue;
+
+                float offset_x = filter_offsets_float_mu1[param_offset] - (offsets_already_centered == false ? kernel_width/2 : 0);
+                float offset_y = filter_offsets_float_mu2[param_offset] - (offsets_already_centered == false ? kernel_height/2 : 0);
+
+                int offset_x_int = floor(offset_x);
+                int offset_y_int = floor(offset_y);
+
+                float interpol_off_x = offset_x - offset_x_int;
+                float interpol_off_y = offset_y - offset_y_int;
+
+                units->s.push_back(s);
+                units->offset_x.push_back(offset_x_int);
+                units->offset_y.push_back(offset_y_int);
+
+                // taps in (dy,dx) order: (0,0), (0,1), (1,0), (1,1)
+                for (int dy = 0; dy < 2; ++dy) {
+                    for (int dx = 0; dx < 2; ++dx) {
+                        float interpol_w = w;
+
+                        interpol_w *= (dx == 0 ? (1-interpol_off_x) : interpol_off_x);
+                        interpol_w *= (dy == 0 ? (1-interpol_off_y) : interpol_off_y);
+
+                        units->tap_w.push_back(interpol_w);
+                    }
+                }
+            }
+        }
     }
+    units->f_start[conv_out_channels_] = units->s.size();
 }
 
 template <typename Dtype>
@@ -518,30 +830,64 @@ void offset_and_sum_opencv(const Dtype* input_data,
                     const int num_, const int conv_in_channels_, const int NUM_GAUSS, const int conv_out_channels_,
                     const int width_, const int height_,
                     const int width_out_, const int height_out_, const int kernel_width, const int kernel_height,
-                    const bool offsets_already_centered, const DAUConvForward<float>::PARAM_FORMAT INPUT_FORMAT = DAUConvForward<float>::SGF) {
+                    const bool offsets_already_centered, const DAUConvForward<float>::PARAM_FORMAT INPUT_FORMAT = DAUConvForward<float>::SGF,
+                    const int num_threads = 1, const bool output_channels_last = false, const int stride = 1,
+                    const int out_row_start = 0, const int out_row_end = -1, const int in_row_start = 0, const int in_rows = -1,
+                    const DAUSparseUnits* sparse_units = NULL) {
 
     // perform offset and sum over individual outputs
+    // (input_data is always in NCHW format while output_data can be in NHWC format)
+    // with stride > 1 only every stride-th row and column of [height_out_, width_out_] output is computed
+    // when computing a tile, only (strided) output rows [out_row_start, out_row_end) are written and input_data holds
+    // only in_rows rows of each blurred channel starting at row in_row_start (all needed rows must be present)
 #define OFFSET(l,k,j,i, num_l, num_k, num_j, num_i) ((( (l)*(num_k) + (k)) * (num_j) + (j))*(num_i) + (i) )
 
     const int INTERPOlATION_Dx = 2;
     const int INTERPOlATION_Dy = 2;
 
     const int F_BATCH = 8;
-    const int S_BATCH = 1;
 
-    for (int n = 0; n < num_; ++n) {
-        //printf("n=%d\n",n);
+    // units with zero weight (e.g. pruned ones) are skipped entirely; the list of remaining units is prepared once for
+    // all images unless given by the caller
+    DAUSparseUnits local_units;
+    if (sparse_units == NULL)
+        get_sparse_units_cpu(filter_weights, filter_offsets_float_mu1, filter_offsets_float_mu2,
+                             conv_in_channels_, NUM_GAUSS, conv_out_channels_, kernel_width, kernel_height,
+                             offsets_already_centered, INPUT_FORMAT, &local_units);
+
+    const DAUSparseUnits& units = sparse_units != NULL ? *sparse_units : local_units;
+
+    // each (n, F_BATCH block) job writes to its own output channels so jobs can run in parallel without locking
+    const int num_f_blocks = (conv_out_channels_ + F_BATCH - 1) / F_BATCH;
+
+#pragma omp parallel for schedule(dynamic) num_threads(num_threads)
+    for (int job = 0; job < num_ * num_f_blocks; ++job) {
+        const int n = job / num_f_blocks;
+        const int f_offset = (job % num_f_blocks) * F_BATCH;
+        const int f_batch = std::min(F_BATCH, conv_out_channels_ - f_offset);
 
         //cv::Mat interm_mat(conv_in_channels_ * height_,width_, CV_32F, (Dtype*)input_data + n * conv_in_channels_ * width_ * height_);
         //cv::Mat top_mat(conv_out_channels_ * height_out_, width_out_, CV_32F, output_data + n * conv_out_channels_ * width_out_  * height_out_);
 
+        const int src_rows = in_rows >= 0 ? in_rows : height_;
+
         int src_width = width_;
-        int src_height = conv_in_channels_ * height_;
-        Dtype const* src =  input_data + n * conv_in_channels_ * width_ * height_;
+        int src_height = conv_in_channels_ * src_rows;
+        Dtype const* src =  input_data + n * conv_in_channels_ * width_ * src_rows;
 
-        int dst_width = width_out_;
-        int dst_height = conv_out_channels_ * height_out_;
-        Dtype* dst = output_data + n * conv_out_channels_ * width_out_  * height_out_;
+        // size of strided output
+        const int strided_width_out = (width_out_ - 1) / stride + 1;
+        const int strided_height_out = (height_out_ - 1) / stride + 1;
+
+        const int row_start = out_row_start;
+        const int row_end = out_row_end >= 0 ? out_row_end : strided_height_out;
+
+        // for NCHW output all channels are stacked as rows of one [conv_out_channels_ * height_out_, width_out_] image,
+        // while for NHWC output each channel is accessed as [height_out_, width_out_] image with dst_step between pixels
+        int dst_width = strided_width_out;
+        int dst_height = output_channels_last ? strided_height_out : conv_out_channels_ * strided_height_out;
+        int dst_step = output_channels_last ? conv_out_channels_ : 1;
+        Dtype* dst = output_data + n * conv_out_channels_ * strided_width_out  * strided_height_out;
 
         int border_x = width_/2 - width_out_/2;
         int border_y = height_/2 - height_out_/2;
@@ -549,118 +895,272 @@ void offset_and_sum_opencv(const Dtype* input_data,
         border_x = border_x > 0 ? border_x : 0;
         border_y = border_y > 0 ? border_y : 0;
 
-        for (int i = 0; i <  dst_width*dst_height; ++i)
-            dst[i] = 0;
+        // reset only output channels (and rows) of this job
+        if (output_channels_last) {
+            for (int i = row_start * strided_width_out; i < row_end * strided_width_out; ++i)
+                memset(dst + i * conv_out_channels_ + f_offset, 0, sizeof(Dtype) * f_batch);
+        } else {
+            for (int ff = 0; ff < f_batch; ++ff)
+                memset(dst + ((f_offset + ff) * strided_height_out + row_start) * strided_width_out, 0, sizeof(Dtype) * (row_end - row_start) * strided_width_out);
+        }
 
         //top_mat.setTo(0);
 
-        for (int f_offset = 0; f_offset < conv_out_channels_; f_offset+=F_BATCH) {
-            for (int s_offset = 0; s_offset < conv_in_channels_; s_offset+=S_BATCH) {
-                for (int ff = 0; ff < F_BATCH; ff++) {
-                    for (int ss = 0; ss < S_BATCH; ss++) {
-                        int f = f_offset + ff;
-                        int s = s_offset + ss;
+        for (int ff = 0; ff < f_batch; ff++) {
+            int f = f_offset + ff;
 
-                        int access_f_offset = f * height_out_;
-                        int access_s_offset = s * height_;
+            int access_f_offset = output_channels_last ? 0 : f * strided_height_out;
 
-                        for (int g = 0; g < NUM_GAUSS; ++g) {
-                            int param_offset = -1;
-                            if (INPUT_FORMAT == DAUConvForward<float>::SGF)
-                                param_offset = OFFSET(0, s,g,f, 1, conv_in_channels_, NUM_GAUSS, conv_out_channels_);
-                            else if (INPUT_FORMAT == DAUConvForward<float>::FGS)
-                                param_offset = OFFSET(0, f,g,s, 1, conv_out_channels_, NUM_GAUSS, conv_in_channels_);
+            Dtype* dst_f = output_channels_last ? dst + f : dst;
 
-                            float w = filter_weights[param_offset];
+            // only units with non-zero weight (in the order of input channels)
+            for (int u = units.f_start[f]; u < units.f_start[f+1]; ++u) {
+                int access_s_offset = units.s[u] * src_rows - in_row_start;
 
-                            float offset_x = filter_offsets_float_mu1[param_offset] - (offsets_already_centered == false ? kernel_width/2 : 0);
-                            float offset_y = filter_offsets_float_mu2[param_offset] - (offsets_already_centered == false ? kernel_height/2 : 0);
+                for (int dy = 0; dy < INTERPOlATION_Dy; ++dy) {
+                    for (int dx = 0; dx < INTERPOlATION_Dx; ++dx) {
 
-                            int offset_x_int = floor(offset_x);
-                            int offset_y_int = floor(offset_y);
+                        int access_x_off = units.offset_x[u] + dx;
+                        int access_y_off = units.offset_y[u] + dy;
 
-                            float interpol_off_x = offset_x - offset_x_int;
-                            float interpol_off_y = offset_y - offset_y_int;
+                        float interpol_w = units.tap_w[4*u + dy*INTERPOlATION_Dx + dx];
 
+                        int dst_start_x, dst_end_x, dst_start_y, dst_end_y;
 
-                            for (int dy = 0; dy < INTERPOlATION_Dy; ++dy) {
-                                for (int dx = 0; dx < INTERPOlATION_Dx; ++dx) {
+                        get_strided_copy_range(access_x_off, width_out_, strided_width_out, stride, &dst_start_x, &dst_end_x);
+                        get_strided_copy_range(access_y_off, height_out_, strided_height_out, stride, &dst_start_y, &dst_end_y);
 
-                                    int access_x_off = offset_x_int + dx;
-                                    int access_y_off = offset_y_int + dy;
+                        dst_start_y = std::max(dst_start_y, row_start);
+                        dst_end_y = std::min(dst_end_y, row_end);
 
-                                    float interpol_w = w;
+                        int copy_width = dst_end_x - dst_start_x;
+                        int copy_height = dst_end_y - dst_start_y;
 
-                                    interpol_w *= (dx == 0 ? (1-interpol_off_x) : interpol_off_x);
-                                    interpol_w *= (dy == 0 ? (1-interpol_off_y) : interpol_off_y);
+                        int src_offset_x = border_x + dst_start_x * stride + access_x_off;
+                        int src_offset_y =  border_y + dst_start_y * stride + access_y_off + access_s_offset;
 
-                                    int copy_width = std::min(width_out_ + access_x_off, width_out_ - access_x_off);
-                                    int copy_height = std::min(height_out_ + access_y_off, height_out_ - access_y_off);
+                        int dst_offset_x = dst_start_x;
+                        int dst_offset_y = dst_start_y + access_f_offset;
 
-                                    int src_offset_x = border_x+std::max(0, access_x_off);
-                                    int src_offset_y =  border_y+std::max(0, access_y_off) + access_s_offset;
+                        if (copy_width > 0 && copy_height > 0 && interpol_w != 0) {
+                            cpu_sum_elementwise_skip(interpol_w, src, src_width, src_height, src_offset_x, src_offset_y,
+                                                     dst_f, dst_width, dst_height, dst_offset_x, dst_offset_y,
+                                                     copy_width, copy_height, dst_step, stride);
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+template <typename Dtype>
+void fused_blur_offset_and_sum_cpu(const Dtype* input_data,
+                    const Dtype* kernel_col, const int kernel_h, const Dtype* kernel_row, const int kernel_w,
+                    const int pad_h, const int pad_w,
+                    const Dtype* filter_weights, const Dtype* filter_offsets_float_mu1, const Dtype* filter_offsets_float_mu2,
+                    Dtype* output_data,
+                    const int num_, const int conv_in_channels_, const int NUM_GAUSS, const int conv_out_channels_,
+                    const int width_, const int height_,
+                    const int width_out_, const int height_out_, const int kernel_width, const int kernel_height,
+                    const bool offsets_already_centered, const int min_shift_y, const int max_shift_y,
+                    const long band_buffer_bytes, const int num_threads = 1, const bool channels_last = false,
+                    const int stride = 1) {
+
+    // separable blur and offset-and-sum in a single pass over the input: each job slides a band of a few blurred rows
+    // (of all input channels) down the image and sums shifted rows of all units into the output rows covered by the
+    // band before blurring the next rows, so blurred data is consumed while it is still in cache and the whole blurred
+    // input is never written to memory; every output row is computed by offset_and_sum_opencv from the same blurred
+    // values as in the unfused version, therefore the output is identical
+    // (input_data and output_data are both in NCHW or both in NHWC format; min_shift_y/max_shift_y bound row offsets
+    // of all interpolation taps)
+    const int strided_width_out = (width_out_ - 1) / stride + 1;
+    const int strided_height_out = (height_out_ - 1) / stride + 1;
+
+    const int border_y = std::max(0, height_/2 - height_out_/2);
+
+    const int plane_size = height_ * width_;
+    const int input_step = channels_last ? conv_in_channels_ : 1;
+
+    // number of output rows summed at once is limited by band_buffer_bytes (soft bound as at least one row is needed)
+    const int halo_rows = max_shift_y - min_shift_y + 1;
+    const long row_bytes = (long)conv_in_channels_ * width_ * sizeof(Dtype);
+
+    const int block_rows = std::min((long)strided_height_out, std::max(1L, (band_buffer_bytes / row_bytes - halo_rows) / stride + 1));
+    const int buffer_rows = std::min(height_, (block_rows - 1) * stride + halo_rows);
+
+    // split images into bands of output rows only to keep all threads busy with small batches (each band blurs
+    // its first halo again)
+    const int num_bands = std::min(strided_height_out, std::max(1, (num_threads + num_ - 1) / num_));
+    const int band_rows = (strided_height_out + num_bands - 1) / num_bands;
+
+    // units with non-zero weight are shared by all blocks of rows
+    DAUSparseUnits units;
+    get_sparse_units_cpu(filter_weights, filter_offsets_float_mu1, filter_offsets_float_mu2,
+                         conv_in_channels_, NUM_GAUSS, conv_out_channels_, kernel_width, kernel_height,
+                         offsets_already_centered, DAUConvForward<float>::SGF, &units);
+
+#pragma omp parallel num_threads(num_threads)
+    {
+        // each thread uses its own band buffer of [conv_in_channels_ x buffer_rows x width_] and row buffer
+        vector<Dtype> band_buff((size_t)conv_in_channels_ * buffer_rows * width_);
+        vector<Dtype> row_buff(width_);
+
+#pragma omp for schedule(dynamic)
+        for (int job = 0; job < num_ * num_bands; ++job) {
+            const int n = job / num_bands;
+            const int band_start = (job % num_bands) * band_rows;
+            const int band_end = std::min(band_start + band_rows, strided_height_out);
+
+            const Dtype* src = input_data + (long)n * conv_in_channels_ * plane_size;
+            Dtype* dst = output_data + (long)n * conv_out_channels_ * strided_width_out * strided_height_out;
+
+            // blurred rows [buffer_start, buffer_end) are currently held in band_buff
+            int buffer_start = 0, buffer_end = 0;
+
+            for (int row_start = band_start; row_start < band_end; row_start += block_rows) {
+                const int row_end = std::min(row_start + block_rows, band_end);
+
+                const int in_row_start = std::min(std::max(0, border_y + row_start * stride + min_shift_y), height_);
+                const int in_row_end = std::min(std::max(in_row_start, border_y + (row_end - 1) * stride + max_shift_y + 1), height_);
+
+                // rows shared with the previous block are moved to the top of the buffer and only new rows are blurred
+                int blur_start = in_row_start;
+                if (in_row_start >= buffer_start && in_row_start < buffer_end) {
+                    for (int s = 0; s < conv_in_channels_; ++s) {
+                        Dtype* buff_s = band_buff.data() + s * buffer_rows * width_;
+                        memmove(buff_s, buff_s + (in_row_start - buffer_start) * width_, sizeof(Dtype) * (buffer_end - in_row_start) * width_);
+                    }
+                    blur_start = buffer_end;
+                }
+
+                for (int s = 0; s < conv_in_channels_; ++s) {
+                    separable_conv2d_cpu(src + get_plane_offset(s, conv_in_channels_, plane_size, channels_last),
+                                         height_, width_,
+                                         kernel_col, kernel_h, kernel_row, kernel_w,
+                                         pad_h - blur_start, pad_w,
+                                         in_row_end - blur_start, width_,
+                                         row_buff.data(), band_buff.data() + (s * buffer_rows + blur_start - in_row_start) * width_, input_step);
+                }
+                buffer_start = in_row_start;
+                buffer_end = in_row_end;
+
+                offset_and_sum_opencv(band_buff.data(), filter_weights, filter_offsets_float_mu1, filter_offsets_float_mu2,
+                                      dst,
+                                      1, conv_in_channels_, NUM_GAUSS, conv_out_channels_,
+                                      width_, height_,
+                                      width_out_, height_out_,
+                                      kernel_width, kernel_height, offsets_already_centered,
+                                      DAUConvForward<float>::SGF, 1, channels_last, stride,
+                                      row_start, row_end, in_row_start, buffer_rows, &units);
+            }
+        }
+    }
+}
 
-                                    int dst_offset_x = std::max(0, -access_x_off);
-                                    int dst_offset_y = std::max(0, -access_y_off) + access_f_offset;
-                                    /*cv::Rect interm_roi(border_x+std::max(0, access_x_off),
-                                                        border_y+std::max(0, access_y_off) + access_s_offset,
-                                                        std::min(width_out_ + access_x_off, width_out_ - access_x_off),
-                                                        std::min(height_out_ + access_y_off, height_out_ - access_y_off));
+// Adds bias (if not NULL) to output of [num x channels x height x width] (or [num x height x width x channels]
+// with channels_last) and applies leaky ReLU with negative_slope (ReLU when 0) if apply_activation is set.
+// Output is processed in contiguous blocks of a single plane (NCHW) or of a single row of all channels (NHWC).
+template <typename Dtype>
+void bias_activation_forward_cpu(Dtype* output, const Dtype* bias,
+                                 const int num, const int channels, const int height, const int width,
+                                 const bool apply_activation, const Dtype negative_slope,
+                                 const int num_threads, const bool channels_last) {
 
-                                    cv::Rect top_roi(std::max(0, -access_x_off),
-                                                     std::max(0, -access_y_off) + access_f_offset,
-                                                     std::min(width_out_ + access_x_off, width_out_ - access_x_off),
-                                                     std::min(height_out_ + access_y_off, height_out_ - access_y_off));*/
+    const int num_blocks = channels_last ? num * height : num * channels;
+    const int block_size = channels_last ? width * channels : height * width;
 
-                                    //std::cout << "top_roi: " << top_roi << " interm_roi: " << interm_roi  << std::endl;
-                                    //if (top_roi.width > 0 && top_roi.height > 0 && interm_roi.width > 0 && interm_roi.height > 0) {
-                                    if (copy_width > 0 && copy_height > 0) {
-                                        //top_mat(top_roi) += interpol_w * interm_mat(interm_roi);
+    // number of consecutive values with different channels
+    const int inner_size = channels_last ? channels : block_size;
 
-                                        cpu_sum_elementwise_skip(interpol_w, src, src_width, src_height, src_offset_x, src_offset_y,
-                                                                 dst, dst_width, dst_height, dst_offset_x, dst_offset_y,
-                                                                 copy_width, copy_height);
+#pragma omp parallel for num_threads(num_threads) schedule(static)
+    for (int b = 0; b < num_blocks; ++b) {
+        Dtype* data = output + (long)b * block_size;
 
+        for (int j = 0; j < block_size; j += inner_size) {
+            for (int k = 0; k < inner_size; ++k) {
+                Dtype value = data[j + k];
 
-                                        //if (f == 0) {
-                                        //    printf("sum of f,s,g=%d,%d,%d is val: ", f,s,g);
-                                        //    std::cout << top_mat(top_roi) << " with top roi: " << top_roi  << " and inter roi: " << interm_roi << " and iter val " << interm_mat(interm_roi) << std::endl;
-                                        //}
-                                    }
-                                }
-                            }
-                        }
-                    }
+                if (bias != NULL)
+                    value += bias[channels_last ? k : b % channels];
+
+                if (apply_activation && value < 0)
+                    value *= negative_slope;
+
+                data[j + k] = value;
+            }
+        }
+    }
+}
+
+// Back-propagates error through the activation of bias_activation_forward_cpu() into error_out (used only with
+// apply_activation) and accumulates the resulting error over all but the channel dimension into bias_diff (if not
+// NULL). Derivative is taken from the sign of the activated output, which matches the sign of its input for
+// negative_slope >= 0.
+template <typename Dtype>
+void bias_activation_backward_cpu(const Dtype* output, const Dtype* error, Dtype* error_out, Dtype* bias_diff,
+                                  const int num, const int channels, const int height, const int width,
+                                  const bool apply_activation, const Dtype negative_slope,
+                                  const int num_threads, const bool channels_last) {
+
+    const int num_blocks = channels_last ? num * height : num * channels;
+    const int block_size = channels_last ? width * channels : height * width;
+
+    const int inner_size = channels_last ? channels : block_size;
+    const int sums_per_block = channels_last ? channels : 1;
+
+    // sums of individual blocks are reduced in a fixed order so that bias gradient does not depend on the number
+    // of threads
+    vector<Dtype> block_sums(bias_diff != NULL ? (size_t)num_blocks * sums_per_block : 0, 0);
+
+#pragma omp parallel for num_threads(num_threads) schedule(static)
+    for (int b = 0; b < num_blocks; ++b) {
+        const long offset = (long)b * block_size;
+        Dtype* sums = block_sums.empty() ? NULL : block_sums.data() + (long)b * sums_per_block;
+
+        for (int j = 0; j < block_size; j += inner_size) {
+            for (int k = 0; k < inner_size; ++k) {
+                Dtype value = error[offset + j + k];
+
+                if (apply_activation) {
+                    if (output[offset + j + k] <= 0)
+                        value *= negative_slope;
+
+                    error_out[offset + j + k] = value;
                 }
+
+                if (sums != NULL)
+                    sums[channels_last ? k : 0] += value;
             }
         }
     }
+
+    if (bias_diff != NULL) {
+        for (int b = 0; b < num_blocks; ++b) {
+            for (int k = 0; k < sums_per_block; ++k)
+                bias_diff[channels_last ? k : b % channels] += block_sums[(long)b * sums_per_block + k];
+        }
+    }
 }
-    template <typename Dtype>
+
+template <typename Dtype>
 void BaseDAUConvLayer<Dtype>::Forward_cpu(const Dtype* bottom_data, const vector<int> bottom_shape,
                                           Dtype* top_data, const vector<int> top_shape) {
 
         // - first perform gaussian bluring based on variance that is fixed over the whole layer (use CuDNN for that)
     // - then perform forward pass with our custom kernel
-    // - optionally add bias
+    // - optionally add bias and apply activation
     M_Assert(this->is_data_on_gpu() == false, "Forward_cpu requires data on CPU, but is_data_on_gpu() returned true !");
 
-    clock_t start_t = clock();
-
-    // check if we need to do merging of components;
-    // make sure we check based on steps done in backpropagation and we should avoid merging if only forward is called (by default current_iteration_index=0 so start at second iter
-    bool do_merginig_optmization = this->unit_merge_iteration_step > 0 && (this->current_iteration_index + 1) % this->unit_merge_iteration_step == 0 ? true : false;
+    // number of bytes in input, output and in single blurred input
+    const long bottom_bytes = (long)this->batch_num_ * this->bottom_dim_ * sizeof(Dtype);
+    const long top_bytes = (long)this->batch_num_ * this->top_dim_ * sizeof(Dtype);
 
-    // if during training then merge components if needed
-    if (do_merginig_optmization) {
-        //merge_components();
-    }
+    DAUConvPhaseTimer phase_timer(this->profile_name_);
 
-    const int height_out = top_shape[this->channel_axis_ + 1];
-    const int width_out = top_shape[this->channel_axis_ + 2];
+    const int num_threads = this->get_num_cpu_threads();
 
     // get filter for gaussian blur step
-    const Dtype* gauss_kernel = this->get_gaussian_kernel(stream_[0]);
+    const Dtype* gauss_kernel = this->get_gaussian_kernel();
 
     // get buffers for all parameters that we learn
     const Dtype* filter_weights = this->param_w();
@@ -672,42 +1172,226 @@ void BaseDAUConvLayer<Dtype>::Forward_cpu(const Dtype* bottom_data, const vector
         //const Dtype* bottom_data = bottom[i]->mutable_cpu_data();
         //Dtype* top_data = top[i]->mutable_cpu_data();
 
-        Dtype* interm_data = this->temp_interm_buffer();
+        // first perform convolutions with gaussian filter (i.e. gaussian blur)
 
+        // gaussian kernel is separable so we can do blur as row and column pass directly on input without im2col,
+        // but fall back to im2col + gemm if kernel cannot be factorized
+        vector<Dtype> kernel_col(this->aggregation.kernel_h_), kernel_row(this->aggregation.kernel_w_);
 
-        // first perform convolutions with gaussian filter (i.e. gaussian blur)
+        const bool is_separable = separable_kernel_factors_cpu(gauss_kernel, this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                                                               kernel_col.data(), kernel_row.data());
 
-        Dtype* col_buff = this->temp_col_buffer();
+        // NHWC input is read in-place with channel stride (blurred output is always in NCHW format)
+        const int input_step = this->channels_last_ ? this->conv_in_channels_ : 1;
 
-        for (int n = 0; n < this->batch_num_ * this->conv_in_channels_; ++n) {
+        const int plane_size = this->height_ * this->width_;
 
-            im2col_cpu(bottom_data + n * (this->height_* this->width_), 1, this->height_, this->width_,
-                       this->aggregation.kernel_h_, this->aggregation.kernel_w_,
-                       this->aggregation.pad_h_, this->aggregation.pad_w_,
-                       this->aggregation.stride_h_, this->aggregation.stride_w_,
-                       1,1, col_buff);
+        const int stride = this->stride_w_;
+        const int strided_height_out = (this->height_out_full_ - 1) / stride + 1;
+        const int border_y = std::max(0, this->height_/2 - this->height_out_full_/2);
 
-            caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, 1 , this->height_ * this->width_, this->aggregation.kernel_h_ * this->aggregation.kernel_w_,
-                                  (Dtype)1., gauss_kernel , col_buff,
-                                  (Dtype)0., interm_data + n * this->width_ * this->height_);
+        // large kernels are blurred with FFT over whole planes (i.e. they are not fused with offset-and-sum)
+        const bool use_fft = this->use_fft_blur(is_separable);
+
+        const bool fused = is_separable && use_fft == false && this->is_forward_fused();
+
+        // kernels that cannot be fused are still bounded by tile_memory_limit_
+        const bool tiled = this->is_forward_tiled(fused);
+
+        // range of row offsets of all interpolation taps (needed only when blurred rows are not all kept at once)
+        int min_shift_y = 0, max_shift_y = 0;
+
+        if (fused || tiled) {
+            const int num_params = this->conv_in_channels_ * this->units_per_channel * this->conv_out_channels_;
+
+            for (int i = 0; i < num_params; ++i) {
+                const float offset_y = filter_offsets_float_mu2[i] - (this->offsets_already_centered_ == false ? this->kernel_h_/2 : 0);
+                const int offset_y_int = floor(offset_y);
+
+                min_shift_y = std::min(min_shift_y, offset_y_int);
+                max_shift_y = std::max(max_shift_y, offset_y_int + 1);
+            }
         }
 
-        //Dtype* interm_data = bottom[i]->mutable_cpu_data();
-
-        // now we take the blured input data and perform sum over shifted input data with our custom kernel
-        offset_and_sum_opencv(interm_data,filter_weights, filter_offsets_float_mu1, filter_offsets_float_mu2,
-                            top_data,
-                            this->batch_num_, this->conv_in_channels_, this->units_per_channel, this->conv_out_channels_,
-                            this->width_, this->height_,
-                            this->width_out_, this->height_out_,
-                            this->kernel_w_, this->kernel_h_, this->offsets_already_centered_);
-
-        // add bias if needed
-        if (this->bias_term_) {
-            const Dtype *bias = this->param_bias();
-            for (int n = 0; n < this->batch_num_ ; ++n) {
-                this->forward_cpu_bias(top_data + n * this->top_dim_, bias);
+        if (fused) {
+
+            phase_timer.start(DAU_PHASE_FWD_BLUR_OFFSET_SUM, bottom_bytes + top_bytes);
+
+            fused_blur_offset_and_sum_cpu(bottom_data,
+                                          kernel_col.data(), this->aggregation.kernel_h_,
+                                          kernel_row.data(), this->aggregation.kernel_w_,
+                                          this->aggregation.pad_h_, this->aggregation.pad_w_,
+                                          filter_weights, filter_offsets_float_mu1, filter_offsets_float_mu2,
+                                          top_data,
+                                          this->batch_num_, this->conv_in_channels_, this->units_per_channel, this->conv_out_channels_,
+                                          this->width_, this->height_,
+                                          this->width_out_full_, this->height_out_full_,
+                                          this->kernel_w_, this->kernel_h_, this->offsets_already_centered_,
+                                          min_shift_y, max_shift_y, FUSED_BAND_BUFFER_BYTES,
+                                          num_threads, this->channels_last_, stride);
+        } else {
+            // by default the whole batch is blurred into temp_interm_buffer() at once, but with tile_memory_limit_ the
+            // blurred input is kept only for a tile of tile_images images and tile_rows (strided) output rows at a time;
+            // each output row needs blurred rows at offsets [min_shift_y, max_shift_y] of interpolation taps (gaussian
+            // radius is read directly from the input), and since the tile is blurred and summed exactly as the same rows
+            // of the whole image the output is identical to the untiled version
+            int tile_images = this->batch_num_;
+            int tile_rows = strided_height_out;
+
+            Dtype* interm_data = NULL;
+
+            if (tiled) {
+                const long row_bytes = (long)this->conv_in_channels_ * this->width_ * sizeof(Dtype);
+                const long max_rows = std::max(1L, this->tile_memory_limit_ / row_bytes);
+
+                if (max_rows >= this->height_) {
+                    // whole images fit into the limit so tile only over the batch
+                    tile_images = std::min((long)this->batch_num_, max_rows / this->height_);
+                } else {
+                    // limit is a soft bound if even a single output row with its halo does not fit into it
+                    tile_images = 1;
+                    tile_rows = std::max(1L, (max_rows - (max_shift_y - min_shift_y + 1)) / stride + 1);
+                    tile_rows = std::min(tile_rows, strided_height_out);
+                }
+
+                const int max_tile_rows = std::min(this->height_, (tile_rows - 1) * stride + max_shift_y - min_shift_y + 1);
+
+                this->tile_buffer_.resize((size_t)tile_images * this->conv_in_channels_ * max_tile_rows * this->width_);
+
+                interm_data = this->tile_buffer_.data();
+            } else if (this->saved_blurred_input_ != NULL) {
+                // whole blurred input is kept for Backward_cpu
+                interm_data = this->saved_blurred_input_;
+            } else if (this->is_forward_fused()) {
+                // temp_interm_buffer() is not allocated for fused version, so blur one image at a time if the kernel
+                // cannot be fused (i.e. is not separable or is blurred with FFT)
+                tile_images = 1;
+
+                this->tile_buffer_.resize((size_t)this->conv_in_channels_ * plane_size);
+
+                interm_data = this->tile_buffer_.data();
+            } else {
+                interm_data = this->temp_interm_buffer();
+            }
+
+            for (int n_start = 0; n_start < this->batch_num_; n_start += tile_images) {
+                const int num_images = std::min(tile_images, this->batch_num_ - n_start);
+
+                for (int row_start = 0; row_start < strided_height_out; row_start += tile_rows) {
+                    const int row_end = std::min(row_start + tile_rows, strided_height_out);
+
+                    // rows of the blurred input needed for this tile (all rows when tiling over batch only)
+                    int in_row_start = 0, in_row_end = this->height_;
+
+                    if (tile_rows < strided_height_out) {
+                        in_row_start = std::min(std::max(0, border_y + row_start * stride + min_shift_y), this->height_);
+                        in_row_end = std::min(std::max(in_row_start, border_y + (row_end - 1) * stride + max_shift_y + 1), this->height_);
+                    }
+                    const int in_rows = in_row_end - in_row_start;
+
+                    const long tile_bottom_bytes = (long)num_images * this->conv_in_channels_ * in_rows * this->width_ * sizeof(Dtype);
+                    const long tile_top_bytes = (long)num_images * this->conv_out_channels_ * (row_end - row_start) * ((this->width_out_full_ - 1) / stride + 1) * sizeof(Dtype);
+
+                    phase_timer.start(DAU_PHASE_FWD_BLUR, 2 * tile_bottom_bytes);
+
+                    const Dtype* tile_bottom_data = bottom_data + (long)n_start * this->bottom_dim_;
+
+                    if (use_fft) {
+
+                        // spectrum of the kernel is shared by all planes of the tile
+                        FFTConv2dPlan<Dtype> fft_plan;
+                        fft_conv2d_plan_cpu(gauss_kernel, 1, this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                                            this->height_, this->width_,
+                                            this->aggregation.pad_h_ - in_row_start, this->aggregation.pad_w_,
+                                            in_rows, this->width_, &fft_plan);
+
+#pragma omp parallel num_threads(num_threads)
+                        {
+                            // each thread uses its own workspace
+                            vector<Dtype> fft_buff(fft_plan.workspace_size());
+
+#pragma omp for schedule(static)
+                            for (int n = 0; n < num_images * this->conv_in_channels_; ++n) {
+
+                                fft_conv2d_cpu(fft_plan, tile_bottom_data + get_plane_offset(n, this->conv_in_channels_, plane_size, this->channels_last_),
+                                               interm_data + n * this->width_ * in_rows, 0, fft_buff.data(), input_step);
+                            }
+                        }
+                    } else if (is_separable) {
+
+#pragma omp parallel num_threads(num_threads)
+                        {
+                            // each thread uses its own row buffer
+                            vector<Dtype> row_buff(this->width_);
+
+#pragma omp for schedule(static)
+                            for (int n = 0; n < num_images * this->conv_in_channels_; ++n) {
+
+                                // output rows [in_row_start, in_row_end) of the whole image (the same computation as for
+                                // the whole image since padding is applied to the input rows that lie outside of it)
+                                separable_conv2d_cpu(tile_bottom_data + get_plane_offset(n, this->conv_in_channels_, plane_size, this->channels_last_),
+                                                     this->height_, this->width_,
+                                                     kernel_col.data(), this->aggregation.kernel_h_,
+                                                     kernel_row.data(), this->aggregation.kernel_w_,
+                                                     this->aggregation.pad_h_ - in_row_start, this->aggregation.pad_w_,
+                                                     in_rows, this->width_,
+                                                     row_buff.data(), interm_data + n * this->width_ * in_rows, input_step);
+                            }
+                        }
+                    } else {
+
+                        Dtype* col_buff = this->temp_col_buffer();
+
+                        // gemm computes the whole plane so a tile needs to copy its rows from a temporary plane
+                        vector<Dtype> plane_buff(in_rows < this->height_ ? plane_size : 0);
+
+                        for (int n = 0; n < num_images * this->conv_in_channels_; ++n) {
+
+                            im2col_cpu(tile_bottom_data + get_plane_offset(n, this->conv_in_channels_, plane_size, this->channels_last_),
+                                       1, this->height_, this->width_,
+                                       this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                                       this->aggregation.pad_h_, this->aggregation.pad_w_,
+                                       this->aggregation.stride_h_, this->aggregation.stride_w_,
+                                       1,1, col_buff, input_step);
+
+                            Dtype* blur_data = plane_buff.empty() ? interm_data + n * plane_size : plane_buff.data();
+
+                            caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, 1 , plane_size, this->aggregation.kernel_h_ * this->aggregation.kernel_w_,
+                                                  (Dtype)1., gauss_kernel , col_buff,
+                                                  (Dtype)0., blur_data);
+
+                            if (plane_buff.empty() == false)
+                                memcpy(interm_data + n * this->width_ * in_rows, blur_data + in_row_start * this->width_, sizeof(Dtype) * in_rows * this->width_);
+                        }
+                    }
+
+                    //Dtype* interm_data = bottom[i]->mutable_cpu_data();
+
+                    // now we take the blured input data and perform sum over shifted input data with our custom kernel
+                    phase_timer.start(DAU_PHASE_FWD_OFFSET_SUM, tile_bottom_bytes + tile_top_bytes);
+
+                    offset_and_sum_opencv(interm_data,filter_weights, filter_offsets_float_mu1, filter_offsets_float_mu2,
+                                        top_data + (long)n_start * this->top_dim_,
+                                        num_images, this->conv_in_channels_, this->units_per_channel, this->conv_out_channels_,
+                                        this->width_, this->height_,
+                                        this->width_out_full_, this->height_out_full_,
+                                        this->kernel_w_, this->kernel_h_, this->offsets_already_centered_,
+                                        DAUConvForward<float>::SGF, num_threads, this->channels_last_, stride,
+                                        row_start, row_end, in_row_start, in_rows);
+                }
             }
+
+        }
+
+        // add bias and apply activation in a single pass over the output
+        if (this->bias_term_ || this->activation_ != ACTIVATION_NONE) {
+            phase_timer.start(DAU_PHASE_FWD_BIAS, 2 * top_bytes);
+
+            bias_activation_forward_cpu(top_data, this->bias_term_ ? (const Dtype*)this->param_bias() : NULL,
+                                        this->batch_num_, this->conv_out_channels_, this->height_out_, this->width_out_,
+                                        this->activation_ != ACTIVATION_NONE,
+                                        this->activation_ == ACTIVATION_LEAKY_RELU ? this->activation_negative_slope_ : (Dtype)0,
+                                        num_threads, this->channels_last_);
         }
     }
 }
@@ -721,9 +1405,12 @@ void offset_and_dot_opencv(const Dtype* input_data, const Dtype* error_data,
                            const int width_, const int height_,
                            const int width_out_, const int height_out_, const int kernel_width, const int kernel_height,
                            const bool ignore_edge_gradients, const bool offsets_already_centered,
-                           const DAUConvForward<float>::PARAM_FORMAT INPUT_FORMAT = DAUConvForward<float>::SGF) {
+                           const DAUConvForward<float>::PARAM_FORMAT INPUT_FORMAT = DAUConvForward<float>::SGF,
+                           const int num_threads = 1, const bool error_channels_last = false, const int stride = 1) {
 
     // perform offset and sum over individual outputs
+    // (input_data is always in NCHW format while error_data can be in NHWC format)
+    // with stride > 1 error_data holds only every stride-th row and column of [height_out_, width_out_] output
 #define OFFSET(l,k,j,i, num_l, num_k, num_j, num_i) ((( (l)*(num_k) + (k)) * (num_j) + (j))*(num_i) + (i) )
 
     const int INTERPOlATION_Dx = 2;
@@ -732,149 +1419,149 @@ void offset_and_dot_opencv(const Dtype* input_data, const Dtype* error_data,
     const int F_BATCH = 8;
     const int S_BATCH = 1;
 
-    for (int n = 0; n < num_; ++n) {
-        //printf("n=%d\n",n);
+    // size of strided output
+    const int strided_width_out = (width_out_ - 1) / stride + 1;
+    const int strided_height_out = (height_out_ - 1) / stride + 1;
 
-        // X == interm_data
-        int X_width = width_;
-        int X_height = conv_in_channels_ * height_;
-        const Dtype* X_ptr = input_data + n * conv_in_channels_ * width_ * height_;
+    // Y == top_data (for NHWC each channel is accessed as [height_out_, width_out_] image with Y_step between pixels)
+    int Y_width = strided_width_out;
+    int Y_height = error_channels_last ? strided_height_out : conv_out_channels_ * strided_height_out;
+    int Y_step = error_channels_last ? conv_out_channels_ : 1;
 
-        // Y == top_data
-        int Y_width = width_out_;
-        int Y_height = conv_out_channels_ * height_out_;
-        Dtype* Y_ptr = (Dtype*)error_data + n * conv_out_channels_ * width_out_  * height_out_;
+    int border_x = width_/2 - width_out_/2;
+    int border_y = height_/2 - height_out_/2;
 
-        //cv::Mat interm_mat(conv_in_channels_ * height_,width_, CV_32F, (Dtype*)input_data + n * conv_in_channels_ * width_ * height_);
-        //cv::Mat top_mat_org(conv_out_channels_ * height_out_, width_out_, CV_32F, (Dtype*)error_data + n * conv_out_channels_ * width_out_  * height_out_);
+    border_x = border_x > 0 ? border_x : 0;
+    border_y = border_y > 0 ? border_y : 0;
 
-        // copy top matrix to another buffer so that we do not modify original data
-        //cv::Mat top_mat;
-        //top_mat_org.copyTo(top_mat);
+    Dtype* error_data_new = NULL;
 
-        // set right/bottom edges to zero if we should ignore them (for GPU compatability)
-        if (ignore_edge_gradients) {
+    // set right/bottom edges to zero if we should ignore them (for GPU compatability)
+    // (copy top matrix to another buffer so that we do not modify original data)
+    if (ignore_edge_gradients) {
 
-            Dtype* Y_ptr_new = (Dtype*)malloc(Y_width*Y_height*sizeof(Dtype));
-            memcpy(Y_ptr_new, Y_ptr, Y_width*Y_height*sizeof(Dtype));
+        bool disable_last_column = false;
+        bool disable_last_row = false;
 
-            for (int f = 0; f< conv_out_channels_; ++f) {
+        if (strided_width_out >= 64) disable_last_column = strided_width_out % 64 == 0 ? true : false;
+        else if (strided_width_out >= 32) disable_last_column = strided_width_out % 32 == 0 ? true : false;
+        else if (strided_width_out >= 16) disable_last_column = strided_width_out % 16 == 0 ? true : false;
+        else if (strided_width_out >= 8) disable_last_column = strided_width_out % 8 == 0 ? true : false;
 
-                int access_f_offset = f * height_out_;
+        if (strided_height_out >= 64) disable_last_row = strided_height_out % 64 == 0 ? true : false;
+        else if (strided_height_out >= 32) disable_last_row = strided_height_out % 32 == 0 ? true : false;
+        else if (strided_height_out >= 16) disable_last_row = strided_height_out % 16 == 0 ? true : false;
+        else if (strided_height_out >= 8) disable_last_row = strided_height_out % 8 == 0 ? true : false;
 
-                bool disable_last_column = false;
-                bool disable_last_row = false;
+        const int error_count = num_ * conv_out_channels_ * strided_height_out * strided_width_out;
 
-                if (width_out_ >= 64) disable_last_column = width_out_ % 64 == 0 ? true : false;
-                else if (width_out_ >= 32) disable_last_column = width_out_ % 32 == 0 ? true : false;
-                else if (width_out_ >= 16) disable_last_column = width_out_ % 16 == 0 ? true : false;
-                else if (width_out_ >= 8) disable_last_column = width_out_ % 8 == 0 ? true : false;
+        error_data_new = new Dtype[error_count];
+        memcpy(error_data_new, error_data, error_count * sizeof(Dtype));
 
-                if (height_out_ >= 64) disable_last_row = height_out_ % 64 == 0 ? true : false;
-                else if (height_out_ >= 32) disable_last_row = height_out_ % 32 == 0 ? true : false;
-                else if (height_out_ >= 16) disable_last_row = height_out_ % 16 == 0 ? true : false;
-                else if (height_out_ >= 8) disable_last_row = height_out_ % 8 == 0 ? true : false;
+        // all images and output channels have the same size so we can treat them as one [num_ * conv_out_channels_] stack
+        for (int nf = 0; nf < num_ * conv_out_channels_; ++nf) {
 
-                //if (disable_last_column) top_mat(cv::Rect(width_out_-1, access_f_offset, 1, height_out_ )) = 0.0f;
-                //if (disable_last_row) top_mat(cv::Rect(0, height_out_-1 + access_f_offset , width_out_, 1)) = 0.0f;
+            Dtype* error_plane = error_data_new + get_plane_offset(nf, conv_out_channels_, Y_width * strided_height_out, error_channels_last);
 
-                if (disable_last_column) {
-                    for (int i = 0; i < Y_height; ++i) {
-                        Y_ptr_new[OFFSET(0,0,access_f_offset + i,  width_out_-1,
-                                         1,1, Y_height,Y_width)] = 0;
-                    }
+            if (disable_last_column) {
+                for (int i = 0; i < strided_height_out; ++i) {
+                    error_plane[OFFSET(0,0,i, Y_width-1, 1,1, strided_height_out,Y_width) * Y_step] = 0;
                 }
-                if (disable_last_row) {
-                    for (int i = 0; i < Y_width; ++i) {
-                        Y_ptr_new[OFFSET(0,0,height_out_-1 + access_f_offset, i,
-                                         1,1, Y_height,Y_width)] = 0;
-                    }
+            }
+            if (disable_last_row) {
+                for (int i = 0; i < Y_width; ++i) {
+                    error_plane[OFFSET(0,0,strided_height_out-1, i, 1,1, strided_height_out,Y_width) * Y_step] = 0;
                 }
             }
-
-            Y_ptr = Y_ptr_new;
         }
-        for (int f_offset = 0; f_offset < conv_out_channels_; f_offset+=F_BATCH) {
-            for (int s_offset = 0; s_offset < conv_in_channels_; s_offset+=S_BATCH) {
-                for (int ff = 0; ff < F_BATCH; ff++) {
-                    for (int ss = 0; ss < S_BATCH; ss++) {
-                        int f = f_offset + ff;
-                        int s = s_offset + ss;
 
-                        int access_f_offset = f * height_out_;
-                        int access_s_offset = s * height_;
+        error_data = error_data_new;
+    }
+
+    // each (F_BATCH block, s) job accumulates gradients of its own parameters over all images, so jobs can run in
+    // parallel without locking and the order of summation does not depend on the number of threads
+    const int num_f_blocks = (conv_out_channels_ + F_BATCH - 1) / F_BATCH;
+    const int num_s_blocks = (conv_in_channels_ + S_BATCH - 1) / S_BATCH;
+
+#pragma omp parallel for schedule(dynamic) num_threads(num_threads)
+    for (int job = 0; job < num_f_blocks * num_s_blocks; ++job) {
+        const int f_offset = (job / num_s_blocks) * F_BATCH;
+        const int s_offset = (job % num_s_blocks) * S_BATCH;
+        const int f_batch = std::min(F_BATCH, conv_out_channels_ - f_offset);
+        const int s_batch = std::min(S_BATCH, conv_in_channels_ - s_offset);
+
+        for (int n = 0; n < num_; ++n) {
+
+            // X == interm_data
+            int X_width = width_;
+            int X_height = conv_in_channels_ * height_;
+            const Dtype* X_ptr = input_data + n * conv_in_channels_ * width_ * height_;
+
+            const Dtype* Y_ptr = error_data + n * conv_out_channels_ * strided_width_out  * strided_height_out;
 
-                        for (int g = 0; g < NUM_GAUSS; ++g) {
+            for (int ff = 0; ff < f_batch; ff++) {
+                for (int ss = 0; ss < s_batch; ss++) {
+                    int f = f_offset + ff;
+                    int s = s_offset + ss;
 
-                            int param_output_offset = OFFSET(0, s,g,f, 1, conv_in_channels_, NUM_GAUSS, conv_out_channels_);
+                    int access_f_offset = error_channels_last ? 0 : f * strided_height_out;
+                    int access_s_offset = s * height_;
 
-                            int param_offset = -1;
-                            if (INPUT_FORMAT == DAUConvForward<float>::SGF)
-                                param_offset = OFFSET(0, s,g,f, 1, conv_in_channels_, NUM_GAUSS, conv_out_channels_);
-                            else if (INPUT_FORMAT == DAUConvForward<float>::FGS)
-                                param_offset = OFFSET(0, f,g,s, 1, conv_out_channels_, NUM_GAUSS, conv_in_channels_);
+                    const Dtype* Y_f_ptr = error_channels_last ? Y_ptr + f : Y_ptr;
 
-                            float w = filter_weights[param_offset];
+                    for (int g = 0; g < NUM_GAUSS; ++g) {
 
-                            float offset_x = filter_offsets_float_mu1[param_offset] - (offsets_already_centered == false ? kernel_width/2 : 0);
-                            float offset_y = filter_offsets_float_mu2[param_offset] - (offsets_already_centered == false ? kernel_height/2 : 0);
+                        int param_output_offset = OFFSET(0, s,g,f, 1, conv_in_channels_, NUM_GAUSS, conv_out_channels_);
 
-                            int offset_x_int = floor(offset_x);
-                            int offset_y_int = floor(offset_y);
+                        int param_offset = -1;
+                        if (INPUT_FORMAT == DAUConvForward<float>::SGF)
+                            param_offset = OFFSET(0, s,g,f, 1, conv_in_channels_, NUM_GAUSS, conv_out_channels_);
+                        else if (INPUT_FORMAT == DAUConvForward<float>::FGS)
+                            param_offset = OFFSET(0, f,g,s, 1, conv_out_channels_, NUM_GAUSS, conv_in_channels_);
 
-                            float interpol_off_x = offset_x - offset_x_int;
-                            float interpol_off_y = offset_y - offset_y_int;
+                        float offset_x = filter_offsets_float_mu1[param_offset] - (offsets_already_centered == false ? kernel_width/2 : 0);
+                        float offset_y = filter_offsets_float_mu2[param_offset] - (offsets_already_centered == false ? kernel_height/2 : 0);
 
-                            for (int dy = 0; dy < INTERPOlATION_Dy; ++dy) {
-                                for (int dx = 0; dx < INTERPOlATION_Dx; ++dx) {
+                        int offset_x_int = floor(offset_x);
+                        int offset_y_int = floor(offset_y);
 
-                                    int access_x_off = offset_x_int + dx;
-                                    int access_y_off = offset_y_int + dy;
+                        float interpol_off_x = offset_x - offset_x_int;
+                        float interpol_off_y = offset_y - offset_y_int;
 
-                                    float interpol_w = 1;
+                        for (int dy = 0; dy < INTERPOlATION_Dy; ++dy) {
+                            for (int dx = 0; dx < INTERPOlATION_Dx; ++dx) {
 
-                                    interpol_w *= (dx == 0 ? (1-interpol_off_x) : interpol_off_x);
-                                    interpol_w *= (dy == 0 ? (1-interpol_off_y) : interpol_off_y);
+                                int access_x_off = offset_x_int + dx;
+                                int access_y_off = offset_y_int + dy;
 
-                                    int copy_width = std::min(width_out_ + access_x_off, width_out_ - access_x_off);
-                                    int copy_height = std::min(height_out_ + access_y_off, height_out_ - access_y_off);
+                                float interpol_w = 1;
 
-                                    // X == interm_data
-                                    int X_offset_x = std::max(0, access_x_off);
-                                    int X_offset_y = std::max(0, access_y_off) + access_s_offset;
+                                interpol_w *= (dx == 0 ? (1-interpol_off_x) : interpol_off_x);
+                                interpol_w *= (dy == 0 ? (1-interpol_off_y) : interpol_off_y);
 
-                                    // Y == top_data
-                                    int Y_offset_x = std::max(0, -access_x_off);
-                                    int Y_offset_y = std::max(0, -access_y_off) + access_f_offset;
-                                    /*
-                                    cv::Rect interm_roi(std::max(0, access_x_off),
-                                                        std::max(0, access_y_off) + access_s_offset,
-                                                        std::min(width_out_ + access_x_off, width_out_ - access_x_off),
-                                                        std::min(height_out_ + access_y_off, height_out_ - access_y_off));
+                                int Y_start_x, Y_end_x, Y_start_y, Y_end_y;
 
-                                    cv::Rect top_roi(std::max(0, -access_x_off),
-                                                     std::max(0, -access_y_off) + access_f_offset,
-                                                     std::min(width_out_ + access_x_off, width_out_ - access_x_off),
-                                                     std::min(height_out_ + access_y_off, height_out_ - access_y_off));
-                                    */
+                                get_strided_copy_range(access_x_off, width_out_, strided_width_out, stride, &Y_start_x, &Y_end_x);
+                                get_strided_copy_range(access_y_off, height_out_, strided_height_out, stride, &Y_start_y, &Y_end_y);
 
-                                    //if (top_roi.width > 0 && top_roi.height > 0 && interm_roi.width > 0 && interm_roi.height > 0) {
-                                    if (copy_width > 0 && copy_height > 0) {
+                                int copy_width = Y_end_x - Y_start_x;
+                                int copy_height = Y_end_y - Y_start_y;
 
-                                        Dtype tmp = cpu_dot_elementwise_skip(X_ptr, X_width, X_height, X_offset_x, X_offset_y,
-                                                                             Y_ptr, Y_width, Y_height, Y_offset_x, Y_offset_y,
-                                                                             copy_width, copy_height);
+                                // X == interm_data
+                                int X_offset_x = border_x + Y_start_x * stride + access_x_off;
+                                int X_offset_y = border_y + Y_start_y * stride + access_y_off + access_s_offset;
 
-                                        //output_data[param_output_offset] += interpol_w * top_mat(top_roi).dot(interm_mat(interm_roi));
-                                        output_data[param_output_offset] += interpol_w * tmp;
+                                // Y == top_data
+                                int Y_offset_x = Y_start_x;
+                                int Y_offset_y = Y_start_y + access_f_offset;
 
+                                if (copy_width > 0 && copy_height > 0 && interpol_w != 0) {
 
-                                        /*if (f == 0 && s == 0 && g == 0)
-                                        {
-                                            printf("sum of f,s,g=%d,%d,%d, n=%d from ", f,s,g, n);
-                                            std::cout << "sum " << output_data[param_output_offset] << " and top " << top_mat(top_roi) << " with top roi: " << top_roi  << " and inter roi: " << interm_roi << " and inter val " << interm_mat(interm_roi) << " and w: " << interpol_w << std::endl;
-                                        }*/
-                                    }
+                                    Dtype tmp = cpu_dot_elementwise_skip(X_ptr, X_width, X_height, X_offset_x, X_offset_y,
+                                                                         Y_f_ptr, Y_width, Y_height, Y_offset_x, Y_offset_y,
+                                                                         copy_width, copy_height, Y_step, stride);
+
+                                    output_data[param_output_offset] += interpol_w * tmp;
                                 }
                             }
                         }
@@ -882,10 +1569,10 @@ void offset_and_dot_opencv(const Dtype* input_data, const Dtype* error_data,
                 }
             }
         }
-
-        if (ignore_edge_gradients)
-            delete Y_ptr;
     }
+
+    if (error_data_new != NULL)
+        delete[] error_data_new;
 }
 template <typename Dtype>
 void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* top_error, const vector<int>& top_shape, bool propagate_down,
@@ -908,10 +1595,10 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
     Dtype* bwd_gradients_data = this->temp_bwd_gradients();
 
     // get filters for back-propagation
-    const Dtype* deriv_error_kernel = this->get_deriv_kernel_error(stream_[0]);
+    const Dtype* deriv_error_kernel = this->get_deriv_kernel_error();
 
     // get filters for param gradients
-    const Dtype* deriv_kernels_data  = this->get_deriv_kernel_params(stream_[0]);
+    const Dtype* deriv_kernels_data  = this->get_deriv_kernel_params();
 
     // intermediate data for blurred input
     Dtype* interm_data = this->temp_interm_buffer();
@@ -919,6 +1606,39 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
     // transform all four accumulated gradients into seperabe buffers of size [S x G x F]
     int param_size = this->units_per_channel * this->conv_in_channels_ * this->conv_out_channels_;
 
+    const int num_threads = this->get_num_cpu_threads();
+
+    // number of bytes in input, output and in single blurred input (blurred error has the same size as input)
+    const long bottom_bytes = (long)this->batch_num_ * this->bottom_dim_ * sizeof(Dtype);
+    const long top_bytes = (long)this->batch_num_ * this->top_dim_ * sizeof(Dtype);
+
+    DAUConvPhaseTimer phase_timer(this->profile_name_);
+
+    // error is first back-propagated through activation (in the same pass as gradient of bias is collected), so that
+    // the rest of the backward pass sees the error of the convolution itself
+    vector<Dtype> activation_error;
+
+    const bool compute_bias_grad = this->bias_term_ && params_propagate_down.size() > 4 && params_propagate_down[4];
+
+    if (this->activation_ != ACTIVATION_NONE || compute_bias_grad) {
+        M_Assert(this->activation_ == ACTIVATION_NONE || top_data != NULL, "Backward_cpu with activation requires top_data (activated output)");
+
+        phase_timer.start(DAU_PHASE_BWD_BIAS, (this->activation_ != ACTIVATION_NONE ? 3 : 1) * top_bytes);
+
+        if (this->activation_ != ACTIVATION_NONE)
+            activation_error.resize((size_t)this->batch_num_ * this->top_dim_);
+
+        bias_activation_backward_cpu(top_data, top_error, activation_error.empty() ? NULL : activation_error.data(),
+                                     compute_bias_grad ? bias_diff : NULL,
+                                     this->batch_num_, this->conv_out_channels_, this->height_out_, this->width_out_,
+                                     this->activation_ != ACTIVATION_NONE,
+                                     this->activation_ == ACTIVATION_LEAKY_RELU ? this->activation_negative_slope_ : (Dtype)0,
+                                     num_threads, this->channels_last_);
+
+        if (activation_error.empty() == false)
+            top_error = activation_error.data();
+    }
+
     {
         // input data
         //const Dtype* bottom_data = bottom[i]->cpu_data();
@@ -933,32 +1653,89 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
         if (propagate_down) {
             // we need to do pre-filtering of the error values
 
-            // make sure col_buffer is big enough
-
-            Dtype* col_buff = this->temp_col_buffer();
-
-            int border_x = this->width_/2 - this->width_out_/2;
-            int border_y = this->height_/2 - this->height_out_/2;
+            int border_x = this->width_/2 - this->width_out_full_/2;
+            int border_y = this->height_/2 - this->height_out_full_/2;
 
             border_x = border_x > 0 ? border_x : 0;
             border_y = border_y > 0 ? border_y : 0;
 
-            // over all top errors where each output channel is considered individual sample as well
-            for (int n = 0; n < this->batch_num_ * this->conv_out_channels_; ++n) {
+            // with stride > 1 error is blurred as if it was up-sampled to stride=1 output size with zeros
+            // inserted between computed pixels
+            vector<Dtype> kernel_col(this->aggregation.kernel_h_), kernel_row(this->aggregation.kernel_w_);
+
+            const int error_step = this->channels_last_ ? this->conv_out_channels_ : 1;
+
+            phase_timer.start(DAU_PHASE_BWD_BLUR_ERROR, top_bytes + (long)this->batch_num_ * this->conv_out_channels_ * this->height_ * this->width_ * sizeof(Dtype));
+
+            const bool is_separable = separable_kernel_factors_cpu(deriv_error_kernel, this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                                                                   kernel_col.data(), kernel_row.data());
+
+            if (this->use_fft_blur(is_separable)) {
+
+                FFTConv2dPlan<Dtype> fft_plan;
+                fft_conv2d_plan_cpu(deriv_error_kernel, 1, this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                                    this->height_out_full_, this->width_out_full_,
+                                    this->aggregation.pad_h_ + border_y, this->aggregation.pad_w_ + border_x,
+                                    this->height_, this->width_, &fft_plan);
 
-                im2col_cpu(top_error + n * (this->height_out_* this->width_out_), 1, this->height_out_, this->width_out_,
-                           this->aggregation.kernel_h_, this->aggregation.kernel_w_,
-                           this->aggregation.pad_h_ + border_y, this->aggregation.pad_w_ + border_x,
-                           this->aggregation.stride_h_, this->aggregation.stride_w_,
-                           1,1, col_buff);
+#pragma omp parallel num_threads(num_threads)
+                {
+                    // each thread uses its own workspace
+                    vector<Dtype> fft_buff(fft_plan.workspace_size());
 
-                caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, 1 , this->height_ * this->width_, this->aggregation.kernel_h_ * this->aggregation.kernel_w_,
-                                      (Dtype)1., deriv_error_kernel, col_buff,
-                                      (Dtype)0., interm_data + n * this->width_ * this->height_ );
+#pragma omp for schedule(static)
+                    for (int n = 0; n < this->batch_num_ * this->conv_out_channels_; ++n) {
+
+                        fft_conv2d_cpu(fft_plan, top_error + get_plane_offset(n, this->conv_out_channels_, this->height_out_* this->width_out_, this->channels_last_),
+                                       interm_data + n * this->width_ * this->height_, 0, fft_buff.data(), error_step, this->stride_w_);
+                    }
+                }
+            } else if (is_separable) {
+
+#pragma omp parallel num_threads(num_threads)
+                {
+                    // each thread uses its own row buffer
+                    vector<Dtype> row_buff(this->width_out_full_);
+
+                    // over all top errors where each output channel is considered individual sample as well
+#pragma omp for schedule(static)
+                    for (int n = 0; n < this->batch_num_ * this->conv_out_channels_; ++n) {
+
+                        separable_conv2d_cpu(top_error + get_plane_offset(n, this->conv_out_channels_, this->height_out_* this->width_out_, this->channels_last_),
+                                             this->height_out_full_, this->width_out_full_,
+                                             kernel_col.data(), this->aggregation.kernel_h_,
+                                             kernel_row.data(), this->aggregation.kernel_w_,
+                                             this->aggregation.pad_h_ + border_y, this->aggregation.pad_w_ + border_x,
+                                             this->height_, this->width_,
+                                             row_buff.data(), interm_data + n * this->width_ * this->height_, error_step, this->stride_w_);
+                    }
+                }
+            } else {
+                M_Assert(this->stride_h_ == 1 && this->stride_w_ == 1, "Backward_cpu with stride>1 requires separable pre-filtering kernels");
+
+                // make sure col_buffer is big enough
+
+                Dtype* col_buff = this->temp_col_buffer();
+
+                // over all top errors where each output channel is considered individual sample as well
+                for (int n = 0; n < this->batch_num_ * this->conv_out_channels_; ++n) {
+
+                    im2col_cpu(top_error + get_plane_offset(n, this->conv_out_channels_, this->height_out_* this->width_out_, this->channels_last_),
+                               1, this->height_out_, this->width_out_,
+                               this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                               this->aggregation.pad_h_ + border_y, this->aggregation.pad_w_ + border_x,
+                               this->aggregation.stride_h_, this->aggregation.stride_w_,
+                               1,1, col_buff, error_step);
+
+                    caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, 1 , this->height_ * this->width_, this->aggregation.kernel_h_ * this->aggregation.kernel_w_,
+                                          (Dtype)1., deriv_error_kernel, col_buff,
+                                          (Dtype)0., interm_data + n * this->width_ * this->height_ );
+                }
             }
 
             // then use our custom kernel for forwarding, however we need to transpose kernels, which in our case means
             // that we need to rotate mu1,mu2 locations
+            phase_timer.start(DAU_PHASE_BWD_BACKPROP_ERROR, (long)this->batch_num_ * this->conv_out_channels_ * this->height_ * this->width_ * sizeof(Dtype) + bottom_bytes);
 
             // we can re-use bwd_gradients_data buffer for mu1 and mu2 that are rotated
             Dtype *param_mu1_backprop = this->temp_param_buffer() + 0 * param_size;
@@ -986,46 +1763,144 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
                                   this->batch_num_, this->conv_out_channels_, this->units_per_channel, this->conv_in_channels_,
                                   this->width_, this->height_,
                                   this->width_, this->height_, this->kernel_w_, this->kernel_h_,
-                                  this->offsets_already_centered_, DAUConvForward<float>::FGS);
+                                  this->offsets_already_centered_, DAUConvForward<float>::FGS, num_threads, this->channels_last_);
 
 
         }
-        // Gradient w.r.t. bias.
-        if (this->bias_term_ && params_propagate_down[4]) {
-
-            Dtype* bias_diff = this->param_bias_grad();
-            for (int n = 0; n < this->batch_num_; ++n) {
-                this->backward_cpu_bias(bias_diff, top_error + n * this->top_dim_);
-            }
+        // Gradient w.r.t w,mu1,mu2 and sigma (only for requested parameters since each one needs its own pre-filtered
+        // input and its own pass over the top error)
+        vector<bool> is_needed_kernel(this->NUM_K);
+        int num_needed_kernels = 0;
+        for (int k = 0; k < this->NUM_K; ++k) {
+            is_needed_kernel[k] = k < params_propagate_down.size() && params_propagate_down[k];
+            num_needed_kernels += is_needed_kernel[k] ? 1 : 0;
         }
 
-        // Gradient w.r.t w,mu1,mu2 and sigma
-        if (params_propagate_down[0]) {
+        // derivative kernel of w is the same gaussian as used in Forward_cpu so its blurred input can be re-used
+        const bool use_saved_blur = this->saved_blurred_input_ != NULL && is_needed_kernel[0];
+
+        vector<bool> is_blurred_kernel(is_needed_kernel);
+        if (use_saved_blur)
+            is_blurred_kernel[0] = false;
+
+        const int num_blurred_kernels = num_needed_kernels - (use_saved_blur ? 1 : 0);
+
+        if (num_needed_kernels > 0) {
 
             // first pre-filter input data with appropriate derivative filters
             int size_batch_k = this->batch_num_ * this->conv_in_channels_ * this->width_ * this->height_;
 
-            Dtype* col_buff = this->temp_col_buffer();
+            const int deriv_kernel_size = this->aggregation.kernel_h_ * this->aggregation.kernel_w_;
 
-            for (int n = 0; n < this->batch_num_ * this->conv_in_channels_; ++n) {
+            // derivative kernels for w, mu1 and mu2 are separable, but kernel for sigma is not, so use im2col + gemm
+            // only for kernels that cannot be factorized
+            vector<Dtype> kernel_col(this->NUM_K * this->aggregation.kernel_h_), kernel_row(this->NUM_K * this->aggregation.kernel_w_);
+            vector<bool> is_separable_kernel(this->NUM_K);
 
-                im2col_cpu(bottom_data + n * (this->height_* this->width_), 1, this->height_, this->width_,
-                           this->aggregation.kernel_h_, this->aggregation.kernel_w_,
-                           this->aggregation.pad_h_, this->aggregation.pad_w_,
-                           this->aggregation.stride_h_, this->aggregation.stride_w_,
-                           1,1, col_buff);
+            // kernels [first_fft_kernel, last_fft_kernel] are blurred with FFT to share transform of the input
+            int first_fft_kernel = this->NUM_K, last_fft_kernel = -1;
 
-                for (int k = 0; k < this->NUM_K; ++k) {
-                    caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, 1 , this->height_ * this->width_, this->aggregation.kernel_h_ * this->aggregation.kernel_w_,
-                                          (Dtype)1., deriv_kernels_data + k * (this->aggregation.kernel_h_ * this->aggregation.kernel_w_) , col_buff,
-                                          (Dtype)0., interm_data + n * this->width_ * this->height_ + k * size_batch_k);
+            const int input_step = this->channels_last_ ? this->conv_in_channels_ : 1;
+
+            phase_timer.start(DAU_PHASE_BWD_BLUR_INPUT, bottom_bytes + num_blurred_kernels * bottom_bytes);
+
+            bool use_col_buffer = false;
+            for (int k = 0; k < this->NUM_K; ++k) {
+                if (is_blurred_kernel[k] == false)
+                    continue;
+
+                is_separable_kernel[k] = separable_kernel_factors_cpu(deriv_kernels_data + k * deriv_kernel_size,
+                                                                      this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                                                                      kernel_col.data() + k * this->aggregation.kernel_h_,
+                                                                      kernel_row.data() + k * this->aggregation.kernel_w_);
+                if (this->use_fft_blur(is_separable_kernel[k])) {
+                    first_fft_kernel = std::min(first_fft_kernel, k);
+                    last_fft_kernel = std::max(last_fft_kernel, k);
+                }
+            }
+            vector<bool> is_fft_kernel(this->NUM_K);
+            for (int k = 0; k < this->NUM_K; ++k) {
+                is_fft_kernel[k] = k >= first_fft_kernel && k <= last_fft_kernel;
+                use_col_buffer = use_col_buffer || (is_blurred_kernel[k] && !is_separable_kernel[k] && !is_fft_kernel[k]);
+            }
+
+            if (first_fft_kernel <= last_fft_kernel) {
+
+                FFTConv2dPlan<Dtype> fft_plan;
+                fft_conv2d_plan_cpu(deriv_kernels_data + first_fft_kernel * deriv_kernel_size, last_fft_kernel - first_fft_kernel + 1,
+                                    this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                                    this->height_, this->width_,
+                                    this->aggregation.pad_h_, this->aggregation.pad_w_,
+                                    this->height_, this->width_, &fft_plan);
+
+#pragma omp parallel num_threads(num_threads)
+                {
+                    // each thread uses its own workspace
+                    vector<Dtype> fft_buff(fft_plan.workspace_size());
+
+#pragma omp for schedule(static)
+                    for (int n = 0; n < this->batch_num_ * this->conv_in_channels_; ++n) {
+
+                        fft_conv2d_cpu(fft_plan, bottom_data + get_plane_offset(n, this->conv_in_channels_, this->height_* this->width_, this->channels_last_),
+                                       interm_data + n * this->width_ * this->height_ + first_fft_kernel * size_batch_k, size_batch_k,
+                                       fft_buff.data(), input_step);
+                    }
+                }
+            }
+
+            // col_buffer is shared so only separable kernels can be processed in parallel
+            if (use_col_buffer) {
+
+                Dtype* col_buff = this->temp_col_buffer();
+
+                for (int n = 0; n < this->batch_num_ * this->conv_in_channels_; ++n) {
+
+                    im2col_cpu(bottom_data + get_plane_offset(n, this->conv_in_channels_, this->height_* this->width_, this->channels_last_),
+                               1, this->height_, this->width_,
+                               this->aggregation.kernel_h_, this->aggregation.kernel_w_,
+                               this->aggregation.pad_h_, this->aggregation.pad_w_,
+                               this->aggregation.stride_h_, this->aggregation.stride_w_,
+                               1,1, col_buff, input_step);
+
+                    for (int k = 0; k < this->NUM_K; ++k) {
+                        if (is_blurred_kernel[k] && is_separable_kernel[k] == false && is_fft_kernel[k] == false) {
+                            caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, 1 , this->height_ * this->width_, deriv_kernel_size,
+                                                  (Dtype)1., deriv_kernels_data + k * deriv_kernel_size, col_buff,
+                                                  (Dtype)0., interm_data + n * this->width_ * this->height_ + k * size_batch_k);
+                        }
+                    }
                 }
             }
+
+#pragma omp parallel num_threads(num_threads)
+            {
+                // each thread uses its own row buffer
+                vector<Dtype> row_buff(this->width_);
+
+#pragma omp for schedule(static)
+                for (int n = 0; n < this->batch_num_ * this->conv_in_channels_; ++n) {
+                    for (int k = 0; k < this->NUM_K; ++k) {
+                        if (is_blurred_kernel[k] && is_separable_kernel[k] && is_fft_kernel[k] == false) {
+                            separable_conv2d_cpu(bottom_data + get_plane_offset(n, this->conv_in_channels_, this->height_* this->width_, this->channels_last_),
+                                                 this->height_, this->width_,
+                                                 kernel_col.data() + k * this->aggregation.kernel_h_, this->aggregation.kernel_h_,
+                                                 kernel_row.data() + k * this->aggregation.kernel_w_, this->aggregation.kernel_w_,
+                                                 this->aggregation.pad_h_, this->aggregation.pad_w_,
+                                                 this->height_, this->width_,
+                                                 row_buff.data(), interm_data + n * this->width_ * this->height_ + k * size_batch_k, input_step);
+                        }
+                    }
+                }
+            }
+            phase_timer.start(DAU_PHASE_BWD_OFFSET_DOT, num_needed_kernels * (bottom_bytes + top_bytes));
+
             Dtype* top_error_expended = NULL;
             Dtype* top_error_ex = (Dtype*)top_error;
 
-            if (this->width_out_ != this->width_ && this->height_out_ != this->height_) {
+            if (this->stride_h_ == 1 && this->stride_w_ == 1 &&
+                this->width_out_ != this->width_ && this->height_out_ != this->height_) {
                 // extend top data if we have top data of not the same size
+                // (with stride > 1 offset_and_dot_opencv handles border directly)
 
                 int border_x = this->width_/2 - this->width_out_/2;
                 int border_y = this->height_/2 - this->height_out_/2;
@@ -1033,7 +1908,8 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
                 border_x = border_x > 0 ? border_x : 0;
                 border_y = border_y > 0 ? border_y : 0;
 
-                vector<int> new_shape = {top_shape[this->channel_axis_-1], top_shape[this->channel_axis_], top_shape[this->channel_axis_+1] + 2*border_y, top_shape[this->channel_axis_+2] + 2*border_x};
+                // expanded error is kept in the same format as top error (NCHW or NHWC)
+                vector<int> new_shape = {this->batch_num_, this->conv_out_channels_, this->height_out_ + 2*border_y, this->width_out_ + 2*border_x};
                 int new_count = std::accumulate(new_shape.begin(), new_shape.end(), 1, std::multiplies<int>());
                 top_error_expended = new Dtype[new_count];
                 //top_error_expended.Reshape(top_shape[this->channel_axis_-1], top_shape[this->channel_axis_], top_shape[this->channel_axis_+1] + 2*border_y, top_shape[this->channel_axis_+2] + 2*border_x);
@@ -1044,10 +1920,16 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
 
                 for (int n = 0; n < new_shape[0]; ++n) {
                     for (int c = 0; c < new_shape[1]; ++c) {
-                        for (int h = 0; h < top_shape[this->channel_axis_+1]; ++h) {
-                            for (int w = 0; w < top_shape[this->channel_axis_+2]; ++w) {
-                                int in_offset = OFFSET(n,c,h,w, top_shape[0], top_shape[1], top_shape[2], top_shape[3]);
-                                int out_offset = OFFSET(n,c,border_y+h,border_x+w, new_shape[0], new_shape[1], new_shape[2], new_shape[3]);
+                        for (int h = 0; h < this->height_out_; ++h) {
+                            for (int w = 0; w < this->width_out_; ++w) {
+                                int in_offset, out_offset;
+                                if (this->channels_last_) {
+                                    in_offset = OFFSET(n,h,w,c, this->batch_num_, this->height_out_, this->width_out_, this->conv_out_channels_);
+                                    out_offset = OFFSET(n,border_y+h,border_x+w,c, new_shape[0], new_shape[2], new_shape[3], new_shape[1]);
+                                } else {
+                                    in_offset = OFFSET(n,c,h,w, this->batch_num_, this->conv_out_channels_, this->height_out_, this->width_out_);
+                                    out_offset = OFFSET(n,c,border_y+h,border_x+w, new_shape[0], new_shape[1], new_shape[2], new_shape[3]);
+                                }
 
                                 top_error_ex[out_offset] = top_error[in_offset];
                             }
@@ -1056,18 +1938,26 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
                 }
             }
 
+            // offset_and_dot_opencv accumulates into output so make sure we start from zero
+            memset(bwd_gradients_data, 0, sizeof(Dtype) * this->NUM_K * param_size);
+
             // then collect gradients by shifting convolved bottom input data and multiplying it with the top error data
             for (int k = 0; k < this->NUM_K; ++k) {
                 //printf("k=%d\n",k);
+                if (is_needed_kernel[k] == false)
+                    continue;
 
-                offset_and_dot_opencv(interm_data + k * size_batch_k,
+                offset_and_dot_opencv(k == 0 && use_saved_blur ? this->saved_blurred_input_ : interm_data + k * size_batch_k,
                                       top_error_ex,
                                       filter_weights, filter_offsets_float_mu1, filter_offsets_float_mu2,
                                       bwd_gradients_data + k * param_size,
                                       this->batch_num_, this->conv_in_channels_, this->units_per_channel, this->conv_out_channels_,
                                       this->width_, this->height_,
-                                      this->width_, this->height_, this->kernel_w_, this->kernel_h_,
-                                      this->ignore_edge_gradients_, this->offsets_already_centered_);
+                                      top_error_expended != NULL ? this->width_ : this->width_out_full_,
+                                      top_error_expended != NULL ? this->height_ : this->height_out_full_,
+                                      this->kernel_w_, this->kernel_h_,
+                                      this->ignore_edge_gradients_, this->offsets_already_centered_,
+                                      DAUConvForward<float>::SGF, num_threads, this->channels_last_, this->stride_w_);
 
             }
             if (top_error_expended != NULL)
@@ -1076,6 +1966,8 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
         }
     }
 
+    phase_timer.stop();
+
     // we need accumulate gradients them to the final buffer and add weights to some derivates
     if (params_propagate_down[0] || params_propagate_down[1] ||
         params_propagate_down[2] || params_propagate_down[3]) {
@@ -1091,27 +1983,53 @@ void BaseDAUConvLayer<Dtype>::Backward_cpu(const Dtype* top_data, const Dtype* t
         if (NUM_K > 2 && params_propagate_down[2]) caffe_axpy(param_size, (Dtype)1, bwd_gradients_data + 2 * param_size, param_mu2_diff); // mu2
         if (NUM_K > 3 && params_propagate_down[3]) caffe_axpy(param_size, (Dtype)1, bwd_gradients_data + 3 * param_size, param_sigma_diff); // sigma
 
-        // if we need to ignore last few gauss then make sure we do not update their parameters
+        // if we need to ignore last few gauss then make sure we do not update their parameters (gradients that
+        // are not requested may not be allocated)
         if (this->num_units_ignore > 0) {
-            this->set_last_n_gauss_to_zero(param_weights_diff, this->num_units_ignore);
-            this->set_last_n_gauss_to_zero(param_mu1_diff, this->num_units_ignore);
-            this->set_last_n_gauss_to_zero(param_mu2_diff, this->num_units_ignore);
-            this->set_last_n_gauss_to_zero(param_sigma_diff, this->num_units_ignore);
+            if (params_propagate_down[0]) this->set_last_n_gauss_to_zero_cpu(param_weights_diff, this->num_units_ignore);
+            if (params_propagate_down[1]) this->set_last_n_gauss_to_zero_cpu(param_mu1_diff, this->num_units_ignore);
+            if (params_propagate_down[2]) this->set_last_n_gauss_to_zero_cpu(param_mu2_diff, this->num_units_ignore);
+            if (params_propagate_down[3]) this->set_last_n_gauss_to_zero_cpu(param_sigma_diff, this->num_units_ignore);
+        }
+    }
+}
+
+template <typename Dtype>
+void BaseDAUConvLayer<Dtype>::set_last_n_gauss_to_zero_cpu(Dtype* array, int num_gauss_zero) {
+    if (array == NULL)
+        return;
+
+    for (int s = 0; s < this->conv_in_channels_; ++s) {
+        for (int g = this->units_per_channel - num_gauss_zero; g < this->units_per_channel; ++g) {
+            memset(array + OFFSET(0, s, g, 0, 1, this->conv_in_channels_, this->units_per_channel, this->conv_out_channels_),
+                   0, sizeof(Dtype) * this->conv_out_channels_);
         }
     }
 }
 
 template <typename Dtype>
 void BaseDAUConvLayer<Dtype>::forward_cpu_bias(Dtype* output, const Dtype* bias){
-    caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, this->conv_out_channels_,
-                          this->out_spatial_dim_, 1, (Dtype)1., bias, this->temp_bias_multiplier(),
-                          (Dtype)1., output);
+    if (this->channels_last_) {
+        // output is [out_spatial_dim_ x conv_out_channels_]
+        caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, this->out_spatial_dim_,
+                              this->conv_out_channels_, 1, (Dtype)1., this->temp_bias_multiplier(), bias,
+                              (Dtype)1., output);
+    } else {
+        caffe_cpu_gemm<Dtype>(CblasNoTrans, CblasNoTrans, this->conv_out_channels_,
+                              this->out_spatial_dim_, 1, (Dtype)1., bias, this->temp_bias_multiplier(),
+                              (Dtype)1., output);
+    }
 }
 
 template <typename Dtype>
 void BaseDAUConvLayer<Dtype>::backward_cpu_bias(Dtype* bias, const Dtype* input) {
-    caffe_cpu_gemv<Dtype>(CblasNoTrans, this->conv_out_channels_, this->out_spatial_dim_, 1.,
-                          input, this->temp_bias_multiplier(), 1., bias);
+    if (this->channels_last_) {
+        caffe_cpu_gemv<Dtype>(CblasTrans, this->out_spatial_dim_, this->conv_out_channels_, 1.,
+                              input, this->temp_bias_multiplier(), 1., bias);
+    } else {
+        caffe_cpu_gemv<Dtype>(CblasNoTrans, this->conv_out_channels_, this->out_spatial_dim_, 1.,
+                              input, this->temp_bias_multiplier(), 1., bias);
+    }
 }
 
 template <typename Dtype>
@@ -1127,6 +2045,9 @@ void BaseDAUConvLayer<Dtype>::backward_gpu_bias(Dtype* bias, const Dtype* input)
                           input, temp_bias_multiplier(), 1., bias, cublas_handle);
 }
 
+template void BaseDAUKernelCompute<float>::get_kernels_cpu(BaseDAUKernelParams<float>& input, BaseDAUKernelOutput<float>& output);
+template void BaseDAUKernelCompute<double>::get_kernels_cpu(BaseDAUKernelParams<double>& input, BaseDAUKernelOutput<double>& output);
+
 template class BaseDAUConvLayer<float>;
 template class BaseDAUConvLayer<double>;
 
@@ -18,18 +18,10 @@ void BaseDAUConvLayer<Dtype>::Forward_gpu(const Dtype* bottom_data, const vector
 	// - then perform forward pass with our custom kernel
 	// - optionally add bias
     M_Assert(this->is_data_on_gpu() == true, "Forward_gpu requires data on GPU, but is_data_on_gpu() returned false !");
+    M_Assert(this->activation_ == this->ACTIVATION_NONE, "Forward_gpu does not support activation (use Forward_cpu)");
 
 	clock_t start_t = clock();
 
-	// check if we need to do merging of components;
-	// make sure we check based on steps done in backpropagation and we should avoid merging if only forward is called (by default current_iteration_index=0 so start at second iter
-	bool do_merginig_optmization = this->unit_merge_iteration_step > 0 && (this->current_iteration_index + 1) % this->unit_merge_iteration_step == 0 ? true : false;
-
-	// if during training then merge components if needed
-	if (do_merginig_optmization) {
-		//merge_components();
-	}
-
     // before we get params we need to ensure params are within valid bounds
     {
         // we still need to ensure our values are within valid bounds
@@ -124,6 +116,7 @@ void BaseDAUConvLayer<Dtype>::Backward_gpu(const Dtype* top_data, const Dtype* t
 	//  - finally back-propagade the error by convolving top error with the rotated filters (we can use the same function as for forward-pass, but need to transpose mu1 and mu2 values)
 
     M_Assert(this->is_data_on_gpu() == true, "Backward_gpu requires data on GPU, but is_data_on_gpu() returned false !");
+    M_Assert(this->activation_ == this->ACTIVATION_NONE, "Backward_gpu does not support activation (use Backward_cpu)");
 
     this->current_iteration_index++;
     //return;
@@ -168,8 +161,9 @@ void BaseDAUConvLayer<Dtype>::Backward_gpu(const Dtype* top_data, const Dtype* t
             this->backward_gpu_bias(bias_diff, top_error);
 		}
 
-		// Gradient w.r.t w,mu1,mu2 and sigma
-		if (params_propagate_down[0]) {
+		// Gradient w.r.t w,mu1,mu2 and sigma (all are computed at once by backward_pass)
+		if (params_propagate_down[0] || params_propagate_down[1] ||
+			params_propagate_down[2] || params_propagate_down[3]) {
 			// TODO: if it is faster we should add zeroing to input prepare functions !!
 
 			// convolve with kernel
@@ -314,12 +308,13 @@ void BaseDAUConvLayer<Dtype>::Backward_gpu(const Dtype* top_data, const Dtype* t
 		if (NUM_K > 2 && params_propagate_down[2]) caffe_gpu_axpy(param_size, (Dtype)1, bwd_gradients_data + 2 * param_size, param_mu2_diff, cublas_handle); // mu2
 		if (NUM_K > 3 && params_propagate_down[3]) caffe_gpu_axpy(param_size, (Dtype)1, bwd_gradients_data + 3 * param_size, param_sigma_diff, cublas_handle); // sigma
 
-        // if we need to ignore last few gauss then make sure we do not update their parameters
+        // if we need to ignore last few gauss then make sure we do not update their parameters (gradients that
+        // are not requested may not be allocated)
         if (this->num_units_ignore > 0) {
-            this->set_last_n_gauss_to_zero(param_weights_diff, this->num_units_ignore);
-            this->set_last_n_gauss_to_zero(param_mu1_diff, this->num_units_ignore);
-            this->set_last_n_gauss_to_zero(param_mu2_diff, this->num_units_ignore);
-            this->set_last_n_gauss_to_zero(param_sigma_diff, this->num_units_ignore);
+            if (params_propagate_down[0]) this->set_last_n_gauss_to_zero(param_weights_diff, this->num_units_ignore);
+            if (params_propagate_down[1]) this->set_last_n_gauss_to_zero(param_mu1_diff, this->num_units_ignore);
+            if (params_propagate_down[2]) this->set_last_n_gauss_to_zero(param_mu2_diff, this->num_units_ignore);
+            if (params_propagate_down[3]) this->set_last_n_gauss_to_zero(param_sigma_diff, this->num_units_ignore);
         }
 	}
 
@@ -343,6 +338,9 @@ __global__ void set_last_n_gauss_to_zero_kernel(const int S, const int G, const
 
 template <typename Dtype>
 void BaseDAUConvLayer<Dtype>::set_last_n_gauss_to_zero(Dtype* array, int num_gauss_zero){
+    if (array == NULL)
+        return;
+
     set_last_n_gauss_to_zero_kernel<Dtype><<<CUDA_GET_BLOCKS(this->conv_in_channels_ * this->units_per_channel * this->conv_out_channels_), CUDA_NUM_THREADS>>>(this->conv_in_channels_, this->units_per_channel, this->conv_out_channels_, array, num_gauss_zero);
 }
 
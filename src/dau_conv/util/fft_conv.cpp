@@ -0,0 +1,276 @@
+#include <algorithm>
+#include <cmath>
+#include <cstring>
+
+#include "dau_conv/util/fft_conv.hpp"
+
+namespace DAUConvNet {
+
+namespace {
+
+int next_power_of_two(const int n) {
+  int size = 1;
+  while (size < n) {
+    size <<= 1;
+  }
+  return size;
+}
+
+// exp(-2*pi*i*k/n) for k in [0, n/2) as [real, imag] pairs
+template <typename Dtype>
+void get_twiddles(const int n, std::vector<Dtype>* twiddles) {
+  twiddles->resize(std::max(2, n));
+  for (int k = 0; k < n / 2; ++k) {
+    const double angle = -2.0 * M_PI * k / n;
+    (*twiddles)[2 * k] = std::cos(angle);
+    (*twiddles)[2 * k + 1] = std::sin(angle);
+  }
+}
+
+// In-place radix-2 FFT of n elements, where each element is a vector of
+// vec_len complex values (i.e. FFT along columns of [n x vec_len] data, or
+// along a single row with vec_len=1). Inverse transform is not scaled.
+template <typename Dtype>
+void fft_vectors(Dtype* data, const int n, const int vec_len,
+    const Dtype* twiddles, const bool inverse) {
+  const int row_size = 2 * vec_len;
+  // bit-reversal permutation
+  for (int i = 1, j = 0; i < n; ++i) {
+    int bit = n >> 1;
+    for (; j & bit; bit >>= 1) {
+      j ^= bit;
+    }
+    j ^= bit;
+    if (i < j) {
+      std::swap_ranges(data + i * row_size, data + (i + 1) * row_size,
+          data + j * row_size);
+    }
+  }
+  for (int len = 2; len <= n; len <<= 1) {
+    const int half = len / 2;
+    const int twiddle_step = n / len;
+    for (int i = 0; i < n; i += len) {
+      for (int j = 0; j < half; ++j) {
+        const Dtype w_re = twiddles[2 * j * twiddle_step];
+        const Dtype w_im = inverse ? -twiddles[2 * j * twiddle_step + 1]
+                                   : twiddles[2 * j * twiddle_step + 1];
+        Dtype* a = data + (i + j) * row_size;
+        Dtype* b = data + (i + j + half) * row_size;
+        for (int v = 0; v < row_size; v += 2) {
+          const Dtype t_re = b[v] * w_re - b[v + 1] * w_im;
+          const Dtype t_im = b[v] * w_im + b[v + 1] * w_re;
+          b[v] = a[v] - t_re;
+          b[v + 1] = a[v + 1] - t_im;
+          a[v] += t_re;
+          a[v + 1] += t_im;
+        }
+      }
+    }
+  }
+}
+
+// Splits FFT z [fft_w] of two real rows packed as (row_a + i*row_b) into
+// half-spectra of both rows [spectrum_w] (row_b may be NULL).
+template <typename Dtype>
+void unpack_real_spectra(const Dtype* z, const int fft_w,
+    const int spectrum_w, Dtype* row_a, Dtype* row_b) {
+  for (int k = 0; k < spectrum_w; ++k) {
+    const int k_neg = (fft_w - k) % fft_w;
+    const Dtype a = z[2 * k], b = z[2 * k + 1];
+    const Dtype c = z[2 * k_neg], d = z[2 * k_neg + 1];
+    row_a[2 * k] = (a + c) / 2;
+    row_a[2 * k + 1] = (b - d) / 2;
+    if (row_b != NULL) {
+      row_b[2 * k] = (b + d) / 2;
+      row_b[2 * k + 1] = (c - a) / 2;
+    }
+  }
+}
+
+// Inverse of unpack_real_spectra(): packs half-spectra of two real rows into
+// full spectrum z [fft_w] of (row_a + i*row_b) (row_b may be NULL).
+template <typename Dtype>
+void pack_real_spectra(const Dtype* row_a, const Dtype* row_b,
+    const int fft_w, const int spectrum_w, Dtype* z) {
+  for (int k = 0; k < fft_w; ++k) {
+    // X[k] = conj(X[fft_w - k]) for k beyond the stored half
+    const bool stored = k < spectrum_w;
+    const int idx = stored ? k : fft_w - k;
+    const Dtype sign = stored ? 1 : -1;
+    const Dtype a_re = row_a[2 * idx], a_im = sign * row_a[2 * idx + 1];
+    const Dtype b_re = row_b != NULL ? row_b[2 * idx] : 0;
+    const Dtype b_im = row_b != NULL ? sign * row_b[2 * idx + 1] : 0;
+    z[2 * k] = a_re - b_im;
+    z[2 * k + 1] = a_im + b_re;
+  }
+}
+
+// Forward 2D FFT of real [rows x fft_w] data given by get_row(r, row_buffer)
+// into half-spectrum [fft_h x spectrum_w] (rows beyond rows are zero).
+template <typename Dtype, typename RowFn>
+void real_fft2d(const FFTConv2dPlan<Dtype>& plan, const int rows,
+    RowFn get_row, Dtype* z, Dtype* spectrum) {
+  const int spectrum_size = 2 * plan.spectrum_w;
+  std::fill(spectrum, spectrum + plan.fft_h * spectrum_size, Dtype(0));
+  for (int r = 0; r < rows; r += 2) {
+    // two real rows are transformed at once as real and imaginary part
+    std::fill(z, z + 2 * plan.fft_w, Dtype(0));
+    get_row(r, z, 2);
+    if (r + 1 < rows) {
+      get_row(r + 1, z + 1, 2);
+    }
+    fft_vectors(z, plan.fft_w, 1, plan.twiddles_w.data(), false);
+    unpack_real_spectra(z, plan.fft_w, plan.spectrum_w,
+        spectrum + r * spectrum_size,
+        r + 1 < rows ? spectrum + (r + 1) * spectrum_size : NULL);
+  }
+  fft_vectors(spectrum, plan.fft_h, plan.spectrum_w, plan.twiddles_h.data(),
+      false);
+}
+
+}  // namespace
+
+template <typename Dtype>
+int FFTConv2dPlan<Dtype>::workspace_size() const {
+  return 2 * (2 * fft_h * spectrum_w + fft_w);
+}
+
+template <typename Dtype>
+void fft_conv2d_plan_cpu(const Dtype* kernels, const int num_kernels,
+    const int kernel_h, const int kernel_w, const int height, const int width,
+    const int pad_h, const int pad_w, const int height_out,
+    const int width_out, FFTConv2dPlan<Dtype>* plan) {
+  plan->num_kernels = num_kernels;
+  plan->height = height;
+  plan->width = width;
+  plan->height_out = height_out;
+  plan->width_out = width_out;
+
+  // only input rows within reach of output rows take part in the transform
+  plan->row_start = std::max(0, -pad_h);
+  plan->rows = std::max(0, std::min(height, height_out - pad_h + kernel_h - 1) - plan->row_start);
+  plan->col_start = std::max(0, -pad_w);
+  plan->cols = std::max(0, std::min(width, width_out - pad_w + kernel_w - 1) - plan->col_start);
+
+  plan->shift_h = pad_h + plan->row_start;
+  plan->shift_w = pad_w + plan->col_start;
+
+  // transforms must hold the kernel and be large enough that cyclic
+  // correlation does not wrap input values (or other output pixels) into
+  // output pixels
+  plan->fft_h = next_power_of_two(std::max(std::max(std::max(2, kernel_h), height_out),
+      std::max(plan->rows + plan->shift_h, height_out - plan->shift_h + kernel_h - 1)));
+  plan->fft_w = next_power_of_two(std::max(std::max(std::max(2, kernel_w), width_out),
+      std::max(plan->cols + plan->shift_w, width_out - plan->shift_w + kernel_w - 1)));
+  plan->spectrum_w = plan->fft_w / 2 + 1;
+
+  get_twiddles(plan->fft_h, &plan->twiddles_h);
+  get_twiddles(plan->fft_w, &plan->twiddles_w);
+
+  const int spectrum_size = plan->fft_h * plan->spectrum_w * 2;
+  plan->kernel_spectra.resize((size_t)num_kernels * spectrum_size);
+
+  std::vector<Dtype> z(2 * plan->fft_w);
+  for (int k = 0; k < num_kernels; ++k) {
+    const Dtype* kernel = kernels + k * kernel_h * kernel_w;
+    Dtype* spectrum = plan->kernel_spectra.data() + (size_t)k * spectrum_size;
+
+    real_fft2d(*plan, kernel_h, [&](int r, Dtype* dst, int dst_step) {
+      for (int c = 0; c < kernel_w; ++c) {
+        dst[c * dst_step] = kernel[r * kernel_w + c];
+      }
+    }, z.data(), spectrum);
+
+    // correlation is a product with conjugated spectrum of the kernel
+    for (int i = 1; i < spectrum_size; i += 2) {
+      spectrum[i] = -spectrum[i];
+    }
+  }
+}
+
+template <typename Dtype>
+void fft_conv2d_cpu(const FFTConv2dPlan<Dtype>& plan, const Dtype* data_im,
+    Dtype* data_out, const long data_out_step, Dtype* workspace,
+    const int data_im_step, const int data_im_upsample) {
+  const int spectrum_size = plan.fft_h * plan.spectrum_w * 2;
+
+  Dtype* image_spectrum = workspace;
+  Dtype* product = workspace + spectrum_size;
+  Dtype* z = workspace + 2 * spectrum_size;
+
+  // only every data_im_upsample-th row/column of (upsampled) input is stored
+  const int stored_width = (plan.width - 1) / data_im_upsample + 1;
+
+  real_fft2d(plan, plan.rows, [&](int r, Dtype* dst, int dst_step) {
+    const int input_row = plan.row_start + r;
+    if (input_row % data_im_upsample != 0) {
+      return;
+    }
+    const Dtype* src = data_im + (long)(input_row / data_im_upsample) * stored_width * data_im_step;
+    for (int c = 0; c < plan.cols; ++c) {
+      const int input_col = plan.col_start + c;
+      if (input_col % data_im_upsample == 0) {
+        dst[c * dst_step] = src[(input_col / data_im_upsample) * data_im_step];
+      }
+    }
+  }, z, image_spectrum);
+
+  const Dtype scale = Dtype(1) / ((Dtype)plan.fft_h * plan.fft_w);
+
+  for (int k = 0; k < plan.num_kernels; ++k) {
+    const Dtype* kernel_spectrum = plan.kernel_spectra.data() + (size_t)k * spectrum_size;
+
+    for (int i = 0; i < spectrum_size; i += 2) {
+      const Dtype a = image_spectrum[i], b = image_spectrum[i + 1];
+      const Dtype c = kernel_spectrum[i], d = kernel_spectrum[i + 1];
+      product[i] = a * c - b * d;
+      product[i + 1] = a * d + b * c;
+    }
+
+    fft_vectors(product, plan.fft_h, plan.spectrum_w, plan.twiddles_h.data(), true);
+
+    // inverse transform of two output rows at once
+    Dtype* out = data_out + k * data_out_step;
+    for (int y = 0; y < plan.height_out; y += 2) {
+      const int row_a = (y - plan.shift_h + plan.fft_h) % plan.fft_h;
+      const int row_b = (y + 1 - plan.shift_h + plan.fft_h) % plan.fft_h;
+      const bool has_b = y + 1 < plan.height_out;
+
+      pack_real_spectra(product + row_a * 2 * plan.spectrum_w,
+          has_b ? product + row_b * 2 * plan.spectrum_w : (const Dtype*)NULL,
+          plan.fft_w, plan.spectrum_w, z);
+
+      fft_vectors(z, plan.fft_w, 1, plan.twiddles_w.data(), true);
+
+      for (int x = 0; x < plan.width_out; ++x) {
+        const int col = (x - plan.shift_w + plan.fft_w) % plan.fft_w;
+        out[y * plan.width_out + x] = z[2 * col] * scale;
+        if (has_b) {
+          out[(y + 1) * plan.width_out + x] = z[2 * col + 1] * scale;
+        }
+      }
+    }
+  }
+}
+
+// Explicit instantiation
+template struct FFTConv2dPlan<float>;
+template struct FFTConv2dPlan<double>;
+
+template void fft_conv2d_plan_cpu<float>(const float* kernels,
+    const int num_kernels, const int kernel_h, const int kernel_w,
+    const int height, const int width, const int pad_h, const int pad_w,
+    const int height_out, const int width_out, FFTConv2dPlan<float>* plan);
+template void fft_conv2d_plan_cpu<double>(const double* kernels,
+    const int num_kernels, const int kernel_h, const int kernel_w,
+    const int height, const int width, const int pad_h, const int pad_w,
+    const int height_out, const int width_out, FFTConv2dPlan<double>* plan);
+
+template void fft_conv2d_cpu<float>(const FFTConv2dPlan<float>& plan,
+    const float* data_im, float* data_out, const long data_out_step,
+    float* workspace, const int data_im_step, const int data_im_upsample);
+template void fft_conv2d_cpu<double>(const FFTConv2dPlan<double>& plan,
+    const double* data_im, double* data_out, const long data_out_step,
+    double* workspace, const int data_im_step, const int data_im_upsample);
+
+}  // namespace DAUConvNet
@@ -0,0 +1,120 @@
+#include <algorithm>
+#include <cstring>
+
+#include "dau_conv/util/kernel_cache.hpp"
+#include "dau_conv/util/math_functions.hpp"
+
+namespace DAUConvNet {
+
+bool DAUKernelCacheKey::operator<(const DAUKernelCacheKey& other) const {
+  if (sigma != other.sigma) return sigma < other.sigma;
+  if (kernel_h != other.kernel_h) return kernel_h < other.kernel_h;
+  if (kernel_w != other.kernel_w) return kernel_w < other.kernel_w;
+  if (unit_normalization != other.unit_normalization)
+    return unit_normalization < other.unit_normalization;
+  if (square_unit_normalization != other.square_unit_normalization)
+    return square_unit_normalization < other.square_unit_normalization;
+  if (sigma_lower_bound != other.sigma_lower_bound)
+    return sigma_lower_bound < other.sigma_lower_bound;
+  return offsets_already_centered < other.offsets_already_centered;
+}
+
+template <typename Dtype>
+static void copy_kernel(const size_t N, const Dtype* src, Dtype* dst,
+    bool is_gpu_ptr) {
+  if (is_gpu_ptr) {
+    caffe_gpu_memcpy(N * sizeof(Dtype), src, dst);
+  } else {
+    memcpy(dst, src, N * sizeof(Dtype));
+  }
+}
+
+template <typename Dtype>
+DAUKernelCache<Dtype>& DAUKernelCache<Dtype>::get_instance() {
+  static DAUKernelCache<Dtype> instance;
+  return instance;
+}
+
+template <typename Dtype>
+bool DAUKernelCache<Dtype>::get(const DAUKernelCacheKey& key, Dtype* weight,
+    Dtype* d_error, Dtype* d_params, bool is_gpu_ptr) {
+  std::lock_guard<std::mutex> lock(mutex_);
+
+  typename std::map<DAUKernelCacheKey,
+      typename std::list<Entry>::iterator>::iterator it = index_.find(key);
+  if (it == index_.end()) {
+    num_misses_++;
+    return false;
+  }
+  // move to front as most recently used
+  entries_.splice(entries_.begin(), entries_, it->second);
+
+  const Entry& entry = *it->second;
+  copy_kernel(entry.weight.size(), entry.weight.data(), weight, is_gpu_ptr);
+  copy_kernel(entry.d_error.size(), entry.d_error.data(), d_error, is_gpu_ptr);
+  copy_kernel(entry.d_params.size(), entry.d_params.data(), d_params,
+      is_gpu_ptr);
+
+  num_hits_++;
+  return true;
+}
+
+template <typename Dtype>
+void DAUKernelCache<Dtype>::put(const DAUKernelCacheKey& key,
+    const Dtype* weight, const Dtype* d_error, const Dtype* d_params,
+    bool is_gpu_ptr) {
+  std::lock_guard<std::mutex> lock(mutex_);
+
+  if (capacity_ <= 0 || index_.find(key) != index_.end()) {
+    return;
+  }
+  const size_t K = key.kernel_h * key.kernel_w;
+
+  entries_.push_front(Entry());
+  Entry& entry = entries_.front();
+  entry.key = key;
+  entry.weight.resize(K);
+  entry.d_error.resize(K);
+  entry.d_params.resize(4 * K);
+
+  copy_kernel(K, weight, entry.weight.data(), is_gpu_ptr);
+  copy_kernel(K, d_error, entry.d_error.data(), is_gpu_ptr);
+  copy_kernel(4 * K, d_params, entry.d_params.data(), is_gpu_ptr);
+
+  index_[key] = entries_.begin();
+
+  evict();
+}
+
+template <typename Dtype>
+void DAUKernelCache<Dtype>::evict() {
+  while (entries_.size() > static_cast<size_t>(std::max(capacity_, 0))) {
+    index_.erase(entries_.back().key);
+    entries_.pop_back();
+  }
+}
+
+template <typename Dtype>
+void DAUKernelCache<Dtype>::clear() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  entries_.clear();
+  index_.clear();
+}
+
+template <typename Dtype>
+void DAUKernelCache<Dtype>::set_capacity(int capacity) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  capacity_ = capacity;
+  evict();
+}
+
+template <typename Dtype>
+int DAUKernelCache<Dtype>::size() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  return entries_.size();
+}
+
+template class DAUKernelCache<float>;
+template class DAUKernelCache<double>;
+
+}  // namespace DAUConvNet
@@ -0,0 +1,97 @@
+#include <cstdlib>
+#include <cstring>
+
+#include "dau_conv/util/profiler.hpp"
+
+namespace DAUConvNet {
+
+const char* get_dau_conv_phase_name(int phase) {
+  static const char* names[DAU_NUM_PHASES] = {
+    "workspace_setup",
+    "kernel_prep",
+    "fwd_blur",
+    "fwd_offset_sum",
+    "fwd_blur_offset_sum",
+    "fwd_bias",
+    "bwd_blur_error",
+    "bwd_backprop_error",
+    "bwd_blur_input",
+    "bwd_offset_dot",
+    "bwd_bias"
+  };
+  return phase >= 0 && phase < DAU_NUM_PHASES ? names[phase] : "unknown";
+}
+
+void DAUConvProfile::reset() {
+  for (int i = 0; i < DAU_NUM_PHASES; ++i) {
+    time_ms[i] = 0;
+    bytes[i] = 0;
+    calls[i] = 0;
+  }
+}
+
+DAUConvProfiler::DAUConvProfiler() : enabled_(false) {
+  const char* env = std::getenv("DAU_CONV_PROFILE");
+  if (env != NULL && strcmp(env, "0") != 0 && strlen(env) > 0) {
+    enabled_ = true;
+  }
+}
+
+DAUConvProfiler& DAUConvProfiler::get_instance() {
+  static DAUConvProfiler instance;
+  return instance;
+}
+
+void DAUConvProfiler::add(const std::string& layer_name, int phase,
+    double time_ms, long bytes) {
+  std::lock_guard<std::mutex> lock(mutex_);
+
+  DAUConvProfile& profile = profiles_[layer_name];
+  profile.time_ms[phase] += time_ms;
+  profile.bytes[phase] += bytes;
+  profile.calls[phase]++;
+}
+
+void DAUConvProfiler::get_profiles(std::vector<std::string>* layer_names,
+    std::vector<DAUConvProfile>* profiles) {
+  std::lock_guard<std::mutex> lock(mutex_);
+
+  layer_names->clear();
+  profiles->clear();
+  for (std::map<std::string, DAUConvProfile>::const_iterator it =
+      profiles_.begin(); it != profiles_.end(); ++it) {
+    layer_names->push_back(it->first);
+    profiles->push_back(it->second);
+  }
+}
+
+void DAUConvProfiler::reset() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  profiles_.clear();
+}
+
+void DAUConvPhaseTimer::start(int phase, long bytes) {
+  stop();
+
+  if (enabled_ == false ||
+      DAUConvProfiler::get_instance().is_enabled() == false) {
+    return;
+  }
+  phase_ = phase;
+  bytes_ = bytes;
+  start_time_ = std::chrono::steady_clock::now();
+}
+
+void DAUConvPhaseTimer::stop() {
+  if (phase_ < 0) {
+    return;
+  }
+  std::chrono::duration<double, std::milli> elapsed =
+      std::chrono::steady_clock::now() - start_time_;
+
+  DAUConvProfiler::get_instance().add(layer_name_, phase_, elapsed.count(),
+      bytes_);
+  phase_ = -1;
+}
+
+}  // namespace DAUConvNet
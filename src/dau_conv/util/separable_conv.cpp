@@ -0,0 +1,129 @@
+#include <algorithm>
+#include <cmath>
+
+#include "dau_conv/util/separable_conv.hpp"
+
+namespace DAUConvNet {
+
+template <typename Dtype>
+bool separable_kernel_factors_cpu(const Dtype* kernel, const int kernel_h,
+    const int kernel_w, Dtype* kernel_col, Dtype* kernel_row,
+    const Dtype tolerance) {
+  // use the largest value as pivot so that row and column are well defined
+  // also for derivative kernels that are zero at the center
+  int pivot_i = 0, pivot_j = 0;
+  Dtype pivot_val = 0;
+  for (int i = 0; i < kernel_h; ++i) {
+    for (int j = 0; j < kernel_w; ++j) {
+      if (std::fabs(kernel[i * kernel_w + j]) > std::fabs(pivot_val)) {
+        pivot_val = kernel[i * kernel_w + j];
+        pivot_i = i;
+        pivot_j = j;
+      }
+    }
+  }
+  if (pivot_val == 0) {
+    std::fill(kernel_col, kernel_col + kernel_h, Dtype(0));
+    std::fill(kernel_row, kernel_row + kernel_w, Dtype(0));
+    return true;
+  }
+  for (int j = 0; j < kernel_w; ++j) {
+    kernel_row[j] = kernel[pivot_i * kernel_w + j];
+  }
+  for (int i = 0; i < kernel_h; ++i) {
+    kernel_col[i] = kernel[i * kernel_w + pivot_j] / pivot_val;
+  }
+  // verify kernel is rank-1 i.e. can be reconstructed from both factors
+  const Dtype max_error = tolerance * std::fabs(pivot_val);
+  for (int i = 0; i < kernel_h; ++i) {
+    for (int j = 0; j < kernel_w; ++j) {
+      if (std::fabs(kernel[i * kernel_w + j] - kernel_col[i] * kernel_row[j])
+          > max_error) {
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+template <typename Dtype>
+void separable_conv2d_cpu(const Dtype* data_im, const int height,
+    const int width, const Dtype* kernel_col, const int kernel_h,
+    const Dtype* kernel_row, const int kernel_w, const int pad_h,
+    const int pad_w, const int height_out, const int width_out,
+    Dtype* row_buffer, Dtype* data_out, const int data_im_step,
+    const int data_im_upsample) {
+  // only every data_im_upsample-th row/column of (upsampled) input is stored
+  const int stored_width = (width - 1) / data_im_upsample + 1;
+  // process one output row at a time so that intermediate result of the
+  // vertical pass stays in cache (only [width] values) before it is consumed
+  // by the horizontal pass; both passes use contiguous inner loops
+  for (int y = 0; y < height_out; ++y) {
+    // vertical pass: weighted sum of kernel_h input rows
+    std::fill(row_buffer, row_buffer + width, Dtype(0));
+    for (int i = 0; i < kernel_h; ++i) {
+      const int input_row = y - pad_h + i;
+      if (input_row < 0 || input_row >= height || kernel_col[i] == 0 ||
+          input_row % data_im_upsample != 0) {
+        continue;
+      }
+      const Dtype k = kernel_col[i];
+      const Dtype* src = data_im +
+          (input_row / data_im_upsample) * stored_width * data_im_step;
+      if (data_im_upsample > 1) {
+        // inserted zeros between stored pixels do not contribute
+        for (int x = 0; x < stored_width; ++x) {
+          row_buffer[x * data_im_upsample] += k * src[x * data_im_step];
+        }
+      } else if (data_im_step == 1) {
+        for (int x = 0; x < width; ++x) {
+          row_buffer[x] += k * src[x];
+        }
+      } else {
+        // HWC data: gather pixels of this channel directly from the input
+        for (int x = 0; x < width; ++x) {
+          row_buffer[x] += k * src[x * data_im_step];
+        }
+      }
+    }
+    // horizontal pass: weighted sum of kernel_w shifted intermediate rows
+    Dtype* dst = data_out + y * width_out;
+    std::fill(dst, dst + width_out, Dtype(0));
+    for (int j = 0; j < kernel_w; ++j) {
+      const int offset = j - pad_w;
+      const int x_start = std::max(0, -offset);
+      const int x_end = std::min(width_out, width - offset);
+      if (x_start >= x_end || kernel_row[j] == 0) {
+        continue;
+      }
+      const Dtype k = kernel_row[j];
+      const Dtype* src = row_buffer + offset;
+      for (int x = x_start; x < x_end; ++x) {
+        dst[x] += k * src[x];
+      }
+    }
+  }
+}
+
+// Explicit instantiation
+template bool separable_kernel_factors_cpu<float>(const float* kernel,
+    const int kernel_h, const int kernel_w, float* kernel_col,
+    float* kernel_row, const float tolerance);
+template bool separable_kernel_factors_cpu<double>(const double* kernel,
+    const int kernel_h, const int kernel_w, double* kernel_col,
+    double* kernel_row, const double tolerance);
+
+template void separable_conv2d_cpu<float>(const float* data_im,
+    const int height, const int width, const float* kernel_col,
+    const int kernel_h, const float* kernel_row, const int kernel_w,
+    const int pad_h, const int pad_w, const int height_out,
+    const int width_out, float* row_buffer, float* data_out,
+    const int data_im_step, const int data_im_upsample);
+template void separable_conv2d_cpu<double>(const double* data_im,
+    const int height, const int width, const double* kernel_col,
+    const int kernel_h, const double* kernel_row, const int kernel_w,
+    const int pad_h, const int pad_w, const int height_out,
+    const int width_out, double* row_buffer, double* data_out,
+    const int data_im_step, const int data_im_upsample);
+
+}  // namespace DAUConvNet
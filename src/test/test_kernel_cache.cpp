@@ -0,0 +1,220 @@
+// Tests of DAUKernelCache: hit and miss counters, LRU eviction at capacity and
+// kernels returned for cached key that must be identical to the ones computed
+// by get_kernels_cpu() for the same key (built as test_kernel_cache and run by
+// ctest).
+
+#include <cstdio>
+#include <vector>
+
+#include "dau_conv/base_dau_conv_layer.hpp"
+#include "dau_conv/util/kernel_cache.hpp"
+
+using namespace DAUConvNet;
+
+static int num_failures = 0;
+
+#define EXPECT(Expr)                                                      \
+  do {                                                                    \
+    if (!(Expr)) {                                                        \
+      fprintf(stderr, "%s:%d: expected %s\n", __FILE__, __LINE__, #Expr); \
+      num_failures++;                                                     \
+    }                                                                     \
+  } while (0)
+
+// Host buffers for pre-filtering kernels of a single unit (as used by
+// BaseDAUConvLayer::update_prefiltering_kernels()).
+class HostKernelParams : public BaseDAUKernelParams<float> {
+ public:
+  virtual void reshape(int num_in_channels, int num_out_channels,
+      int num_gauss) {
+    const int N = num_in_channels * num_out_channels * num_gauss;
+    weight_.resize(N);
+    mu1_.resize(N);
+    mu2_.resize(N);
+    sigma_.resize(N);
+  }
+
+  virtual float* weight() { return weight_.data(); }
+  virtual float* mu1() { return mu1_.data(); }
+  virtual float* mu2() { return mu2_.data(); }
+  virtual float* sigma() { return sigma_.data(); }
+
+ private:
+  std::vector<float> weight_, mu1_, mu2_, sigma_;
+};
+
+class HostKernelOutput : public BaseDAUKernelOutput<float> {
+ public:
+  virtual void reshape(int num_in_channels, int num_out_channels,
+      int num_gauss, int kernel_h, int kernel_w) {
+    const int K = kernel_h * kernel_w;
+    weight_.assign(num_in_channels * num_out_channels * K, 0);
+    d_error_.assign(num_in_channels * num_out_channels * K, 0);
+    d_params_.assign(4 * num_in_channels * num_out_channels * num_gauss * K, 0);
+  }
+
+  virtual float* weight() { return weight_.data(); }
+  virtual float* d_error() { return d_error_.data(); }
+  virtual float* d_params() { return d_params_.data(); }
+
+  std::vector<float> weight_, d_error_, d_params_;
+};
+
+// get_kernels_cpu() does not use any temporary buffers
+class HostKernelCompute : public BaseDAUKernelCompute<float> {
+ public:
+  virtual void reshape(int num_in_channels, int num_out_channels,
+      int num_gauss, int kernel_h, int kernel_w) {
+    this->num_in_channels = num_in_channels;
+    this->num_out_channels = num_out_channels;
+    this->num_gauss = num_gauss;
+    this->kernel_h = kernel_h;
+    this->kernel_w = kernel_w;
+  }
+
+  virtual float* param_temp(Param_IDX index) { return NULL; }
+  virtual float* kernels_temp(Kernel_IDX index) { return NULL; }
+  virtual int* precomp_index() { return NULL; }
+};
+
+static DAUKernelCacheKey make_key(float sigma, int kernel_size) {
+  DAUKernelCacheKey key;
+  key.sigma = sigma;
+  key.kernel_h = kernel_size;
+  key.kernel_w = kernel_size;
+  key.unit_normalization = true;
+  key.square_unit_normalization = false;
+  key.sigma_lower_bound = 0.1f;
+  key.offsets_already_centered = true;
+  return key;
+}
+
+// Computes kernels for key with w=1 and mu=0 in the same way as the layer.
+static void compute_kernels(const DAUKernelCacheKey& key,
+    HostKernelOutput* output) {
+  HostKernelCompute compute;
+  HostKernelParams params;
+
+  compute.setup(key.unit_normalization, key.square_unit_normalization,
+      key.sigma_lower_bound, 0, key.offsets_already_centered);
+  compute.reshape(1, 1, 1, key.kernel_h, key.kernel_w);
+
+  params.reshape(1, 1, 1);
+  params.weight()[0] = 1;
+  params.mu1()[0] = key.offsets_already_centered ? 0 : key.kernel_w / 2;
+  params.mu2()[0] = key.offsets_already_centered ? 0 : key.kernel_h / 2;
+  params.sigma()[0] = key.sigma;
+
+  output->reshape(1, 1, 1, key.kernel_h, key.kernel_w);
+  compute.get_kernels_cpu(params, *output);
+}
+
+static bool cache_get(DAUKernelCache<float>& cache,
+    const DAUKernelCacheKey& key, HostKernelOutput* output) {
+  output->reshape(1, 1, 1, key.kernel_h, key.kernel_w);
+  return cache.get(key, output->weight(), output->d_error(),
+      output->d_params(), false);
+}
+
+static void cache_put(DAUKernelCache<float>& cache,
+    const DAUKernelCacheKey& key) {
+  HostKernelOutput output;
+  compute_kernels(key, &output);
+  cache.put(key, output.weight(), output.d_error(), output.d_params(), false);
+}
+
+static void test_hits_and_misses() {
+  DAUKernelCache<float> cache(4);
+  HostKernelOutput output;
+
+  const DAUKernelCacheKey key = make_key(0.5f, 5);
+
+  EXPECT(cache_get(cache, key, &output) == false);
+  EXPECT(cache.num_hits() == 0);
+  EXPECT(cache.num_misses() == 1);
+
+  cache_put(cache, key);
+  EXPECT(cache.size() == 1);
+
+  EXPECT(cache_get(cache, key, &output));
+  EXPECT(cache_get(cache, key, &output));
+  EXPECT(cache.num_hits() == 2);
+  EXPECT(cache.num_misses() == 1);
+
+  // any setting of the key is part of it
+  DAUKernelCacheKey other_key = key;
+  other_key.square_unit_normalization = true;
+
+  EXPECT(cache_get(cache, other_key, &output) == false);
+  EXPECT(cache.num_hits() == 2);
+  EXPECT(cache.num_misses() == 2);
+
+  // put of existing key does not add new entry
+  cache_put(cache, key);
+  EXPECT(cache.size() == 1);
+}
+
+static void test_lru_eviction() {
+  DAUKernelCache<float> cache(2);
+  HostKernelOutput output;
+
+  const DAUKernelCacheKey key_a = make_key(0.5f, 5);
+  const DAUKernelCacheKey key_b = make_key(0.7f, 5);
+  const DAUKernelCacheKey key_c = make_key(1.0f, 7);
+
+  cache_put(cache, key_a);
+  cache_put(cache, key_b);
+  EXPECT(cache.size() == 2);
+
+  // use of key_a makes key_b least recently used, so it is evicted first
+  EXPECT(cache_get(cache, key_a, &output));
+  cache_put(cache, key_c);
+
+  EXPECT(cache.size() == 2);
+  EXPECT(cache_get(cache, key_b, &output) == false);
+  EXPECT(cache_get(cache, key_a, &output));
+  EXPECT(cache_get(cache, key_c, &output));
+
+  // shrinking capacity keeps only the most recently used entries
+  cache.set_capacity(1);
+  EXPECT(cache.size() == 1);
+  EXPECT(cache_get(cache, key_a, &output) == false);
+  EXPECT(cache_get(cache, key_c, &output));
+
+  // nothing is cached without capacity
+  cache.set_capacity(0);
+  cache_put(cache, key_a);
+  EXPECT(cache.size() == 0);
+}
+
+static void test_cached_kernels_are_identical() {
+  DAUKernelCache<float> cache(4);
+
+  const DAUKernelCacheKey keys[] = {make_key(0.5f, 5), make_key(1.5f, 9)};
+
+  for (int i = 0; i < 2; ++i) {
+    cache_put(cache, keys[i]);
+  }
+  for (int i = 0; i < 2; ++i) {
+    HostKernelOutput fresh, cached;
+    compute_kernels(keys[i], &fresh);
+
+    EXPECT(cache_get(cache, keys[i], &cached));
+    EXPECT(cached.weight_ == fresh.weight_);
+    EXPECT(cached.d_error_ == fresh.d_error_);
+    EXPECT(cached.d_params_ == fresh.d_params_);
+  }
+}
+
+int main(int argc, char** argv) {
+  test_hits_and_misses();
+  test_lru_eviction();
+  test_cached_kernels_are_identical();
+
+  if (num_failures > 0) {
+    fprintf(stderr, "test_kernel_cache: %d checks failed\n", num_failures);
+    return 1;
+  }
+  printf("test_kernel_cache: all checks passed\n");
+  return 0;
+}